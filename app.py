@@ -18,6 +18,9 @@ import plotly.express as px
 import plotly.graph_objects as go
 import time
 from utils import get_ajustes_app
+from services.plataforma_service import get_plataforma_service
+from services.query_memo import con_memo, registrar_estadisticas_memo
+from services.log_acciones_service import get_registro_acciones
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
@@ -931,6 +934,14 @@ if not SUPABASE_URL or not SUPABASE_ANON_KEY:
 supabase_public = create_client(SUPABASE_URL, SUPABASE_ANON_KEY)
 supabase_admin = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY) if SUPABASE_SERVICE_ROLE_KEY else None
 
+# Registro de acciones: se inicializa una vez por proceso con el cliente original
+get_registro_acciones(supabase_admin)
+
+# Memo de lecturas por rerun: las consultas idénticas dentro de la misma
+# ejecución se sirven desde memoria (el cliente se envuelve de nuevo en cada rerun)
+supabase_public = con_memo(supabase_public)
+supabase_admin = con_memo(supabase_admin)
+
 # =============================================================================
 # ESTADO INICIAL
 # =============================================================================
@@ -944,16 +955,17 @@ for key, default in {
 # =============================================================================
 # FUNCIONES AUXILIARES
 # =============================================================================
-@st.cache_data(ttl=300)
 def get_metricas_admin():
     try:
         if not supabase_admin:
             return {"empresas": 0, "usuarios": 0, "cursos": 0, "grupos": 0}
-        total_empresas = supabase_admin.table("empresas").select("id", count="exact").execute().count or 0
-        total_usuarios = supabase_admin.table("usuarios").select("id", count="exact").execute().count or 0
-        total_cursos = supabase_admin.table("acciones_formativas").select("id", count="exact").execute().count or 0
-        total_grupos = supabase_admin.table("grupos").select("id", count="exact").execute().count or 0
-        return {"empresas": total_empresas, "usuarios": total_usuarios, "cursos": total_cursos, "grupos": total_grupos}
+        contadores = get_plataforma_service().get_contadores(supabase_admin)
+        return {
+            "empresas": contadores["total_empresas"],
+            "usuarios": contadores["total_usuarios"],
+            "cursos": contadores["total_cursos"],
+            "grupos": contadores["total_grupos"],
+        }
     except Exception as e:
         print(f"Error métricas admin: {e}")
         return {"empresas": 0, "usuarios": 0, "cursos": 0, "grupos": 0}
@@ -1730,5 +1742,7 @@ def main():
                 st.cache_data.clear()
                 st.rerun()
 
+    registrar_estadisticas_memo(supabase_admin or supabase_public, st.session_state.get("page"))
+
 if __name__ == "__main__":
     main()
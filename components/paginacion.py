@@ -0,0 +1,33 @@
+import streamlit as st
+
+
+def paginador_cursor(clave: str, firma, cargar, etiqueta: str = "registros"):
+    """
+    Paginación por cursor (keyset) para listados grandes.
+
+    `cargar(cursor)` devuelve (DataFrame, cursor_siguiente). La pila de cursores
+    se guarda en sesión bajo `clave` y vuelve a la primera página cuando cambia
+    `firma` (p. ej. una tupla con los filtros activos). Devuelve el DataFrame
+    de la página actual.
+    """
+    estado = st.session_state.get(clave)
+    if not estado or estado["firma"] != firma:
+        estado = {"firma": firma, "cursores": [None]}
+        st.session_state[clave] = estado
+
+    df, siguiente = cargar(estado["cursores"][-1])
+    pagina = len(estado["cursores"])
+
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("◀ Anterior", key=f"{clave}_anterior", disabled=pagina == 1, use_container_width=True):
+            estado["cursores"].pop()
+            st.rerun()
+    with col2:
+        st.caption(f"Página {pagina} · {len(df)} {etiqueta}")
+    with col3:
+        if st.button("Siguiente ▶", key=f"{clave}_siguiente", disabled=siguiente is None, use_container_width=True):
+            estado["cursores"].append(siguiente)
+            st.rerun()
+
+    return df
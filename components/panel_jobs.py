@@ -0,0 +1,81 @@
+import streamlit as st
+from services.query_memo import sin_memo
+from services.jobs_service import (
+    get_job_runner, snapshot_sesion,
+    COMPLETADO, ERROR, INTERRUMPIDO, CANCELADO, ESTADOS_ACTIVOS, ESTADOS_REANUDABLES
+)
+
+ICONOS_ESTADO = {
+    "PENDIENTE": "⏳",
+    "EN_CURSO": "🔄",
+    COMPLETADO: "✅",
+    ERROR: "❌",
+    INTERRUMPIDO: "⏸️",
+    "CANCELANDO": "🛑",
+    CANCELADO: "🚫",
+}
+
+
+def lanzar_job(tipo: str, params: dict, supabase, session_state, clave_sesion: str,
+               secretos: dict = None) -> str:
+    """
+    Lanza una tarea en segundo plano y guarda su id en sesión para seguirla entre reruns.
+    `secretos` no se guarda con los parámetros (ver JobRunner.lanzar).
+    """
+    job_id = get_job_runner().lanzar(
+        tipo,
+        params,
+        {"supabase": sin_memo(supabase), "sesion": snapshot_sesion(session_state)},
+        usuario_id=session_state.user.get("id"),
+        empresa_id=session_state.user.get("empresa_id"),
+        secretos=secretos,
+    )
+    st.session_state[clave_sesion] = job_id
+    return job_id
+
+
+def panel_job(clave_sesion: str, supabase, session_state, titulo: str = "Tarea en segundo plano"):
+    """
+    Muestra el progreso de la tarea guardada en `clave_sesion`.
+    Se refresca solo cada 2 segundos mientras la tarea está activa.
+    """
+    job_id = st.session_state.get(clave_sesion)
+    if not job_id:
+        return
+
+    @st.fragment(run_every=2)
+    def _panel():
+        runner = get_job_runner()
+        job = runner.get(job_id)
+        if not job:
+            st.session_state.pop(clave_sesion, None)
+            return
+
+        with st.container(border=True):
+            icono = ICONOS_ESTADO.get(job["estado"], "•")
+            st.markdown(f"**{icono} {titulo}** — {job['estado']}")
+            st.progress(min(job["progreso"], 1.0), text=f"{job['procesados']} / {job['total'] or '?'}")
+
+            if job["resultado"]:
+                st.caption(" · ".join(f"{k}: {v}" for k, v in job["resultado"].items()))
+
+            if job["errores"]:
+                with st.expander(f"⚠️ {len(job['errores'])} incidencias"):
+                    for error in job["errores"][-50:]:
+                        st.text(error)
+
+            col1, col2 = st.columns(2)
+            with col1:
+                if job["estado"] in ESTADOS_ACTIVOS:
+                    if st.button("🛑 Cancelar", key=f"cancelar_job_{job_id}", use_container_width=True):
+                        runner.cancelar(job_id)
+                elif job["estado"] in ESTADOS_REANUDABLES:
+                    if st.button("▶️ Reanudar", key=f"reanudar_job_{job_id}", use_container_width=True):
+                        runner.reanudar(job_id, {"supabase": sin_memo(supabase), "sesion": snapshot_sesion(session_state)})
+            with col2:
+                if job["estado"] not in ESTADOS_ACTIVOS:
+                    if st.button("✖️ Cerrar", key=f"cerrar_job_{job_id}", use_container_width=True):
+                        st.session_state.pop(clave_sesion, None)
+                        st.rerun()
+
+    _panel()
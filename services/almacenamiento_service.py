@@ -0,0 +1,456 @@
+"""
+Canal común de subidas a Supabase Storage.
+
+- Las rutas se direccionan por contenido (SHA-256 del archivo dentro de la
+  carpeta lógica), así que un archivo idéntico ya subido no se vuelve a
+  enviar: se comprueba su existencia y se reutiliza la URL. Como el objeto
+  no cambia nunca, se sirve con cache-control largo.
+- Los lotes se suben en paralelo en un pool de hilos del proceso con un
+  número acotado de subidas simultáneas (STORAGE_MAX_PARALELO).
+- Un mismo objeto puede quedar compartido por varios registros, de modo que
+  sustituciones y borrados no eliminan el archivo directamente: liberar()
+  comprueba en segundo plano que ninguna columna de REFERENCIAS_STORAGE lo
+  sigue apuntando, y la tarea "limpiar_huerfanos_storage" barre un bucket
+  entero respetando un margen para las subidas aún no registradas.
+
+AlmacenamientoLocal reproduce la API de `supabase.storage` sobre el disco
+para pruebas y para el benchmark (`python -m services.almacenamiento_service`).
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import streamlit as st
+from storage3.exceptions import StorageApiError
+
+from services.avatares_service import base_avatar
+
+STORAGE_MAX_PARALELO = int(os.environ.get("STORAGE_MAX_PARALELO", "4"))
+MARGEN_HUERFANOS_HORAS = 24
+PAGINA_LISTADO = 1000
+LOTE_BORRADO = 100
+
+# Columnas que guardan URLs públicas de cada bucket: (tabla, columna)
+REFERENCIAS_STORAGE = {
+    "avatars": [("participantes_avatars", "archivo_url")],
+    "curriculums": [("tutores", "cv_url")],
+    "diplomas": [
+        ("diplomas", "url"),
+        ("empresas_firmas_diplomas", "archivo_url"),
+        ("empresas_logos_diplomas", "archivo_url"),
+    ],
+    "documentos": [("documentos_avanzados", "url")],
+}
+
+# Normalización de rutas al comparar objetos con referencias: en avatars la
+# base de datos solo guarda la variante principal, pero todas cuentan como usadas
+CLAVE_REFERENCIA: Dict[str, Callable[[str], str]] = {
+    "avatars": base_avatar,
+}
+
+
+def huella(contenido: bytes) -> str:
+    return hashlib.sha256(contenido).hexdigest()
+
+
+def ruta_contenido(carpeta: str, contenido: bytes, extension: str, prefijo: str = "") -> str:
+    """Ruta estable para un contenido: <carpeta>/<prefijo>_<sha256[:32]>.<extensión>"""
+    nombre = huella(contenido)[:32]
+    if prefijo:
+        nombre = f"{prefijo}_{nombre}"
+    ruta = f"{nombre}.{extension.lstrip('.').lower()}"
+    carpeta = carpeta.strip("/")
+    return f"{carpeta}/{ruta}" if carpeta else ruta
+
+
+def ruta_desde_url(url: Optional[str], bucket: str) -> Optional[str]:
+    """Ruta del objeto dentro del bucket a partir de su URL pública."""
+    if not url or f"/{bucket}/" not in url:
+        return None
+    return url.split("?")[0].split(f"/{bucket}/", 1)[1] or None
+
+
+def _es_duplicado(error: Exception) -> bool:
+    texto = str(error).lower()
+    return "duplicate" in texto or "already exists" in texto
+
+
+def _fecha_objeto(valor: Optional[str]) -> Optional[datetime]:
+    if not valor:
+        return None
+    try:
+        fecha = datetime.fromisoformat(str(valor).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return fecha if fecha.tzinfo else fecha.replace(tzinfo=timezone.utc)
+
+
+# =========================
+# SERVICIO
+# =========================
+
+class AlmacenamientoService:
+    """Subidas deduplicadas y paralelas, y limpieza de objetos huérfanos."""
+
+    def __init__(self, storage, supabase=None, max_paralelo: int = STORAGE_MAX_PARALELO):
+        self.storage = storage
+        self.supabase = supabase
+        self._executor = ThreadPoolExecutor(max_workers=max_paralelo, thread_name_prefix="storage")
+
+    # ---- Subidas ----
+
+    def existe(self, bucket: str, ruta: str) -> bool:
+        carpeta, _, nombre = ruta.rpartition("/")
+        objetos = self.storage.from_(bucket).list(carpeta, {"search": nombre, "limit": 100}) or []
+        return any(o.get("name") == nombre for o in objetos)
+
+    def subir(self, bucket: str, ruta: str, contenido: bytes,
+              content_type: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Sube `contenido` a `ruta` salvo que ya exista (misma ruta = mismo
+        contenido). Devuelve ruta, url, bytes y si se reutilizó el objeto.
+        """
+        cliente = self.storage.from_(bucket)
+        reutilizado = self.existe(bucket, ruta)
+        if not reutilizado:
+            try:
+                cliente.upload(ruta, contenido, {
+                    "content-type": content_type or "application/octet-stream",
+                    "cache-control": "31536000",
+                    "upsert": "false",
+                })
+            except Exception as e:
+                # Otra sesión ha subido el mismo contenido entre la comprobación y la subida
+                if not _es_duplicado(e):
+                    raise
+                reutilizado = True
+        return {
+            "ruta": ruta,
+            "url": cliente.get_public_url(ruta),
+            "bytes": len(contenido),
+            "reutilizado": reutilizado,
+        }
+
+    def subir_archivo(self, bucket: str, carpeta: str, contenido: bytes, extension: str,
+                      content_type: Optional[str] = None, prefijo: str = "") -> Dict[str, Any]:
+        return self.subir(bucket, ruta_contenido(carpeta, contenido, extension, prefijo),
+                          contenido, content_type)
+
+    def subir_lote(self, bucket: str, archivos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Sube varios archivos en paralelo (como mucho STORAGE_MAX_PARALELO a la vez).
+
+        Cada archivo es un dict con `contenido` y `ruta`, o con `carpeta`,
+        `extension` y opcionalmente `prefijo`; `content_type` es opcional.
+        Los resultados vuelven en el mismo orden; los fallos llevan `error`
+        y url None. Los contenidos repetidos en el lote se suben una vez.
+        """
+        rutas = [
+            a.get("ruta") or ruta_contenido(a["carpeta"], a["contenido"], a["extension"], a.get("prefijo", ""))
+            for a in archivos
+        ]
+        futuros: Dict[str, Future] = {}
+        for ruta, archivo in zip(rutas, archivos):
+            if ruta not in futuros:
+                futuros[ruta] = self._executor.submit(
+                    self.subir, bucket, ruta, archivo["contenido"], archivo.get("content_type")
+                )
+
+        resultados = []
+        for ruta, archivo in zip(rutas, archivos):
+            try:
+                resultados.append(futuros[ruta].result())
+            except Exception as e:
+                resultados.append({"ruta": ruta, "url": None, "bytes": len(archivo["contenido"]),
+                                   "reutilizado": False, "error": str(e)})
+        return resultados
+
+    # ---- Referencias y limpieza ----
+
+    def _clave(self, bucket: str, ruta: str) -> str:
+        return CLAVE_REFERENCIA.get(bucket, lambda r: r)(ruta)
+
+    def _referenciada(self, bucket: str, ruta: str) -> bool:
+        """True si alguna columna registrada sigue apuntando a la ruta (o no se puede saber)."""
+        referencias = REFERENCIAS_STORAGE.get(bucket)
+        if not referencias or self.supabase is None:
+            return True
+        patron = f"%/{bucket}/{self._clave(bucket, ruta)}%"
+        for tabla, columna in referencias:
+            res = self.supabase.table(tabla).select(columna).like(columna, patron).limit(1).execute()
+            if res.data:
+                return True
+        return False
+
+    def eliminar_si_huerfanos(self, bucket: str, rutas: List[str]) -> List[str]:
+        """Elimina las rutas que ya no referencia ningún registro. Devuelve las eliminadas."""
+        try:
+            huerfanas = [r for r in dict.fromkeys(rutas) if r and not self._referenciada(bucket, r)]
+            if huerfanas:
+                self.storage.from_(bucket).remove(huerfanas)
+            return huerfanas
+        except Exception as e:
+            print(f"Error liberando objetos de {bucket}: {e}")
+            return []
+
+    def liberar(self, bucket: str, rutas_o_urls: List[Optional[str]]) -> Future:
+        """
+        Programa en segundo plano el borrado de objetos que han dejado de usarse.
+        Llamar después de actualizar o borrar el registro que los apuntaba.
+        """
+        rutas = [ruta_desde_url(r, bucket) if r and "://" in r else r for r in rutas_o_urls]
+        return self._executor.submit(self.eliminar_si_huerfanos, bucket, [r for r in rutas if r])
+
+    def listar_objetos(self, bucket: str, prefijo: str = "") -> List[Dict[str, Any]]:
+        """Todos los objetos bajo `prefijo`, recorriendo subcarpetas: [{ruta, actualizado}]."""
+        cliente = self.storage.from_(bucket)
+        pendientes, objetos = [prefijo.strip("/")], []
+        while pendientes:
+            carpeta = pendientes.pop()
+            desplazamiento = 0
+            while True:
+                pagina = cliente.list(carpeta, {"limit": PAGINA_LISTADO, "offset": desplazamiento}) or []
+                for item in pagina:
+                    ruta = f"{carpeta}/{item['name']}" if carpeta else item["name"]
+                    if item.get("id") is None:
+                        pendientes.append(ruta)
+                    else:
+                        objetos.append({"ruta": ruta, "actualizado": item.get("updated_at") or item.get("created_at")})
+                if len(pagina) < PAGINA_LISTADO:
+                    break
+                desplazamiento += PAGINA_LISTADO
+        return objetos
+
+    def rutas_referenciadas(self, bucket: str) -> Set[str]:
+        """Claves de todas las rutas del bucket que apunta alguna columna registrada."""
+        claves = set()
+        for tabla, columna in REFERENCIAS_STORAGE[bucket]:
+            inicio = 0
+            while True:
+                filas = self.supabase.table(tabla).select(columna).not_.is_(columna, "null") \
+                    .range(inicio, inicio + PAGINA_LISTADO - 1).execute().data or []
+                for fila in filas:
+                    ruta = ruta_desde_url(fila.get(columna), bucket)
+                    if ruta:
+                        claves.add(self._clave(bucket, ruta))
+                if len(filas) < PAGINA_LISTADO:
+                    break
+                inicio += PAGINA_LISTADO
+        return claves
+
+    def recolectar_huerfanos(self, bucket: str, prefijo: str = "",
+                             margen_horas: float = MARGEN_HUERFANOS_HORAS, dry_run: bool = False,
+                             referenciadas: Optional[Set[str]] = None) -> Dict[str, Any]:
+        """
+        Borra los objetos del bucket que no referencia ningún registro y que
+        llevan más de `margen_horas` sin modificarse (las subidas recientes
+        pueden estar todavía pendientes de guardarse en su tabla).
+        """
+        if referenciadas is None and bucket not in REFERENCIAS_STORAGE:
+            raise ValueError(f"Bucket sin referencias registradas: {bucket}")
+
+        # Primero el listado y después las referencias: un objeto enlazado
+        # mientras tanto aparece en las referencias y no se borra
+        objetos = self.listar_objetos(bucket, prefijo)
+        if referenciadas is None:
+            referenciadas = self.rutas_referenciadas(bucket)
+
+        limite = datetime.now(timezone.utc) - timedelta(hours=margen_horas)
+        huerfanos = []
+        for objeto in objetos:
+            fecha = _fecha_objeto(objeto["actualizado"])
+            if fecha and fecha < limite and self._clave(bucket, objeto["ruta"]) not in referenciadas:
+                huerfanos.append(objeto["ruta"])
+
+        eliminados = 0
+        if not dry_run:
+            cliente = self.storage.from_(bucket)
+            for i in range(0, len(huerfanos), LOTE_BORRADO):
+                lote = huerfanos[i:i + LOTE_BORRADO]
+                cliente.remove(lote)
+                eliminados += len(lote)
+
+        return {
+            "bucket": bucket,
+            "objetos": len(objetos),
+            "huerfanos": len(huerfanos),
+            "eliminados": eliminados,
+            "muestra": huerfanos[:20],
+        }
+
+
+@st.cache_resource
+def get_almacenamiento(_supabase) -> AlmacenamientoService:
+    """Canal único por proceso: un solo pool de subidas compartido entre sesiones."""
+    from services.query_memo import sin_memo
+
+    cliente = sin_memo(_supabase)
+    return AlmacenamientoService(cliente.storage, cliente)
+
+
+# =========================
+# STORAGE LOCAL (PRUEBAS Y BENCHMARK)
+# =========================
+
+class AlmacenamientoLocal:
+    """
+    Sustituto de `supabase.storage` sobre el sistema de archivos: un
+    directorio por bucket. Cuenta peticiones y bytes subidos, y `latencia`
+    (segundos) simula el coste de ida y vuelta de cada petición.
+    """
+
+    def __init__(self, raiz: str, url_base: str = "http://localhost/storage/v1/object/public",
+                 latencia: float = 0.0):
+        self.raiz = raiz
+        self.url_base = url_base
+        self.latencia = latencia
+        self.peticiones = 0
+        self.bytes_subidos = 0
+        self._lock = threading.Lock()
+
+    def from_(self, bucket: str) -> "_BucketLocal":
+        return _BucketLocal(self, bucket)
+
+    def _peticion(self, bytes_subidos: int = 0):
+        with self._lock:
+            self.peticiones += 1
+            self.bytes_subidos += bytes_subidos
+        if self.latencia:
+            time.sleep(self.latencia)
+
+
+class _BucketLocal:
+
+    def __init__(self, almacen: AlmacenamientoLocal, bucket: str):
+        self.almacen = almacen
+        self.bucket = bucket
+        self.base = os.path.join(almacen.raiz, bucket)
+
+    def _ruta(self, path: Optional[str]) -> str:
+        partes = [p for p in (path or "").strip("/").split("/") if p]
+        return os.path.join(self.base, *partes)
+
+    def upload(self, path: str, file, file_options: Optional[Dict[str, str]] = None):
+        datos = file if isinstance(file, bytes) else file.read()
+        self.almacen._peticion(len(datos))
+        destino = self._ruta(path)
+        upsert = str((file_options or {}).get("upsert", "false")).lower() == "true"
+        if os.path.exists(destino) and not upsert:
+            raise StorageApiError("The resource already exists", "Duplicate", 409)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        with open(destino, "wb") as f:
+            f.write(datos)
+        return {"path": path}
+
+    def get_public_url(self, path: str) -> str:
+        return f"{self.almacen.url_base}/{self.bucket}/{path.strip('/')}"
+
+    def list(self, path: Optional[str] = None, options: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        self.almacen._peticion()
+        opciones = options or {}
+        carpeta = self._ruta(path)
+        if not os.path.isdir(carpeta):
+            return []
+
+        busqueda = str(opciones.get("search", "")).lower()
+        items = []
+        for entrada in sorted(os.scandir(carpeta), key=lambda e: e.name):
+            if busqueda and not entrada.name.lower().startswith(busqueda):
+                continue
+            if entrada.is_dir():
+                items.append({"name": entrada.name, "id": None, "updated_at": None, "metadata": None})
+            else:
+                estado = entrada.stat()
+                fecha = datetime.fromtimestamp(estado.st_mtime, timezone.utc).isoformat()
+                items.append({"name": entrada.name, "id": entrada.name, "updated_at": fecha,
+                              "created_at": fecha, "metadata": {"size": estado.st_size}})
+
+        inicio = int(opciones.get("offset", 0))
+        return items[inicio:inicio + int(opciones.get("limit", 100))]
+
+    def remove(self, paths: List[str]) -> List[Dict[str, Any]]:
+        self.almacen._peticion()
+        eliminados = []
+        for path in paths:
+            destino = self._ruta(path)
+            if os.path.isfile(destino):
+                os.remove(destino)
+                eliminados.append({"name": path})
+        return eliminados
+
+
+# =========================
+# BENCHMARK
+# =========================
+
+def benchmark_subidas(n_archivos: int = 60, distintos: int = 20, tamano_kb: int = 200,
+                      latencia_ms: float = 40.0) -> Dict[str, Any]:
+    """
+    Compara la subida anterior (una a una, nombre con timestamp, sin
+    deduplicar) con el canal de subidas sobre storage local, y después
+    limpia los objetos que han dejado de estar referenciados.
+    """
+    import tempfile
+
+    contenidos = [os.urandom(tamano_kb * 1024) for _ in range(distintos)]
+    archivos = [contenidos[i % distintos] for i in range(n_archivos)]
+
+    with tempfile.TemporaryDirectory() as raiz:
+        # Camino anterior
+        storage = AlmacenamientoLocal(os.path.join(raiz, "anterior"), latencia=latencia_ms / 1000.0)
+        t0 = time.perf_counter()
+        for i, contenido in enumerate(archivos):
+            ruta = f"empresa_1/doc_{i}_{int(datetime.now().timestamp())}.pdf"
+            storage.from_("documentos").upload(ruta, contenido, {"content-type": "application/pdf"})
+            storage.from_("documentos").get_public_url(ruta)
+        anterior = {"segundos": round(time.perf_counter() - t0, 3), "peticiones": storage.peticiones,
+                    "mb_subidos": round(storage.bytes_subidos / 1e6, 1)}
+
+        # Canal de subidas: deduplicado y en paralelo
+        storage = AlmacenamientoLocal(os.path.join(raiz, "canal"), latencia=latencia_ms / 1000.0)
+        servicio = AlmacenamientoService(storage)
+        t0 = time.perf_counter()
+        resultados = servicio.subir_lote("documentos", [
+            {"carpeta": "empresa_1", "contenido": c, "extension": "pdf", "content_type": "application/pdf"}
+            for c in archivos
+        ])
+        canal = {"segundos": round(time.perf_counter() - t0, 3), "peticiones": storage.peticiones,
+                 "mb_subidos": round(storage.bytes_subidos / 1e6, 1),
+                 "errores": sum(1 for r in resultados if r.get("error"))}
+
+        # Segunda tanda idéntica: todo se reutiliza
+        t0 = time.perf_counter()
+        repetidos = servicio.subir_lote("documentos", [
+            {"carpeta": "empresa_1", "contenido": c, "extension": "pdf"} for c in archivos
+        ])
+        canal["resubida_segundos"] = round(time.perf_counter() - t0, 3)
+        canal["resubida_reutilizados"] = sum(1 for r in repetidos if r["reutilizado"])
+
+        # Limpieza: solo la mitad de los contenidos sigue referenciada
+        referenciadas = {r["ruta"] for r in resultados[:distintos // 2]}
+        limpieza = servicio.recolectar_huerfanos("documentos", margen_horas=0, referenciadas=referenciadas)
+        limpieza["restantes"] = len(servicio.listar_objetos("documentos"))
+        servicio._executor.shutdown()
+
+    return {
+        "archivos": n_archivos,
+        "contenidos_distintos": distintos,
+        "anterior": anterior,
+        "canal": canal,
+        "aceleracion": round(anterior["segundos"] / canal["segundos"], 1) if canal["segundos"] else None,
+        "limpieza": {k: v for k, v in limpieza.items() if k != "muestra"},
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    latencia_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 40.0
+    print(json.dumps(benchmark_subidas(n, latencia_ms=latencia_ms), indent=2))
@@ -0,0 +1,328 @@
+"""
+Perfil de sesión del alumno.
+
+La identidad del alumno (usuario → participante), sus datos personales,
+inscripciones en grupos, suscripción de clases y diplomas se resuelven una
+sola vez por login con una select embebida y se guardan en
+st.session_state como un perfil compacto. Las pestañas del área del alumno
+leen de ese perfil, así que cambiar de pestaña o hacer rerun no cuesta
+ninguna consulta de identidad. Solo se vuelve a leer una sección cuando la
+propia app la cambia (reserva, cancelación, avatar...) mediante refrescar().
+
+Las reservas de clases se leen por páginas ya formateadas para las
+tarjetas, y los enlaces a archivos de Storage (diplomas) se firman por
+lotes y se guardan en sesión con su caducidad, de modo que volver a la
+pestaña no vuelve a pedir nada a Storage mientras el enlace siga vigente.
+"""
+
+import time
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+
+from services.almacenamiento_service import ruta_desde_url
+from services.clases_service import ClasesService
+
+CLAVE_PERFIL = "perfil_alumno"
+CLAVE_ENLACES = "enlaces_alumno"
+
+PAGINA_RESERVAS = 10
+URL_FIRMADA_SEGUNDOS = 3600
+MARGEN_CADUCIDAD = 300  # segundos antes de caducar en que se vuelve a firmar
+BUCKETS_FIRMADOS = {"diplomas"}
+
+SELECT_RESERVAS = """
+    id, horario_id, fecha_clase, estado,
+    horario:clases_horarios!inner(hora_inicio, hora_fin, clase:clases!inner(nombre, categoria, color_cronograma))
+"""
+
+# Sección del perfil → fragmento de la select embebida sobre participantes
+SECCIONES_PERFIL = {
+    "datos": """
+        id, nombre, apellidos, email, telefono, nif, fecha_nacimiento, sexo, empresa_id, auth_id,
+        empresa:empresas(nombre, tipo_empresa),
+        avatar:participantes_avatars(archivo_url, created_at)
+    """,
+    "grupos": """
+        inscripciones:participantes_grupos(
+            id, fecha_asignacion,
+            grupo:grupos(
+                id, codigo_grupo, fecha_inicio, fecha_fin_prevista, fecha_fin,
+                modalidad, lugar_imparticion, horario, observaciones,
+                accion_formativa:acciones_formativas(nombre, horas)
+            )
+        )
+    """,
+    "suscripcion": """
+        suscripciones:participantes_suscripciones(
+            id, empresa_id, activa, clases_mensuales, clases_usadas_mes,
+            mes_actual, año_actual, mes_referencia, fecha_activacion
+        )
+    """,
+    "diplomas": """
+        diplomas(
+            id, archivo_nombre, url, fecha_subida,
+            grupo:grupos(codigo_grupo, accion_formativa:acciones_formativas(nombre))
+        )
+    """,
+}
+
+
+class AlumnoService:
+    def __init__(self, supabase, session_state):
+        self.supabase = supabase
+        self.session_state = session_state
+        self.user = session_state.user or {}
+
+    # =========================
+    # CARGA
+    # =========================
+
+    def _select(self, *secciones: str) -> str:
+        return ",".join(SECCIONES_PERFIL[s].strip() for s in secciones)
+
+    def _leer(self, columna: str, valor: str, *secciones: str) -> Optional[Dict[str, Any]]:
+        res = self.supabase.table("participantes").select(self._select(*secciones)) \
+            .eq(columna, valor).limit(1).execute()
+        return res.data[0] if res.data else None
+
+    def _resolver(self) -> Optional[Dict[str, Any]]:
+        """
+        Participante del usuario con todas las secciones. Primero por auth_id;
+        si no, por el email del usuario, corrigiendo el auth_id del participante.
+        """
+        user_id = self.user.get("id")
+        if not user_id:
+            return None
+        fila = self._leer("auth_id", user_id, *SECCIONES_PERFIL)
+        if fila:
+            return fila
+
+        usuario = self.supabase.table("usuarios").select("email, auth_id").eq("id", user_id).execute()
+        if not usuario.data:
+            return None
+        fila = self._leer("email", usuario.data[0]["email"], *SECCIONES_PERFIL)
+        if fila and usuario.data[0].get("auth_id") and fila.get("auth_id") != usuario.data[0]["auth_id"]:
+            self.supabase.table("participantes").update({
+                "auth_id": usuario.data[0]["auth_id"]
+            }).eq("id", fila["id"]).execute()
+        return fila
+
+    # =========================
+    # FORMATO DEL PERFIL
+    # =========================
+
+    @staticmethod
+    def _datos(fila: Dict[str, Any]) -> Dict[str, Any]:
+        empresa = fila.get("empresa") if isinstance(fila.get("empresa"), dict) else {}
+        avatar = fila.get("avatar")
+        if isinstance(avatar, list):
+            avatar = avatar[0] if avatar else None
+        datos = {k: fila.get(k) for k in ("id", "nombre", "apellidos", "email", "telefono", "nif",
+                                          "fecha_nacimiento", "sexo", "empresa_id")}
+        datos["empresa_nombre"] = empresa.get("nombre")
+        datos["empresa_tipo"] = empresa.get("tipo_empresa")
+        return {"datos": datos, "avatar": avatar or None}
+
+    @staticmethod
+    def _grupos(fila: Dict[str, Any]) -> Dict[str, Any]:
+        grupos = []
+        for relacion in fila.get("inscripciones") or []:
+            grupo = relacion.get("grupo") or {}
+            if not grupo:
+                continue
+            accion = grupo.get("accion_formativa") or {}
+            grupos.append({
+                "relacion_id": relacion.get("id"),
+                "grupo_id": grupo.get("id"),
+                "fecha_asignacion": relacion.get("fecha_asignacion"),
+                "codigo_grupo": grupo.get("codigo_grupo", ""),
+                "fecha_inicio": grupo.get("fecha_inicio"),
+                "fecha_fin_prevista": grupo.get("fecha_fin_prevista"),
+                "fecha_fin": grupo.get("fecha_fin"),
+                "modalidad": grupo.get("modalidad", ""),
+                "lugar_imparticion": grupo.get("lugar_imparticion", ""),
+                "horario": grupo.get("horario"),
+                "observaciones": grupo.get("observaciones"),
+                "accion_nombre": accion.get("nombre", ""),
+                "accion_horas": int(accion.get("horas") or 0),
+            })
+        return {"grupos": grupos}
+
+    @staticmethod
+    def _suscripcion(fila: Dict[str, Any]) -> Dict[str, Any]:
+        sus = next((s for s in fila.get("suscripciones") or [] if s.get("activa")), None)
+        if sus:
+            sus = dict(sus)
+            sus["clases_usadas_mes"] = ClasesService.uso_mes(sus)
+            sus["clases_disponibles"] = max(0, (sus.get("clases_mensuales") or 0) - sus["clases_usadas_mes"])
+        return {"suscripcion": sus}
+
+    @staticmethod
+    def _diplomas(fila: Dict[str, Any]) -> Dict[str, Any]:
+        diplomas = []
+        for diploma in fila.get("diplomas") or []:
+            grupo = diploma.get("grupo") or {}
+            accion = grupo.get("accion_formativa") or {}
+            fecha = pd.to_datetime(diploma.get("fecha_subida"), errors="coerce")
+            diplomas.append({
+                "id": diploma.get("id"),
+                "nombre": diploma.get("archivo_nombre") or "Diploma",
+                "codigo_grupo": grupo.get("codigo_grupo") or "",
+                "curso": accion.get("nombre") or "",
+                "fecha": fecha.date().isoformat() if not pd.isna(fecha) else None,
+                "fecha_display": fecha.strftime("%d/%m/%Y") if not pd.isna(fecha) else "",
+                "url": diploma.get("url"),
+            })
+        diplomas.sort(key=lambda d: d["fecha"] or "", reverse=True)
+        return {"diplomas": diplomas}
+
+    # =========================
+    # API
+    # =========================
+
+    def get_perfil(self) -> Optional[Dict[str, Any]]:
+        """
+        Perfil de la sesión; se construye en la primera llamada tras el login.
+        Devuelve None si el usuario no tiene registro de participante.
+        """
+        perfil = st.session_state.get(CLAVE_PERFIL)
+        if perfil and perfil.get("user_id") == self.user.get("id"):
+            return perfil
+
+        fila = self._resolver()
+        if not fila:
+            return None
+        perfil = {"user_id": self.user.get("id"), "participante_id": fila["id"], "cargado": time.time()}
+        for seccion in SECCIONES_PERFIL:
+            perfil.update(getattr(self, f"_{seccion}")(fila))
+        st.session_state[CLAVE_PERFIL] = perfil
+        return perfil
+
+    def refrescar(self, *secciones: str) -> Optional[Dict[str, Any]]:
+        """Vuelve a leer solo las secciones indicadas (todas si no se indica ninguna)."""
+        perfil = st.session_state.get(CLAVE_PERFIL)
+        if not perfil or not secciones:
+            st.session_state.pop(CLAVE_PERFIL, None)
+            return self.get_perfil()
+
+        fila = self._leer("id", perfil["participante_id"], *secciones)
+        if fila:
+            for seccion in secciones:
+                perfil.update(getattr(self, f"_{seccion}")(fila))
+            perfil["cargado"] = time.time()
+        return perfil
+
+    @staticmethod
+    def grupos_df(perfil: Dict[str, Any]) -> pd.DataFrame:
+        return pd.DataFrame(perfil.get("grupos") or [])
+
+    # =========================
+    # RESERVAS Y DIPLOMAS
+    # =========================
+
+    @staticmethod
+    def _reserva(fila: Dict[str, Any], hoy: date) -> Dict[str, Any]:
+        horario = fila.get("horario") or {}
+        clase = horario.get("clase") or {}
+        fecha = date.fromisoformat(str(fila["fecha_clase"])[:10])
+        inicio, fin = str(horario.get("hora_inicio") or "")[:5], str(horario.get("hora_fin") or "")[:5]
+        return {
+            "id": fila["id"],
+            "horario_id": fila["horario_id"],
+            "fecha": fecha,
+            "fecha_display": fecha.strftime("%d/%m/%Y"),
+            "hora_inicio": inicio,
+            "horario_display": f"{inicio} - {fin}",
+            "clase_nombre": clase.get("nombre") or "Sin nombre",
+            "categoria": clase.get("categoria") or "",
+            "color": clase.get("color_cronograma") or "#3498db",
+            "estado": fila.get("estado"),
+            "cancelable": fila.get("estado") == "RESERVADA" and fecha >= hoy,
+        }
+
+    def reservas(self, participante_id: str, desde: date, hasta: Optional[date] = None,
+                 pasadas: bool = False, desplazamiento: int = 0,
+                 limite: int = PAGINA_RESERVAS) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Una página de reservas activas (no canceladas) ya formateadas. Las
+        próximas van en orden cronológico desde hoy; las pasadas (historial),
+        de la más reciente a la más antigua. Devuelve (reservas, siguiente
+        desplazamiento o None si no hay más).
+        """
+        hoy = date.today()
+        query = self.supabase.table("clases_reservas").select(SELECT_RESERVAS) \
+            .eq("participante_id", participante_id).neq("estado", "CANCELADA")
+        if pasadas:
+            query = query.gte("fecha_clase", desde.isoformat()).lt("fecha_clase", hoy.isoformat())
+        else:
+            query = query.gte("fecha_clase", max(desde, hoy).isoformat())
+        if hasta:
+            query = query.lte("fecha_clase", hasta.isoformat())
+        filas = query.order("fecha_clase", desc=pasadas).order("id") \
+            .range(desplazamiento, desplazamiento + limite).execute().data or []
+
+        reservas = [self._reserva(f, hoy) for f in filas[:limite]]
+        reservas.sort(key=lambda r: (r["fecha"], r["hora_inicio"]), reverse=pasadas)
+        return reservas, (desplazamiento + limite if len(filas) > limite else None)
+
+    @staticmethod
+    def filtrar_diplomas(perfil: Dict[str, Any], nombre: str = "", desde: Optional[date] = None,
+                         curso: str = "") -> List[Dict[str, Any]]:
+        diplomas = perfil.get("diplomas") or []
+        if nombre:
+            diplomas = [d for d in diplomas if nombre.lower() in d["nombre"].lower()]
+        if desde:
+            diplomas = [d for d in diplomas if d["fecha"] and d["fecha"] >= desde.isoformat()]
+        if curso:
+            diplomas = [d for d in diplomas if curso.lower() in d["curso"].lower()]
+        return diplomas
+
+    # =========================
+    # ENLACES A STORAGE
+    # =========================
+
+    def enlaces(self, bucket: str, urls: List[Optional[str]]) -> Dict[str, str]:
+        """
+        {url guardada: url a servir}. En BUCKETS_FIRMADOS se firman de una vez
+        todas las rutas que no tengan ya un enlace vigente en sesión; si la
+        firma falla se sirve la URL guardada sin guardarla en sesión, para
+        volver a intentarlo en el siguiente pintado. El resto se sirve tal cual.
+        """
+        urls = [u for u in dict.fromkeys(urls) if u]
+        if bucket not in BUCKETS_FIRMADOS:
+            return {u: u for u in urls}
+
+        cache = st.session_state.setdefault(CLAVE_ENLACES, {})
+        ahora = time.time()
+        pendientes = {}
+        for url in urls:
+            vigente = cache.get((bucket, url))
+            if vigente and vigente[1] - MARGEN_CADUCIDAD > ahora:
+                continue
+            ruta = ruta_desde_url(url, bucket)
+            if ruta:
+                pendientes[ruta] = url
+            else:
+                cache[(bucket, url)] = (url, float("inf"))
+
+        if pendientes:
+            caduca = ahora + URL_FIRMADA_SEGUNDOS
+            try:
+                firmadas = self.supabase.storage.from_(bucket).create_signed_urls(
+                    list(pendientes), URL_FIRMADA_SEGUNDOS)
+                firmadas = {f["path"]: f.get("signedURL") for f in firmadas if not f.get("error")}
+            except Exception as e:
+                st.error(f"Error al firmar enlaces de {bucket}: {e}")
+                firmadas = {}
+            for ruta, url in pendientes.items():
+                if firmadas.get(ruta):
+                    cache[(bucket, url)] = (firmadas[ruta], caduca)
+
+        return {u: cache[(bucket, u)][0] if (bucket, u) in cache else u for u in urls}
+
+
+def get_alumno_service(supabase, session_state) -> AlumnoService:
+    return AlumnoService(supabase, session_state)
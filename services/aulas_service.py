@@ -3,6 +3,7 @@ import pandas as pd
 from datetime import datetime, timedelta, date
 from typing import Dict, List, Optional, Tuple, Any
 import uuid
+from utils import log_accion
 
 class AulasService:
     def __init__(self, supabase, session_state):
@@ -21,6 +22,7 @@ class AulasService:
             self.get_aulas_con_empresa.clear()
             self.get_estadisticas_aulas.clear()
             self.get_ocupacion_por_aula.clear()
+            self.get_timeline_aulas.clear()
             st.cache_data.clear()
         except:
             pass
@@ -407,6 +409,10 @@ class AulasService:
             result = self.supabase.table("aula_reservas").insert(datos_reserva).execute()
             
             if result.data:
+                self.get_timeline_aulas.clear()
+                log_accion("reserva_aula_creada", self.session_state.user.get("id"), {
+                    "reserva_id": reserva_id, "aula_id": datos_reserva["aula_id"]
+                })
                 return True, reserva_id
             
             return False, None
@@ -499,6 +505,7 @@ class AulasService:
             ).eq("id", reserva_id).execute()
             
             if result.data:
+                self.get_timeline_aulas.clear()
                 return True, result.data[0]  # devolvemos la reserva actualizada
             return False, None
             
@@ -510,6 +517,8 @@ class AulasService:
         """Elimina una reserva"""
         try:
             result = self.supabase.table("aula_reservas").delete().eq("id", reserva_id).execute()
+            if result.data:
+                self.get_timeline_aulas.clear()
             return bool(result.data)
         except Exception as e:
             return False
@@ -562,6 +571,8 @@ class AulasService:
                 datos_actualizacion
             ).eq("id", reserva_id).execute()
             
+            if result.data:
+                self.get_timeline_aulas.clear()
             return bool(result.data)
             
         except Exception as e:
@@ -1032,27 +1043,34 @@ class AulasService:
     # FUNCIONES PARA CRONOGRAMA
     # =========================
     
+    def _get_reservas_cronograma(self, fecha_inicio: str, fecha_fin: str,
+                                 aulas_ids: Optional[List[str]] = None,
+                                 empresas_gestionadas: Optional[List[str]] = None) -> List[Dict]:
+        """Reservas manuales del periodo con su aula y grupo (una sola consulta)"""
+        query = self.supabase.table("aula_reservas").select("""
+            id, titulo, fecha_inicio, fecha_fin, tipo_reserva, estado,
+            aulas!inner(id, nombre, color_cronograma, empresa_id),
+            grupos(codigo_grupo)
+        """).gte("fecha_inicio", fecha_inicio).lte("fecha_fin", fecha_fin)
+        
+        if aulas_ids:
+            query = query.in_("aula_id", aulas_ids)
+        
+        if self.role == "gestor" and self.empresa_id:
+            if empresas_gestionadas is None:
+                empresas_gestionadas = self._get_empresas_gestionadas()
+            query = query.in_("aulas.empresa_id", empresas_gestionadas)
+        
+        return query.execute().data or []
+
     def get_eventos_cronograma(self, fecha_inicio: str, fecha_fin: str, 
                              aulas_ids: Optional[List[str]] = None) -> List[Dict]:
         """Obtiene eventos para el componente de cronograma"""
         try:
-            query = self.supabase.table("aula_reservas").select("""
-                id, titulo, fecha_inicio, fecha_fin, tipo_reserva, estado,
-                aulas!inner(id, nombre, color_cronograma, empresa_id),
-                grupos(codigo_grupo)
-            """).gte("fecha_inicio", fecha_inicio).lte("fecha_fin", fecha_fin)
-            
-            if aulas_ids:
-                query = query.in_("aula_id", aulas_ids)
-            
-            if self.role == "gestor" and self.empresa_id:
-                empresas_gestionadas = self._get_empresas_gestionadas()
-                query = query.in_("aulas.empresa_id", empresas_gestionadas)
-            
-            result = query.execute()
+            reservas = self._get_reservas_cronograma(fecha_inicio, fecha_fin, aulas_ids)
             
             eventos = []
-            for reserva in result.data or []:
+            for reserva in reservas:
                 aula = reserva["aulas"]
                 grupo = reserva.get("grupos")
                 
@@ -1092,6 +1110,148 @@ class AulasService:
         }
         return colores_tipo.get(tipo_reserva, color_aula or '#6c757d')
 
+    # =========================
+    # TIMELINE UNIFICADO (RESERVAS + CLASES)
+    # =========================
+
+    COLUMNAS_TIMELINE = [
+        "id", "aula_id", "aula_nombre", "tipo", "titulo", "inicio", "fin", "fecha",
+        "tipo_reserva", "estado", "grupo_codigo", "clase_id", "capacidad", "color"
+    ]
+    COLOR_CLASE = "#8B5CF6"
+
+    def _get_horarios_con_aula(self, empresas_gestionadas: Optional[List[str]] = None) -> pd.DataFrame:
+        """Horarios recurrentes de clases que tienen aula asignada"""
+        query = self.supabase.table("clases_horarios").select("""
+            id, dia_semana, hora_inicio, hora_fin, capacidad_maxima, clase_id, aula_id,
+            clases!inner(nombre, empresa_id),
+            aulas(nombre)
+        """).not_.is_("aula_id", "null")
+        
+        if self.role == "gestor" and self.empresa_id:
+            if not empresas_gestionadas:
+                return pd.DataFrame()
+            query = query.in_("clases.empresa_id", empresas_gestionadas)
+        
+        result = query.execute()
+        return pd.DataFrame([{
+            "horario_id": h["id"],
+            "dia_semana": int(h["dia_semana"]),
+            "hora_inicio": h["hora_inicio"],
+            "hora_fin": h["hora_fin"],
+            "capacidad": h.get("capacidad_maxima"),
+            "clase_id": h["clase_id"],
+            "aula_id": h["aula_id"],
+            "titulo": (h.get("clases") or {}).get("nombre", ""),
+            "aula_nombre": (h.get("aulas") or {}).get("nombre") or "Aula no especificada",
+        } for h in result.data or []])
+
+    @staticmethod
+    def _hora_a_timedelta(horas: pd.Series) -> pd.Series:
+        """'HH:MM' o 'HH:MM:SS' -> Timedelta (vectorizado)"""
+        horas = horas.astype(str).str.slice(0, 8)
+        horas = horas.where(horas.str.len() == 8, horas + ":00")
+        return pd.to_timedelta(horas, errors="coerce")
+
+    @classmethod
+    def expandir_horarios(cls, df_horarios: pd.DataFrame, fecha_inicio: date, fecha_fin: date) -> pd.DataFrame:
+        """
+        Expande los horarios semanales a ocurrencias concretas del rango
+        cruzando cada horario con los días del periodo que caen en su día de la semana.
+        """
+        if df_horarios.empty:
+            return pd.DataFrame(columns=cls.COLUMNAS_TIMELINE)
+        
+        dias = pd.DataFrame({"dia": pd.date_range(fecha_inicio, fecha_fin, freq="D")})
+        dias["dia_semana"] = dias["dia"].dt.weekday
+        
+        df = df_horarios.merge(dias, on="dia_semana", how="inner")
+        if df.empty:
+            return pd.DataFrame(columns=cls.COLUMNAS_TIMELINE)
+        
+        df["inicio"] = df["dia"] + cls._hora_a_timedelta(df["hora_inicio"])
+        df["fin"] = df["dia"] + cls._hora_a_timedelta(df["hora_fin"])
+        df["id"] = "clase_" + df["horario_id"].astype(str) + "_" + df["dia"].dt.strftime("%Y-%m-%d")
+        df["tipo"] = "CLASE"
+        df["tipo_reserva"] = ""
+        df["estado"] = ""
+        df["grupo_codigo"] = None
+        df["color"] = cls.COLOR_CLASE
+        return df.reindex(columns=cls.COLUMNAS_TIMELINE)
+
+    def _reservas_a_timeline(self, reservas: List[Dict]) -> pd.DataFrame:
+        """Reservas manuales -> filas del timeline"""
+        if not reservas:
+            return pd.DataFrame(columns=self.COLUMNAS_TIMELINE)
+        
+        df = pd.DataFrame([{
+            "id": r["id"],
+            "aula_id": r["aulas"]["id"],
+            "aula_nombre": r["aulas"]["nombre"],
+            "tipo": "RESERVA",
+            "titulo": r.get("titulo") or "",
+            "inicio": r["fecha_inicio"],
+            "fin": r["fecha_fin"],
+            "tipo_reserva": r.get("tipo_reserva") or "",
+            "estado": r.get("estado") or "",
+            "grupo_codigo": (r.get("grupos") or {}).get("codigo_grupo"),
+            "clase_id": None,
+            "capacidad": None,
+            "color": self._get_color_evento(r.get("tipo_reserva"), r["aulas"].get("color_cronograma")),
+        } for r in reservas])
+        
+        # Las reservas llegan en UTC; se guardan sin zona para poder ordenarlas junto a las clases
+        for columna in ("inicio", "fin"):
+            df[columna] = pd.to_datetime(df[columna], utc=True, errors="coerce").dt.tz_convert(None)
+        return df.reindex(columns=self.COLUMNAS_TIMELINE)
+
+    @st.cache_data(ttl=300, show_spinner=False)
+    def get_timeline_aulas(_self, rol: str, empresa_id: Optional[str],
+                           fecha_inicio: date, fecha_fin: date) -> pd.DataFrame:
+        """
+        Timeline de ocupación de aulas para un rango: reservas manuales y clases
+        recurrentes ya expandidas, en un único DataFrame ordenado por aula e inicio.
+        Cacheado por (rol, empresa, rango); usar get_timeline().
+        """
+        try:
+            empresas_gestionadas = _self._get_empresas_gestionadas() if rol == "gestor" else None
+            
+            reservas = _self._reservas_a_timeline(_self._get_reservas_cronograma(
+                fecha_inicio.isoformat() + "T00:00:00Z",
+                fecha_fin.isoformat() + "T23:59:59Z",
+                empresas_gestionadas=empresas_gestionadas
+            ))
+            clases = _self.expandir_horarios(
+                _self._get_horarios_con_aula(empresas_gestionadas), fecha_inicio, fecha_fin
+            )
+            
+            partes = [df for df in (reservas, clases) if not df.empty]
+            if not partes:
+                return pd.DataFrame(columns=_self.COLUMNAS_TIMELINE)
+            
+            timeline = pd.concat(partes, ignore_index=True)
+            timeline = timeline.dropna(subset=["inicio", "fin"])
+            timeline["fecha"] = timeline["inicio"].dt.date
+            return timeline.sort_values(["aula_nombre", "inicio"], kind="stable").reset_index(drop=True)
+        
+        except Exception as e:
+            print(f"Error construyendo timeline de aulas: {e}")
+            return pd.DataFrame(columns=_self.COLUMNAS_TIMELINE)
+
+    def get_timeline(self, fecha_inicio: date, fecha_fin: date) -> pd.DataFrame:
+        """Timeline de aulas del usuario actual para el rango indicado"""
+        return self.get_timeline_aulas(self.role, self.empresa_id, fecha_inicio, fecha_fin)
+
+    @staticmethod
+    def rejilla_timeline(timeline: pd.DataFrame) -> Dict[Tuple[str, date], List[Dict]]:
+        """Índice {(aula_nombre, fecha): [eventos ordenados]} para las vistas por aula y día"""
+        if timeline.empty:
+            return {}
+        return {
+            clave: grupo.to_dict("records")
+            for clave, grupo in timeline.groupby(["aula_nombre", "fecha"], sort=False)
+        }
+
     # =========================
     # INTEGRACIÓN CON GRUPOS
     # =========================
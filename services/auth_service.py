@@ -1,9 +1,36 @@
 import streamlit as st
 from datetime import datetime
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, Optional, Set, Tuple
+from services.plataforma_service import registrar_alta, registrar_baja
+from services.usuarios_service import get_directorio_usuarios
 import re
 import secrets
 import string
+import threading
+
+# Columnas de timestamp conocidas, para tablas aún vacías
+SCHEMAS_CONOCIDOS = {
+    "usuarios": {"created_at": True, "updated_at": False},
+    "participantes": {"created_at": True, "updated_at": True},
+    "tutores": {"created_at": True, "updated_at": True},
+}
+
+_COLUMNAS_TABLA: Dict[str, Set[str]] = {}
+_columnas_lock = threading.Lock()
+
+
+def _columnas_tabla(supabase, tabla: str) -> Optional[Set[str]]:
+    """Columnas de una tabla, leídas de una fila cualquiera y cacheadas por proceso."""
+    with _columnas_lock:
+        if tabla not in _COLUMNAS_TABLA:
+            try:
+                res = supabase.table(tabla).select("*").limit(1).execute()
+            except Exception:
+                return None
+            if not res.data:
+                return None
+            _COLUMNAS_TABLA[tabla] = set(res.data[0])
+        return _COLUMNAS_TABLA[tabla]
 
 
 class AuthService:
@@ -62,22 +89,11 @@ class AuthService:
         return {}
 
     def _get_schema_fields(self, tabla: str) -> Dict[str, bool]:
-        """Define qué campos existen en cada tabla."""
-        schemas = {
-            "usuarios": {
-                "created_at": True,
-                "updated_at": False  # ❌ usuarios NO tiene updated_at
-            },
-            "participantes": {
-                "created_at": True,
-                "updated_at": True   # ✅ participantes SÍ tiene updated_at
-            },
-            "tutores": {
-                "created_at": True,
-                "updated_at": True   # ✅ tutores SÍ tiene updated_at  
-            }
-        }
-        return schemas.get(tabla, {"created_at": True, "updated_at": True})
+        """Qué columnas de timestamp tiene cada tabla (consultado una vez por proceso)."""
+        columnas = _columnas_tabla(self.supabase, tabla)
+        if columnas:
+            return {"created_at": "created_at" in columnas, "updated_at": "updated_at" in columnas}
+        return SCHEMAS_CONOCIDOS.get(tabla, {"created_at": True, "updated_at": True})
 
     # =========================
     # CREAR USUARIO
@@ -154,6 +170,9 @@ class AuthService:
             
             if res.data and len(res.data) > 0:
                 registro_id = res.data[0]["id"]
+                registrar_alta(tabla)
+                if tabla == "usuarios":
+                    get_directorio_usuarios().registrar_alta(res.data[0])
                 st.write(f"✅ Usuario insertado correctamente con ID: {registro_id}")
                 
                 if password != datos.get("password"):
@@ -287,6 +306,8 @@ class AuthService:
                 .execute()
             )
             
+            if res.data and tabla == "usuarios":
+                get_directorio_usuarios().registrar_cambio(registro_id, res.data[0])
             return bool(res.data)
             
         except Exception as e:
@@ -317,6 +338,10 @@ class AuthService:
             # 2. Eliminar en tabla primero
             st.write(f"🗑️ Eliminando de tabla {tabla} registro ID: {registro_id}")
             delete_res = self.supabase.table(tabla).delete().eq("id", registro_id).execute()
+            if delete_res.data:
+                registrar_baja(tabla)
+                if tabla == "usuarios":
+                    get_directorio_usuarios().registrar_baja(registro_id)
             st.write(f"📥 Resultado eliminación tabla: {delete_res.data}")
 
             # 3. Eliminar en Auth si tenemos auth_id
@@ -0,0 +1,172 @@
+"""
+Pipeline de avatares de participantes.
+
+- En la subida se generan variantes pequeñas (32, 64 y 150 px) en WebP
+  (o JPEG si Pillow no soporta WebP) que se guardan junto al original.
+- Las miniaturas se descargan y cachean en servidor, de modo que los
+  navegadores no piden cada avatar por separado.
+- Para las listas de reservas se compone una única "tira" de avatares por
+  clase como data-URI; la clave de cache incluye las URLs de los avatares,
+  así que cualquier alta o baja de reserva genera una tira nueva.
+"""
+
+import base64
+import io
+import re
+from typing import Dict, List, Optional, Tuple
+
+import requests
+import streamlit as st
+
+TAMANOS_AVATAR = (32, 64, 150)
+TAMANO_PRINCIPAL = 150
+TAMANO_TIRA = 32
+MAX_AVATARES_TIRA = 8
+
+_PATRON_VARIANTE = re.compile(r"_px(\d+)\.(webp|jpg|jpeg)$", re.IGNORECASE)
+
+
+def _formato_salida() -> Tuple[str, str, str]:
+    """Devuelve (formato PIL, extensión, mime) según soporte WebP de Pillow."""
+    from PIL import features
+
+    if features.check("webp"):
+        return "WEBP", "webp", "image/webp"
+    return "JPEG", "jpg", "image/jpeg"
+
+
+def _recortar_cuadrado(image):
+    """Recorta la imagen al cuadrado central para no deformarla al redimensionar."""
+    ancho, alto = image.size
+    lado = min(ancho, alto)
+    izquierda = (ancho - lado) // 2
+    arriba = (alto - lado) // 2
+    return image.crop((izquierda, arriba, izquierda + lado, arriba + lado))
+
+
+def generar_variantes_avatar(file_bytes: bytes) -> Tuple[Dict[int, bytes], str, str]:
+    """
+    Genera las variantes de tamaño del avatar.
+
+    Returns:
+        (variantes {tamaño: bytes}, extensión, mime)
+    """
+    from PIL import Image, ImageOps
+
+    formato, extension, mime = _formato_salida()
+
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(file_bytes)))
+    image = _recortar_cuadrado(image)
+    image = image.convert("RGBA" if formato == "WEBP" else "RGB")
+
+    variantes = {}
+    for tamano in TAMANOS_AVATAR:
+        output = io.BytesIO()
+        image.resize((tamano, tamano), Image.Resampling.LANCZOS).save(output, format=formato, quality=85)
+        variantes[tamano] = output.getvalue()
+
+    return variantes, extension, mime
+
+
+def nombre_variante(nombre_base: str, tamano: int, extension: str) -> str:
+    """Nombre en storage de una variante: avatar_<id>_<ts>_px<tamaño>.<ext>"""
+    return f"{nombre_base}_px{tamano}.{extension}"
+
+
+def url_variante_avatar(archivo_url: Optional[str], tamano: int) -> Optional[str]:
+    """
+    Devuelve la URL de la variante pedida a partir de la URL principal.
+    Los avatares antiguos (sin variantes) devuelven la URL original.
+    """
+    if not archivo_url:
+        return archivo_url
+    base_url = archivo_url.split("?")[0]
+    if _PATRON_VARIANTE.search(base_url):
+        return _PATRON_VARIANTE.sub(lambda m: f"_px{tamano}.{m.group(2)}", base_url)
+    return archivo_url
+
+
+def base_avatar(ruta: str) -> str:
+    """Ruta sin el sufijo de variante: común a todas las variantes de un mismo avatar."""
+    return _PATRON_VARIANTE.sub("", ruta.split("?")[0])
+
+
+def nombres_archivos_avatar(archivo_url: str) -> List[str]:
+    """Nombres en storage de todas las variantes de un avatar (o el archivo antiguo)."""
+    nombre = archivo_url.split("?")[0].split("/")[-1]
+    coincidencia = _PATRON_VARIANTE.search(nombre)
+    if not coincidencia:
+        return [nombre]
+    base = nombre[:coincidencia.start()]
+    return [nombre_variante(base, t, coincidencia.group(2)) for t in TAMANOS_AVATAR]
+
+
+@st.cache_data(ttl=3600, max_entries=5000, show_spinner=False)
+def get_miniatura_avatar(archivo_url: str, tamano: int = TAMANO_TIRA) -> Optional[bytes]:
+    """
+    Descarga (una sola vez por proceso) la variante pequeña de un avatar
+    y la normaliza a tamano×tamano. Cache compartida entre sesiones.
+    """
+    from PIL import Image
+
+    try:
+        respuesta = requests.get(url_variante_avatar(archivo_url, tamano), timeout=5)
+        if respuesta.status_code != 200:
+            respuesta = requests.get(archivo_url, timeout=5)
+        respuesta.raise_for_status()
+
+        image = _recortar_cuadrado(Image.open(io.BytesIO(respuesta.content)).convert("RGBA"))
+        if image.size != (tamano, tamano):
+            image = image.resize((tamano, tamano), Image.Resampling.LANCZOS)
+
+        output = io.BytesIO()
+        image.save(output, format="PNG")
+        return output.getvalue()
+    except Exception:
+        return None
+
+
+@st.cache_data(ttl=3600, max_entries=2000, show_spinner=False)
+def get_tira_avatares(urls: Tuple[str, ...], tamano: int = TAMANO_TIRA,
+                      maximo: int = MAX_AVATARES_TIRA) -> Optional[str]:
+    """
+    Compone en una sola imagen los avatares (recortados en círculo) de una
+    clase y la devuelve como data-URI. La tupla de URLs forma parte de la
+    clave de cache: si cambian las reservas, cambia la tira.
+    """
+    from PIL import Image, ImageDraw
+
+    miniaturas = [m for m in (get_miniatura_avatar(u, tamano) for u in urls[:maximo]) if m]
+    if not miniaturas:
+        return None
+
+    separacion = 4
+    tira = Image.new("RGBA", (len(miniaturas) * (tamano + separacion) - separacion, tamano), (0, 0, 0, 0))
+
+    mascara = Image.new("L", (tamano, tamano), 0)
+    ImageDraw.Draw(mascara).ellipse((0, 0, tamano - 1, tamano - 1), fill=255)
+
+    for i, miniatura in enumerate(miniaturas):
+        image = Image.open(io.BytesIO(miniatura)).convert("RGBA")
+        tira.paste(image, (i * (tamano + separacion), 0), mascara)
+
+    # La tira necesita transparencia: WebP sin pérdida o, en su defecto, PNG
+    output = io.BytesIO()
+    if _formato_salida()[0] == "WEBP":
+        tira.save(output, format="WEBP", lossless=True)
+        mime = "image/webp"
+    else:
+        tira.save(output, format="PNG")
+        mime = "image/png"
+    return f"data:{mime};base64,{base64.b64encode(output.getvalue()).decode()}"
+
+
+def html_tira_avatares(urls: List[str], maximo: int = MAX_AVATARES_TIRA) -> str:
+    """HTML de una tira de avatares (una sola <img> inline) con el contador de restantes."""
+    urls_validas = tuple(u for u in urls if u)
+    data_uri = get_tira_avatares(urls_validas, TAMANO_TIRA, maximo) if urls_validas else None
+
+    html = f'<img src="{data_uri}" style="height:{TAMANO_TIRA}px;" />' if data_uri else ""
+    if len(urls_validas) > maximo:
+        html += f'<span style="margin-left:8px; color:#666;">+{len(urls_validas) - maximo} más</span>'
+    return html
@@ -0,0 +1,189 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+from datetime import date
+from typing import Dict, Optional, Any
+
+
+class CalidadService:
+    """Servicio de indicadores ISO 9001 compartido por dashboard, indicadores e informe de auditoría"""
+
+    # Columnas proyectadas por tabla (evita select("*"))
+    COLUMNAS = {
+        "no_conformidades": "id, descripcion, responsable, estado, acciones, fecha_detectada, fecha_cierre, empresa_id",
+        "acciones_correctivas": "id, no_conformidad_id, descripcion, responsable, estado, seguimiento, fecha_inicio, empresa_id",
+        "auditorias": "id, tipo, estado, fecha, auditor, descripcion, hallazgos, no_conformidad_id, empresa_id",
+        "objetivos_calidad": "id, nombre, meta, responsable, fuente_datos, frecuencia, ano, empresa_id",
+        "seguimiento_objetivos": "id, objetivo_id, valor_real, fecha, observaciones, empresa_id",
+    }
+
+    # Campo de fecha sobre el que se aplica el periodo
+    CAMPOS_FECHA = {
+        "no_conformidades": "fecha_detectada",
+        "acciones_correctivas": "fecha_inicio",
+        "auditorias": "fecha",
+    }
+
+    def __init__(self, supabase, session_state):
+        self.supabase = supabase
+        self.session_state = session_state
+        self.role = session_state.role
+        self.empresa_id = session_state.user.get("empresa_id") if hasattr(session_state, 'user') and session_state.user else None
+
+    # =========================
+    # GESTIÓN DE CACHE
+    # =========================
+
+    def limpiar_cache_calidad(self):
+        """Limpia el cache de indicadores de calidad"""
+        try:
+            if hasattr(self.get_datos_calidad, 'clear'):
+                self.get_datos_calidad.clear()
+        except:
+            pass
+
+    def get_empresa_filtro(self) -> Optional[str]:
+        """Empresa a la que se restringen los datos según rol (None = global para admin)"""
+        if self.role == "gestor":
+            return self.empresa_id
+        return None
+
+    # =========================
+    # CARGA DE DATOS
+    # =========================
+
+    def _cargar_tabla(self, tabla: str, empresa_id: Optional[str],
+                      fecha_inicio: Optional[date], fecha_fin: Optional[date]) -> pd.DataFrame:
+        """Carga una tabla de calidad con columnas proyectadas y filtro de periodo en servidor"""
+        query = self.supabase.table(tabla).select(self.COLUMNAS[tabla])
+
+        if empresa_id:
+            query = query.eq("empresa_id", empresa_id)
+
+        campo_fecha = self.CAMPOS_FECHA.get(tabla)
+        if campo_fecha:
+            if fecha_inicio:
+                query = query.gte(campo_fecha, fecha_inicio.isoformat())
+            if fecha_fin:
+                query = query.lte(campo_fecha, fecha_fin.isoformat())
+
+        df = pd.DataFrame(query.execute().data or [])
+        if df.empty:
+            return pd.DataFrame(columns=[c.strip() for c in self.COLUMNAS[tabla].split(",")])
+
+        for col in ["fecha_detectada", "fecha_cierre", "fecha_inicio", "fecha"]:
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col], errors="coerce")
+        return df
+
+    @st.cache_data(ttl=300)
+    def get_datos_calidad(_self, empresa_id: Optional[str],
+                          fecha_inicio: Optional[date] = None,
+                          fecha_fin: Optional[date] = None) -> Dict[str, Any]:
+        """
+        Carga las cinco tablas de calidad y calcula todos los KPIs en una sola pasada.
+        Cacheado por (empresa, periodo): las tres vistas ISO comparten el mismo resultado.
+        """
+        try:
+            df_nc = _self._cargar_tabla("no_conformidades", empresa_id, fecha_inicio, fecha_fin)
+            df_ac = _self._cargar_tabla("acciones_correctivas", empresa_id, fecha_inicio, fecha_fin)
+            df_aud = _self._cargar_tabla("auditorias", empresa_id, fecha_inicio, fecha_fin)
+            df_obj = _self._cargar_tabla("objetivos_calidad", empresa_id, None, None)
+            df_seg = _self._cargar_tabla("seguimiento_objetivos", empresa_id, None, None)
+        except Exception as e:
+            st.error(f"❌ Error al cargar datos de calidad: {e}")
+            vacio = pd.DataFrame()
+            df_nc = df_ac = df_aud = df_obj = df_seg = vacio
+
+        return {
+            "nc": df_nc,
+            "ac": df_ac,
+            "aud": df_aud,
+            "obj": df_obj,
+            "seg": df_seg,
+            "kpis": _self.calcular_kpis(df_nc, df_ac, df_aud),
+            "objetivos": _self.calcular_estado_objetivos(df_obj, df_seg),
+        }
+
+    # =========================
+    # CÁLCULO DE KPIs
+    # =========================
+
+    @staticmethod
+    def calcular_kpis(df_nc: pd.DataFrame, df_ac: pd.DataFrame, df_aud: pd.DataFrame) -> Dict[str, Any]:
+        """Calcula los KPIs de NC, AC y auditorías con value_counts (sin filtrados repetidos)"""
+        nc_estados = df_nc["estado"].value_counts() if "estado" in df_nc.columns else pd.Series(dtype=int)
+        ac_estados = df_ac["estado"].value_counts() if "estado" in df_ac.columns else pd.Series(dtype=int)
+        aud_estados = df_aud["estado"].value_counts() if "estado" in df_aud.columns else pd.Series(dtype=int)
+
+        tiempo_medio = None
+        if {"fecha_detectada", "fecha_cierre"}.issubset(df_nc.columns) and not df_nc.empty:
+            dias = (df_nc["fecha_cierre"] - df_nc["fecha_detectada"]).dt.days
+            media = dias.mean(skipna=True)
+            tiempo_medio = float(media) if pd.notnull(media) else None
+
+        total_aud = len(df_aud)
+        aud_cerradas = int(aud_estados.get("Cerrada", 0))
+
+        return {
+            "nc_abiertas": int(nc_estados.get("Abierta", 0)),
+            "nc_cerradas": int(nc_estados.get("Cerrada", 0)),
+            "nc_en_curso": int(nc_estados.get("En curso", 0)),
+            "ac_cerradas": int(ac_estados.get("Cerrada", 0)),
+            "auditorias_total": total_aud,
+            "auditorias_cerradas": aud_cerradas,
+            "cumplimiento_auditorias": (aud_cerradas / total_aud * 100) if total_aud > 0 else 0,
+            "tiempo_medio_resolucion": tiempo_medio,
+            "nc_por_estado": nc_estados,
+            "ac_por_estado": ac_estados,
+            "aud_por_tipo": df_aud["tipo"].value_counts() if "tipo" in df_aud.columns else pd.Series(dtype=int),
+        }
+
+    @staticmethod
+    def calcular_estado_objetivos(df_obj: pd.DataFrame, df_seg: pd.DataFrame) -> pd.DataFrame:
+        """
+        Último seguimiento por objetivo (una pasada ordenada, sin bucles) y semáforo respecto a la meta.
+        Devuelve una fila por objetivo con ultimo_valor, ultima_fecha y semaforo.
+        """
+        if df_obj.empty:
+            return pd.DataFrame(columns=["id", "nombre", "meta", "responsable",
+                                         "ultimo_valor", "ultima_fecha", "semaforo"])
+
+        df = df_obj.copy()
+
+        if not df_seg.empty and "objetivo_id" in df_seg.columns:
+            ultimos = (
+                df_seg.sort_values("fecha")
+                .drop_duplicates("objetivo_id", keep="last")[["objetivo_id", "valor_real", "fecha"]]
+                .rename(columns={"objetivo_id": "id", "valor_real": "ultimo_valor", "fecha": "ultima_fecha"})
+            )
+            df = df.merge(ultimos, on="id", how="left")
+        else:
+            df["ultimo_valor"] = np.nan
+            df["ultima_fecha"] = pd.NaT
+
+        meta = df["meta"].fillna("").astype(str)
+        meta_num = pd.to_numeric(meta.str.replace(r"[^0-9.]", "", regex=True), errors="coerce")
+        valor = pd.to_numeric(df["ultimo_valor"], errors="coerce")
+        es_porcentaje = meta.str.contains("%", regex=False)
+
+        por_debajo = es_porcentaje & (valor < meta_num)
+        por_encima = ~es_porcentaje & (valor > meta_num)
+
+        df["semaforo"] = np.select(
+            [
+                df["ultimo_valor"].isna(),
+                por_debajo & (valor < meta_num * 0.9),
+                por_debajo,
+                por_encima & (valor > meta_num * 1.1),
+                por_encima,
+            ],
+            ["⚪", "🔴", "🟡", "🔴", "🟡"],
+            default="🟢",
+        )
+        return df
+
+
+def get_calidad_service(supabase, session_state) -> CalidadService:
+    """Factory function para obtener instancia del servicio de calidad"""
+    return CalidadService(supabase, session_state)
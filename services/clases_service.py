@@ -4,6 +4,8 @@ from datetime import datetime, timedelta, date, time
 from typing import Dict, List, Optional, Tuple, Any
 import uuid
 import json
+import re
+from utils import log_accion
 
 class ClasesService:
     def __init__(self, supabase, session_state):
@@ -26,6 +28,8 @@ class ClasesService:
                 self.get_horarios_con_clase.clear()
             if hasattr(self.get_estadisticas_clases, 'clear'):
                 self.get_estadisticas_clases.clear()
+            if hasattr(self.get_avatares_reservas_rango, 'clear'):
+                self.get_avatares_reservas_rango.clear()
             st.cache_data.clear()
         except:
             pass
@@ -323,6 +327,42 @@ class ClasesService:
         except Exception as e:
             print(f"Error get_avatares_reserva: {e}")
             return []
+
+    @st.cache_data(ttl=120)
+    def get_avatares_reservas_rango(_self, horario_ids: Tuple[str, ...], fecha_inicio: date, fecha_fin: date) -> Dict[Tuple[str, str], List[str]]:
+        """
+        Avatares de todas las reservas activas de varios horarios en un rango de fechas,
+        en una sola consulta. Devuelve {(horario_id, fecha_iso): [archivo_url, ...]}.
+        """
+        if not horario_ids:
+            return {}
+        try:
+            result = (
+                _self.supabase.table("clases_reservas")
+                .select("""
+                    horario_id, fecha_clase,
+                    participante:participantes!inner(
+                        participantes_avatars(archivo_url)
+                    )
+                """)
+                .in_("horario_id", list(horario_ids))
+                .gte("fecha_clase", fecha_inicio.isoformat())
+                .lte("fecha_clase", fecha_fin.isoformat())
+                .neq("estado", "CANCELADA")
+                .execute()
+            )
+
+            avatares = {}
+            for r in result.data or []:
+                clave = (r["horario_id"], str(r["fecha_clase"])[:10])
+                urls = avatares.setdefault(clave, [])
+                for avatar in (r.get("participante") or {}).get("participantes_avatars", []) or []:
+                    if avatar.get("archivo_url"):
+                        urls.append(avatar["archivo_url"])
+            return avatares
+        except Exception as e:
+            print(f"Error get_avatares_reservas_rango: {e}")
+            return {}
             
     # =========================
     # GESTIÓN DE HORARIOS
@@ -610,6 +650,10 @@ class ClasesService:
             if result.data:
                 # Incrementar contador mensual
                 self._incrementar_contador_mensual(participante_id)
+                self.get_avatares_reservas_rango.clear()
+                log_accion("reserva_clase_creada", self.user_id, {
+                    "reserva_id": reserva_id, "participante_id": participante_id, "horario_id": horario_id
+                })
                 return True, reserva_id
             
             return False, None
@@ -637,6 +681,7 @@ class ClasesService:
             if result.data:
                 # Decrementar contador mensual
                 self._decrementar_contador_mensual(participante_id)
+                self.get_avatares_reservas_rango.clear()
                 return True
                 
             return False
@@ -702,56 +747,243 @@ class ClasesService:
 
     def activar_suscripcion(self, participante_id: str, empresa_id: str, clases_mensuales: int) -> bool:
         """Activa suscripción de un participante"""
+        resultado = self.activar_suscripciones_masivo(
+            [{"id": participante_id, "empresa_id": empresa_id}], clases_mensuales
+        )
+        return resultado.get(participante_id) == "activada"
+
+    def actualizar_suscripcion(self, participante_id: str, clases_mensuales: int) -> bool:
+        """Cambia las clases mensuales de la suscripción activa de un participante"""
+        resultado = self.actualizar_suscripciones_masivo([participante_id], clases_mensuales)
+        return resultado.get(participante_id) == "actualizada"
+
+    def desactivar_suscripcion(self, participante_id: str, empresa_id: Optional[str] = None) -> bool:
+        """Desactiva suscripción de un participante"""
+        resultado = self.desactivar_suscripciones_masivo([participante_id], empresa_id)
+        return resultado.get(participante_id) == "desactivada"
+
+    # =========================
+    # ROSTER Y OPERACIONES EN BLOQUE
+    # =========================
+
+    LOTE_SUSCRIPCIONES = 200  # participantes por sentencia (filtro `in` / inserción)
+
+    SELECT_ROSTER = (
+        "id, nombre, apellidos, email, empresa_id, "
+        "empresa:empresas{empresa}(nombre), "
+        "suscripcion:participantes_suscripciones{suscripcion}(id, activa, clases_mensuales, "
+        "clases_usadas_mes, mes_actual, año_actual, mes_referencia, fecha_activacion)"
+    )
+
+    COLUMNAS_ROSTER = ["id", "nombre", "email", "empresa_id", "empresa_nombre", "suscripcion_id",
+                       "suscripcion_activa", "estado", "clases_mensuales", "clases_usadas", "disponibles"]
+
+    def _consulta_roster(self, estado: str = "Todos", busqueda: str = "", empresa: str = "",
+                         count: Optional[str] = None):
+        """
+        Participantes con su suscripción activa embebida, en una sola select.
+
+        `estado` se resuelve en el servidor: "Activas" usa un embebido !inner y
+        "Inactivas" un anti-join (embebido filtrado + is.null).
+        """
+        select = self.SELECT_ROSTER.format(
+            empresa="!inner" if empresa else "",
+            suscripcion="!inner" if estado == "Activas" else ""
+        )
+        query = self.supabase.table("participantes").select(select, count=count) \
+            .eq("suscripcion.activa", True)
+
+        if estado == "Inactivas":
+            query = query.is_("suscripcion", "null")
+        if self.role == "gestor":
+            query = query.eq("empresa_id", self.empresa_id)
+
+        busqueda = re.sub(r"[,()*%\\]", " ", busqueda or "").strip()
+        if busqueda:
+            query = query.or_(
+                f"nombre.ilike.*{busqueda}*,apellidos.ilike.*{busqueda}*,email.ilike.*{busqueda}*"
+            )
+        empresa = re.sub(r"[,()*%\\]", " ", empresa or "").strip()
+        if empresa:
+            query = query.ilike("empresa.nombre", f"*{empresa}*")
+
+        return query.order("apellidos").order("nombre").order("id")
+
+    @staticmethod
+    def uso_mes(suscripcion: Optional[Dict], hoy: Optional[date] = None) -> int:
+        """Clases usadas en el mes en curso; un contador de otro mes equivale a 0 (se reinicia al reservar)."""
+        if not suscripcion:
+            return 0
+        hoy = hoy or date.today()
+        vigente = suscripcion.get("mes_referencia") == f"{hoy.year}-{hoy.month:02d}" or (
+            suscripcion.get("mes_actual") == hoy.month and suscripcion.get("año_actual") == hoy.year
+        )
+        return (suscripcion.get("clases_usadas_mes") or 0) if vigente else 0
+
+    @staticmethod
+    def _filas_roster(filas: List[Dict]) -> pd.DataFrame:
+        """Aplana el resultado embebido y calcula usadas/disponibles del mes en curso."""
+        hoy = date.today()
+        registros = []
+        for fila in filas:
+            empresa = fila.get("empresa")
+            sus = next(iter(fila.get("suscripcion") or []), None)
+            mensuales = (sus.get("clases_mensuales") or 0) if sus else 0
+            usadas = ClasesService.uso_mes(sus, hoy)
+            registros.append({
+                "id": fila["id"],
+                "nombre": f"{fila.get('nombre') or ''} {fila.get('apellidos') or ''}".strip(),
+                "email": fila.get("email"),
+                "empresa_id": fila.get("empresa_id"),
+                "empresa_nombre": empresa.get("nombre", "") if isinstance(empresa, dict) else "",
+                "suscripcion_id": sus["id"] if sus else None,
+                "suscripcion_activa": bool(sus),
+                "estado": "✅ Activa" if sus else "❌ Inactiva",
+                "clases_mensuales": mensuales,
+                "clases_usadas": usadas,
+                "disponibles": max(0, mensuales - usadas),
+            })
+        return pd.DataFrame(registros, columns=ClasesService.COLUMNAS_ROSTER)
+
+    def get_roster_suscripciones(self, estado: str = "Todos", busqueda: str = "", empresa: str = "",
+                                 limite: int = 50, desplazamiento: int = 0) -> Tuple[pd.DataFrame, int]:
+        """Una página del roster de suscripciones y el total de filas que cumplen los filtros."""
         try:
-            # Verificar si ya tiene suscripción
-            existing = self.supabase.table("participantes_suscripciones").select("id").eq(
-                "participante_id", participante_id
-            ).eq("empresa_id", empresa_id).execute()
-            
-            mes_actual = datetime.now().month
-            año_actual = datetime.now().year
-            
-            datos_suscripcion = {
-                "participante_id": participante_id,
-                "empresa_id": empresa_id,
-                "activa": True,
-                "clases_mensuales": clases_mensuales,
-                "clases_usadas_mes": 0,
-                "fecha_activacion": datetime.now().date().isoformat(),
-                "mes_actual": mes_actual,
-                "año_actual": año_actual
-            }
-            
-            if existing.data:
-                # Actualizar existente
-                result = self.supabase.table("participantes_suscripciones").update(
-                    datos_suscripcion
-                ).eq("id", existing.data[0]["id"]).execute()
-            else:
-                # Crear nueva
-                datos_suscripcion["id"] = str(uuid.uuid4())
-                result = self.supabase.table("participantes_suscripciones").insert(
-                    datos_suscripcion
-                ).execute()
-            
-            return bool(result.data)
-            
+            res = self._consulta_roster(estado, busqueda, empresa, count="exact") \
+                .range(desplazamiento, desplazamiento + limite - 1).execute()
+            return self._filas_roster(res.data or []), res.count or 0
         except Exception as e:
-            return False
+            print(f"Error cargando roster de suscripciones: {e}")
+            return pd.DataFrame(columns=self.COLUMNAS_ROSTER), 0
 
-    def desactivar_suscripcion(self, participante_id: str, empresa_id: str) -> bool:
-        """Desactiva suscripción de un participante"""
+    @st.cache_data(ttl=300)
+    def get_roster_completo(_self, estado: str = "Todos", rol: str = "", empresa_id: str = "") -> pd.DataFrame:
+        """Roster completo (leído por páginas de 1000) para informes y acciones masivas."""
         try:
-            result = self.supabase.table("participantes_suscripciones").update({
-                "activa": False,
-                "fecha_vencimiento": datetime.now().date().isoformat(),
-                "updated_at": datetime.utcnow().isoformat()
-            }).eq("participante_id", participante_id).eq("empresa_id", empresa_id).execute()
-            
-            return bool(result.data)
-            
+            filas, pagina = [], 1000
+            while True:
+                lote = _self._consulta_roster(estado) \
+                    .range(len(filas), len(filas) + pagina - 1).execute().data or []
+                filas.extend(lote)
+                if len(lote) < pagina:
+                    break
+            return _self._filas_roster(filas)
         except Exception as e:
-            return False
+            print(f"Error cargando roster de suscripciones: {e}")
+            return pd.DataFrame(columns=_self.COLUMNAS_ROSTER)
+
+    def get_roster(self, estado: str = "Todos") -> pd.DataFrame:
+        # rol y empresa forman parte de la clave de cache
+        return self.get_roster_completo(estado, self.role, self.empresa_id or "")
+
+    @staticmethod
+    def resumen_mensual_suscripciones(df_roster: pd.DataFrame) -> pd.DataFrame:
+        """Consumo del mes por empresa a partir del roster."""
+        if df_roster.empty:
+            return pd.DataFrame(columns=["empresa_nombre", "participantes", "suscripciones_activas",
+                                         "clases_asignadas", "clases_usadas", "clases_restantes", "uso_pct"])
+        resumen = df_roster.assign(
+            activa=df_roster["suscripcion_activa"].astype(int)
+        ).groupby("empresa_nombre", dropna=False).agg(
+            participantes=("id", "count"),
+            suscripciones_activas=("activa", "sum"),
+            clases_asignadas=("clases_mensuales", "sum"),
+            clases_usadas=("clases_usadas", "sum"),
+            clases_restantes=("disponibles", "sum"),
+        ).reset_index()
+        asignadas = resumen["clases_asignadas"].where(resumen["clases_asignadas"] > 0)
+        resumen["uso_pct"] = (resumen["clases_usadas"] / asignadas * 100).round(1).fillna(0)
+        return resumen.sort_values("clases_usadas", ascending=False)
+
+    def _limpiar_cache_roster(self):
+        if hasattr(self.get_roster_completo, 'clear'):
+            self.get_roster_completo.clear()
+        if hasattr(self.get_estadisticas_clases, 'clear'):
+            self.get_estadisticas_clases.clear()
+
+    def activar_suscripciones_masivo(self, participantes: List[Dict[str, str]],
+                                     clases_mensuales: int) -> Dict[str, str]:
+        """
+        Activa (o reactiva) la suscripción de muchos participantes.
+
+        Por cada lote: una lectura de las suscripciones existentes, un update
+        de todas ellas y un insert de las que faltan. `participantes` son
+        dicts con "id" y "empresa_id". Devuelve {participante_id: resultado}.
+        """
+        hoy = datetime.now()
+        datos = {
+            "activa": True,
+            "clases_mensuales": clases_mensuales,
+            "clases_usadas_mes": 0,
+            "fecha_activacion": hoy.date().isoformat(),
+            "mes_actual": hoy.month,
+            "año_actual": hoy.year,
+            "mes_referencia": f"{hoy.year}-{hoy.month:02d}",
+        }
+        empresa_de = {p["id"]: p["empresa_id"] for p in participantes if p.get("id")}
+        ids = list(empresa_de)
+        resultados: Dict[str, str] = {}
+
+        for i in range(0, len(ids), self.LOTE_SUSCRIPCIONES):
+            lote = ids[i:i + self.LOTE_SUSCRIPCIONES]
+            try:
+                existentes = self.supabase.table("participantes_suscripciones") \
+                    .select("id, participante_id, empresa_id").in_("participante_id", lote).execute()
+                por_participante = {
+                    s["participante_id"]: s["id"] for s in (existentes.data or [])
+                    if s.get("empresa_id") == empresa_de[s["participante_id"]]
+                }
+                if por_participante:
+                    self.supabase.table("participantes_suscripciones").update(datos) \
+                        .in_("id", list(por_participante.values())).execute()
+                nuevas = [{**datos, "id": str(uuid.uuid4()), "participante_id": pid, "empresa_id": empresa_de[pid]}
+                          for pid in lote if pid not in por_participante]
+                if nuevas:
+                    self.supabase.table("participantes_suscripciones").insert(nuevas).execute()
+                resultados.update({pid: "activada" for pid in lote})
+            except Exception as e:
+                resultados.update({pid: f"error: {e}" for pid in lote})
+
+        self._limpiar_cache_roster()
+        return resultados
+
+    def _update_suscripciones_activas(self, participante_ids: List[str], cambios: Dict[str, Any],
+                                      etiqueta: str, empresa_id: Optional[str] = None) -> Dict[str, str]:
+        """Un update por lote sobre las suscripciones activas de los participantes dados."""
+        cambios = {**cambios, "updated_at": datetime.utcnow().isoformat()}
+        ids = list(dict.fromkeys(p for p in participante_ids if p))
+        resultados: Dict[str, str] = {}
+
+        for i in range(0, len(ids), self.LOTE_SUSCRIPCIONES):
+            lote = ids[i:i + self.LOTE_SUSCRIPCIONES]
+            try:
+                query = self.supabase.table("participantes_suscripciones").update(cambios) \
+                    .in_("participante_id", lote).eq("activa", True)
+                if empresa_id:
+                    query = query.eq("empresa_id", empresa_id)
+                tocadas = {s["participante_id"] for s in (query.execute().data or [])}
+                resultados.update({pid: etiqueta if pid in tocadas else "sin_suscripcion" for pid in lote})
+            except Exception as e:
+                resultados.update({pid: f"error: {e}" for pid in lote})
+
+        self._limpiar_cache_roster()
+        return resultados
+
+    def actualizar_suscripciones_masivo(self, participante_ids: List[str], clases_mensuales: int) -> Dict[str, str]:
+        """Cambia las clases mensuales de muchas suscripciones activas. Devuelve {participante_id: resultado}."""
+        return self._update_suscripciones_activas(
+            participante_ids, {"clases_mensuales": clases_mensuales}, "actualizada"
+        )
+
+    def desactivar_suscripciones_masivo(self, participante_ids: List[str],
+                                        empresa_id: Optional[str] = None) -> Dict[str, str]:
+        """Desactiva muchas suscripciones activas. Devuelve {participante_id: resultado}."""
+        return self._update_suscripciones_activas(
+            participante_ids,
+            {"activa": False, "fecha_vencimiento": datetime.now().date().isoformat()},
+            "desactivada",
+            empresa_id
+        )
 
     def _verificar_limite_mensual(self, participante_id: str) -> bool:
         """Verifica si el participante puede reservar más clases este mes"""
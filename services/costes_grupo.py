@@ -0,0 +1,361 @@
+"""
+Libro de costes y bonificaciones FUNDAE de un grupo.
+
+Una sola select embebida sobre grupos trae la modalidad, las horas de la
+acción formativa y, por cada empresa participante (empresas_grupos), su
+fila de empresa_grupo_costes y sus bonificaciones mensuales. Totales,
+límite (tarifa × horas × participantes), bonificado, disponible y avisos
+se calculan por columnas para todas las empresas a la vez.
+
+El libro se guarda en st.session_state por grupo. Las ediciones se envían
+como upsert por lotes sobre la clave primaria y las filas devueltas se
+aplican sobre el propio libro, así que guardar no obliga a recargarlo.
+Los mismos cambios se trasladan al consumo de crédito (credito_fundae).
+"""
+
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+
+from services.credito_fundae import get_motor_credito
+
+CLAVE_LIBROS = "libros_costes_grupo"
+TTL_LIBRO = 300  # segundos
+LOTE_COSTES = 150  # filas o ids por petición
+
+CAMPOS_COSTE = ["costes_directos", "costes_indirectos", "costes_organizacion", "costes_salariales"]
+CAMPOS_EDITABLES = CAMPOS_COSTE + ["cofinanciacion_privada", "tarifa_hora"]
+MAX_PCT_INDIRECTOS = 30.0
+MESES = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio",
+         "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
+
+SELECT_LIBRO = """
+    id, modalidad, n_participantes_previstos,
+    accion_formativa:acciones_formativas(num_horas),
+    empresas_grupos(
+        id, empresa_id, fecha_asignacion,
+        empresa:empresas(id, nombre, cif, tipo_empresa),
+        costes:empresa_grupo_costes(*),
+        bonificaciones:empresa_grupo_bonificaciones(*)
+    )
+"""
+
+COLUMNAS_BONIFICACION = ["id", "empresa_grupo_id", "mes", "importe", "observaciones"]
+
+
+def limite_fundae(modalidad: str, horas: float, participantes: int) -> Tuple[float, float]:
+    """(límite máximo, tarifa máxima por hora) según modalidad."""
+    tarifa = 7.5 if modalidad in ["Teleformación", "TELEFORMACION"] else 13.0
+    return tarifa * horas * participantes, tarifa
+
+
+def nombre_mes(mes: Any) -> str:
+    try:
+        return MESES[int(mes) - 1] if 1 <= int(mes) <= 12 else "N/D"
+    except (TypeError, ValueError):
+        return "N/D"
+
+
+class LibroCostes:
+    """Costes y bonificaciones de todas las empresas de un grupo."""
+
+    def __init__(self, grupo_id: str, fila: Dict[str, Any]):
+        self.grupo_id = grupo_id
+        self.modalidad = fila.get("modalidad") or "PRESENCIAL"
+        self.participantes = int(fila.get("n_participantes_previstos") or 1)
+        accion = fila.get("accion_formativa") if isinstance(fila.get("accion_formativa"), dict) else {}
+        self.horas = float(accion.get("num_horas") or 0)
+        self.limite_base, self.tarifa_max = limite_fundae(self.modalidad, self.horas, self.participantes)
+        self.cargado = time.monotonic()
+
+        empresas, bonificaciones = [], []
+        for relacion in fila.get("empresas_grupos") or []:
+            empresa = relacion.get("empresa")
+            if not isinstance(empresa, dict):
+                continue
+            costes = relacion.get("costes")
+            if isinstance(costes, list):
+                costes = costes[0] if costes else None
+            empresas.append({
+                "empresa_grupo_id": relacion["id"],
+                "empresa_id": relacion.get("empresa_id"),
+                "nombre": empresa.get("nombre") or "Sin nombre",
+                "cif": empresa.get("cif") or "N/A",
+                "tipo_empresa": empresa.get("tipo_empresa") or "N/D",
+                **self._valores_coste(costes or {}),
+            })
+            bonificaciones.extend(relacion.get("bonificaciones") or [])
+
+        self.empresas = pd.DataFrame(empresas, columns=[
+            "empresa_grupo_id", "empresa_id", "nombre", "cif", "tipo_empresa", "coste_id", *CAMPOS_EDITABLES
+        ]).set_index("empresa_grupo_id", drop=False)
+        self.bonificaciones = self._preparar_bonificaciones(bonificaciones)
+        self._recalcular()
+
+    # =========================
+    # CARGA
+    # =========================
+
+    @classmethod
+    def cargar(cls, supabase, grupo_id: str) -> Optional["LibroCostes"]:
+        res = supabase.table("grupos").select(SELECT_LIBRO).eq("id", grupo_id).limit(1).execute()
+        return cls(grupo_id, res.data[0]) if res.data else None
+
+    def vigente(self) -> bool:
+        return time.monotonic() - self.cargado < TTL_LIBRO
+
+    def _valores_coste(self, costes: Dict[str, Any]) -> Dict[str, Any]:
+        valores = {campo: float(costes.get(campo) or 0) for campo in CAMPOS_EDITABLES}
+        valores["tarifa_hora"] = float(costes.get("tarifa_hora") or self.tarifa_max)
+        valores["coste_id"] = costes.get("id")
+        return valores
+
+    @staticmethod
+    def _preparar_bonificaciones(filas: List[Dict[str, Any]]) -> pd.DataFrame:
+        df = pd.DataFrame(filas)
+        for columna in COLUMNAS_BONIFICACION:
+            if columna not in df.columns:
+                df[columna] = None
+        df = df[COLUMNAS_BONIFICACION].copy()
+        df["importe"] = pd.to_numeric(df["importe"], errors="coerce").fillna(0.0).astype(float)
+        df["mes"] = pd.to_numeric(df["mes"], errors="coerce").fillna(1).astype(int)
+        return df.sort_values(["empresa_grupo_id", "mes"]).reset_index(drop=True)
+
+    # =========================
+    # CÁLCULOS
+    # =========================
+
+    def _recalcular(self):
+        e = self.empresas
+        e["total_costes"] = e[CAMPOS_COSTE].sum(axis=1)
+        e["limite"] = e["tarifa_hora"] * self.horas * self.participantes
+        e["bonificado"] = self.bonificaciones.groupby("empresa_grupo_id")["importe"].sum() \
+            .reindex(e.index, fill_value=0.0)
+        e["disponible"] = e["total_costes"] - e["bonificado"]
+        e["meses_bonificados"] = self.bonificaciones.groupby("empresa_grupo_id").size() \
+            .reindex(e.index, fill_value=0).astype(int)
+        directos = e["costes_directos"].where(e["costes_directos"] > 0)
+        e["pct_indirectos"] = (e["costes_indirectos"] / directos * 100).fillna(0.0)
+        e["supera_indirectos"] = e["pct_indirectos"] > MAX_PCT_INDIRECTOS
+        e["supera_tarifa"] = e["tarifa_hora"] > self.tarifa_max
+        e["supera_limite"] = e["bonificado"] > e["limite"]
+        e["supera_costes"] = e["disponible"] < 0
+
+    def empresa(self, empresa_grupo_id: str) -> Dict[str, Any]:
+        if empresa_grupo_id not in self.empresas.index:
+            return {}
+        return self.empresas.loc[empresa_grupo_id].to_dict()
+
+    def bonificaciones_de(self, empresa_grupo_id: str) -> pd.DataFrame:
+        df = self.bonificaciones[self.bonificaciones["empresa_grupo_id"] == empresa_grupo_id].copy()
+        df["mes_nombre"] = df["mes"].map(nombre_mes)
+        return df
+
+    def meses_libres(self, empresa_grupo_id: str) -> List[int]:
+        usados = set(self.bonificaciones.loc[self.bonificaciones["empresa_grupo_id"] == empresa_grupo_id, "mes"])
+        return [m for m in range(1, 13) if m not in usados]
+
+    def resumen(self) -> Dict[str, Any]:
+        e = self.empresas
+        return {
+            "empresas": len(e),
+            "costes": float(e["total_costes"].sum()),
+            "bonificado": float(e["bonificado"].sum()),
+            "disponible": float(e["disponible"].sum()),
+            "limite": float(e["limite"].sum()),
+            "con_avisos": int((e["supera_indirectos"] | e["supera_tarifa"]
+                               | e["supera_limite"] | e["supera_costes"]).sum()),
+        }
+
+    # =========================
+    # VALIDACIONES
+    # =========================
+
+    def errores_costes(self, valores: Dict[str, float]) -> List[str]:
+        errores = []
+        directos = valores.get("costes_directos") or 0
+        if directos > 0:
+            pct = (valores.get("costes_indirectos") or 0) / directos * 100
+            if pct > MAX_PCT_INDIRECTOS:
+                errores.append(f"Costes indirectos ({pct:.1f}%) superan el {MAX_PCT_INDIRECTOS:.0f}% permitido")
+        if (valores.get("tarifa_hora") or 0) > self.tarifa_max:
+            errores.append(f"Tarifa/hora ({valores['tarifa_hora']:.2f}€) supera el máximo ({self.tarifa_max:.2f}€)")
+        return errores
+
+    def validar_bonificacion(self, empresa_grupo_id: str, mes: int, importe: float,
+                             bonificacion_id: Optional[str] = None) -> Tuple[bool, str]:
+        """Comprueba importe frente al disponible y que el mes esté libre, sin consultar la base de datos."""
+        empresa = self.empresa(empresa_grupo_id)
+        if not empresa:
+            return False, "La empresa no participa en este grupo"
+        if importe <= 0:
+            return False, "El importe debe ser mayor que 0"
+        if empresa["total_costes"] <= 0:
+            return False, "Esta empresa no tiene costes definidos"
+
+        otras = self.bonificaciones[(self.bonificaciones["empresa_grupo_id"] == empresa_grupo_id)
+                                    & (self.bonificaciones["id"] != bonificacion_id)]
+        if (otras["mes"] == int(mes)).any():
+            return False, f"Ya existe una bonificación para {nombre_mes(mes)} en esta empresa"
+        disponible = empresa["total_costes"] - float(otras["importe"].sum())
+        if importe > disponible:
+            return False, f"Importe ({importe:.2f}€) supera el disponible ({disponible:.2f}€) para esta empresa"
+        return True, ""
+
+    # =========================
+    # ESCRITURAS
+    # =========================
+
+    def guardar_costes(self, supabase, cambios: Dict[str, Dict[str, float]]) -> Dict[str, str]:
+        """
+        Guarda los costes de varias empresas con un upsert por lote sobre la
+        clave primaria (las empresas sin fila de costes reciben un id nuevo).
+        Devuelve {empresa_grupo_id: "guardado" | "error: ..."}.
+        """
+        ahora = datetime.utcnow().isoformat()
+        filas, resultados = [], {}
+        for empresa_grupo_id, valores in cambios.items():
+            empresa = self.empresa(empresa_grupo_id)
+            if not empresa:
+                resultados[empresa_grupo_id] = "error: la empresa no participa en este grupo"
+                continue
+            fila = {campo: float(valores.get(campo, empresa[campo]) or 0) for campo in CAMPOS_EDITABLES}
+            errores = self.errores_costes(fila)
+            if errores:
+                resultados[empresa_grupo_id] = "error: " + "; ".join(errores)
+                continue
+            fila.update({
+                "id": empresa["coste_id"] or str(uuid.uuid4()),
+                "empresa_grupo_id": empresa_grupo_id,
+                "modalidad": self.modalidad,
+                "total_costes_formacion": sum(fila[c] for c in CAMPOS_COSTE),
+                "limite_maximo_bonificacion": fila["tarifa_hora"] * self.horas * self.participantes,
+                "observaciones": valores.get("observaciones"),
+                "updated_at": ahora,
+            })
+            filas.append(fila)
+
+        for i in range(0, len(filas), LOTE_COSTES):
+            lote = filas[i:i + LOTE_COSTES]
+            try:
+                guardadas = supabase.table("empresa_grupo_costes").upsert(lote, on_conflict="id").execute().data or lote
+            except Exception as e:
+                resultados.update({f["empresa_grupo_id"]: f"error: {e}" for f in lote})
+                continue
+            for fila in guardadas:
+                self.empresas.loc[fila["empresa_grupo_id"], ["coste_id", *CAMPOS_EDITABLES]] = \
+                    [fila.get("id"), *(float(fila.get(c) or 0) for c in CAMPOS_EDITABLES)]
+                get_motor_credito().registrar_costes(fila["empresa_grupo_id"],
+                                                     float(fila.get("total_costes_formacion") or 0),
+                                                     float(fila.get("limite_maximo_bonificacion") or 0))
+                resultados[fila["empresa_grupo_id"]] = "guardado"
+
+        self._recalcular()
+        return resultados
+
+    def guardar_bonificaciones(self, supabase, filas: List[Dict[str, Any]]) -> Tuple[int, List[str]]:
+        """
+        Alta o edición de bonificaciones: valida cada fila contra el libro
+        (incluidas las anteriores del mismo lote) y envía un upsert por lote.
+        Devuelve (guardadas, errores).
+        """
+        ahora = datetime.utcnow().isoformat()
+        antes = self.bonificaciones
+        validas, errores = [], []
+        for fila in filas:
+            fila = dict(fila)
+            ok, mensaje = self.validar_bonificacion(fila["empresa_grupo_id"], fila["mes"],
+                                                    float(fila["importe"]), fila.get("id"))
+            if not ok:
+                errores.append(f"{nombre_mes(fila['mes'])}: {mensaje}")
+                continue
+            fila.setdefault("id", str(uuid.uuid4()))
+            fila["updated_at"] = ahora
+            validas.append(fila)
+            self._aplicar_bonificaciones([fila])
+
+        guardadas = 0
+        for i in range(0, len(validas), LOTE_COSTES):
+            lote = validas[i:i + LOTE_COSTES]
+            try:
+                supabase.table("empresa_grupo_bonificaciones").upsert(lote, on_conflict="id").execute()
+                guardadas += len(lote)
+            except Exception as e:
+                ids = [f["id"] for f in lote]
+                self._quitar_bonificaciones(ids)
+                self.bonificaciones = self._preparar_bonificaciones(pd.concat(
+                    [self.bonificaciones, antes[antes["id"].isin(ids)]], ignore_index=True).to_dict("records"))
+                errores.append(f"error: {e}")
+
+        self._recalcular()
+        self._propagar_bonificaciones(f["empresa_grupo_id"] for f in validas)
+        return guardadas, errores
+
+    def eliminar_bonificaciones(self, supabase, ids: Iterable[str]) -> int:
+        ids = [i for i in dict.fromkeys(ids) if i]
+        afectadas = set(self.bonificaciones.loc[self.bonificaciones["id"].isin(ids), "empresa_grupo_id"])
+        borradas = 0
+        for i in range(0, len(ids), LOTE_COSTES):
+            lote = ids[i:i + LOTE_COSTES]
+            try:
+                supabase.table("empresa_grupo_bonificaciones").delete().in_("id", lote).execute()
+            except Exception as e:
+                st.error(f"Error al eliminar bonificaciones: {e}")
+                continue
+            self._quitar_bonificaciones(lote)
+            borradas += len(lote)
+        self._recalcular()
+        self._propagar_bonificaciones(afectadas)
+        return borradas
+
+    def _propagar_bonificaciones(self, empresa_grupo_ids: Iterable[str]):
+        """Lleva las bonificaciones actuales de cada empresa-grupo al consumo de crédito cacheado."""
+        for empresa_grupo_id in set(empresa_grupo_ids):
+            get_motor_credito().registrar_bonificaciones(empresa_grupo_id, self.bonificaciones_de(empresa_grupo_id))
+
+    def _aplicar_bonificaciones(self, filas: List[Dict[str, Any]]):
+        nuevas = self._preparar_bonificaciones(filas)
+        resto = self.bonificaciones[~self.bonificaciones["id"].isin(nuevas["id"])]
+        self.bonificaciones = self._preparar_bonificaciones(
+            pd.concat([resto, nuevas], ignore_index=True).to_dict("records"))
+
+    def _quitar_bonificaciones(self, ids: List[str]):
+        self.bonificaciones = self.bonificaciones[~self.bonificaciones["id"].isin(ids)].reset_index(drop=True)
+
+
+# =========================
+# CACHE POR SESIÓN
+# =========================
+
+def get_libro_costes(supabase, grupo_id: str, refrescar: bool = False) -> Optional[LibroCostes]:
+    """Libro del grupo desde la sesión; se carga (una consulta) si falta o ha caducado."""
+    libros = st.session_state.setdefault(CLAVE_LIBROS, {})
+    libro = libros.get(grupo_id)
+    if refrescar or libro is None or not libro.vigente():
+        libro = LibroCostes.cargar(supabase, grupo_id)
+        if libro is None:
+            libros.pop(grupo_id, None)
+        else:
+            libros[grupo_id] = libro
+    return libro
+
+
+def sembrar_libro_costes(grupo_id: str, fila: Dict[str, Any]) -> LibroCostes:
+    """Guarda en la sesión el libro construido con una fila de grupos ya leída (p. ej. la ficha del grupo)."""
+    libro = LibroCostes(grupo_id, fila)
+    st.session_state.setdefault(CLAVE_LIBROS, {})[grupo_id] = libro
+    return libro
+
+
+def invalidar_libro_costes(grupo_id: Optional[str] = None):
+    libros = st.session_state.get(CLAVE_LIBROS)
+    if not libros:
+        return
+    if grupo_id is None:
+        libros.clear()
+    else:
+        libros.pop(grupo_id, None)
@@ -0,0 +1,244 @@
+"""
+Consumo de crédito FUNDAE por empresa, año y mes, a través de todos los grupos.
+
+El consumo de un ejercicio se obtiene con una sola consulta agrupada (RPC
+RPC_CONSUMO o, si no existe, una select embebida paginada sobre
+empresas_grupos) con una fila por empresa-grupo: costes, límite máximo de
+bonificación y lo bonificado en cada mes. Con esa base se agregan en
+memoria los totales por empresa, la tabla mensual y las alertas de límite.
+
+La base se guarda por (año, ámbito) en una cache única por proceso. Al
+guardar costes o bonificaciones desde el libro de costes (costes_grupo) se
+parchea la fila de la empresa-grupo afectada, sin volver a leer nada. El
+TTL solo cubre cambios hechos desde fuera de este proceso.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+
+TTL_CONSUMO = 600  # segundos
+PAGINA_CONSUMO = 1000
+UMBRAL_AVISO = 90.0  # % del límite a partir del cual se avisa
+
+COLUMNAS_BASE = ["empresa_grupo_id", "empresa_id", "empresa_nombre", "empresa_cif",
+                 "grupo_id", "codigo_grupo", "año", "costes", "limite_maximo"]
+COLUMNAS_CONSUMO = ["empresa_id", "empresa_nombre", "empresa_cif", "grupos", "costes", "limite",
+                    "bonificado", "disponible", "pct_consumo", "grupos_excedidos"]
+
+# Año del grupo: el de fecha_inicio (los meses de bonificación se refieren a él).
+# Devuelve una fila por empresa-grupo con lo bonificado agrupado por mes en `meses`.
+#
+#   create or replace function consumo_credito_fundae(p_año int, p_gestor uuid default null)
+#   returns table (empresa_grupo_id uuid, empresa_id uuid, empresa_nombre text, empresa_cif text,
+#                  grupo_id uuid, codigo_grupo text, año int, costes numeric,
+#                  limite_maximo numeric, meses jsonb)
+#   language sql stable as $$
+#     select eg.id, eg.empresa_id, e.nombre, e.cif, g.id, g.codigo_grupo,
+#            extract(year from g.fecha_inicio)::int,
+#            coalesce(c.total_costes_formacion, 0), coalesce(c.limite_maximo_bonificacion, 0),
+#            coalesce(b.meses, '{}'::jsonb)
+#     from empresas_grupos eg
+#     join grupos g on g.id = eg.grupo_id
+#     join empresas e on e.id = eg.empresa_id
+#     left join empresa_grupo_costes c on c.empresa_grupo_id = eg.id
+#     left join lateral (
+#       select jsonb_object_agg(mes, total) as meses
+#       from (select mes, sum(importe) as total from empresa_grupo_bonificaciones
+#             where empresa_grupo_id = eg.id group by mes) m
+#     ) b on true
+#     where g.fecha_inicio >= make_date(p_año, 1, 1) and g.fecha_inicio < make_date(p_año + 1, 1, 1)
+#       and (p_gestor is null or e.id = p_gestor or e.empresa_matriz_id = p_gestor);
+#   $$;
+RPC_CONSUMO = "consumo_credito_fundae"
+
+SELECT_CONSUMO = """
+    id, empresa_id,
+    empresa:empresas!inner(nombre, cif, empresa_matriz_id),
+    grupo:grupos!inner(id, codigo_grupo, fecha_inicio),
+    costes:empresa_grupo_costes(total_costes_formacion, limite_maximo_bonificacion),
+    bonificaciones:empresa_grupo_bonificaciones(mes, importe)
+"""
+
+
+def _uno(valor: Any) -> Dict[str, Any]:
+    if isinstance(valor, list):
+        valor = valor[0] if valor else None
+    return valor if isinstance(valor, dict) else {}
+
+
+class ConsumoCredito:
+    """Base de consumo de un ejercicio: una fila por empresa-grupo y una por (empresa-grupo, mes)."""
+
+    def __init__(self, base: List[Dict[str, Any]], mensual: List[Dict[str, Any]]):
+        self.base = pd.DataFrame(base, columns=COLUMNAS_BASE).set_index("empresa_grupo_id", drop=False)
+        self.base[["costes", "limite_maximo"]] = self.base[["costes", "limite_maximo"]] \
+            .apply(pd.to_numeric, errors="coerce").fillna(0.0)
+        # La RPC devuelve NULL donde la select ya pone el valor por defecto;
+        # sin normalizar, el groupby por empresa descartaría esas filas
+        self.base["empresa_nombre"] = self.base["empresa_nombre"].fillna("Sin nombre")
+        self.base[["empresa_cif", "codigo_grupo"]] = self.base[["empresa_cif", "codigo_grupo"]].fillna("")
+        self.mensual = pd.DataFrame(mensual, columns=["empresa_grupo_id", "mes", "importe"])
+        self.mensual["mes"] = pd.to_numeric(self.mensual["mes"], errors="coerce").fillna(1).astype(int)
+        self.mensual["importe"] = pd.to_numeric(self.mensual["importe"], errors="coerce").fillna(0.0)
+        self.cargado = time.monotonic()
+
+    def por_empresa_grupo(self) -> pd.DataFrame:
+        """Base con bonificado, límite efectivo (mín. de costes y límite máximo) y exceso."""
+        df = self.base.copy()
+        df["bonificado"] = self.mensual.groupby("empresa_grupo_id")["importe"].sum() \
+            .reindex(df.index, fill_value=0.0)
+        df["limite"] = df["costes"].where(
+            (df["limite_maximo"] <= 0) | (df["costes"] <= df["limite_maximo"]), df["limite_maximo"])
+        df["excedido"] = df["bonificado"] > df["limite"] + 0.005
+        return df
+
+
+class MotorCreditoFundae:
+    def __init__(self, ttl: float = TTL_CONSUMO):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._consumos: Dict[Tuple[int, Optional[str]], ConsumoCredito] = {}
+
+    # =========================
+    # CARGA
+    # =========================
+
+    def _cargar_rpc(self, supabase, año: int, gestor_id: Optional[str]) -> ConsumoCredito:
+        filas = supabase.rpc(RPC_CONSUMO, {"p_año": año, "p_gestor": gestor_id}).execute().data or []
+        mensual = [{"empresa_grupo_id": f["empresa_grupo_id"], "mes": mes, "importe": importe}
+                   for f in filas for mes, importe in (f.get("meses") or {}).items()]
+        return ConsumoCredito(filas, mensual)
+
+    def _cargar_select(self, supabase, año: int, gestor_id: Optional[str]) -> ConsumoCredito:
+        base, mensual = [], []
+        desde = 0
+        while True:
+            query = supabase.table("empresas_grupos").select(SELECT_CONSUMO) \
+                .gte("grupo.fecha_inicio", f"{año}-01-01").lt("grupo.fecha_inicio", f"{año + 1}-01-01")
+            if gestor_id:
+                query = query.or_(f"empresa_id.eq.{gestor_id},empresa.empresa_matriz_id.eq.{gestor_id}")
+            filas = query.order("id").range(desde, desde + PAGINA_CONSUMO - 1).execute().data or []
+            for fila in filas:
+                empresa, grupo, costes = _uno(fila.get("empresa")), _uno(fila.get("grupo")), _uno(fila.get("costes"))
+                base.append({
+                    "empresa_grupo_id": fila["id"],
+                    "empresa_id": fila.get("empresa_id"),
+                    "empresa_nombre": empresa.get("nombre") or "Sin nombre",
+                    "empresa_cif": empresa.get("cif") or "",
+                    "grupo_id": grupo.get("id"),
+                    "codigo_grupo": grupo.get("codigo_grupo") or "",
+                    "año": año,
+                    "costes": costes.get("total_costes_formacion"),
+                    "limite_maximo": costes.get("limite_maximo_bonificacion"),
+                })
+                mensual.extend({"empresa_grupo_id": fila["id"], **b} for b in fila.get("bonificaciones") or [])
+            if len(filas) < PAGINA_CONSUMO:
+                break
+            desde += PAGINA_CONSUMO
+        return ConsumoCredito(base, mensual)
+
+    def _consumo(self, supabase, año: int, gestor_id: Optional[str]) -> ConsumoCredito:
+        clave = (int(año), gestor_id)
+        with self._lock:
+            consumo = self._consumos.get(clave)
+            if consumo is None or time.monotonic() - consumo.cargado >= self.ttl:
+                try:
+                    consumo = self._cargar_rpc(supabase, int(año), gestor_id)
+                except Exception:
+                    consumo = self._cargar_select(supabase, int(año), gestor_id)
+                self._consumos[clave] = consumo
+            return consumo
+
+    # =========================
+    # CONSULTAS
+    # =========================
+
+    def por_empresa_grupo(self, supabase, año: int, gestor_id: Optional[str] = None) -> pd.DataFrame:
+        return self._consumo(supabase, año, gestor_id).por_empresa_grupo()
+
+    def por_empresa(self, supabase, año: int, gestor_id: Optional[str] = None) -> pd.DataFrame:
+        """Una fila por empresa con costes, límite, bonificado y disponible del ejercicio."""
+        df = self.por_empresa_grupo(supabase, año, gestor_id)
+        if df.empty:
+            return pd.DataFrame(columns=COLUMNAS_CONSUMO)
+        agregado = df.groupby(["empresa_id", "empresa_nombre", "empresa_cif"], as_index=False, dropna=False).agg(
+            grupos=("grupo_id", "nunique"),
+            costes=("costes", "sum"),
+            limite=("limite", "sum"),
+            bonificado=("bonificado", "sum"),
+            grupos_excedidos=("excedido", "sum"),
+        )
+        agregado["disponible"] = agregado["limite"] - agregado["bonificado"]
+        agregado["pct_consumo"] = (agregado["bonificado"] / agregado["limite"].where(agregado["limite"] > 0) * 100) \
+            .fillna(0.0).round(1)
+        agregado["grupos_excedidos"] = agregado["grupos_excedidos"].astype(int)
+        return agregado[COLUMNAS_CONSUMO].sort_values("bonificado", ascending=False).reset_index(drop=True)
+
+    def por_mes(self, supabase, año: int, gestor_id: Optional[str] = None) -> pd.DataFrame:
+        """Bonificado por empresa (filas) y mes 1-12 (columnas)."""
+        consumo = self._consumo(supabase, año, gestor_id)
+        mensual = consumo.mensual.merge(consumo.base[["empresa_nombre"]], left_on="empresa_grupo_id",
+                                        right_index=True, how="inner")
+        return mensual.pivot_table(index="empresa_nombre", columns="mes", values="importe",
+                                   aggfunc="sum", fill_value=0.0) \
+            .reindex(columns=range(1, 13), fill_value=0.0)
+
+    def alertas(self, supabase, año: int, gestor_id: Optional[str] = None,
+                umbral: float = UMBRAL_AVISO) -> pd.DataFrame:
+        """
+        Empresas por encima del límite o cerca de él. nivel: "excedido" (algún
+        grupo o el total supera su límite), "sin_costes" (bonificado sin costes
+        registrados) o "aviso" (consumo >= umbral %). Sin costes el límite es 0
+        y cualquier bonificación lo supera, así que "sin_costes" prevalece.
+        """
+        df = self.por_empresa(supabase, año, gestor_id)
+        if df.empty:
+            return df.assign(nivel=pd.Series(dtype=str))
+        excedido = (df["grupos_excedidos"] > 0) | (df["bonificado"] > df["limite"] + 0.005)
+        sin_costes = (df["bonificado"] > 0) & (df["costes"] <= 0)
+        aviso = df["pct_consumo"] >= umbral
+        df["nivel"] = pd.Series(None, index=df.index, dtype=object) \
+            .mask(aviso, "aviso").mask(excedido, "excedido").mask(sin_costes, "sin_costes")
+        df["_orden"] = df["nivel"].map({"excedido": 0, "sin_costes": 1, "aviso": 2})
+        return df[df["nivel"].notna()].sort_values(["_orden", "pct_consumo"], ascending=[True, False]) \
+            .drop(columns="_orden").reset_index(drop=True)
+
+    # =========================
+    # ACTUALIZACIÓN INCREMENTAL
+    # =========================
+
+    def registrar_costes(self, empresa_grupo_id: str, costes: float, limite_maximo: float):
+        with self._lock:
+            for consumo in self._consumos.values():
+                if empresa_grupo_id in consumo.base.index:
+                    consumo.base.loc[empresa_grupo_id, ["costes", "limite_maximo"]] = [float(costes), float(limite_maximo)]
+
+    def registrar_bonificaciones(self, empresa_grupo_id: str, bonificaciones: pd.DataFrame):
+        """Sustituye las bonificaciones de una empresa-grupo (columnas mes, importe)."""
+        with self._lock:
+            for consumo in self._consumos.values():
+                if empresa_grupo_id not in consumo.base.index:
+                    continue
+                nuevas = pd.DataFrame({"empresa_grupo_id": empresa_grupo_id,
+                                       "mes": bonificaciones["mes"].astype(int),
+                                       "importe": bonificaciones["importe"].astype(float)})
+                resto = consumo.mensual[consumo.mensual["empresa_grupo_id"] != empresa_grupo_id]
+                consumo.mensual = pd.concat([resto, nuevas], ignore_index=True)
+
+    def invalidar(self, años: Optional[Iterable[int]] = None):
+        with self._lock:
+            if años is None:
+                self._consumos.clear()
+            else:
+                años = {int(a) for a in años}
+                self._consumos = {k: v for k, v in self._consumos.items() if k[0] not in años}
+
+
+@st.cache_resource
+def get_motor_credito() -> MotorCreditoFundae:
+    """Instancia única por proceso (sobrevive a reruns y sesiones)."""
+    return MotorCreditoFundae()
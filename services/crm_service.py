@@ -0,0 +1,292 @@
+import streamlit as st
+import pandas as pd
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+ESTADOS_OPORTUNIDAD = ["Abierta", "Ganada", "Perdida"]
+ESTADOS_TAREA = ["Pendiente", "En proceso", "Completada"]
+PAGINA_CRM = 50
+PAGINA_LECTURA = 1000
+
+# Orden de paginación por tabla: (columna de fecha, desempate por id), descendente
+ORDEN_TABLAS = {
+    "crm_oportunidades": "fecha_cierre_prevista",
+    "crm_tareas": "fecha_vencimiento",
+    "crm_comunicaciones": "fecha",
+}
+
+
+class CrmService:
+    """
+    Capa de consultas del CRM.
+
+    Los filtros (empresa, comercial, estado, fechas) se aplican en PostgREST,
+    los listados se paginan por cursor (fecha, id) y los agregados de embudo y
+    ranking salen de una consulta agrupada (RPC) o, si la función no existe, de
+    una lectura de solo las columnas necesarias agrupada en pandas. Todo se
+    cachea por empresa y se invalida al insertar.
+    """
+
+    # Función SQL opcional:
+    #   crm_resumen_oportunidades(p_empresa_id uuid)
+    #   returns table(comercial_id uuid, estado text, mes date,
+    #                 oportunidades bigint, valor_estimado numeric, importe numeric)
+    #   -- select ... group by comercial_id, estado, date_trunc('month', fecha_cierre_real)
+    RPC_RESUMEN = "crm_resumen_oportunidades"
+
+    def __init__(self, supabase, session_state):
+        self.supabase = supabase
+        self.session_state = session_state
+        self.rol = session_state.role
+        self.empresa_id = session_state.user.get("empresa_id")
+        self.comercial_id = session_state.user.get("comercial_id")
+
+    def empresa_ambito(self, empresa_id: Optional[str] = None) -> Optional[str]:
+        """Empresa a consultar: la del usuario salvo para admin, que puede elegirla (o ver todas con None)."""
+        return empresa_id if self.rol == "admin" else self.empresa_id
+
+    def comercial_ambito(self) -> Optional[str]:
+        return self.comercial_id if self.rol == "comercial" else None
+
+    @staticmethod
+    def _filtrar(query, empresa_id: Optional[str], comercial_id: Optional[str]):
+        if empresa_id:
+            query = query.eq("empresa_id", empresa_id)
+        if comercial_id:
+            query = query.eq("comercial_id", comercial_id)
+        return query
+
+    # =========================
+    # CATÁLOGOS
+    # =========================
+
+    @st.cache_data(ttl=600)
+    def get_comerciales(_self, empresa_id: Optional[str]) -> List[Dict[str, Any]]:
+        try:
+            query = _self.supabase.table("comerciales").select("id, nombre, empresa_id")
+            if empresa_id:
+                query = query.eq("empresa_id", empresa_id)
+            return query.order("nombre").execute().data or []
+        except Exception as e:
+            st.error(f"❌ Error al cargar comerciales: {e}")
+            return []
+
+    def get_comerciales_dict(self, empresa_id: Optional[str] = None) -> Dict[str, str]:
+        """{id: nombre} de los comerciales del ámbito."""
+        return {c["id"]: c["nombre"] for c in self.get_comerciales(self.empresa_ambito(empresa_id))}
+
+    # =========================
+    # LISTADOS PAGINADOS (KEYSET)
+    # =========================
+
+    @staticmethod
+    def _condicion_cursor(campo: str, cursor: Dict[str, Any]) -> str:
+        """
+        Filas posteriores al cursor en orden (campo desc nulls last, id desc).
+        Las fechas nulas van al final y se recorren por id.
+        """
+        valor, ultimo_id = cursor.get(campo), cursor["id"]
+        if valor is None:
+            return f'and({campo}.is.null,id.lt."{ultimo_id}")'
+        return f'{campo}.lt."{valor}",and({campo}.eq."{valor}",id.lt."{ultimo_id}"),{campo}.is.null'
+
+    @st.cache_data(ttl=300)
+    def _get_pagina(_self, tabla: str, empresa_id: Optional[str], comercial_id: Optional[str],
+                    filtros: Tuple[Tuple[str, str, Any], ...], cursor: Optional[Tuple[Tuple[str, Any], ...]],
+                    limite: int) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        campo = ORDEN_TABLAS[tabla]
+        query = _self._filtrar(_self.supabase.table(tabla).select("*"), empresa_id, comercial_id)
+        for columna, operador, valor in filtros:
+            query = getattr(query, operador)(columna, valor)
+        if cursor:
+            query = query.or_(_self._condicion_cursor(campo, dict(cursor)))
+
+        filas = query.order(campo, desc=True, nullsfirst=False).order("id", desc=True) \
+            .limit(limite + 1).execute().data or []
+
+        siguiente = None
+        if len(filas) > limite:
+            filas = filas[:limite]
+            siguiente = {campo: filas[-1].get(campo), "id": filas[-1]["id"]}
+        return filas, siguiente
+
+    def get_pagina(self, tabla: str, filtros: Optional[List[Tuple[str, str, Any]]] = None,
+                   cursor: Optional[Dict[str, Any]] = None, empresa_id: Optional[str] = None,
+                   limite: int = PAGINA_CRM) -> Tuple[pd.DataFrame, Optional[Dict[str, Any]]]:
+        """
+        Una página de `tabla` en el ámbito del usuario. `filtros` son tuplas
+        (columna, operador postgrest, valor), p. ej. ("estado", "eq", "Ganada").
+        Devuelve el DataFrame y el cursor de la página siguiente (o None).
+        """
+        try:
+            filas, siguiente = self._get_pagina(
+                tabla, self.empresa_ambito(empresa_id), self.comercial_ambito(),
+                tuple(filtros or ()), tuple(sorted(cursor.items())) if cursor else None, limite
+            )
+            return pd.DataFrame(filas), siguiente
+        except Exception as e:
+            st.error(f"❌ Error al cargar {tabla}: {e}")
+            return pd.DataFrame(), None
+
+    def filtros_oportunidades(self, estado: Optional[str] = None, comercial_id: Optional[str] = None,
+                              desde: Optional[date] = None, hasta: Optional[date] = None) -> List[Tuple[str, str, Any]]:
+        filtros = []
+        if estado:
+            filtros.append(("estado", "eq", estado))
+        if comercial_id:
+            filtros.append(("comercial_id", "eq", comercial_id))
+        if desde:
+            filtros.append(("fecha_cierre_prevista", "gte", desde.isoformat()))
+        if hasta:
+            filtros.append(("fecha_cierre_prevista", "lte", hasta.isoformat()))
+        return filtros
+
+    # =========================
+    # AGREGADOS
+    # =========================
+
+    @st.cache_data(ttl=300)
+    def _get_resumen(_self, empresa_id: Optional[str], comercial_id: Optional[str]) -> pd.DataFrame:
+        columnas = ["comercial_id", "estado", "mes", "oportunidades", "valor_estimado", "importe"]
+        try:
+            filas = _self.supabase.rpc(_self.RPC_RESUMEN, {"p_empresa_id": empresa_id}).execute().data or []
+            df = pd.DataFrame(filas, columns=columnas)
+            if comercial_id:
+                df = df[df["comercial_id"] == comercial_id]
+        except Exception:
+            df = _self._resumen_local(empresa_id, comercial_id)
+
+        df["mes"] = pd.to_datetime(df["mes"], errors="coerce")
+        for col in ["oportunidades", "valor_estimado", "importe"]:
+            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+        return df.reset_index(drop=True)
+
+    def _resumen_local(self, empresa_id: Optional[str], comercial_id: Optional[str]) -> pd.DataFrame:
+        """Sin la función SQL: solo las columnas del agregado, paginadas, agrupadas en pandas."""
+        filas, inicio = [], 0
+        while True:
+            query = self._filtrar(
+                self.supabase.table("crm_oportunidades").select(
+                    "comercial_id, estado, fecha_cierre_real, valor_estimado, importe"
+                ), empresa_id, comercial_id
+            )
+            pagina = query.range(inicio, inicio + PAGINA_LECTURA - 1).execute().data or []
+            filas.extend(pagina)
+            if len(pagina) < PAGINA_LECTURA:
+                break
+            inicio += PAGINA_LECTURA
+
+        df = pd.DataFrame(filas, columns=["comercial_id", "estado", "fecha_cierre_real", "valor_estimado", "importe"])
+        df["mes"] = pd.to_datetime(df["fecha_cierre_real"], errors="coerce").dt.to_period("M").dt.to_timestamp()
+        return df.groupby(["comercial_id", "estado", "mes"], dropna=False).agg(
+            oportunidades=("estado", "size"),
+            valor_estimado=("valor_estimado", "sum"),
+            importe=("importe", "sum"),
+        ).reset_index()
+
+    def get_resumen(self, empresa_id: Optional[str] = None, anio: Optional[int] = None,
+                    mes: Optional[int] = None) -> pd.DataFrame:
+        """
+        Oportunidades agregadas por comercial, estado y mes de cierre real,
+        con el nombre del comercial. Los filtros de año/mes se aplican sobre
+        el agregado (pocas filas), no sobre las oportunidades.
+        """
+        empresa = self.empresa_ambito(empresa_id)
+        df = self._get_resumen(empresa, self.comercial_ambito()).copy()
+        if anio:
+            df = df[df["mes"].dt.year == anio]
+        if mes:
+            df = df[df["mes"].dt.month == mes]
+        df["comercial"] = df["comercial_id"].map(self.get_comerciales_dict(empresa_id)).fillna("Sin asignar")
+        return df
+
+    @staticmethod
+    def embudo(resumen: pd.DataFrame) -> pd.DataFrame:
+        """Oportunidades, valor estimado e importe por estado."""
+        embudo = resumen.groupby("estado")[["oportunidades", "valor_estimado", "importe"]].sum()
+        return embudo.reindex(ESTADOS_OPORTUNIDAD, fill_value=0).reset_index()
+
+    @staticmethod
+    def ranking(resumen: pd.DataFrame) -> pd.DataFrame:
+        """Por comercial: oportunidades por estado, total ganado y tasa de conversión (ganadas / cerradas)."""
+        if resumen.empty:
+            return pd.DataFrame(columns=["comercial", "Abierta", "Ganada", "Perdida", "total_ganado", "tasa_conversion"])
+        conteos = resumen.pivot_table(
+            index="comercial", columns="estado", values="oportunidades", aggfunc="sum", fill_value=0
+        ).reindex(columns=ESTADOS_OPORTUNIDAD, fill_value=0).rename_axis(columns=None)
+        ganado = resumen[resumen["estado"] == "Ganada"].groupby("comercial")["importe"].sum()
+        ranking = conteos.assign(total_ganado=ganado.reindex(conteos.index, fill_value=0))
+        cerradas = ranking["Ganada"] + ranking["Perdida"]
+        ranking["tasa_conversion"] = (ranking["Ganada"] / cerradas.where(cerradas > 0)).fillna(0).round(3)
+        return ranking.sort_values("total_ganado", ascending=False).reset_index()
+
+    @staticmethod
+    def ganadas_por_periodo(resumen: pd.DataFrame, periodo: str = "mes") -> pd.DataFrame:
+        """Oportunidades ganadas e importe por comercial y mes (periodo="mes") o año (periodo="año")."""
+        ganadas = resumen[resumen["estado"] == "Ganada"].copy()
+        ganadas[periodo] = ganadas["mes"].dt.to_period("M") if periodo == "mes" else ganadas["mes"].dt.year
+        return ganadas.groupby([periodo, "comercial"]).agg(
+            oportunidades_cerradas=("oportunidades", "sum"),
+            total_ganado=("importe", "sum"),
+        ).reset_index()
+
+    # =========================
+    # CONTADORES DEL PANEL
+    # =========================
+
+    @st.cache_data(ttl=300)
+    def _contar(_self, tabla: str, empresa_id: Optional[str], comercial_id: Optional[str],
+                excluir: Optional[Tuple[str, Any]] = None) -> int:
+        query = _self._filtrar(_self.supabase.table(tabla).select("id", count="exact"), empresa_id, comercial_id)
+        if excluir:
+            query = query.neq(*excluir)
+        return query.limit(1).execute().count or 0
+
+    def get_kpis(self, empresa_id: Optional[str] = None) -> Dict[str, int]:
+        """Clientes, oportunidades abiertas/ganadas y tareas pendientes sin descargar filas."""
+        empresa = self.empresa_ambito(empresa_id)
+        try:
+            por_estado = self._get_resumen(empresa, self.comercial_ambito()) \
+                .groupby("estado")["oportunidades"].sum()
+            return {
+                "clientes": self._contar("participantes", empresa, None),
+                "abiertas": int(por_estado.get("Abierta", 0)),
+                "ganadas": int(por_estado.get("Ganada", 0)),
+                "tareas_pendientes": self._contar(
+                    "crm_tareas", empresa, self.comercial_ambito(), ("estado", "Completada")
+                ),
+            }
+        except Exception as e:
+            st.error(f"❌ Error al cargar indicadores CRM: {e}")
+            return {"clientes": 0, "abiertas": 0, "ganadas": 0, "tareas_pendientes": 0}
+
+    # =========================
+    # ALTAS
+    # =========================
+
+    def limpiar_cache_crm(self):
+        self._get_pagina.clear()
+        self._get_resumen.clear()
+        self._contar.clear()
+
+    def _insertar(self, tabla: str, datos: Dict[str, Any]) -> bool:
+        try:
+            self.supabase.table(tabla).insert(datos).execute()
+            self.limpiar_cache_crm()
+            return True
+        except Exception as e:
+            st.error(f"❌ Error al guardar en {tabla}: {e}")
+            return False
+
+    def crear_oportunidad(self, datos: Dict[str, Any]) -> bool:
+        return self._insertar("crm_oportunidades", datos)
+
+    def crear_tarea(self, datos: Dict[str, Any]) -> bool:
+        return self._insertar("crm_tareas", datos)
+
+    def crear_comunicacion(self, datos: Dict[str, Any]) -> bool:
+        return self._insertar("crm_comunicaciones", datos)
+
+
+def get_crm_service(supabase, session_state) -> CrmService:
+    return CrmService(supabase, session_state)
@@ -3,6 +3,14 @@ import pandas as pd
 from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime
 from utils import validar_dni_cif
+from services.plataforma_service import get_plataforma_service, registrar_alta, registrar_baja
+from services.migraciones_service import (
+    MigracionConjuntos, DestinoSupabase, MAX_IDS_FILTRO, df_a_registros
+)
+
+# Campos obligatorios de una acción formativa (además de codigo_accion); el
+# upsert de respaldo de las migraciones tiene que llevarlos
+COLUMNAS_OBLIGATORIAS_ACCION = ["nombre", "modalidad", "num_horas"]
 
 class DataService:
     def __init__(self, supabase, session_state):
@@ -435,6 +443,7 @@ class DataService:
             
             if result.data:
                 # Limpiar caches
+                registrar_alta("empresas")
                 _self.get_empresas_con_jerarquia.clear()
                 _self.get_empresas_con_modulos.clear()
                 _self.get_empresas_para_asignacion.clear()
@@ -572,6 +581,7 @@ class DataService:
             
             if res.data:
                 # Limpiar caches
+                registrar_baja("empresas")
                 _self.get_empresas_con_jerarquia.clear()
                 _self.get_empresas_con_modulos.clear()
                 _self.get_empresas_para_asignacion.clear()
@@ -684,6 +694,7 @@ class DataService:
 
             if result.data:
                 empresa_id = result.data[0]["id"]
+                registrar_alta("empresas")
 
                 if crm_data and any(crm_data.values()):
                     crm_data["empresa_id"] = empresa_id
@@ -718,6 +729,7 @@ class DataService:
             _self.supabase.table("empresas").delete().eq("id", empresa_id).execute()
             _self.supabase.table("crm_empresas").delete().eq("empresa_id", empresa_id).execute()
 
+            registrar_baja("empresas")
             _self.get_empresas_con_modulos.clear()
             _self.get_metricas_empresas.clear()
 
@@ -761,6 +773,7 @@ class DataService:
         """Elimina una acción formativa."""
         try:
             _self.supabase.table("acciones_formativas").delete().eq("id", accion_id).execute()
+            registrar_baja("acciones_formativas")
             _self.get_acciones_formativas.clear()
             return True
         except Exception as e:
@@ -1153,6 +1166,7 @@ class DataService:
             res = self.supabase.table("acciones_formativas").insert(data).execute()
             
             if res.data:
+                registrar_alta("acciones_formativas")
                 self.get_acciones_formativas.clear()
                 return True
             else:
@@ -1410,49 +1424,37 @@ class DataService:
             st.error(f"Error al resolver conflicto: {e}")
             return False
     
-    def auto_resolver_conflictos_fundae(self, empresa_id: str = None) -> Dict[str, int]:
+    def auto_resolver_conflictos_fundae(self, empresa_id: str = None, dry_run: bool = False,
+                                        checkpoints=None, progreso=None) -> Dict[str, int]:
         """
         Intenta resolver automáticamente conflictos de códigos FUNDAE generando códigos alternativos.
+        Todas las acciones duplicadas (salvo la primera de cada código) reciben código nuevo
+        calculado en memoria y se escriben por lotes.
         """
         try:
-            conflictos = self.get_reporte_conflictos_fundae()
-            
-            # Filtrar por empresa si se especifica
-            if empresa_id:
-                conflictos = [c for c in conflictos if c["empresa_id"] == empresa_id]
-            
-            resueltos = 0
-            errores = 0
-            
-            for conflicto in conflictos:
-                if conflicto["tipo"] != "codigo_duplicado":
-                    continue
-                
-                # Para cada acción duplicada excepto la primera, generar nuevo código
-                acciones_afectadas = conflicto["acciones_afectadas"]
-                
-                for i, accion in enumerate(acciones_afectadas[1:], 1):  # Empezar desde la segunda
-                    accion_id = accion["id"]
-                    empresa_id_conflicto = conflicto["empresa_id"]
-                    ano_conflicto = conflicto["ano"]
-                    
-                    # Generar código alternativo
-                    nuevo_codigo, error = self.generar_codigo_accion_sugerido(empresa_id_conflicto, ano_conflicto)
-                    
-                    if error:
-                        errores += 1
-                        continue
-                    
-                    # Intentar resolver
-                    if self.resolver_conflicto_codigo_fundae(conflicto, accion_id, nuevo_codigo):
-                        resueltos += 1
-                    else:
-                        errores += 1
-            
+            resumen = {}
+
+            def seleccionar(df):
+                candidatas = df[df["empresa_id"].notna() & df["ano"].notna() & df["codigo_accion"].notna()]
+                if empresa_id:
+                    candidatas = candidatas[candidatas["empresa_id"] == empresa_id]
+                claves = ["empresa_id", "ano", "codigo_accion"]
+                resumen["conflictos"] = candidatas[candidatas.duplicated(claves, keep=False)].groupby(claves).ngroups
+                return candidatas[candidatas.duplicated(claves, keep="first")]
+
+            informe = self._migracion_codigos_accion(
+                "auto_resolver_conflictos_fundae", seleccionar,
+                lambda cambios: {"conflicto_resuelto": True}, resumen
+            ).ejecutar(dry_run=dry_run, checkpoints=checkpoints, progreso=progreso)
+
+            if informe["aplicadas"]:
+                self.get_acciones_formativas.clear()
+
             return {
-                "conflictos_procesados": len(conflictos),
-                "resueltos": resueltos,
-                "errores": errores
+                **informe,
+                "conflictos_procesados": resumen.get("conflictos", 0),
+                "resueltos": informe["aplicadas"],
+                "errores": informe["errores"] + resumen.get("sin_codigo", 0)
             }
             
         except Exception as e:
@@ -1463,86 +1465,130 @@ class DataService:
     # MÉTODOS PARA MIGRACIÓN DE DATOS LEGACY
     # =========================
     
-    def migrar_codigos_fundae_legacy(self) -> Dict[str, int]:
+    def migrar_codigos_fundae_legacy(self, dry_run: bool = False, checkpoints=None,
+                                     progreso=None) -> Dict[str, int]:
         """
         Migra acciones formativas existentes que no tienen códigos FUNDAE válidos.
+        Los códigos nuevos se calculan en memoria y se escriben por lotes (ver migraciones_service).
         """
         try:
-            # Obtener acciones sin código o con códigos problemáticos
-            df_acciones = self.get_acciones_formativas()
-            
-            if df_acciones.empty:
-                return {"procesadas": 0, "migradas": 0, "errores": 0}
-            
-            procesadas = 0
-            migradas = 0
-            errores = 0
-            
-            for _, accion in df_acciones.iterrows():
-                procesadas += 1
-                
-                codigo_actual = accion.get("codigo_accion", "")
-                empresa_id = accion.get("empresa_id")
-                fecha_inicio = accion.get("fecha_inicio")
-                
-                # Determinar si necesita migración
-                necesita_migracion = False
-                
-                # Sin código
-                if not codigo_actual:
-                    necesita_migracion = True
-                
-                # Código muy corto o muy largo
-                elif len(codigo_actual) < 3 or len(codigo_actual) > 20:
-                    necesita_migracion = True
-                
-                # Contiene caracteres no válidos para FUNDAE
-                elif not re.match(r'^[A-Z0-9\-_]+$', codigo_actual.upper()):
-                    necesita_migracion = True
-                
-                if necesita_migracion and empresa_id and fecha_inicio:
-                    try:
-                        ano = datetime.fromisoformat(str(fecha_inicio).replace('Z', '+00:00')).year
-                        
-                        # Generar nuevo código
-                        nuevo_codigo, error = self.generar_codigo_accion_sugerido(empresa_id, ano)
-                        
-                        if error:
-                            errores += 1
-                            continue
-                        
-                        # Actualizar acción
-                        datos_migracion = {
-                            "codigo_accion": nuevo_codigo,
-                            "updated_at": datetime.utcnow().isoformat(),
-                            "migrado_fundae": True,
-                            "codigo_anterior": codigo_actual
-                        }
-                        
-                        res = self.supabase.table("acciones_formativas").update(datos_migracion).eq("id", accion["id"]).execute()
-                        
-                        if res.data:
-                            migradas += 1
-                        else:
-                            errores += 1
-                            
-                    except Exception as e:
-                        errores += 1
-                        continue
-            
+            resumen = {}
+
+            def seleccionar(df):
+                codigo = df["codigo_accion"].fillna("").astype(str)
+                necesita_migracion = (
+                    (codigo.str.len() < 3) | (codigo.str.len() > 20) |
+                    ~codigo.str.upper().str.match(r'^[A-Z0-9\-_]+$')
+                )
+                return df[necesita_migracion & df["empresa_id"].notna() & df["ano"].notna()]
+
+            informe = self._migracion_codigos_accion(
+                "migrar_codigos_fundae_legacy", seleccionar,
+                lambda cambios: {"codigo_anterior": cambios["codigo_accion"], "migrado_fundae": True}, resumen
+            ).ejecutar(dry_run=dry_run, checkpoints=checkpoints, progreso=progreso)
+
             # Limpiar cache al final
-            if migradas > 0:
+            if informe["aplicadas"]:
                 self.get_acciones_formativas.clear()
-            
+
             return {
-                "procesadas": procesadas,
-                "migradas": migradas,
-                "errores": errores
+                **informe,
+                "procesadas": informe["leidas"],
+                "migradas": informe["aplicadas"],
+                "errores": informe["errores"] + resumen.get("sin_codigo", 0)
             }
             
         except Exception as e:
             st.error(f"Error en migración de códigos legacy: {e}")
             return {"procesadas": 0, "migradas": 0, "errores": 1}
+
+    def _prefijos_empresas(self, empresa_ids) -> Dict[str, str]:
+        """Prefijo de código (3 primeras letras del nombre) de cada empresa, en bloque."""
+        ids = [e for e in pd.unique(pd.Series(empresa_ids, dtype=object)) if pd.notna(e)]
+        prefijos = {}
+        for inicio in range(0, len(ids), MAX_IDS_FILTRO):
+            res = self.supabase.table("empresas").select("id, nombre").in_(
+                "id", ids[inicio:inicio + MAX_IDS_FILTRO]
+            ).execute()
+            for empresa in res.data or []:
+                prefijo = "".join(c.upper() for c in empresa.get("nombre") or "" if c.isalpha())[:3]
+                prefijos[empresa["id"]] = prefijo.ljust(3, "X")
+        return prefijos
+
+    def _asignar_codigos_accion(self, df_acciones: pd.DataFrame, objetivo: pd.DataFrame) -> pd.Series:
+        """
+        Asigna a cada acción de `objetivo` el siguiente código libre de su empresa y año
+        con el formato de generar_codigo_accion_sugerido, sin una consulta por acción.
+        Devuelve los códigos con el índice de `objetivo` (NaN si la empresa no existe).
+        """
+        prefijos = self._prefijos_empresas(objetivo["empresa_id"])
+        codigos = df_acciones["codigo_accion"].fillna("").astype(str)
+        nuevos = pd.Series(None, index=objetivo.index, dtype=object)
+
+        for (empresa_id, ano), grupo in objetivo.groupby(["empresa_id", "ano"], sort=False):
+            prefijo = prefijos.get(empresa_id)
+            if not prefijo:
+                continue
+            patron_base = f"{prefijo}{str(int(ano))[-2:]}"
+            mismos = codigos[
+                (df_acciones["empresa_id"] == empresa_id) & (df_acciones["ano"] == ano) &
+                codigos.str.startswith(patron_base)
+            ]
+            usados = set(pd.to_numeric(mismos.str.slice(len(patron_base)), errors="coerce").dropna().astype(int))
+
+            asignados, siguiente = [], 1
+            for _ in range(len(grupo)):
+                while siguiente in usados:
+                    siguiente += 1
+                asignados.append(f"{patron_base}{siguiente:03d}")
+                siguiente += 1
+            nuevos.loc[grupo.index] = asignados
+
+        return nuevos
+
+    def _migracion_codigos_accion(self, nombre: str, seleccionar, marcas, resumen: Dict[str, int]) -> MigracionConjuntos:
+        """
+        Migración de códigos de acción: selecciona filas, asigna códigos y escribe
+        cada lote en una petición con solo las columnas que cambia (código, marcas
+        y updated_at). Las columnas obligatorias de la acción solo viajan si hay
+        que recurrir al upsert (ver DestinoSupabase.actualizar_filas).
+        """
+        destino = DestinoSupabase(self.supabase)
+        columnas_cambiadas = []
+
+        def calcular(df):
+            df = df.assign(ano=pd.to_datetime(df["fecha_inicio"], errors="coerce", utc=True).dt.year)
+            objetivo = seleccionar(df)
+            nuevos = self._asignar_codigos_accion(df, objetivo)
+            resumen["sin_codigo"] = int(nuevos.isna().sum())
+
+            asignados = nuevos.dropna()
+            cambios = objetivo.loc[asignados.index].drop(columns="ano")
+            valores_marcas = marcas(cambios)
+            columnas_cambiadas[:] = ["codigo_accion", *valores_marcas, "updated_at"]
+            return cambios.assign(
+                **valores_marcas,
+                codigo_accion=asignados,
+                updated_at=datetime.utcnow().isoformat()
+            )
+
+        def aplicar_lote(lote):
+            obligatorias = [c for c in COLUMNAS_OBLIGATORIAS_ACCION if c in lote.columns]
+            destino.actualizar_filas(
+                "acciones_formativas", df_a_registros(lote[["id", *columnas_cambiadas, *obligatorias]]),
+                obligatorias=obligatorias
+            )
+
+        return MigracionConjuntos(
+            nombre,
+            cargar=lambda: destino.leer(
+                "acciones_formativas", "*",
+                filtrar=lambda q: self._apply_empresa_filter(q, "acciones_formativas").order("nombre").order("id")
+            ),
+            calcular=calcular,
+            aplicar_lote=aplicar_lote,
+            columnas_huella=["codigo_accion"],
+        )
         
     # =========================
     # MÉTRICAS Y ESTADÍSTICAS GLOBALES
@@ -1576,31 +1622,14 @@ class DataService:
             st.error(f"Error al cargar métricas: {e}")
             return {}
 
-    @st.cache_data(ttl=300)
-    def get_metricas_admin(_self) -> Dict[str, int]:
-        """Obtiene métricas globales para admin."""
+    def get_metricas_admin(self) -> Dict[str, int]:
+        """Obtiene métricas globales para admin (cache de proceso de plataforma_service)."""
         try:
-            try:
-                res = _self.supabase.rpc('get_admin_metrics').execute()
-                if res.data:
-                    return res.data[0]
-            except Exception:
-                pass
-            
-            empresas = _self.supabase.table("empresas").select("*", count="exact").execute().count or 0
-            usuarios = _self.supabase.table("usuarios").select("*", count="exact").execute().count or 0
-            cursos = _self.supabase.table("acciones_formativas").select("*", count="exact").execute().count or 0
-            grupos = _self.supabase.table("grupos").select("*", count="exact").execute().count or 0
-            
-            return {
-                "total_empresas": empresas,
-                "total_usuarios": usuarios,
-                "total_cursos": cursos,
-                "total_grupos": grupos
-            }
+            return get_plataforma_service().get_contadores(self.supabase)
         except Exception as e:
             st.error(f"Error al cargar métricas admin: {e}")
             return {}
+
     # =========================
     # MÉTODOS DE UTILIDAD ADICIONALES
     # =========================
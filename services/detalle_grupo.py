@@ -0,0 +1,157 @@
+"""
+Ficha de un grupo para la página de detalle.
+
+Una sola select embebida sobre grupos trae la fila del grupo con su acción
+formativa, su provincia (con las localidades de esa provincia para el
+desplegable), la empresa centro gestor y las relaciones de tutores,
+empresas (con sus costes y bonificaciones) y participantes. El formulario y
+las secciones de la página leen de la ficha en lugar de consultar cada una
+su tabla de relación, y el libro de costes se construye con la misma fila.
+
+La ficha se guarda en st.session_state por grupo. La invalidan las
+asignaciones y bajas de tutores, empresas y participantes (GruposService y
+ParticipantesService), los cambios de centro gestor y el guardado del
+grupo. El TTL cubre el resto: cambios desde otra sesión y ediciones de los
+datos de tutores, empresas o participantes. Los catálogos comunes
+(acciones formativas, provincias) siguen en los st.cache_data del servicio.
+"""
+
+import time
+from typing import Any, Dict, List, Optional
+
+import streamlit as st
+
+from services.costes_grupo import sembrar_libro_costes
+
+CLAVE_DETALLES = "detalles_grupo"
+TTL_DETALLE = 300  # segundos
+
+# Peticiones esperadas al pintar la página de un grupo con la caché fría:
+# ficha, acciones, provincias, empresas del formulario y los candidatos de
+# tutores, centro gestor, empresas y participantes (con la RPC instalada).
+# Con la ficha y los catálogos en caché quedan solo los candidatos.
+MAX_PETICIONES_DETALLE = 8
+
+SELECT_DETALLE = """
+    *,
+    accion_formativa:acciones_formativas(id, nombre, codigo_accion, modalidad, num_horas),
+    provincia:provincias(id, nombre, localidades(id, nombre)),
+    centro_empresa:empresas!centro_gestor_empresa_id(id, nombre, cif),
+    tutores_grupos(
+        id, tutor_id, fecha_asignacion,
+        tutor:tutores(id, nombre, apellidos, email, especialidad)
+    ),
+    empresas_grupos(
+        id, empresa_id, fecha_asignacion,
+        empresa:empresas(id, nombre, cif, tipo_empresa),
+        costes:empresa_grupo_costes(*),
+        bonificaciones:empresa_grupo_bonificaciones(*)
+    ),
+    participantes_grupos(
+        id, participante_id, fecha_asignacion,
+        participante:participantes(id, nif, nombre, apellidos, email, telefono)
+    )
+"""
+
+EMBEBIDOS = ("accion_formativa", "provincia", "centro_empresa",
+             "tutores_grupos", "empresas_grupos", "participantes_grupos")
+
+
+def _dict(valor: Any) -> Dict[str, Any]:
+    return valor if isinstance(valor, dict) else {}
+
+
+def _relaciones(fila: Dict[str, Any], tabla: str, miembro: str) -> List[Dict[str, Any]]:
+    """Filas de relación cuyo miembro embebido existe (visible para el usuario)."""
+    return [r for r in fila.get(tabla) or [] if isinstance(r.get(miembro), dict)]
+
+
+class DetalleGrupo:
+    """Grupo con sus relaciones, tal como lo necesita la página de detalle."""
+
+    def __init__(self, grupo_id: str, fila: Dict[str, Any]):
+        self.grupo_id = grupo_id
+        self.cargado = time.monotonic()
+        self.grupo = {k: v for k, v in fila.items() if k not in EMBEBIDOS}
+        self.accion = _dict(fila.get("accion_formativa"))
+
+        provincia = _dict(fila.get("provincia"))
+        self.provincia_id = provincia.get("id")
+        self.localidades = sorted(
+            ({"id": loc["id"], "nombre": loc["nombre"]} for loc in provincia.get("localidades") or []),
+            key=lambda loc: loc["nombre"] or ""
+        )
+
+        centro = _dict(fila.get("centro_empresa"))
+        self.centro_gestor = centro if fila.get("centro_gestor_empresa_id") and centro else None
+
+        self.tutores = _relaciones(fila, "tutores_grupos", "tutor")
+        self.empresas = _relaciones(fila, "empresas_grupos", "empresa")
+        self.participantes = _relaciones(fila, "participantes_grupos", "participante")
+
+    # =========================
+    # CARGA
+    # =========================
+
+    @classmethod
+    def cargar(cls, supabase, grupo_id: str) -> Optional["DetalleGrupo"]:
+        res = supabase.table("grupos").select(SELECT_DETALLE).eq("id", grupo_id).limit(1).execute()
+        if not res.data:
+            return None
+        # La misma fila alimenta el libro de costes: la sección de costes no consulta
+        sembrar_libro_costes(grupo_id, res.data[0])
+        return cls(grupo_id, res.data[0])
+
+    def vigente(self) -> bool:
+        return time.monotonic() - self.cargado < TTL_DETALLE
+
+    # =========================
+    # CONSULTAS
+    # =========================
+
+    @property
+    def modalidad(self) -> str:
+        return self.grupo.get("modalidad") or "PRESENCIAL"
+
+    def tutor_ids(self) -> List[str]:
+        return [r["tutor_id"] for r in self.tutores]
+
+    def empresa_ids(self) -> List[str]:
+        return [r["empresa_id"] for r in self.empresas]
+
+    def localidades_de(self, provincia_id) -> Optional[List[Dict[str, Any]]]:
+        """Localidades ya cargadas si es la provincia del grupo; None si hay que pedirlas."""
+        return self.localidades if provincia_id == self.provincia_id else None
+
+
+# =========================
+# CACHÉ DE SESIÓN
+# =========================
+
+def get_detalle_grupo(supabase, grupo_id: str, refrescar: bool = False) -> Optional[DetalleGrupo]:
+    """Ficha del grupo desde la sesión; se carga (una consulta) si falta o ha caducado."""
+    detalles = st.session_state.setdefault(CLAVE_DETALLES, {})
+    detalle = detalles.get(grupo_id)
+    if refrescar or detalle is None or not detalle.vigente():
+        detalle = DetalleGrupo.cargar(supabase, grupo_id)
+        if detalle is None:
+            detalles.pop(grupo_id, None)
+        else:
+            detalles[grupo_id] = detalle
+    return detalle
+
+
+def detalle_en_sesion(grupo_id: str) -> Optional[DetalleGrupo]:
+    """Ficha vigente del grupo si ya está en la sesión, sin consultar."""
+    detalle = (st.session_state.get(CLAVE_DETALLES) or {}).get(grupo_id)
+    return detalle if detalle is not None and detalle.vigente() else None
+
+
+def invalidar_detalle_grupo(grupo_id: Optional[str] = None):
+    detalles = st.session_state.get(CLAVE_DETALLES)
+    if not detalles:
+        return
+    if grupo_id is None:
+        detalles.clear()
+    else:
+        detalles.pop(grupo_id, None)
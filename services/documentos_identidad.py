@@ -0,0 +1,318 @@
+"""
+Validación y clasificación vectorizada de documentos de identidad (NIF/NIE/CIF).
+
+Equivalente por columnas a utils.validar_dni_cif y utils.detectar_tipo_documento_fundae:
+los documentos de 9 caracteres se convierten en una matriz de bytes (n × 9) y
+la letra de control (módulo 23) y el dígito/letra de control del CIF se
+calculan con aritmética entera de numpy, sin expresiones regulares por fila.
+
+Verificación contra las funciones escalares sobre un corpus generado:
+`python -m services.documentos_identidad [documentos]`.
+"""
+
+import json
+import random
+import string
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+LETRAS_DNI = np.frombuffer(b"TRWAGMYFPDXBNJZSQVHLCKE", dtype=np.uint8)
+LETRAS_CONTROL_CIF = np.frombuffer(b"JABCDEFGHI", dtype=np.uint8)
+
+# Clases de carácter como bits de una tabla de 256 entradas: una sola
+# indexación clasifica toda la matriz.
+DIGITO, LETRA, INICIAL_NIE, INICIAL_CIF, CONTROL_A_J, CIF_LETRA, CIF_NUMERO, CIF_MIXTO, ESPACIO = (
+    1, 2, 4, 8, 16, 32, 64, 128, 256
+)
+
+
+def _tabla_clases() -> np.ndarray:
+    tabla = np.zeros(256, dtype=np.uint16)
+    for caracteres, bit in (
+        (b"0123456789", DIGITO),
+        (b"ABCDEFGHIJKLMNOPQRSTUVWXYZ", LETRA),
+        (b"XYZ", INICIAL_NIE),
+        (b"ABCDEFGHJKLMNPQRSUVW", INICIAL_CIF),
+        (b"ABCDEFGHIJ", CONTROL_A_J),
+        # Primera letra del CIF según el tipo de control que admite
+        (b"KPQSNW", CIF_LETRA),
+        (b"ABEH", CIF_NUMERO),
+        (b"CDFGJRUV", CIF_MIXTO),
+        # Los espacios ASCII que quita str.strip()
+        (b"\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f ", ESPACIO),
+    ):
+        tabla[np.frombuffer(caracteres, dtype=np.uint8)] |= bit
+    return tabla
+
+
+CLASES = _tabla_clases()
+
+TIPO_FUNDAE_NIF = 10
+TIPO_FUNDAE_PASAPORTE = 20
+TIPO_FUNDAE_NIE = 60
+
+_POTENCIAS = 10 ** np.arange(7, -1, -1, dtype=np.int64)
+ANCHO_MATRIZ = 16  # los documentos más largos (raros) se normalizan fila a fila
+
+
+# =========================
+# MATRICES DE CARACTERES
+# =========================
+
+def _matriz_codigos(documentos: pd.Series):
+    """
+    Documentos -> matriz de caracteres en mayúsculas (n × ANCHO_MATRIZ, uint8,
+    relleno con 0) a partir de la representación UCS-4 de numpy.
+
+    Devuelve (textos, matriz, largos, rapidas): `rapidas` marca las filas que
+    caben en la matriz y son ASCII; el resto (raras) se trata fila a fila.
+    """
+    textos = documentos.where(documentos.notna(), "").astype(str).to_numpy(dtype=object)
+    largos = np.fromiter(map(len, textos), dtype=np.int64, count=len(textos))
+    cortos = largos <= ANCHO_MATRIZ
+    unicode = np.where(cortos, textos, "").astype(f"U{ANCHO_MATRIZ}")
+    codigos = unicode.view(np.uint32).reshape(len(textos), ANCHO_MATRIZ)
+    rapidas = cortos & (codigos < 128).all(axis=1)
+
+    matriz = codigos.astype(np.uint8)
+    minusculas = (matriz >= ord("a")) & (matriz <= ord("z"))
+    matriz[minusculas] -= 32
+    return textos, matriz, largos, rapidas
+
+
+def _compactar(matriz: np.ndarray, quitar: np.ndarray):
+    """Elimina de cada fila los caracteres marcados en `quitar` (y el relleno)."""
+    conservar = ~quitar & (matriz != 0)
+    destino = np.cumsum(conservar, axis=1) - 1
+    filas = np.broadcast_to(np.arange(len(matriz))[:, None], matriz.shape)
+    compacta = np.zeros_like(matriz)
+    compacta[filas[conservar], destino[conservar]] = matriz[conservar]
+    return compacta, conservar.sum(axis=1)
+
+
+# =========================
+# VALIDACIÓN
+# =========================
+
+def _control_cif(numeros: np.ndarray) -> np.ndarray:
+    """Unidad de control del CIF a partir de sus 7 dígitos centrales (matriz n × 7)."""
+    suma_pares = numeros[:, 1] + numeros[:, 3] + numeros[:, 5]
+    dobles = numeros[:, [0, 2, 4, 6]] * 2
+    suma_impares = (dobles // 10 + dobles % 10).sum(axis=1)
+    return (10 - (suma_pares + suma_impares) % 10) % 10
+
+
+def _validar_matriz(m: np.ndarray):
+    """Devuelve (valido, tipo) para una matriz uint8 de documentos normalizados de 9 caracteres."""
+    clases = CLASES[m]
+    primera, ultima = clases[:, 0], clases[:, 8]
+    centro_digitos = (np.bitwise_and.reduce(clases[:, 1:8], axis=1) & DIGITO) != 0
+    final_letra = (ultima & LETRA) != 0
+
+    es_nif = ((primera & DIGITO) != 0) & centro_digitos & final_letra
+    es_nie = ((primera & INICIAL_NIE) != 0) & centro_digitos & final_letra
+    es_cif = ((primera & INICIAL_CIF) != 0) & centro_digitos & ((ultima & (DIGITO | CONTROL_A_J)) != 0)
+
+    # NIF / NIE: letra = LETRAS_DNI[número % 23]; en el NIE X/Y/Z valen 0/1/2
+    centrales = m[:, 1:8].astype(np.int64) - ord("0")
+    numero = centrales @ _POTENCIAS[1:]
+    inicial = np.where(es_nie, m[:, 0].astype(np.int64) - ord("X"), m[:, 0].astype(np.int64) - ord("0"))
+    letra_ok = LETRAS_DNI[(inicial * 10 ** 7 + numero) % 23] == m[:, 8]
+
+    # CIF: control numérico o letra según la primera letra
+    unidad = _control_cif(centrales)
+    control_numero = m[:, 8] == unidad + ord("0")
+    control_letra = m[:, 8] == LETRAS_CONTROL_CIF[unidad]
+    cif_ok = (
+        (((primera & CIF_LETRA) != 0) & control_letra)
+        | (((primera & CIF_NUMERO) != 0) & control_numero)
+        | (((primera & CIF_MIXTO) != 0) & (control_numero | control_letra))
+    )
+
+    # Mismo orden de prioridad que validar_dni_cif: DNI, NIE y después CIF
+    valido = np.where(es_nif | es_nie, letra_ok, es_cif & cif_ok)
+    tipo = np.select([es_nif, es_nie, es_cif], ["NIF", "NIE", "CIF"], default="")
+    return valido, tipo
+
+
+def _normalizar(documento: str) -> str:
+    return documento.upper().replace("-", "").replace(" ", "")
+
+
+def validar_documentos(documentos: pd.Series) -> pd.DataFrame:
+    """
+    Valida y clasifica una Series de documentos de una vez.
+
+    Devuelve un DataFrame alineado con el índice de entrada:
+    - tipo: "NIF", "NIE", "CIF" o "" si no tiene ninguno de esos formatos
+    - valido: mismo resultado que validar_dni_cif (formato y control)
+    - tipo_documento_fundae: mismo resultado que detectar_tipo_documento_fundae (10/60/20)
+    """
+    textos, matriz, largos, rapidas = _matriz_codigos(documentos)
+    tipo_fundae = _tipo_fundae_matriz(textos, matriz, largos, rapidas)
+
+    # Quitar guiones y espacios solo en las filas que los tienen
+    separadores = (matriz == ord("-")) | (matriz == ord(" "))
+    con_separadores = np.flatnonzero(separadores.any(axis=1))
+    if len(con_separadores):
+        matriz[con_separadores], largos[con_separadores] = _compactar(
+            matriz[con_separadores], separadores[con_separadores]
+        )
+    # El `$` de las expresiones de validar_dni_cif admite un salto de línea final
+    largos = np.where((largos == 10) & (matriz[:, 9] == ord("\n")), 9, largos)
+    candidatos = rapidas & (largos == 9)
+    matriz = matriz[:, :9].copy()
+
+    # Filas largas o con caracteres no ASCII (upper() puede cambiar su longitud)
+    for i in np.flatnonzero(~rapidas):
+        d = _normalizar(textos[i])
+        d = d[:-1] if d.endswith("\n") else d
+        if len(d) == 9 and d.isascii():
+            matriz[i] = np.frombuffer(d.encode("ascii"), dtype=np.uint8)
+            candidatos[i] = True
+
+    valido = np.zeros(len(textos), dtype=bool)
+    tipo = np.full(len(textos), "", dtype=object)
+    if candidatos.any():
+        valido[candidatos], tipo[candidatos] = _validar_matriz(matriz[candidatos])
+
+    return pd.DataFrame({
+        "tipo": tipo,
+        "valido": valido,
+        "tipo_documento_fundae": tipo_fundae,
+    }, index=documentos.index)
+
+
+def tipo_documento_fundae(documentos: pd.Series) -> pd.Series:
+    """
+    Tipo de documento FUNDAE por formato (10 NIF, 60 NIE, 20 pasaporte),
+    igual que detectar_tipo_documento_fundae: vacío cuenta como NIF.
+    """
+    return pd.Series(_tipo_fundae_matriz(*_matriz_codigos(documentos)), index=documentos.index)
+
+
+def _tipo_fundae_matriz(textos: np.ndarray, codigos: np.ndarray, largos: np.ndarray,
+                        rapidas: np.ndarray) -> np.ndarray:
+    clases = CLASES[codigos]
+    filas = np.arange(len(codigos))
+    inicio = np.zeros(len(codigos), dtype=np.int64)
+    fin = np.maximum(np.minimum(largos, ANCHO_MATRIZ) - 1, 0)
+
+    # strip(): solo las filas que empiezan o terminan en espacio necesitan buscar los bordes
+    con_bordes = np.flatnonzero(((clases[:, 0] | clases[filas, fin]) & ESPACIO) != 0)
+    if len(con_bordes):
+        contenido = ((clases[con_bordes] & ESPACIO) == 0) & (codigos[con_bordes] != 0)
+        inicio[con_bordes] = contenido.argmax(axis=1)
+        fin[con_bordes] = np.where(
+            contenido.any(axis=1), ANCHO_MATRIZ - 1 - contenido[:, ::-1].argmax(axis=1), -1
+        )
+    nueve = rapidas & (fin - inicio + 1 == 9)
+
+    c = clases[:, :9].copy()
+    if len(con_bordes):
+        c[con_bordes] = np.take_along_axis(
+            clases[con_bordes], np.minimum(inicio[con_bordes, None] + np.arange(9), ANCHO_MATRIZ - 1), axis=1
+        )
+    centro_digitos = (np.bitwise_and.reduce(c[:, 1:8], axis=1) & DIGITO) != 0
+    letra_final = (c[:, 8] & LETRA) != 0
+    es_nie = ((c[:, 0] & INICIAL_NIE) != 0) & centro_digitos & letra_final
+    es_nif = ((c[:, 0] & DIGITO) != 0) & centro_digitos & letra_final
+
+    tipo = np.select(
+        [largos == 0, nueve & es_nie, nueve & es_nif],
+        [TIPO_FUNDAE_NIF, TIPO_FUNDAE_NIE, TIPO_FUNDAE_NIF],
+        default=TIPO_FUNDAE_PASAPORTE
+    )
+
+    # Largos o no ASCII (dígitos o letras Unicode): misma lógica que la función escalar
+    lentas = np.flatnonzero(~rapidas)
+    if len(lentas):
+        tipo[lentas] = [_tipo_fundae_escalar(t.strip().upper()) for t in textos[lentas]]
+    return tipo
+
+
+def _tipo_fundae_escalar(doc: str) -> int:
+    if len(doc) != 9:
+        return TIPO_FUNDAE_PASAPORTE
+    if doc[0] in "XYZ" and doc[1:8].isdigit() and doc[8].isalpha():
+        return TIPO_FUNDAE_NIE
+    if doc[:8].isdigit() and doc[8].isalpha():
+        return TIPO_FUNDAE_NIF
+    return TIPO_FUNDAE_PASAPORTE
+
+
+# =========================
+# VERIFICACIÓN CONTRA LA VERSIÓN ESCALAR
+# =========================
+
+def _documento_corpus(rnd: random.Random) -> Optional[str]:
+    letras = string.ascii_uppercase
+    tipo = rnd.random()
+    if tipo < 0.3:
+        numero = rnd.randint(0, 99999999)
+        control = "TRWAGMYFPDXBNJZSQVHLCKE"[numero % 23] if rnd.random() < 0.7 else rnd.choice(letras)
+        doc = f"{numero:08d}{control}"
+    elif tipo < 0.45:
+        numero = rnd.randint(0, 9999999)
+        inicial = rnd.choice("XYZ")
+        control = "TRWAGMYFPDXBNJZSQVHLCKE"[int(str("XYZ".index(inicial)) + f"{numero:07d}") % 23] \
+            if rnd.random() < 0.7 else rnd.choice(letras)
+        doc = f"{inicial}{numero:07d}{control}"
+    elif tipo < 0.7:
+        doc = rnd.choice(letras) + f"{rnd.randint(0, 9999999):07d}" + rnd.choice(string.digits + "ABCDEFGHIJ")
+    elif tipo < 0.9:
+        doc = "".join(rnd.choice(letras + string.digits) for _ in range(rnd.randint(1, 12)))
+    elif tipo < 0.97:
+        return rnd.choice([None, "", " ", "-", "12345678-Z ", "ñ2345678A", "１２３４５６７８Z", "x1234567l", "12345678Z\n"])
+    else:
+        doc = f"{rnd.randint(0, 99999999):08d}"
+    # Variantes de escritura que también normaliza validar_dni_cif
+    variante = rnd.random()
+    if variante < 0.1:
+        doc = doc.lower()
+    elif variante < 0.15:
+        doc = f"{doc[:-1]}-{doc[-1:]}"
+    elif variante < 0.2:
+        doc = f" {doc} "
+    return doc
+
+
+def verificar_contra_escalar(n_documentos: int = 1_000_000, semilla: int = 23) -> Dict[str, Any]:
+    """Compara validar_documentos con las funciones escalares de utils sobre un corpus aleatorio."""
+    from utils import validar_dni_cif, detectar_tipo_documento_fundae
+
+    rnd = random.Random(semilla)
+    corpus = pd.Series([_documento_corpus(rnd) for _ in range(n_documentos)], dtype=object)
+
+    t0 = time.perf_counter()
+    esperado_valido = np.array([validar_dni_cif(d) for d in corpus])
+    esperado_tipo = np.array([detectar_tipo_documento_fundae(d) for d in corpus])
+    t_escalar = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    resultado = validar_documentos(corpus)
+    t_vectorizado = time.perf_counter() - t0
+
+    difieren_valido = esperado_valido != resultado["valido"].to_numpy()
+    difieren_tipo = esperado_tipo != resultado["tipo_documento_fundae"].to_numpy()
+    return {
+        "documentos": n_documentos,
+        "validos": int(esperado_valido.sum()),
+        "por_tipo": resultado["tipo"].replace("", "otro").value_counts().to_dict(),
+        "escalar_segundos": round(t_escalar, 3),
+        "vectorizado_segundos": round(t_vectorizado, 3),
+        "aceleracion": round(t_escalar / t_vectorizado, 1) if t_vectorizado else None,
+        "discrepancias_valido": int(difieren_valido.sum()),
+        "discrepancias_tipo_fundae": int(difieren_tipo.sum()),
+        "ejemplos_discrepancia": corpus[difieren_valido | difieren_tipo].head(10).tolist(),
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(json.dumps(verificar_contra_escalar(n), indent=2, ensure_ascii=False, default=str))
@@ -3,6 +3,7 @@ import pandas as pd
 from typing import Dict, List, Optional, Tuple, Any
 from datetime import datetime
 from utils import validar_dni_cif
+from services.plataforma_service import registrar_alta, registrar_baja
 
 class EmpresasService:
     """
@@ -231,6 +232,7 @@ class EmpresasService:
             
             if result.data:
                 # Limpiar caches
+                registrar_alta("empresas")
                 self.get_empresas_con_jerarquia.clear()
                 return True, result.data[0]["id"]
             else:
@@ -425,6 +427,7 @@ class EmpresasService:
             
             if res.data:
                 # Limpiar caches
+                registrar_baja("empresas")
                 self.get_empresas_con_jerarquia.clear()
                 return True
             return False
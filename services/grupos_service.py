@@ -2,7 +2,11 @@ import streamlit as st
 import pandas as pd
 import uuid
 import re
-from utils import validar_uuid_seguro, validar_codigo_grupo_fundae
+from utils import validar_uuid_seguro, validar_codigo_grupo_fundae, log_accion
+from services.plataforma_service import registrar_alta
+from services.costes_grupo import invalidar_libro_costes, limite_fundae
+from services.credito_fundae import get_motor_credito
+from services.detalle_grupo import detalle_en_sesion, invalidar_detalle_grupo
 from datetime import datetime, time, date
 from typing import Dict, Any, Tuple, List, Optional
 
@@ -224,9 +228,7 @@ class GruposService:
     def calcular_limite_fundae(self, modalidad: str, horas: int, participantes: int) -> Tuple[float, float]:
         """Calcula límite máximo FUNDAE según modalidad."""
         try:
-            tarifa = 7.5 if modalidad in ["Teleformación", "TELEFORMACION"] else 13.0
-            limite = tarifa * horas * participantes
-            return limite, tarifa
+            return limite_fundae(modalidad, horas, participantes)
         except:
             return 0, 0
             
@@ -291,6 +293,16 @@ class GruposService:
         except Exception as e:
             return False, f"Error al validar código: {e}"
             
+    @st.cache_data(ttl=300)
+    def get_empresas_gestionables(_self, empresa_id: str) -> List[str]:
+        """Empresa del gestor y sus empresas clientes (empresa_matriz_id)."""
+        try:
+            res = _self.supabase.table("empresas").select("id").eq("empresa_matriz_id", empresa_id).execute()
+            return [empresa_id] + [c["id"] for c in (res.data or [])]
+        except Exception as e:
+            st.error(f"Error cargando empresas clientes: {e}")
+            return [empresa_id]
+
     def get_empresas_centro_gestor_disponibles(self) -> Dict[str, str]:
         """Obtiene empresas marcadas como centro gestor según jerarquía."""
         try:
@@ -298,10 +310,7 @@ class GruposService:
                 query = self.supabase.table("empresas").select("id, nombre").eq("es_centro_gestor", True)
             elif self.rol == "gestor" and self.empresa_id:
                 # Gestor: su empresa + clientes que sean centro gestor
-                empresas_permitidas = [self.empresa_id]
-                clientes = self.supabase.table("empresas").select("id").eq("empresa_matriz_id", self.empresa_id).execute()
-                empresas_permitidas.extend([c["id"] for c in (clientes.data or [])])
-                
+                empresas_permitidas = self.get_empresas_gestionables(self.empresa_id)
                 query = self.supabase.table("empresas").select("id, nombre").eq("es_centro_gestor", True).in_("id", empresas_permitidas)
             else:
                 return {}
@@ -333,6 +342,7 @@ class GruposService:
                 "centro_gestor_empresa_id": empresa_id,
                 "updated_at": datetime.utcnow().isoformat()
             }).eq("id", grupo_id).execute()
+            invalidar_detalle_grupo(grupo_id)
             return True
         except Exception as e:
             st.error(f"Error asignando centro gestor: {e}")
@@ -345,6 +355,7 @@ class GruposService:
                 "centro_gestor_empresa_id": None,
                 "updated_at": datetime.utcnow().isoformat()
             }).eq("id", grupo_id).execute()
+            invalidar_detalle_grupo(grupo_id)
             return True
         except Exception as e:
             st.error(f"Error quitando centro gestor: {e}")
@@ -487,6 +498,9 @@ class GruposService:
         """
         Obtiene el código numérico de la acción formativa para mostrar al usuario.
         """
+        accion = self._accion_en_cache(accion_formativa_id)
+        if accion and accion.get("codigo_accion") is not None:
+            return str(accion["codigo_accion"])
         try:
             accion_res = self.supabase.table("acciones_formativas").select(
                 "codigo_accion"
@@ -1186,6 +1200,8 @@ class GruposService:
             datos_editados["updated_at"] = datetime.utcnow().isoformat()
             self.supabase.table("grupos").update(datos_editados).eq("id", grupo_id).execute()
             self.limpiar_cache_grupos()
+            invalidar_detalle_grupo(grupo_id)
+            log_accion("grupo_actualizado", self.user_id, {"grupo_id": grupo_id, "campos": list(datos_editados)})
             return True
         except Exception as e:
             st.error(f"Error al actualizar grupo: {e}")
@@ -1211,8 +1227,6 @@ class GruposService:
                 self.get_empresas_grupo.clear()
             if hasattr(self, 'get_participantes_grupo'):
                 self.get_participantes_grupo.clear()
-            if hasattr(self, 'get_participantes_disponibles_jerarquia'):
-                self.get_participantes_disponibles_jerarquia.clear()
             if hasattr(self, 'get_grupo_costes'):
                 self.get_grupo_costes.clear()
             if hasattr(self, 'get_grupo_bonificaciones'):
@@ -1268,8 +1282,19 @@ class GruposService:
             st.error(f"Error al cargar localidades: {e}")
             return []
 
+    def _accion_en_cache(self, accion_id: str) -> Optional[Dict[str, Any]]:
+        """Fila de la acción en get_acciones_formativas (ya en caché), o None si no está."""
+        df = self.get_acciones_formativas()
+        if df.empty or "id" not in df.columns:
+            return None
+        filas = df[df["id"] == accion_id]
+        return filas.iloc[0].to_dict() if not filas.empty else None
+
     def get_accion_modalidad(self, accion_id: str) -> str:
         """Devuelve la modalidad de una acción formativa concreta."""
+        accion = self._accion_en_cache(accion_id)
+        if accion and "modalidad" in accion:
+            return accion.get("modalidad") or ""
         try:
             res = self.supabase.table("acciones_formativas").select("modalidad").eq("id", accion_id).execute()
             if res.data:
@@ -1385,12 +1410,14 @@ class GruposService:
                 return False, ""
         
             grupo_id = res.data[0]["id"]
+            registrar_alta("grupos")
         
             # Auto-asignar empresa propietaria como empresa participante
             self.create_empresa_grupo(grupo_id, datos_grupo["empresa_id"])
         
             # Limpiar caches
             self.limpiar_cache_grupos()
+            log_accion("grupo_creado", self.user_id, {"grupo_id": grupo_id, "codigo_grupo": datos_grupo.get("codigo_grupo")})
         
             return True, grupo_id
         
@@ -1398,19 +1425,27 @@ class GruposService:
             st.error(f"Error al crear grupo: {e}")
             return False, ""
 
-    def get_empresas_asignables_a_grupo(self, grupo_id: str) -> Dict[str, str]:
-        """Obtiene empresas que pueden asignarse como participantes de un grupo específico."""
+    def get_empresas_asignables_a_grupo(self, grupo_id: str, detalle=None) -> Dict[str, str]:
+        """
+        Obtiene empresas que pueden asignarse como participantes de un grupo específico.
+        Con la ficha del grupo (DetalleGrupo) se toman de ella la empresa
+        propietaria y las empresas ya asignadas.
+        """
         try:
-            # Obtener empresa propietaria del grupo
-            grupo_info = self.supabase.table("grupos").select("empresa_id").eq("id", grupo_id).execute()
-            if not grupo_info.data:
-                return {}
-        
-            empresa_propietaria = grupo_info.data[0]["empresa_id"]
-        
-            # Obtener empresas ya asignadas
-            empresas_ya_asignadas = self.supabase.table("empresas_grupos").select("empresa_id").eq("grupo_id", grupo_id).execute()
-            empresas_asignadas_ids = [e["empresa_id"] for e in (empresas_ya_asignadas.data or [])]
+            if detalle is not None:
+                empresa_propietaria = detalle.grupo.get("empresa_id")
+                empresas_asignadas_ids = detalle.empresa_ids()
+            else:
+                # Obtener empresa propietaria del grupo
+                grupo_info = self.supabase.table("grupos").select("empresa_id").eq("id", grupo_id).execute()
+                if not grupo_info.data:
+                    return {}
+
+                empresa_propietaria = grupo_info.data[0]["empresa_id"]
+
+                # Obtener empresas ya asignadas
+                empresas_ya_asignadas = self.supabase.table("empresas_grupos").select("empresa_id").eq("grupo_id", grupo_id).execute()
+                empresas_asignadas_ids = [e["empresa_id"] for e in (empresas_ya_asignadas.data or [])]
         
             # Obtener empresas disponibles según jerarquía
             if self.rol == "admin":
@@ -1470,6 +1505,7 @@ class GruposService:
             # Limpiar cache
             if hasattr(self, 'get_empresas_grupo'):
                 self.get_empresas_grupo.clear()
+            invalidar_detalle_grupo()
         
             return True
         except Exception as e:
@@ -1484,6 +1520,7 @@ class GruposService:
             # Limpiar cache
             if hasattr(self, 'get_empresas_grupo'):
                 self.get_empresas_grupo.clear()
+            invalidar_detalle_grupo()
         
             return True
         except Exception as e:
@@ -1576,6 +1613,7 @@ class GruposService:
             # Limpiar cache
             if hasattr(self, 'get_tutores_grupo'):
                 self.get_tutores_grupo.clear()
+            invalidar_detalle_grupo()
         
             return True
         except Exception as e:
@@ -1590,6 +1628,7 @@ class GruposService:
             # Limpiar cache
             if hasattr(self, 'get_tutores_grupo'):
                 self.get_tutores_grupo.clear()
+            invalidar_detalle_grupo()
         
             return True
         except Exception as e:
@@ -1638,94 +1677,256 @@ class GruposService:
             return _self._handle_query_error("cargar participantes de grupo", e)
     
     
-    def get_participantes_disponibles_jerarquia(self, grupo_id: str) -> pd.DataFrame:
-        """Obtiene participantes disponibles según jerarquía empresarial."""
+    # Función SQL opcional (anti-join en servidor):
+    #   participantes_disponibles_grupo(p_grupo_id uuid, p_empresas uuid[], p_busqueda text,
+    #                                   p_nifs text[], p_limite int, p_offset int)
+    #   returns table(id uuid, nif text, nombre text, apellidos text, email text,
+    #                 telefono text, empresa_id uuid, empresa_nombre text)
+    #   -- from participantes p join empresas e on e.id = p.empresa_id
+    #   -- where p.empresa_id = any(p_empresas)
+    #   --   and not exists (select 1 from participantes_grupos pg
+    #   --                   where pg.participante_id = p.id and pg.grupo_id = p_grupo_id)
+    #   --   and (p_busqueda is null or p.nif ilike '%'||p_busqueda||'%' or p.nombre ilike ...)
+    #   --   and (p_nifs is null or upper(p.nif) = any(p_nifs))
+    #   -- order by p.apellidos, p.nombre, p.id limit p_limite offset p_offset
+    RPC_DISPONIBLES = "participantes_disponibles_grupo"
+
+    COLUMNAS_DISPONIBLES = ["id", "nif", "nombre", "apellidos", "email", "telefono",
+                            "empresa_id", "empresa_nombre"]
+
+    def _empresas_candidatas(self, grupo_id: str) -> List[str]:
+        """
+        Empresas cuyos participantes pueden entrar en el grupo (limitadas por
+        rol). Si la ficha del grupo está en la sesión se toman de ella.
+        """
+        detalle = detalle_en_sesion(grupo_id)
+        if detalle is not None:
+            fila = {"empresa_id": detalle.grupo.get("empresa_id"), "empresas_grupos": detalle.empresas}
+        else:
+            grupo = self.supabase.table("grupos").select(
+                "empresa_id, empresas_grupos(empresa_id)"
+            ).eq("id", grupo_id).execute()
+            if not grupo.data:
+                return []
+            fila = grupo.data[0]
+        empresas_ids = {e["empresa_id"] for e in (fila.get("empresas_grupos") or []) if e.get("empresa_id")}
+        if fila.get("empresa_id"):
+            empresas_ids.add(fila["empresa_id"])
+
+        if self.rol == "gestor":
+            empresas_ids &= set(self.get_empresas_gestionables(self.empresa_id))
+
+        return sorted(empresas_ids)
+
+    @staticmethod
+    def _limpiar_busqueda(texto: str) -> str:
+        """Quita los caracteres con significado en la sintaxis de filtros de PostgREST."""
+        return re.sub(r"[,()*%\\]", " ", texto or "").strip()
+
+    def buscar_participantes_disponibles(self, grupo_id: str, busqueda: str = "",
+                                         nifs: Optional[List[str]] = None,
+                                         limite: int = 50, desplazamiento: int = 0) -> Tuple[pd.DataFrame, bool]:
+        """
+        Participantes de las empresas del grupo que aún no están en él.
+
+        El anti-join se resuelve en la base de datos (RPC o, si no existe, un
+        embebido de participantes_grupos filtrado por is.null), así que solo
+        viaja la página pedida. Devuelve (página, hay_mas).
+        """
+        vacio = pd.DataFrame(columns=self.COLUMNAS_DISPONIBLES)
+        if not grupo_id or grupo_id == "None":
+            return vacio, False
+        if self.rol == "gestor" and not self.empresa_id:
+            return vacio, False  # Gestor sin empresa asignada
+
         try:
-            # Validar parámetros de entrada
-            if not grupo_id or grupo_id == "None":
-                return pd.DataFrame()
-            
-            if self.rol == "gestor" and not self.empresa_id:
-                return pd.DataFrame()  # Gestor sin empresa asignada
-    
-            # Participantes ya asignados
-            participantes_asignados = self.supabase.table("participantes_grupos") \
-                .select("participante_id").eq("grupo_id", grupo_id).execute()
-            participantes_asignados_ids = [p["participante_id"] for p in (participantes_asignados.data or [])]
-    
-            # Empresas participantes del grupo
-            empresas_grupo = self.supabase.table("empresas_grupos").select("empresa_id").eq("grupo_id", grupo_id).execute()
-            empresas_ids = [e["empresa_id"] for e in (empresas_grupo.data or [])]
-    
-            # Empresa propietaria
-            grupo_info = self.supabase.table("grupos").select("empresa_id").eq("id", grupo_id).execute()
-            if grupo_info.data:
-                empresas_ids.append(grupo_info.data[0]["empresa_id"])
-    
+            empresas_ids = self._empresas_candidatas(grupo_id)
             if not empresas_ids:
-                return pd.DataFrame()
-    
-            # Participantes de empresas participantes
-            query = self.supabase.table("participantes").select("""
-                id, nif, nombre, apellidos, email, telefono, empresa_id,
-                empresa:empresas(nombre)
-            """).in_("empresa_id", empresas_ids)
-    
-            # Filtro por rol
-            if self.rol == "gestor" and self.empresa_id:
-                query = query.or_(f"empresa_id.eq.{self.empresa_id},empresa.empresa_matriz_id.eq.{self.empresa_id}")
-    
-            res = query.execute()
-            df = pd.DataFrame(res.data or [])
-    
-            if not df.empty:
-                df["empresa_nombre"] = df["empresa"].apply(
-                    lambda x: x.get("nombre") if isinstance(x, dict) else ""
-                )
-                df = df[~df["id"].isin(participantes_asignados_ids)]
-    
-            return df
-    
-        except Exception as e:
-            return self._handle_query_error("cargar participantes disponibles", e)
+                return vacio, False
 
-    def asignar_participante_a_grupo(self, participante_id: str, grupo_id: str) -> bool:
-        """Asigna un participante a un grupo."""
-        try:
-            datos = {
-                "grupo_id": grupo_id,
-                "participante_id": participante_id,
-                "fecha_asignacion": datetime.utcnow().isoformat()
-            }
-        
-            self.supabase.table("participantes_grupos").insert(datos).execute()
-        
-            # Limpiar cache
-            if hasattr(self, 'get_participantes_grupo'):
-                self.get_participantes_grupo.clear()
-            if hasattr(self, 'get_participantes_disponibles_jerarquia'):
-                self.get_participantes_disponibles_jerarquia.clear()
-        
-            return True
-        except Exception as e:
-            st.error(f"Error al asignar participante al grupo: {e}")
-            return False
+            busqueda = self._limpiar_busqueda(busqueda)
+            if nifs:
+                # Se envían tal cual y en mayúsculas por si la tabla guarda alguno sin normalizar
+                nifs = sorted({v for n in nifs for v in (str(n).strip(), str(n).strip().upper()) if v})
+
+            # Se pide una fila de más para saber si hay página siguiente
+            try:
+                filas = self.supabase.rpc(self.RPC_DISPONIBLES, {
+                    "p_grupo_id": grupo_id,
+                    "p_empresas": empresas_ids,
+                    "p_busqueda": busqueda or None,
+                    "p_nifs": nifs,
+                    "p_limite": limite + 1,
+                    "p_offset": desplazamiento,
+                }).execute().data or []
+            except Exception:
+                query = self.supabase.table("participantes").select(
+                    "id, nif, nombre, apellidos, email, telefono, empresa_id, "
+                    "empresa:empresas(nombre), inscripcion:participantes_grupos(grupo_id)"
+                ).in_("empresa_id", empresas_ids) \
+                    .eq("inscripcion.grupo_id", grupo_id) \
+                    .is_("inscripcion", "null")
+                if busqueda:
+                    query = query.or_(
+                        f"nif.ilike.*{busqueda}*,nombre.ilike.*{busqueda}*,"
+                        f"apellidos.ilike.*{busqueda}*,email.ilike.*{busqueda}*"
+                    )
+                if nifs:
+                    query = query.in_("nif", nifs)
+                filas = query.order("apellidos").order("nombre").order("id") \
+                    .range(desplazamiento, desplazamiento + limite).execute().data or []
+                for fila in filas:
+                    empresa = fila.pop("empresa", None)
+                    fila.pop("inscripcion", None)
+                    fila["empresa_nombre"] = empresa.get("nombre", "") if isinstance(empresa, dict) else ""
+
+            hay_mas = len(filas) > limite
+            return pd.DataFrame(filas[:limite], columns=self.COLUMNAS_DISPONIBLES), hay_mas
 
-    def desasignar_participante_de_grupo(self, relacion_id: str) -> bool:
-        """Desasigna un participante de un grupo."""
-        try:
-            self.supabase.table("participantes_grupos").delete().eq("id", relacion_id).execute()
-        
-            # Limpiar cache
-            if hasattr(self, 'get_participantes_grupo'):
-                self.get_participantes_grupo.clear()
-            if hasattr(self, 'get_participantes_disponibles_jerarquia'):
-                self.get_participantes_disponibles_jerarquia.clear()
-        
-            return True
         except Exception as e:
-            st.error(f"Error al desasignar participante del grupo: {e}")
-            return False
+            return self._handle_query_error("cargar participantes disponibles", e), False
+
+    def get_participantes_disponibles_jerarquia(self, grupo_id: str, busqueda: str = "",
+                                                limite: int = 50, desplazamiento: int = 0) -> pd.DataFrame:
+        """Obtiene participantes disponibles según jerarquía empresarial (una página)."""
+        df, _ = self.buscar_participantes_disponibles(grupo_id, busqueda, limite=limite,
+                                                      desplazamiento=desplazamiento)
+        return df
+
+    def resolver_nifs_disponibles(self, grupo_id: str, nifs: List[str], lote: int = 150) -> Dict[str, str]:
+        """
+        {NIF: participante_id} de los NIF que pueden asignarse al grupo.
+
+        Los NIF se consultan por lotes; los que no aparecen no existen, son de
+        otra empresa o ya están en el grupo.
+        """
+        nifs = sorted({str(n).strip().upper() for n in nifs if str(n).strip()})
+        resueltos = {}
+        for i in range(0, len(nifs), lote):
+            bloque = nifs[i:i + lote]
+            desplazamiento, hay_mas = 0, True
+            while hay_mas:
+                df, hay_mas = self.buscar_participantes_disponibles(
+                    grupo_id, nifs=bloque, limite=lote, desplazamiento=desplazamiento
+                )
+                for _, fila in df.iterrows():
+                    resueltos.setdefault(str(fila["nif"]).strip().upper(), fila["id"])
+                desplazamiento += lote
+        return resueltos
+
+    # =========================
+    # ASIGNACIONES EN BLOQUE
+    # =========================
+
+    # tipo → (tabla de relación, columna del miembro, caches que dependen de ella)
+    RELACIONES_GRUPO = {
+        "participantes": ("participantes_grupos", "participante_id",
+                          ("get_participantes_grupo",)),
+        "tutores": ("tutores_grupos", "tutor_id", ("get_tutores_grupo",)),
+        "empresas": ("empresas_grupos", "empresa_id", ("get_empresas_grupo",)),
+    }
+    LOTE_RELACIONES = 150  # ids por petición (filtro `in` e inserción)
+
+    # Resultados por elemento
+    ASIGNADO = "asignado"
+    YA_ASIGNADO = "ya_asignado"
+    QUITADO = "quitado"
+    NO_ASIGNADO = "no_asignado"
+
+    def _limpiar_caches_relacion(self, tipo: str, grupo_id: Optional[str] = None):
+        for cache in self.RELACIONES_GRUPO[tipo][2]:
+            if hasattr(getattr(self, cache, None), "clear"):
+                getattr(self, cache).clear()
+        invalidar_detalle_grupo(grupo_id)
+        if tipo == "empresas":
+            invalidar_libro_costes(grupo_id)
+            get_motor_credito().invalidar()
+
+    def _asignar_en_bloque(self, tipo: str, grupo_id: str, ids: List[str]) -> Dict[str, str]:
+        """
+        Inserta las relaciones que faltan con una lectura y una inserción por
+        lote. Si la inserción del lote falla se reintenta fila a fila para
+        saber qué elemento la provoca. Devuelve {id: resultado}.
+        """
+        tabla, columna, _ = self.RELACIONES_GRUPO[tipo]
+        ids = list(dict.fromkeys(i for i in ids if i))
+        resultados: Dict[str, str] = {}
+        ahora = datetime.utcnow().isoformat()
+
+        for i in range(0, len(ids), self.LOTE_RELACIONES):
+            lote = ids[i:i + self.LOTE_RELACIONES]
+            try:
+                existentes = self.supabase.table(tabla).select(columna) \
+                    .eq("grupo_id", grupo_id).in_(columna, lote).execute()
+            except Exception as e:
+                resultados.update({m: f"error: {e}" for m in lote})
+                continue
+
+            ya = {f[columna] for f in (existentes.data or [])}
+            resultados.update({m: self.YA_ASIGNADO for m in lote if m in ya})
+            filas = [{"grupo_id": grupo_id, columna: m, "fecha_asignacion": ahora}
+                     for m in lote if m not in ya]
+            if not filas:
+                continue
+
+            try:
+                self.supabase.table(tabla).insert(filas).execute()
+                resultados.update({f[columna]: self.ASIGNADO for f in filas})
+            except Exception:
+                for fila in filas:
+                    try:
+                        self.supabase.table(tabla).insert(fila).execute()
+                        resultados[fila[columna]] = self.ASIGNADO
+                    except Exception as e:
+                        resultados[fila[columna]] = f"error: {e}"
+
+        if self.ASIGNADO in resultados.values():
+            self._limpiar_caches_relacion(tipo, grupo_id)
+        return resultados
+
+    def _quitar_en_bloque(self, tipo: str, grupo_id: str, ids: List[str]) -> Dict[str, str]:
+        """Borra las relaciones con un delete por lote. Devuelve {id: resultado}."""
+        tabla, columna, _ = self.RELACIONES_GRUPO[tipo]
+        ids = list(dict.fromkeys(i for i in ids if i))
+        resultados: Dict[str, str] = {}
+
+        for i in range(0, len(ids), self.LOTE_RELACIONES):
+            lote = ids[i:i + self.LOTE_RELACIONES]
+            try:
+                borradas = self.supabase.table(tabla).delete() \
+                    .eq("grupo_id", grupo_id).in_(columna, lote).execute()
+                quitados = {f[columna] for f in (borradas.data or [])}
+                resultados.update({m: self.QUITADO if m in quitados else self.NO_ASIGNADO for m in lote})
+            except Exception as e:
+                resultados.update({m: f"error: {e}" for m in lote})
+
+        if self.QUITADO in resultados.values():
+            self._limpiar_caches_relacion(tipo, grupo_id)
+        return resultados
+
+    def asignar_participantes_a_grupo(self, grupo_id: str, participante_ids: List[str]) -> Dict[str, str]:
+        """Asigna varios participantes a un grupo. Devuelve {participante_id: resultado}."""
+        return self._asignar_en_bloque("participantes", grupo_id, participante_ids)
+
+    def quitar_participantes_de_grupo(self, grupo_id: str, participante_ids: List[str]) -> Dict[str, str]:
+        """Quita varios participantes de un grupo. Devuelve {participante_id: resultado}."""
+        return self._quitar_en_bloque("participantes", grupo_id, participante_ids)
+
+    def asignar_tutores_a_grupo(self, grupo_id: str, tutor_ids: List[str]) -> Dict[str, str]:
+        """Asigna varios tutores a un grupo. Devuelve {tutor_id: resultado}."""
+        return self._asignar_en_bloque("tutores", grupo_id, tutor_ids)
+
+    def quitar_tutores_de_grupo(self, grupo_id: str, tutor_ids: List[str]) -> Dict[str, str]:
+        """Quita varios tutores de un grupo. Devuelve {tutor_id: resultado}."""
+        return self._quitar_en_bloque("tutores", grupo_id, tutor_ids)
+
+    def asignar_empresas_a_grupo(self, grupo_id: str, empresa_ids: List[str]) -> Dict[str, str]:
+        """Asigna varias empresas participantes a un grupo. Devuelve {empresa_id: resultado}."""
+        return self._asignar_en_bloque("empresas", grupo_id, empresa_ids)
+
+    def quitar_empresas_de_grupo(self, grupo_id: str, empresa_ids: List[str]) -> Dict[str, str]:
+        """Quita varias empresas participantes de un grupo. Devuelve {empresa_id: resultado}."""
+        return self._quitar_en_bloque("empresas", grupo_id, empresa_ids)
 
     # =========================
     # CENTROS GESTORES
@@ -0,0 +1,497 @@
+"""
+Ejecutor de tareas largas en segundo plano.
+
+Las operaciones pesadas (importaciones, migraciones, activaciones masivas...)
+se lanzan en un pool de hilos del proceso y no en el hilo del script de
+Streamlit, así que sobreviven a reruns y a desconexiones del navegador.
+El estado de cada tarea (progreso, resultados parciales, errores y cursor
+de reanudación) se persiste en una tabla SQLite local; la interfaz solo
+tiene que consultarla.
+
+Los secretos (p. ej. contraseñas de una importación) no van en `params`:
+se pasan aparte y solo viven en memoria del proceso mientras la tarea
+puede reanudarse. El fichero SQLite se crea con permisos 0600.
+
+Uso:
+
+    @tarea("mi_tarea")
+    def mi_tarea(ctx, recursos):
+        items = ctx.params["items"]
+        for i in range(ctx.cursor, len(items)):
+            ...
+            ctx.avanzar(i + 1, len(items))
+
+    job_id = get_job_runner().lanzar("mi_tarea", {"items": [...]}, {"supabase": supabase})
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+import streamlit as st
+
+JOBS_DB_PATH = os.environ.get(
+    "JOBS_DB_PATH", os.path.join(tempfile.gettempdir(), "gestorformacion_jobs.sqlite3")
+)
+JOBS_MAX_WORKERS = int(os.environ.get("JOBS_MAX_WORKERS", "2"))
+MAX_ERRORES_GUARDADOS = 200
+
+# Estados posibles de una tarea
+PENDIENTE = "PENDIENTE"
+EN_CURSO = "EN_CURSO"
+COMPLETADO = "COMPLETADO"
+ERROR = "ERROR"
+INTERRUMPIDO = "INTERRUMPIDO"
+CANCELANDO = "CANCELANDO"
+CANCELADO = "CANCELADO"
+
+ESTADOS_ACTIVOS = (PENDIENTE, EN_CURSO, CANCELANDO)
+ESTADOS_REANUDABLES = (INTERRUMPIDO, ERROR, CANCELADO)
+
+# Registro tipo → función de la tarea
+_TAREAS: Dict[str, Callable] = {}
+
+
+def tarea(tipo: str):
+    """Registra una función como tarea ejecutable en segundo plano."""
+    def decorator(func):
+        _TAREAS[tipo] = func
+        return func
+    return decorator
+
+
+def snapshot_sesion(session_state) -> SimpleNamespace:
+    """
+    Copia mínima de la sesión (rol y usuario) para construir servicios
+    dentro del hilo de la tarea, donde st.session_state no está disponible.
+    """
+    return SimpleNamespace(
+        role=session_state.role,
+        user=dict(session_state.user or {}),
+    )
+
+
+class TareaCancelada(Exception):
+    """Se lanza dentro de una tarea cuando el usuario ha pedido cancelarla."""
+
+
+# =========================
+# PERSISTENCIA
+# =========================
+
+class JobStore:
+    """Tabla de tareas en SQLite (sustituible por una tabla de Supabase)."""
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._crear_fichero_privado(path)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    tipo TEXT NOT NULL,
+                    estado TEXT NOT NULL,
+                    usuario_id TEXT,
+                    empresa_id TEXT,
+                    params TEXT,
+                    procesados INTEGER DEFAULT 0,
+                    total INTEGER DEFAULT 0,
+                    cursor INTEGER DEFAULT 0,
+                    resultado TEXT,
+                    errores TEXT,
+                    mensaje TEXT,
+                    created_at TEXT,
+                    updated_at TEXT
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_usuario ON jobs(usuario_id, created_at)")
+        self._borrar_passwords_guardadas()
+
+    @staticmethod
+    def _crear_fichero_privado(path: str):
+        """Crea la base de datos legible solo por el usuario del proceso (0600)."""
+        os.close(os.open(path, os.O_CREAT | os.O_RDWR, 0o600))
+        try:
+            os.chmod(path, 0o600)
+        except OSError as e:
+            print(f"No se pudieron ajustar los permisos de {path}: {e}")
+
+    def _borrar_passwords_guardadas(self):
+        """Quita las contraseñas que versiones anteriores guardaban en los params de importación."""
+        with self._lock, self._conn:
+            filas = self._conn.execute(
+                "SELECT id, params FROM jobs WHERE tipo = 'importar_participantes' AND params LIKE '%\"password\"%'"
+            ).fetchall()
+            for fila in filas:
+                try:
+                    params = json.loads(fila["params"])
+                except ValueError:
+                    continue
+                for item in params.get("filas") or []:
+                    item.pop("password", None)
+                self._conn.execute("UPDATE jobs SET params = ? WHERE id = ?",
+                                   (json.dumps(params, default=str), fila["id"]))
+
+    def crear(self, tipo: str, params: Dict[str, Any], usuario_id: Optional[str],
+              empresa_id: Optional[str]) -> str:
+        job_id = str(uuid.uuid4())
+        ahora = datetime.utcnow().isoformat()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT INTO jobs (id, tipo, estado, usuario_id, empresa_id, params,
+                                     resultado, errores, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, '{}', '[]', ?, ?)""",
+                (job_id, tipo, PENDIENTE, usuario_id, empresa_id,
+                 json.dumps(params, default=str), ahora, ahora)
+            )
+        return job_id
+
+    def actualizar(self, job_id: str, **campos):
+        if not campos:
+            return
+        for clave in ("resultado", "errores", "params"):
+            if clave in campos and not isinstance(campos[clave], str):
+                campos[clave] = json.dumps(campos[clave], default=str)
+        campos["updated_at"] = datetime.utcnow().isoformat()
+        columnas = ", ".join(f"{c} = ?" for c in campos)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {columnas} WHERE id = ?", (*campos.values(), job_id))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            fila = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._a_dict(fila) if fila else None
+
+    def listar(self, usuario_id: Optional[str] = None, tipo: Optional[str] = None,
+               limite: int = 20) -> List[Dict[str, Any]]:
+        condiciones, valores = [], []
+        if usuario_id:
+            condiciones.append("usuario_id = ?")
+            valores.append(usuario_id)
+        if tipo:
+            condiciones.append("tipo = ?")
+            valores.append(tipo)
+        where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        with self._lock:
+            filas = self._conn.execute(
+                f"SELECT * FROM jobs {where} ORDER BY created_at DESC LIMIT ?", (*valores, limite)
+            ).fetchall()
+        return [self._a_dict(f) for f in filas]
+
+    def marcar_interrumpidos(self):
+        """Al arrancar el proceso, las tareas que estaban en marcha quedan interrumpidas."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET estado = ?, updated_at = ? WHERE estado IN (?, ?, ?)",
+                (INTERRUMPIDO, datetime.utcnow().isoformat(), *ESTADOS_ACTIVOS)
+            )
+
+    @staticmethod
+    def _a_dict(fila) -> Dict[str, Any]:
+        job = dict(fila)
+        for clave, defecto in (("params", {}), ("resultado", {}), ("errores", [])):
+            try:
+                job[clave] = json.loads(job.get(clave) or "null") or defecto
+            except ValueError:
+                job[clave] = defecto
+        job["progreso"] = (job["procesados"] / job["total"]) if job.get("total") else 0.0
+        return job
+
+
+# =========================
+# CONTEXTO DE EJECUCIÓN
+# =========================
+
+class JobContext:
+    """Lo que ve una tarea: parámetros, cursor de reanudación y helpers de progreso."""
+
+    def __init__(self, store: JobStore, job: Dict[str, Any]):
+        self.store = store
+        self.job_id = job["id"]
+        self.params = job["params"]
+        self.cursor = job.get("cursor") or 0
+        self.resultado = dict(job.get("resultado") or {})
+        self.errores = list(job.get("errores") or [])
+
+    def avanzar(self, procesados: int, total: Optional[int] = None,
+                resultado_parcial: Optional[Dict[str, Any]] = None, cursor: Optional[int] = None):
+        """
+        Persiste el progreso. `cursor` es la posición desde la que se reanudaría
+        (por defecto, igual a `procesados`).
+        """
+        if resultado_parcial:
+            self.resultado.update(resultado_parcial)
+        campos = {
+            "procesados": procesados,
+            "cursor": procesados if cursor is None else cursor,
+            "resultado": self.resultado,
+            "errores": self.errores[-MAX_ERRORES_GUARDADOS:],
+        }
+        if total is not None:
+            campos["total"] = total
+        self.store.actualizar(self.job_id, **campos)
+
+        if self.cancelado():
+            raise TareaCancelada()
+
+    def registrar_error(self, mensaje: str):
+        self.errores.append(str(mensaje))
+
+    def cancelado(self) -> bool:
+        job = self.store.get(self.job_id)
+        return bool(job and job["estado"] == CANCELANDO)
+
+
+# =========================
+# EJECUTOR
+# =========================
+
+class JobRunner:
+    """Pool de hilos del proceso + tabla de tareas."""
+
+    def __init__(self, store: Optional[JobStore] = None, max_workers: int = JOBS_MAX_WORKERS):
+        self.store = store or JobStore()
+        self.store.marcar_interrumpidos()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="jobs")
+        self._secretos: Dict[str, Dict[str, Any]] = {}
+
+    def lanzar(self, tipo: str, params: Dict[str, Any], recursos: Dict[str, Any],
+               usuario_id: Optional[str] = None, empresa_id: Optional[str] = None,
+               secretos: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Crea y encola una tarea.
+
+        Args:
+            tipo: nombre registrado con @tarea
+            params: parámetros serializables (se guardan para poder reanudar)
+            recursos: dependencias no serializables (cliente supabase, sesión...)
+            secretos: datos que no deben escribirse en disco; la tarea los recibe
+                en recursos["secretos"] y se olvidan al terminar o al reiniciar el proceso
+        """
+        if tipo not in _TAREAS:
+            raise ValueError(f"Tarea no registrada: {tipo}")
+        job_id = self.store.crear(tipo, params, usuario_id, empresa_id)
+        if secretos:
+            self._secretos[job_id] = secretos
+        self._executor.submit(self._ejecutar, job_id, recursos)
+        return job_id
+
+    def reanudar(self, job_id: str, recursos: Dict[str, Any]) -> bool:
+        """Vuelve a encolar una tarea interrumpida/fallida desde su último cursor."""
+        job = self.store.get(job_id)
+        if not job or job["estado"] not in ESTADOS_REANUDABLES:
+            return False
+        self.store.actualizar(job_id, estado=PENDIENTE, mensaje="Reanudada")
+        self._executor.submit(self._ejecutar, job_id, recursos)
+        return True
+
+    def cancelar(self, job_id: str) -> bool:
+        """Pide la cancelación; la tarea se detiene en su siguiente avance."""
+        job = self.store.get(job_id)
+        if not job or job["estado"] not in ESTADOS_ACTIVOS:
+            return False
+        self.store.actualizar(job_id, estado=CANCELANDO)
+        return True
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def listar(self, usuario_id: Optional[str] = None, tipo: Optional[str] = None,
+               limite: int = 20) -> List[Dict[str, Any]]:
+        return self.store.listar(usuario_id, tipo, limite)
+
+    def _ejecutar(self, job_id: str, recursos: Dict[str, Any]):
+        job = self.store.get(job_id)
+        if not job:
+            return
+        if job["estado"] == CANCELANDO:
+            self.store.actualizar(job_id, estado=CANCELADO)
+            return
+
+        self.store.actualizar(job_id, estado=EN_CURSO)
+        ctx = JobContext(self.store, job)
+        recursos = {**recursos, "secretos": self._secretos.get(job_id) or {}}
+        try:
+            resultado = _TAREAS[job["tipo"]](ctx, recursos)
+            if isinstance(resultado, dict):
+                ctx.resultado.update(resultado)
+            self.store.actualizar(
+                job_id, estado=COMPLETADO, resultado=ctx.resultado,
+                errores=ctx.errores[-MAX_ERRORES_GUARDADOS:], mensaje="Completada"
+            )
+            self._secretos.pop(job_id, None)
+        except TareaCancelada:
+            self.store.actualizar(job_id, estado=CANCELADO, mensaje="Cancelada por el usuario")
+            self._secretos.pop(job_id, None)
+        except Exception as e:
+            ctx.registrar_error(f"{type(e).__name__}: {e}")
+            print(f"Error en tarea {job_id}: {traceback.format_exc()}")
+            self.store.actualizar(
+                job_id, estado=ERROR, resultado=ctx.resultado,
+                errores=ctx.errores[-MAX_ERRORES_GUARDADOS:], mensaje=str(e)
+            )
+
+
+@st.cache_resource
+def get_job_runner() -> JobRunner:
+    """Instancia única del ejecutor por proceso (sobrevive a reruns y sesiones)."""
+    return JobRunner()
+
+
+# =========================
+# TAREAS REGISTRADAS
+# =========================
+
+@tarea("activacion_masiva_suscripciones")
+def _tarea_activacion_masiva(ctx: JobContext, recursos: Dict[str, Any]):
+    from services.clases_service import ClasesService
+
+    clases_service = ClasesService(recursos["supabase"], recursos["sesion"])
+    participantes = ctx.params["participantes"]
+    clases_mensuales = ctx.params["clases_mensuales"]
+    exitos = ctx.resultado.get("exitos", 0)
+    errores = ctx.resultado.get("errores", 0)
+
+    # Un lote por sentencia; el cursor avanza lote a lote
+    lote = clases_service.LOTE_SUSCRIPCIONES
+    for i in range(ctx.cursor, len(participantes), lote):
+        bloque = participantes[i:i + lote]
+        resultados = clases_service.activar_suscripciones_masivo(bloque, clases_mensuales)
+        for participante in bloque:
+            resultado = resultados.get(participante["id"], "error: sin resultado")
+            if resultado == "activada":
+                exitos += 1
+            else:
+                errores += 1
+                ctx.registrar_error(f"{participante.get('nombre', participante['id'])}: {resultado}")
+        ctx.avanzar(i + len(bloque), len(participantes), {"exitos": exitos, "errores": errores})
+
+
+@tarea("importar_participantes")
+def _tarea_importar_participantes(ctx: JobContext, recursos: Dict[str, Any]):
+    from services.auth_service import AuthService
+
+    auth_service = AuthService(recursos["supabase"], recursos["sesion"])
+    filas = ctx.params["filas"]
+    # Contraseñas por número de fila, solo en memoria (si faltan se generan)
+    passwords = recursos["secretos"].get("passwords", {})
+    creados = ctx.resultado.get("creados", 0)
+
+    for i in range(ctx.cursor, len(filas)):
+        fila = filas[i]
+        try:
+            datos = fila["datos"]
+            if not datos.get("nombre") or not datos.get("apellidos") or not datos.get("email"):
+                raise ValueError("Nombre, apellidos y email son obligatorios")
+            if "@" not in datos["email"]:
+                raise ValueError(f"Email inválido: {datos['email']}")
+
+            ok, _ = auth_service.crear_usuario_con_auth(datos, tabla="participantes", password=passwords.get(fila.get("fila")))
+            if not ok:
+                raise ValueError("Error al crear participante con AuthService")
+            creados += 1
+        except Exception as e:
+            ctx.registrar_error(f"Fila {fila.get('fila', i + 1)}: {e}")
+        ctx.avanzar(i + 1, len(filas), {"creados": creados})
+
+
+def _opciones_migracion(ctx: JobContext) -> Dict[str, Any]:
+    """Checkpoints y progreso por lotes para las migraciones de migraciones_service."""
+    from services.migraciones_service import CheckpointStore
+
+    return {
+        "dry_run": bool(ctx.params.get("dry_run", False)),
+        "checkpoints": CheckpointStore(),
+        "progreso": lambda hechas, total: ctx.avanzar(hechas, total),
+    }
+
+
+def _informe_migracion(ctx: JobContext, informe: Dict[str, Any]) -> Dict[str, Any]:
+    for mensaje in informe.pop("mensajes_error", []):
+        ctx.registrar_error(mensaje)
+    informe.pop("muestra", None)
+    return informe
+
+
+@tarea("migrar_codigos_fundae_legacy")
+def _tarea_migrar_codigos_fundae(ctx: JobContext, recursos: Dict[str, Any]):
+    from services.data_service import DataService
+
+    servicio = DataService(recursos["supabase"], recursos["sesion"])
+    return _informe_migracion(ctx, servicio.migrar_codigos_fundae_legacy(**_opciones_migracion(ctx)))
+
+
+@tarea("auto_resolver_conflictos_fundae")
+def _tarea_auto_resolver_conflictos(ctx: JobContext, recursos: Dict[str, Any]):
+    from services.data_service import DataService
+
+    servicio = DataService(recursos["supabase"], recursos["sesion"])
+    return _informe_migracion(ctx, servicio.auto_resolver_conflictos_fundae(
+        ctx.params.get("empresa_id"), **_opciones_migracion(ctx)
+    ))
+
+
+@tarea("migrar_horarios_existentes")
+def _tarea_migrar_horarios(ctx: JobContext, recursos: Dict[str, Any]):
+    from services.migraciones_service import DestinoSupabase, migracion_horarios_grupos
+
+    migracion = migracion_horarios_grupos(DestinoSupabase(recursos["supabase"]))
+    return _informe_migracion(ctx, migracion.ejecutar(**_opciones_migracion(ctx)))
+
+
+@tarea("actualizar_tipo_documento_tutores")
+def _tarea_tipo_documento_tutores(ctx: JobContext, recursos: Dict[str, Any]):
+    from services.migraciones_service import DestinoSupabase, migracion_tipo_documento_tutores
+
+    migracion = migracion_tipo_documento_tutores(DestinoSupabase(recursos["supabase"]))
+    return _informe_migracion(ctx, migracion.ejecutar(**_opciones_migracion(ctx)))
+
+
+@tarea("limpiar_huerfanos_storage")
+def _tarea_limpiar_huerfanos_storage(ctx: JobContext, recursos: Dict[str, Any]):
+    from services.almacenamiento_service import AlmacenamientoService, MARGEN_HUERFANOS_HORAS
+
+    supabase = recursos["supabase"]
+    almacenamiento = AlmacenamientoService(supabase.storage, supabase)
+    buckets = ctx.params["buckets"]
+
+    for i in range(ctx.cursor, len(buckets)):
+        try:
+            informe = almacenamiento.recolectar_huerfanos(
+                buckets[i],
+                margen_horas=ctx.params.get("margen_horas", MARGEN_HUERFANOS_HORAS),
+                dry_run=ctx.params.get("dry_run", False),
+            )
+            ctx.resultado[f"{buckets[i]}_huerfanos"] = informe["huerfanos"]
+            ctx.resultado[f"{buckets[i]}_eliminados"] = informe["eliminados"]
+        except Exception as e:
+            ctx.registrar_error(f"{buckets[i]}: {e}")
+        ctx.avanzar(i + 1, len(buckets))
+
+
+@tarea("rollover_suscripciones")
+def _tarea_rollover_suscripciones(ctx: JobContext, recursos: Dict[str, Any]):
+    from services.rollover_suscripciones import RolloverSuscripciones, mes_en_curso
+
+    rollover = RolloverSuscripciones(recursos["supabase"])
+    mes = ctx.params.get("mes") or mes_en_curso()
+    empresas = ctx.params.get("empresas") or rollover.empresas()
+    filas = ctx.resultado.get("filas", 0)
+
+    for i in range(ctx.cursor, len(empresas)):
+        try:
+            filas += rollover.ejecutar_empresa(empresas[i], mes, ctx.params.get("forzar", False))["filas"]
+        except Exception as e:
+            ctx.registrar_error(f"{empresas[i]}: {e}")
+        ctx.avanzar(i + 1, len(empresas), {"mes": mes, "filas": filas})
@@ -0,0 +1,189 @@
+"""
+Registro persistente de acciones (auditoría).
+
+log_accion() solo añade la entrada a un buffer circular en memoria (O(1),
+sin E/S), así que no añade latencia a los guardados. Un hilo en segundo
+plano vacía el buffer por lotes:
+
+- cada LOG_ACCIONES_INTERVALO segundos, o antes si el buffer supera la marca
+  de agua alta (contrapresión),
+- a la tabla de Supabase LOG_ACCIONES_TABLA si LOG_ACCIONES_DESTINO=supabase,
+  con el fichero JSONL local (append-only) como respaldo si falla la inserción,
+- o directamente al fichero JSONL (destino por defecto).
+
+Si el buffer se llena se descartan las entradas más antiguas y se cuentan;
+estadisticas() expone encoladas, escritas, descartadas y fallidas.
+"""
+
+import atexit
+import json
+import os
+import tempfile
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import streamlit as st
+
+LOG_ACCIONES_DESTINO = os.environ.get("LOG_ACCIONES_DESTINO", "archivo")
+LOG_ACCIONES_TABLA = os.environ.get("LOG_ACCIONES_TABLA", "log_acciones")
+LOG_ACCIONES_PATH = os.environ.get(
+    "LOG_ACCIONES_PATH", os.path.join(tempfile.gettempdir(), "gestorformacion_acciones.jsonl")
+)
+LOG_ACCIONES_CAPACIDAD = int(os.environ.get("LOG_ACCIONES_CAPACIDAD", "10000"))
+LOG_ACCIONES_LOTE = 200
+LOG_ACCIONES_INTERVALO = 2.0
+MARCA_AGUA_ALTA = 0.5  # fracción del buffer que fuerza un vaciado inmediato
+MAX_ESPERA_REINTENTO = 60.0
+
+
+# =========================
+# DESTINOS
+# =========================
+
+class DestinoArchivo:
+    """Fichero JSONL append-only: una acción por línea."""
+
+    def __init__(self, path: str = LOG_ACCIONES_PATH):
+        self.path = path
+
+    def escribir(self, entradas: List[Dict[str, Any]]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(e, default=str, ensure_ascii=False) + "\n" for e in entradas))
+
+
+class DestinoSupabase:
+    """Inserción por lotes en la tabla de log; si falla, el lote va al fichero local."""
+
+    def __init__(self, supabase, tabla: str = LOG_ACCIONES_TABLA,
+                 respaldo: Optional[DestinoArchivo] = None):
+        self.supabase = supabase
+        self.tabla = tabla
+        self.respaldo = respaldo or DestinoArchivo()
+
+    def escribir(self, entradas: List[Dict[str, Any]]):
+        try:
+            self.supabase.table(self.tabla).insert(entradas).execute()
+        except Exception as e:
+            print(f"[log-acciones] inserción en {self.tabla} fallida, usando fichero local: {e}")
+            self.respaldo.escribir(entradas)
+
+
+# =========================
+# REGISTRO
+# =========================
+
+class RegistroAcciones:
+    """Buffer circular acotado + hilo que lo vacía por lotes."""
+
+    def __init__(self, destino, capacidad: int = LOG_ACCIONES_CAPACIDAD,
+                 tamano_lote: int = LOG_ACCIONES_LOTE, intervalo: float = LOG_ACCIONES_INTERVALO):
+        self.destino = destino
+        self.capacidad = capacidad
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._parar = threading.Event()
+        self._contadores = {"encoladas": 0, "escritas": 0, "descartadas": 0, "fallidas": 0, "lotes": 0}
+        self._ultimo_error: Optional[str] = None
+
+        self._hilo = threading.Thread(target=self._bucle, name="log-acciones", daemon=True)
+        self._hilo.start()
+        atexit.register(self.cerrar)
+
+    def registrar(self, entrada: Dict[str, Any]):
+        """Encola una entrada sin bloquear; si el buffer está lleno descarta la más antigua."""
+        with self._lock:
+            if len(self._buffer) >= self.capacidad:
+                self._buffer.popleft()
+                self._contadores["descartadas"] += 1
+            self._buffer.append(entrada)
+            self._contadores["encoladas"] += 1
+            presion = len(self._buffer) >= self.capacidad * MARCA_AGUA_ALTA
+        if presion:
+            self._despertar.set()
+
+    def _extraer_lote(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [self._buffer.popleft() for _ in range(min(self.tamano_lote, len(self._buffer)))]
+
+    def _devolver_lote(self, lote: List[Dict[str, Any]]):
+        """Reencola un lote fallido por delante, sin superar la capacidad."""
+        with self._lock:
+            hueco = max(0, self.capacidad - len(self._buffer))
+            self._contadores["descartadas"] += len(lote) - min(hueco, len(lote))
+            self._buffer.extendleft(reversed(lote[:hueco]))
+
+    def vaciar(self) -> int:
+        """Escribe todo lo pendiente en lotes. Devuelve el número de entradas escritas."""
+        escritas = 0
+        while True:
+            lote = self._extraer_lote()
+            if not lote:
+                return escritas
+            try:
+                self.destino.escribir(lote)
+            except Exception as e:
+                self._ultimo_error = f"{type(e).__name__}: {e}"
+                self._contadores["fallidas"] += len(lote)
+                self._devolver_lote(lote)
+                raise
+            escritas += len(lote)
+            with self._lock:
+                self._contadores["escritas"] += len(lote)
+                self._contadores["lotes"] += 1
+
+    def _bucle(self):
+        espera = self.intervalo
+        while not self._parar.is_set():
+            self._despertar.wait(espera)
+            self._despertar.clear()
+            try:
+                self.vaciar()
+                espera = self.intervalo
+            except Exception as e:
+                # Reintento con espera exponencial; el lote sigue en el buffer
+                espera = min(espera * 2, MAX_ESPERA_REINTENTO)
+                print(f"[log-acciones] error escribiendo lote, reintento en {espera:.0f}s: {e}")
+
+    def cerrar(self):
+        """Detiene el hilo y vacía lo pendiente (al terminar el proceso)."""
+        self._parar.set()
+        self._despertar.set()
+        try:
+            self.vaciar()
+        except Exception:
+            pass
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._contadores,
+                "pendientes": len(self._buffer),
+                "capacidad": self.capacidad,
+                "ultimo_error": self._ultimo_error,
+            }
+
+
+@st.cache_resource
+def get_registro_acciones(_supabase=None) -> RegistroAcciones:
+    """
+    Registro único por proceso. El cliente de Supabase solo se usa con
+    LOG_ACCIONES_DESTINO=supabase y debe ser el original (sin memo por rerun).
+    """
+    if LOG_ACCIONES_DESTINO == "supabase" and _supabase is not None:
+        return RegistroAcciones(DestinoSupabase(_supabase))
+    return RegistroAcciones(DestinoArchivo())
+
+
+def nueva_entrada(accion: str, usuario_id: Optional[str], detalles: Optional[dict] = None) -> Dict[str, Any]:
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "accion": accion,
+        "usuario_id": usuario_id,
+        "detalles": detalles or {},
+    }
@@ -0,0 +1,536 @@
+"""
+Migraciones de datos por conjuntos.
+
+Las migraciones puntuales (tipo de documento de tutores, horarios de texto,
+códigos FUNDAE...) se describen como tres pasos:
+
+- cargar():        lee las filas de origen (paginado, pocas peticiones)
+- calcular(df):    calcula los valores nuevos de forma vectorizada y devuelve
+                   solo las filas que cambian
+- aplicar_lote(df): escribe un lote con una petición en bloque
+                   (update ... in, upsert o delete+insert)
+
+MigracionConjuntos se encarga del troceado, de los checkpoints (cada fila
+aplicada se anota con la huella de sus valores nuevos, así que relanzar la
+migración no repite trabajo), del modo simulación y del informe de
+rendimiento. El destino de escritura es intercambiable: DestinoSupabase en la
+app y DestinoSQLite para el benchmark local (`python -m services.migraciones_service`).
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import string
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from services.jobs_service import JOBS_DB_PATH
+
+MIGRACIONES_DB_PATH = os.environ.get("MIGRACIONES_DB_PATH", JOBS_DB_PATH)
+MIGRACION_CHUNK = 500
+PAGINA_LECTURA = 1000
+MAX_IDS_FILTRO = 150  # ids por filtro `in` para no exceder la longitud de URL
+MUESTRA_SIMULACION = 10
+
+
+def _trocear(valores: List[Any], tamano: int) -> Iterable[List[Any]]:
+    for inicio in range(0, len(valores), tamano):
+        yield valores[inicio:inicio + tamano]
+
+
+def df_a_registros(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    DataFrame -> lista de dicts serializable (NaN -> None, numpy -> tipos nativos).
+    Las columnas float con todos sus valores enteros (enteros con nulos que pandas
+    lee como float) vuelven a int: Postgres rechaza 40.0 en una columna integer.
+    """
+    df = df.copy()
+    for columna in df.columns[[pd.api.types.is_float_dtype(t) for t in df.dtypes]]:
+        valores = df[columna].dropna()
+        if (valores == valores.round()).all():
+            df[columna] = df[columna].astype("Int64")
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+def _funcion_inexistente(error: Exception) -> bool:
+    """PostgREST responde PGRST202 cuando la función RPC no existe."""
+    texto = str(error)
+    return "PGRST202" in texto or "Could not find the function" in texto
+
+
+# =========================
+# CHECKPOINTS
+# =========================
+
+class CheckpointStore:
+    """Filas ya aplicadas por migración (SQLite local, junto a la tabla de tareas)."""
+
+    def __init__(self, path: str = MIGRACIONES_DB_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS migraciones_checkpoints (
+                    migracion TEXT NOT NULL,
+                    huella TEXT NOT NULL,
+                    aplicado_en TEXT,
+                    PRIMARY KEY (migracion, huella)
+                )
+            """)
+
+    def aplicadas(self, migracion: str) -> set:
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT huella FROM migraciones_checkpoints WHERE migracion = ?", (migracion,)
+            ).fetchall()
+        return {f[0] for f in filas}
+
+    def registrar(self, migracion: str, huellas: List[str]):
+        ahora = datetime.utcnow().isoformat()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO migraciones_checkpoints VALUES (?, ?, ?)",
+                [(migracion, h, ahora) for h in huellas]
+            )
+
+    def reiniciar(self, migracion: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM migraciones_checkpoints WHERE migracion = ?", (migracion,))
+
+
+# =========================
+# DESTINOS
+# =========================
+
+# Función SQL opcional para actualizar filas con valores distintos en una
+# sentencia (UPDATE ... FROM). Sin ella, actualizar_filas usa un upsert.
+#
+#   create or replace function actualizar_filas_lote(p_tabla text, p_clave text, p_filas jsonb)
+#   returns integer language plpgsql as $$
+#   declare asignaciones text; n integer;
+#   begin
+#     select string_agg(format('%I = v.%I', k, k), ', ') into asignaciones
+#       from jsonb_object_keys(p_filas -> 0) k where k <> p_clave;
+#     execute format('update %I t set %s from jsonb_populate_recordset(null::%I, $1) v where t.%I = v.%I',
+#                    p_tabla, asignaciones, p_tabla, p_clave, p_clave) using p_filas;
+#     get diagnostics n = row_count;
+#     return n;
+#   end $$;
+RPC_ACTUALIZAR_FILAS = "actualizar_filas_lote"
+
+
+class DestinoSupabase:
+    """Lecturas paginadas y escrituras en bloque contra Supabase/PostgREST."""
+
+    # Se desactiva para todo el proceso si la RPC no está instalada
+    _rpc_actualizar = True
+
+    def __init__(self, supabase):
+        self.supabase = supabase
+        self.peticiones = 0
+
+    def leer(self, tabla: str, columnas: str = "*",
+             filtrar: Optional[Callable] = None) -> pd.DataFrame:
+        filas, inicio = [], 0
+        while True:
+            query = self.supabase.table(tabla).select(columnas)
+            if filtrar:
+                query = filtrar(query)
+            pagina = query.range(inicio, inicio + PAGINA_LECTURA - 1).execute().data or []
+            self.peticiones += 1
+            filas.extend(pagina)
+            if len(pagina) < PAGINA_LECTURA:
+                break
+            inicio += PAGINA_LECTURA
+        return pd.DataFrame(filas)
+
+    def actualizar_por_valores(self, tabla: str, valores: Dict[str, Any], ids: List[Any], clave: str = "id"):
+        """UPDATE tabla SET valores WHERE clave IN ids (mismo valor para todo el grupo)."""
+        for trozo in _trocear(list(ids), MAX_IDS_FILTRO):
+            self.supabase.table(tabla).update(valores).in_(clave, trozo).execute()
+            self.peticiones += 1
+
+    def upsert(self, tabla: str, filas: List[Dict[str, Any]], clave: str = "id"):
+        if filas:
+            self.supabase.table(tabla).upsert(filas, on_conflict=clave).execute()
+            self.peticiones += 1
+
+    def actualizar_filas(self, tabla: str, filas: List[Dict[str, Any]], clave: str = "id",
+                         obligatorias: Iterable[str] = ()):
+        """
+        Actualiza filas con valores distintos: una petición por conjunto de
+        columnas cambiadas. Con RPC_ACTUALIZAR_FILAS solo se escriben esas
+        columnas. Sin ella se hace un upsert que lleva además las columnas
+        `obligatorias` (NOT NULL), porque la parte INSERT del upsert las exige.
+        """
+        obligatorias = tuple(c for c in obligatorias if c != clave)
+        grupos: Dict[tuple, List[Dict[str, Any]]] = {}
+        for fila in filas:
+            columnas = tuple(c for c in fila if c not in obligatorias)
+            grupos.setdefault(columnas, []).append(fila)
+
+        for columnas, grupo in grupos.items():
+            if DestinoSupabase._rpc_actualizar:
+                self.peticiones += 1
+                try:
+                    self.supabase.rpc(RPC_ACTUALIZAR_FILAS, {
+                        "p_tabla": tabla, "p_clave": clave,
+                        "p_filas": [{c: f[c] for c in columnas} for f in grupo],
+                    }).execute()
+                    continue
+                except Exception as e:
+                    if not _funcion_inexistente(e):
+                        raise
+                    DestinoSupabase._rpc_actualizar = False
+            self.upsert(tabla, [{c: f.get(c) for c in (*columnas, *obligatorias)} for f in grupo], clave)
+
+    def reemplazar(self, tabla: str, columna: str, ids: List[Any], filas: List[Dict[str, Any]]):
+        """Borra las filas hijas de `ids` e inserta las nuevas en bloque."""
+        for trozo in _trocear(list(ids), MAX_IDS_FILTRO):
+            self.supabase.table(tabla).delete().in_(columna, trozo).execute()
+            self.peticiones += 1
+        if filas:
+            self.supabase.table(tabla).insert(filas).execute()
+            self.peticiones += 1
+
+
+class DestinoSQLite:
+    """Mismo interfaz sobre SQLite, para el benchmark local."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.peticiones = 0
+
+    def leer(self, tabla: str, columnas: str = "*", filtrar: Optional[Callable] = None) -> pd.DataFrame:
+        self.peticiones += 1
+        return pd.read_sql_query(f"SELECT {columnas} FROM {tabla}", self.conn)
+
+    def actualizar_por_valores(self, tabla: str, valores: Dict[str, Any], ids: List[Any], clave: str = "id"):
+        asignaciones = ", ".join(f"{c} = ?" for c in valores)
+        with self.conn:
+            for trozo in _trocear(list(ids), MAX_IDS_FILTRO):
+                marcas = ", ".join("?" * len(trozo))
+                self.conn.execute(
+                    f"UPDATE {tabla} SET {asignaciones} WHERE {clave} IN ({marcas})",
+                    (*valores.values(), *trozo)
+                )
+                self.peticiones += 1
+
+    def upsert(self, tabla: str, filas: List[Dict[str, Any]], clave: str = "id"):
+        if not filas:
+            return
+        columnas = list(filas[0].keys())
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join('?' * len(columnas))})",
+                [tuple(f[c] for c in columnas) for f in filas]
+            )
+        self.peticiones += 1
+
+    def actualizar_filas(self, tabla: str, filas: List[Dict[str, Any]], clave: str = "id",
+                         obligatorias: Iterable[str] = ()):
+        grupos: Dict[tuple, List[Dict[str, Any]]] = {}
+        for fila in filas:
+            columnas = tuple(c for c in fila if c not in obligatorias and c != clave)
+            grupos.setdefault(columnas, []).append(fila)
+        with self.conn:
+            for columnas, grupo in grupos.items():
+                self.conn.executemany(
+                    f"UPDATE {tabla} SET {', '.join(f'{c} = ?' for c in columnas)} WHERE {clave} = ?",
+                    [(*(f[c] for c in columnas), f[clave]) for f in grupo]
+                )
+                self.peticiones += 1
+
+    def reemplazar(self, tabla: str, columna: str, ids: List[Any], filas: List[Dict[str, Any]]):
+        with self.conn:
+            for trozo in _trocear(list(ids), MAX_IDS_FILTRO):
+                self.conn.execute(
+                    f"DELETE FROM {tabla} WHERE {columna} IN ({', '.join('?' * len(trozo))})", trozo
+                )
+                self.peticiones += 1
+        self.upsert(tabla, filas)
+
+
+# =========================
+# MOTOR
+# =========================
+
+class MigracionConjuntos:
+    """Ejecuta una migración cargar → calcular → aplicar por lotes."""
+
+    def __init__(self, nombre: str, cargar: Callable[[], pd.DataFrame],
+                 calcular: Callable[[pd.DataFrame], pd.DataFrame],
+                 aplicar_lote: Callable[[pd.DataFrame], None],
+                 clave: str = "id", columnas_huella: Optional[List[str]] = None):
+        self.nombre = nombre
+        self.cargar = cargar
+        self.calcular = calcular
+        self.aplicar_lote = aplicar_lote
+        self.clave = clave
+        self.columnas_huella = columnas_huella
+
+    def _huellas(self, cambios: pd.DataFrame) -> List[str]:
+        """clave + hash de los valores nuevos: si el destino cambia, la fila vuelve a migrarse."""
+        columnas = self.columnas_huella or [c for c in cambios.columns if c != self.clave]
+        return [
+            f"{fila[self.clave]}:" + hashlib.md5(
+                json.dumps([fila.get(c) for c in columnas], default=str).encode()
+            ).hexdigest()
+            for fila in df_a_registros(cambios[[self.clave] + columnas])
+        ]
+
+    def ejecutar(self, dry_run: bool = False, chunk_size: int = MIGRACION_CHUNK,
+                 checkpoints: Optional[CheckpointStore] = None, reiniciar: bool = False,
+                 progreso: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """
+        Ejecuta la migración y devuelve un informe con conteos y tiempos.
+
+        Args:
+            dry_run: calcula el plan y devuelve una muestra sin escribir nada
+            checkpoints: almacén de filas aplicadas (None = sin checkpoints)
+            reiniciar: olvida los checkpoints previos de esta migración
+            progreso: callback (aplicadas, total) tras cada lote
+        """
+        t0 = time.perf_counter()
+        df = self.cargar()
+        t_carga = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        cambios = self.calcular(df) if not df.empty else pd.DataFrame(columns=[self.clave])
+        t_calculo = time.perf_counter() - t0
+
+        if checkpoints and reiniciar and not dry_run:
+            checkpoints.reiniciar(self.nombre)
+        huellas = pd.Series(self._huellas(cambios) if not cambios.empty else [], index=cambios.index, dtype=object)
+        if checkpoints and not cambios.empty:
+            pendientes_mask = ~huellas.isin(checkpoints.aplicadas(self.nombre))
+            pendientes, huellas = cambios[pendientes_mask], huellas[pendientes_mask]
+        else:
+            pendientes = cambios
+
+        informe = {
+            "migracion": self.nombre,
+            "dry_run": dry_run,
+            "leidas": len(df),
+            "cambios": len(cambios),
+            "omitidas_checkpoint": len(cambios) - len(pendientes),
+            "aplicadas": 0,
+            "errores": 0,
+            "lotes": 0,
+            "segundos_carga": round(t_carga, 3),
+            "segundos_calculo": round(t_calculo, 3),
+            "segundos_escritura": 0.0,
+            "filas_por_segundo": 0.0,
+        }
+
+        if dry_run:
+            informe["muestra"] = df_a_registros(pendientes.head(MUESTRA_SIMULACION))
+            return informe
+
+        mensajes = []
+        t0 = time.perf_counter()
+        total = len(pendientes)
+        for inicio in range(0, total, chunk_size):
+            lote = pendientes.iloc[inicio:inicio + chunk_size]
+            try:
+                self.aplicar_lote(lote)
+                if checkpoints:
+                    checkpoints.registrar(self.nombre, huellas.iloc[inicio:inicio + chunk_size].tolist())
+                informe["aplicadas"] += len(lote)
+            except Exception as e:
+                informe["errores"] += len(lote)
+                mensajes.append(f"Lote {inicio // chunk_size + 1}: {e}")
+                print(f"[migracion {self.nombre}] error en lote {inicio // chunk_size + 1}: {e}")
+            informe["lotes"] += 1
+            if progreso:
+                progreso(min(inicio + chunk_size, total), total)
+
+        t_escritura = time.perf_counter() - t0
+        informe["segundos_escritura"] = round(t_escritura, 3)
+        informe["filas_por_segundo"] = round(informe["aplicadas"] / t_escritura, 1) if t_escritura > 0 else 0.0
+        if mensajes:
+            informe["mensajes_error"] = mensajes
+        return informe
+
+
+def aplicar_por_valores(destino, tabla: str, lote: pd.DataFrame, columnas: List[str], clave: str = "id"):
+    """Agrupa el lote por valores nuevos y lanza un UPDATE ... IN por grupo."""
+    for valores, grupo in lote.groupby(columnas, dropna=False, sort=False):
+        valores = valores if isinstance(valores, tuple) else (valores,)
+        payload = {c: (None if pd.isna(v) else (v.item() if isinstance(v, np.generic) else v))
+                   for c, v in zip(columnas, valores)}
+        destino.actualizar_por_valores(tabla, payload, grupo[clave].tolist(), clave)
+
+
+# =========================
+# MIGRACIONES
+# =========================
+
+PATRON_NIF = r"^[0-9]{8}[A-Z]$"
+PATRON_NIE = r"^[XYZ][0-9]{7}[A-Z]$"
+
+
+def calcular_tipo_documento(documentos: pd.Series) -> pd.Series:
+    """Tipo de documento FUNDAE por formato: 10 NIF, 60 NIE, 20 pasaporte (≥6 caracteres)."""
+    doc = documentos.fillna("").astype(str).str.upper().str.strip()
+    tipo = np.select(
+        [doc.str.match(PATRON_NIF), doc.str.match(PATRON_NIE), doc.str.len() >= 6],
+        [10, 60, 20],
+        default=0
+    )
+    return pd.Series(tipo, index=documentos.index).replace(0, np.nan)
+
+
+def migracion_tipo_documento_tutores(destino) -> MigracionConjuntos:
+    def calcular(df):
+        if "tipo_documento" not in df.columns:
+            df["tipo_documento"] = np.nan
+        nuevo = calcular_tipo_documento(df["nif"])
+        cambia = nuevo.notna() & (pd.to_numeric(df["tipo_documento"], errors="coerce") != nuevo)
+        return pd.DataFrame({"id": df.loc[cambia, "id"], "tipo_documento": nuevo[cambia].astype(int)})
+
+    return MigracionConjuntos(
+        "tipo_documento_tutores",
+        cargar=lambda: destino.leer("tutores", "id, nif, tipo_documento"),
+        calcular=calcular,
+        aplicar_lote=lambda lote: aplicar_por_valores(destino, "tutores", lote, ["tipo_documento"]),
+    )
+
+
+def _extraer_tramo(horarios: pd.Series, etiqueta: str) -> pd.DataFrame:
+    tramo = horarios.str.extract(rf"(?:^| \| ){etiqueta}: ([^|]+?) - ([^|]+?)(?= \| |$)")
+    return tramo.apply(lambda col: col.str.strip())
+
+
+def migracion_horarios_grupos(destino) -> MigracionConjuntos:
+    def calcular(df):
+        df = df[df["horario"].fillna("").astype(str).str.len() > 0]
+        horario = df["horario"].astype(str)
+        manana = _extraer_tramo(horario, "Mañana")
+        tarde = _extraer_tramo(horario, "Tarde")
+        dias = horario.str.extract(r"(?:^| \| )Días: (.*?)(?= \| |$)")[0].fillna("").str.replace("-", "", regex=False)
+        num_horas = df.get("accion_formativa", pd.Series(index=df.index, dtype=object)).map(
+            lambda a: a.get("num_horas") if isinstance(a, dict) else None
+        )
+        return pd.DataFrame({
+            "grupo_id": df["id"],
+            "horas_totales": pd.to_numeric(num_horas, errors="coerce").fillna(0.0).astype(float),
+            "hora_inicio_tramo1": manana[0],
+            "hora_fin_tramo1": manana[1],
+            "hora_inicio_tramo2": tarde[0],
+            "hora_fin_tramo2": tarde[1],
+            "dias": dias,
+        })
+
+    return MigracionConjuntos(
+        "horarios_grupos",
+        cargar=lambda: destino.leer(
+            "grupos", "id, horario, accion_formativa:acciones_formativas(num_horas)",
+            filtrar=lambda q: q.not_.is_("horario", "null")
+        ),
+        calcular=calcular,
+        aplicar_lote=lambda lote: destino.reemplazar(
+            "grupos_horarios", "grupo_id", lote["grupo_id"].tolist(), df_a_registros(lote)
+        ),
+        clave="grupo_id",
+    )
+
+
+# =========================
+# BENCHMARK LOCAL
+# =========================
+
+def _documento_aleatorio(rnd: random.Random) -> Optional[str]:
+    letras = string.ascii_uppercase
+    tipo = rnd.random()
+    if tipo < 0.6:
+        return f"{rnd.randint(0, 99999999):08d}{rnd.choice(letras)}"
+    if tipo < 0.8:
+        return f"{rnd.choice('XYZ')}{rnd.randint(0, 9999999):07d}{rnd.choice(letras)}"
+    if tipo < 0.95:
+        return "".join(rnd.choice(letras + string.digits) for _ in range(rnd.randint(6, 10)))
+    return None
+
+
+def _crear_tutores_sqlite(n_filas: int, semilla: int = 42) -> sqlite3.Connection:
+    rnd = random.Random(semilla)
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE tutores (id TEXT PRIMARY KEY, nif TEXT, tipo_documento INTEGER)")
+    conn.executemany(
+        "INSERT INTO tutores VALUES (?, ?, NULL)",
+        [(f"tutor-{i:07d}", _documento_aleatorio(rnd)) for i in range(n_filas)]
+    )
+    conn.commit()
+    return conn
+
+
+def _tipo_documento_fila_a_fila(conn: sqlite3.Connection) -> int:
+    """Algoritmo anterior: una expresión regular y un UPDATE (una petición) por tutor."""
+    peticiones = 1
+    tutores = conn.execute("SELECT id, nif FROM tutores").fetchall()
+    for tutor_id, nif in tutores:
+        if not nif:
+            continue
+        nif = nif.upper().strip()
+        tipo = None
+        if re.match(r'^[0-9]{8}[A-Z]$', nif):
+            tipo = 10
+        elif re.match(r'^[XYZ][0-9]{7}[A-Z]$', nif):
+            tipo = 60
+        elif len(nif) >= 6:
+            tipo = 20
+        if tipo:
+            with conn:
+                conn.execute("UPDATE tutores SET tipo_documento = ? WHERE id = ?", (tipo, tutor_id))
+            peticiones += 1
+    return peticiones
+
+
+def benchmark_migracion(n_filas: int = 20000, chunk_size: int = MIGRACION_CHUNK,
+                        latencia_ms: float = 0.0) -> Dict[str, Any]:
+    """
+    Compara la migración fila a fila con la de conjuntos sobre SQLite en memoria.
+    `latencia_ms` simula el coste de ida y vuelta HTTP por petición.
+    """
+    latencia = latencia_ms / 1000.0
+
+    conn = _crear_tutores_sqlite(n_filas)
+    t0 = time.perf_counter()
+    peticiones_fila = _tipo_documento_fila_a_fila(conn)
+    t_fila = time.perf_counter() - t0 + peticiones_fila * latencia
+    esperado = dict(conn.execute("SELECT id, tipo_documento FROM tutores").fetchall())
+
+    conn = _crear_tutores_sqlite(n_filas)
+    destino = DestinoSQLite(conn)
+    t0 = time.perf_counter()
+    informe = migracion_tipo_documento_tutores(destino).ejecutar(chunk_size=chunk_size)
+    t_conjuntos = time.perf_counter() - t0 + destino.peticiones * latencia
+    obtenido = dict(conn.execute("SELECT id, tipo_documento FROM tutores").fetchall())
+
+    # Segunda pasada: no debe quedar nada por migrar
+    repeticion = migracion_tipo_documento_tutores(destino).ejecutar(dry_run=True)
+
+    return {
+        "filas": n_filas,
+        "fila_a_fila": {"segundos": round(t_fila, 3), "peticiones": peticiones_fila},
+        "conjuntos": {"segundos": round(t_conjuntos, 3), "peticiones": destino.peticiones, **informe},
+        "aceleracion": round(t_fila / t_conjuntos, 1) if t_conjuntos else None,
+        "resultados_identicos": esperado == obtenido,
+        "pendientes_tras_migrar": repeticion["cambios"],
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    filas = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    latencia_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    print(json.dumps(benchmark_migracion(filas, latencia_ms=latencia_ms), indent=2, default=str))
@@ -4,6 +4,11 @@ import uuid
 from typing import Dict, Any, List, Optional
 from datetime import datetime
 from utils import validar_dni_cif
+from services.avatares_service import (
+    generar_variantes_avatar, nombre_variante, nombres_archivos_avatar, TAMANO_PRINCIPAL
+)
+from services.almacenamiento_service import get_almacenamiento, huella
+from services.detalle_grupo import invalidar_detalle_grupo
 
 class ParticipantesService:
     def __init__(self, supabase, session_state):
@@ -779,6 +784,7 @@ class ParticipantesService:
             
             # Limpiar caches
             self.get_participantes_con_grupos_nn.clear()
+            invalidar_detalle_grupo(grupo_id)
             
             return True
             
@@ -813,6 +819,7 @@ class ParticipantesService:
             
             # Limpiar caches
             self.get_participantes_con_grupos_nn.clear()
+            invalidar_detalle_grupo(grupo_id)
             
             return True
             
@@ -920,6 +927,8 @@ class ParticipantesService:
                 except Exception as e:
                     errores.append(f"Participante {participante['id']}: {e}")
             
+            if migrados:
+                invalidar_detalle_grupo()
             st.success(f"Migración completada: {migrados} relaciones creadas")
             if errores:
                 st.error(f"Errores: {len(errores)}")
@@ -947,90 +956,79 @@ class ParticipantesService:
             return None
     
     def subir_avatar(self, participante_id: str, archivo_imagen) -> bool:
-        """Sube avatar de participante a Supabase Storage"""
+        """Sube avatar de participante a Supabase Storage en varios tamaños (32, 64 y 150 px)"""
         try:
-            from PIL import Image
-            import io
-            
             # Leer archivo
             file_bytes = archivo_imagen.getvalue()
             file_name = archivo_imagen.name
-            file_type = archivo_imagen.type
             
             # Validar tamaño (máximo 2MB)
             if len(file_bytes) > 2 * 1024 * 1024:
                 return False
             
-            # Redimensionar imagen a 150x150px
-            image = Image.open(io.BytesIO(file_bytes))
-            image = image.resize((150, 150), Image.Resampling.LANCZOS)
-            
-            # Convertir de vuelta a bytes
-            output = io.BytesIO()
-            format_map = {"image/jpeg": "JPEG", "image/jpg": "JPEG", "image/png": "PNG"}
-            img_format = format_map.get(file_type, "JPEG")
-            image.save(output, format=img_format, quality=85)
-            processed_bytes = output.getvalue()
-            
-            # Generar nombre único
-            import uuid
-            extension = file_name.split('.')[-1] if '.' in file_name else 'jpg'
-            nombre_unico = f"avatar_{participante_id}_{int(datetime.now().timestamp())}.{extension}"
-            
-            # Subir a Supabase Storage
-            resultado = self.supabase.storage.from_("avatars").upload(
-                nombre_unico, processed_bytes, {"content-type": file_type}
-            )
+            # Generar variantes (WebP o JPEG según soporte de Pillow)
+            variantes, extension, mime = generar_variantes_avatar(file_bytes)
             
-            if resultado:
-                # Obtener URL pública
-                url_publica = self.supabase.storage.from_("avatars").get_public_url(nombre_unico)
-                
-                # Eliminar avatar anterior si existe
-                self.eliminar_avatar(participante_id)
-                
-                # Guardar en base de datos
-                datos_avatar = {
-                    "id": str(uuid.uuid4()),
-                    "participante_id": participante_id,
-                    "archivo_nombre": file_name,
-                    "archivo_url": url_publica,
-                    "mime_type": file_type,
-                    "tamaño_bytes": len(processed_bytes),
-                    "created_at": datetime.utcnow().isoformat()
-                }
-                
-                resultado_db = self.supabase.table("participantes_avatars").insert(datos_avatar).execute()
-                return bool(resultado_db.data)
+            # Nombre base por contenido: la misma imagen reutiliza sus variantes ya subidas
+            nombre_base = f"avatar_{huella(file_bytes)[:32]}"
+            almacenamiento = get_almacenamiento(self.supabase)
+            resultados = almacenamiento.subir_lote("avatars", [
+                {"ruta": nombre_variante(nombre_base, tamano, extension), "contenido": contenido, "content_type": mime}
+                for tamano, contenido in variantes.items()
+            ])
+            if any(r.get("error") for r in resultados):
+                return False
             
-            return False
+            # La URL principal apunta a la variante de 150px; las demás se derivan de ella
+            nombre_principal = nombre_variante(nombre_base, TAMANO_PRINCIPAL, extension)
+            url_publica = self.supabase.storage.from_("avatars").get_public_url(nombre_principal)
+            
+            # Sustituir el registro del avatar anterior
+            anterior = self._borrar_registro_avatar(participante_id)
+            
+            # Guardar en base de datos
+            datos_avatar = {
+                "id": str(uuid.uuid4()),
+                "participante_id": participante_id,
+                "archivo_nombre": file_name,
+                "archivo_url": url_publica,
+                "mime_type": mime,
+                "tamaño_bytes": len(variantes[TAMANO_PRINCIPAL]),
+                "created_at": datetime.utcnow().isoformat()
+            }
+            
+            resultado_db = self.supabase.table("participantes_avatars").insert(datos_avatar).execute()
+            
+            # Las variantes anteriores se borran en segundo plano si ya no las usa nadie
+            if anterior:
+                almacenamiento.liberar("avatars", nombres_archivos_avatar(anterior))
+            return bool(resultado_db.data)
             
         except Exception as e:
             return False
     
+    def _borrar_registro_avatar(self, participante_id: str) -> Optional[str]:
+        """Borra el registro del avatar actual y devuelve su URL (o None)."""
+        avatar_actual = self.supabase.table("participantes_avatars").select("archivo_url").eq(
+            "participante_id", participante_id
+        ).execute()
+        if not avatar_actual.data:
+            return None
+        
+        self.supabase.table("participantes_avatars").delete().eq(
+            "participante_id", participante_id
+        ).execute()
+        return avatar_actual.data[0].get("archivo_url")
+    
     def eliminar_avatar(self, participante_id: str) -> bool:
-        """Elimina avatar existente de un participante"""
+        """Elimina avatar existente de un participante (todas sus variantes)"""
         try:
-            # Obtener avatar actual
-            avatar_actual = self.supabase.table("participantes_avatars").select("*").eq(
-                "participante_id", participante_id
-            ).execute()
+            archivo_url = self._borrar_registro_avatar(participante_id)
             
-            if avatar_actual.data:
-                avatar = avatar_actual.data[0]
-                
-                # Eliminar de storage
-                archivo_url = avatar["archivo_url"]
-                nombre_archivo = archivo_url.split("/")[-1]
-                try:
-                    self.supabase.storage.from_("avatars").remove([nombre_archivo])
-                except:
-                    pass  # No fallar si el archivo ya no existe
-                
-                # Eliminar de base de datos
-                self.supabase.table("participantes_avatars").delete().eq(
-                    "participante_id", participante_id
-                ).execute()
+            # Las variantes pueden estar compartidas con otro participante (misma imagen):
+            # se eliminan en segundo plano solo si ya no las referencia nadie
+            if archivo_url:
+                get_almacenamiento(self.supabase).liberar("avatars", nombres_archivos_avatar(archivo_url))
             
             return True
             
@@ -0,0 +1,106 @@
+"""
+Metadatos de la plataforma: fila de ajustes_app y contadores globales.
+
+Se guardan en una cache única por proceso (compartida entre sesiones) con
+TTL corto, así que los reruns normales no hacen ninguna consulta. Las
+escrituras de la propia app la mantienen al día sin esperar al TTL:
+update_ajustes_app() fusiona los cambios en la fila cacheada y las altas y
+bajas de empresas, usuarios, grupos y acciones llaman a
+registrar_alta()/registrar_baja(). El TTL solo cubre los cambios hechos
+desde fuera de este proceso.
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import streamlit as st
+
+TTL_PLATAFORMA = 60  # segundos
+
+# Contador → tabla
+TABLAS_CONTADAS = {
+    "total_empresas": "empresas",
+    "total_usuarios": "usuarios",
+    "total_grupos": "grupos",
+    "total_cursos": "acciones_formativas",
+}
+
+
+class PlataformaService:
+    """Cache de proceso para ajustes_app y contadores globales."""
+
+    def __init__(self, ttl: float = TTL_PLATAFORMA):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._ajustes: Optional[Dict[str, Any]] = None
+        self._ajustes_ts = 0.0
+        self._contadores: Optional[Dict[str, int]] = None
+        self._contadores_ts = 0.0
+
+    def _vigente(self, instante: float) -> bool:
+        return time.monotonic() - instante < self.ttl
+
+    # =========================
+    # AJUSTES
+    # =========================
+
+    def get_ajustes(self, supabase, campos: Optional[List[str]] = None) -> Dict[str, Any]:
+        with self._lock:
+            if self._ajustes is None or not self._vigente(self._ajustes_ts):
+                res = supabase.table("ajustes_app").select("*").eq("id", 1).execute()
+                self._ajustes = res.data[0] if res.data else {}
+                self._ajustes_ts = time.monotonic()
+            ajustes = self._ajustes
+            if campos:
+                return {c: ajustes.get(c) for c in campos if c in ajustes}
+            return dict(ajustes)
+
+    def update_ajustes(self, supabase, cambios: Dict[str, Any]):
+        supabase.table("ajustes_app").update(cambios).eq("id", 1).execute()
+        with self._lock:
+            if self._ajustes is not None:
+                self._ajustes.update(cambios)
+
+    # =========================
+    # CONTADORES GLOBALES
+    # =========================
+
+    def get_contadores(self, supabase) -> Dict[str, int]:
+        with self._lock:
+            if self._contadores is None or not self._vigente(self._contadores_ts):
+                self._contadores = {
+                    clave: supabase.table(tabla).select("id", count="exact").limit(1).execute().count or 0
+                    for clave, tabla in TABLAS_CONTADAS.items()
+                }
+                self._contadores_ts = time.monotonic()
+            return dict(self._contadores)
+
+    def ajustar_contador(self, tabla: str, delta: int):
+        with self._lock:
+            if self._contadores is None:
+                return
+            for clave, contada in TABLAS_CONTADAS.items():
+                if contada == tabla:
+                    self._contadores[clave] = max(0, self._contadores[clave] + delta)
+
+    def invalidar(self):
+        with self._lock:
+            self._ajustes = None
+            self._contadores = None
+
+
+@st.cache_resource
+def get_plataforma_service() -> PlataformaService:
+    """Instancia única por proceso (sobrevive a reruns y sesiones)."""
+    return PlataformaService()
+
+
+def registrar_alta(tabla: str, n: int = 1):
+    """Actualiza los contadores globales tras insertar `n` filas en `tabla`."""
+    get_plataforma_service().ajustar_contador(tabla, n)
+
+
+def registrar_baja(tabla: str, n: int = 1):
+    """Actualiza los contadores globales tras borrar `n` filas de `tabla`."""
+    get_plataforma_service().ajustar_contador(tabla, -n)
@@ -0,0 +1,223 @@
+"""
+Analítica de proyectos e índice de asignaciones proyecto → grupos.
+
+Vencimientos, urgencias, totales de presupuesto y barras del Gantt se
+calculan sobre columnas completas del DataFrame de proyectos (una
+conversión de fechas por columna y máscaras), sin recorrer los proyectos
+fila a fila.
+
+Las relaciones proyecto_grupos se leen una vez y se guardan en un índice
+{proyecto_id: {grupo_id}} por proceso. Las comprobaciones de "¿ya está
+asignado?" se resuelven en memoria y las asignaciones o bajas hechas desde
+ProyectosService lo actualizan directamente. El TTL solo cubre cambios
+hechos desde fuera de este proceso.
+"""
+
+import threading
+import time
+from collections import defaultdict
+from datetime import date
+from typing import Any, Dict, Iterable, Optional, Set
+
+import pandas as pd
+import streamlit as st
+
+CAMPOS_VENCIMIENTO = ["fecha_fin", "fecha_justificacion", "fecha_presentacion_informes"]
+DIAS_AVISO = 30
+COLUMNAS_URGENTES = ["nombre", "estado_proyecto", "fecha_fin", "fecha_justificacion",
+                     "dias_restantes", "tipo_vencimiento", "fecha_urgente"]
+COLUMNAS_GANTT = ["Task", "Start", "Finish", "Resource", "Description"]
+
+TTL_INDICE = 300  # segundos
+PAGINA_INDICE = 1000  # filas por lectura de proyecto_grupos
+
+
+# =========================
+# COLUMNAS
+# =========================
+
+def _columna(df: pd.DataFrame, nombre: str, defecto: Any = "") -> pd.Series:
+    if nombre in df.columns:
+        return df[nombre]
+    return pd.Series(defecto, index=df.index, dtype=object)
+
+
+def _fecha(df: pd.DataFrame, nombre: str) -> pd.Series:
+    """Columna como datetime64 a medianoche; vacíos y valores inválidos → NaT."""
+    if nombre not in df.columns:
+        return pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+    return pd.to_datetime(df[nombre].replace("", None), errors="coerce").dt.normalize()
+
+
+def _importe(df: pd.DataFrame, nombre: str) -> pd.Series:
+    return pd.to_numeric(_columna(df, nombre, 0), errors="coerce").fillna(0)
+
+
+def _hoy(hoy: Optional[date] = None) -> pd.Timestamp:
+    return pd.Timestamp(hoy or date.today()).normalize()
+
+
+# =========================
+# VENCIMIENTOS Y MÉTRICAS
+# =========================
+
+def _en_plazo(df: pd.DataFrame, hoy: pd.Timestamp, dias: int):
+    """(fechas de vencimiento, máscara de las que caen en [hoy, hoy + dias])."""
+    fechas = pd.DataFrame({c: _fecha(df, c) for c in CAMPOS_VENCIMIENTO}, index=df.index)
+    return fechas, (fechas >= hoy) & (fechas <= hoy + pd.Timedelta(days=dias))
+
+
+def vencimientos(df: pd.DataFrame, hoy: Optional[date] = None, dias: int = DIAS_AVISO) -> pd.DataFrame:
+    """
+    Proyectos con alguna fecha clave en los próximos `dias` días, uno por
+    proyecto. Se toma la primera de CAMPOS_VENCIMIENTO (en ese orden) que
+    cae en plazo. Ordenado por días restantes.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=COLUMNAS_URGENTES)
+    hoy = _hoy(hoy)
+    fechas, en_plazo = _en_plazo(df, hoy, dias)
+    hay = en_plazo.any(axis=1)
+    if not hay.any():
+        return pd.DataFrame(columns=COLUMNAS_URGENTES)
+
+    fechas, en_plazo = fechas[hay], en_plazo[hay]
+    campo = en_plazo.idxmax(axis=1)
+    urgente = fechas.where(en_plazo).bfill(axis=1).iloc[:, 0]
+    resultado = pd.DataFrame({
+        "nombre": _columna(df, "nombre", "Sin nombre")[hay],
+        "estado_proyecto": _columna(df, "estado_proyecto", "N/A")[hay],
+        "fecha_fin": fechas["fecha_fin"].dt.date,
+        "fecha_justificacion": fechas["fecha_justificacion"].dt.date,
+        "dias_restantes": (urgente - hoy).dt.days.astype(int),
+        "tipo_vencimiento": campo.str.replace("fecha_", "", n=1).str.replace("_", " ").str.title(),
+        "fecha_urgente": urgente.dt.date,
+    })
+    return resultado.sort_values("dias_restantes", kind="stable").reset_index(drop=True)
+
+
+def totales_presupuesto(df: pd.DataFrame) -> Dict[str, float]:
+    return {
+        "presupuesto_total": float(_importe(df, "presupuesto_total").sum()),
+        "importe_concedido": float(_importe(df, "importe_concedido").sum()),
+    }
+
+
+def presupuesto_por_año(df: pd.DataFrame) -> pd.DataFrame:
+    """Presupuesto total por year_proyecto (o por año de fecha_inicio si no existe)."""
+    if df.empty:
+        return pd.DataFrame(columns=["year_proyecto", "presupuesto_total"])
+    if "year_proyecto" in df.columns:
+        año = pd.to_numeric(df["year_proyecto"], errors="coerce")
+    else:
+        año = _fecha(df, "fecha_inicio").dt.year
+    return pd.DataFrame({"year_proyecto": año, "presupuesto_total": _importe(df, "presupuesto_total")}) \
+        .dropna(subset=["year_proyecto"]).astype({"year_proyecto": int}) \
+        .groupby("year_proyecto", as_index=False)["presupuesto_total"].sum()
+
+
+def metricas_dashboard(df: pd.DataFrame, hoy: Optional[date] = None, dias: int = DIAS_AVISO) -> Dict[str, Any]:
+    if df.empty:
+        return {"total_proyectos": 0, "proyectos_activos": 0, "presupuesto_total": 0,
+                "importe_concedido": 0, "tasa_exito": 0, "proximos_vencimientos": 0}
+
+    subvencion = _columna(df, "estado_subvencion").fillna("")
+    resuelta = (subvencion != "") & (subvencion != "CONVOCADA")
+    concedidas = (subvencion == "CONCEDIDA").sum()
+    _, en_plazo = _en_plazo(df, _hoy(hoy), dias)
+
+    return {
+        "total_proyectos": len(df),
+        "proyectos_activos": int((_columna(df, "estado_proyecto") == "EN_EJECUCION").sum()),
+        **totales_presupuesto(df),
+        "tasa_exito": float(concedidas / resuelta.sum() * 100) if resuelta.any() else 0,
+        "proximos_vencimientos": int(en_plazo.any(axis=1).sum()),
+    }
+
+
+# =========================
+# GANTT
+# =========================
+
+def barras_gantt(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Una barra por proyecto con inicio (fecha_inicio o, si falta,
+    fecha_ejecucion) y fin (fecha_fin o fecha_justificacion). Los proyectos
+    sin ambas fechas se descartan.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=COLUMNAS_GANTT)
+    inicio = _fecha(df, "fecha_inicio").fillna(_fecha(df, "fecha_ejecucion"))
+    fin = _fecha(df, "fecha_fin").fillna(_fecha(df, "fecha_justificacion"))
+    validas = inicio.notna() & fin.notna()
+
+    nombre = _columna(df, "nombre").fillna("").astype(str)[validas]
+    empresa = _columna(df, "empresa_nombre").fillna("").astype(str)[validas]
+    return pd.DataFrame({
+        "Task": nombre.where(nombre.str.len() <= 30, nombre.str.slice(0, 30) + "..."),
+        "Start": inicio[validas].dt.date,
+        "Finish": fin[validas].dt.date,
+        "Resource": _columna(df, "estado_proyecto")[validas],
+        "Description": "Tipo: " + _columna(df, "tipo_proyecto").fillna("").astype(str)[validas]
+                       + " | Empresa: " + empresa.where(empresa != "", "N/A"),
+    }).reset_index(drop=True)
+
+
+# =========================
+# ÍNDICE PROYECTO → GRUPOS
+# =========================
+
+class IndiceProyectoGrupos:
+    """{proyecto_id: {grupo_id}} de proyecto_grupos, compartido por el proceso."""
+
+    def __init__(self, ttl: float = TTL_INDICE):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._grupos: Optional[Dict[str, Set[str]]] = None
+        self._cargado = 0.0
+
+    def _cargar(self, supabase):
+        indice: Dict[str, Set[str]] = defaultdict(set)
+        desde = 0
+        while True:
+            filas = supabase.table("proyecto_grupos").select("proyecto_id, grupo_id").order("id") \
+                .range(desde, desde + PAGINA_INDICE - 1).execute().data or []
+            for fila in filas:
+                indice[fila["proyecto_id"]].add(fila["grupo_id"])
+            if len(filas) < PAGINA_INDICE:
+                break
+            desde += PAGINA_INDICE
+        self._grupos = dict(indice)
+        self._cargado = time.monotonic()
+
+    def _vigente(self) -> bool:
+        return self._grupos is not None and time.monotonic() - self._cargado < self.ttl
+
+    def grupos_de(self, supabase, proyecto_id: str) -> Set[str]:
+        with self._lock:
+            if not self._vigente():
+                self._cargar(supabase)
+            return set(self._grupos.get(proyecto_id, ()))
+
+    def asignado(self, supabase, proyecto_id: str, grupo_id: str) -> bool:
+        return grupo_id in self.grupos_de(supabase, proyecto_id)
+
+    def registrar(self, proyecto_id: str, grupo_ids: Iterable[str]):
+        with self._lock:
+            if self._grupos is not None:
+                self._grupos.setdefault(proyecto_id, set()).update(grupo_ids)
+
+    def quitar(self, proyecto_id: str, grupo_ids: Iterable[str]):
+        with self._lock:
+            if self._grupos is not None and proyecto_id in self._grupos:
+                self._grupos[proyecto_id].difference_update(grupo_ids)
+
+    def invalidar(self):
+        with self._lock:
+            self._grupos = None
+
+
+@st.cache_resource
+def get_indice_proyecto_grupos() -> IndiceProyectoGrupos:
+    """Instancia única por proceso (sobrevive a reruns y sesiones)."""
+    return IndiceProyectoGrupos()
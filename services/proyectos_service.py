@@ -1,8 +1,10 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
 import uuid
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Set
+
+from services.proyectos_analitica import get_indice_proyecto_grupos, metricas_dashboard
 
 class ProyectosService:
     """Servicio para gestión de proyectos de formación"""
@@ -312,185 +314,178 @@ class ProyectosService:
             st.error(f"Error al cargar grupos disponibles: {e}")
             return pd.DataFrame()
     
-    def asignar_grupo_proyecto(self, proyecto_id: str, grupo_id: str) -> bool:
-        """Asigna un grupo a un proyecto"""
+    @st.cache_data(ttl=300)
+    def get_grupos_asignables(_self, rol: str, empresa_id: Optional[str]) -> pd.DataFrame:
+        """
+        Grupos con su acción formativa para el selector de asignación, con la
+        etiqueta "Código - Acción (Modalidad) [Estado] - Horas" ya construida.
+        El rol y la empresa van como argumentos para que formen parte de la
+        clave de caché.
+        """
         try:
-            if not self.can_modify_data():
-                st.error("No tienes permisos para asignar grupos")
-                return False
-            
-            # Verificar si ya está asignado
-            existing = self.supabase.table("proyecto_grupos").select("id").eq("proyecto_id", proyecto_id).eq("grupo_id", grupo_id).execute()
-            
-            if existing.data:
-                st.warning("El grupo ya está asignado a este proyecto")
-                return False
+            query = _self.supabase.table("grupos").select("""
+                id, codigo_grupo, estado, localidad, fecha_inicio, fecha_fin_prevista,
+                accion_formativa:acciones_formativas(nombre, modalidad, num_horas)
+            """)
+            if rol == "gestor" and empresa_id:
+                query = query.eq("empresa_id", empresa_id)
+            result = query.execute()
             
-            # Insertar relación
-            datos_relacion = {
-                "id": str(uuid.uuid4()),
-                "proyecto_id": proyecto_id,
-                "grupo_id": grupo_id,
-                "fecha_asignacion": datetime.utcnow().isoformat()
-            }
+            if not result.data:
+                return pd.DataFrame()
             
-            result = self.supabase.table("proyecto_grupos").insert(datos_relacion).execute()
+            df = pd.DataFrame(result.data)
+            accion = df.pop("accion_formativa").map(lambda x: x if isinstance(x, dict) else {})
+            df["accion_nombre"] = accion.map(lambda x: x.get("nombre") or "Sin acción")
+            df["modalidad"] = accion.map(lambda x: x.get("modalidad") or "")
+            df["num_horas"] = accion.map(lambda x: x.get("num_horas") or "")
+            df["estado"] = df["estado"].fillna("abierto")
+            df["localidad"] = df["localidad"].fillna("No definida")
+            
+            modalidad = df["modalidad"].where(df["modalidad"] == "", " (" + df["modalidad"] + ")")
+            horas = df["num_horas"].astype(str)
+            horas = horas.where(horas == "", " - " + horas + "h")
+            df["etiqueta"] = (df["codigo_grupo"].fillna("") + " - " + df["accion_nombre"] + modalidad
+                              + " [" + df["estado"].str.capitalize() + "]" + horas)
+            return df
             
-            if result.data:
-                # Limpiar cache
-                self.get_grupos_proyecto.clear()
-                st.success("Grupo asignado correctamente al proyecto")
-                return True
-            else:
-                st.error("Error al asignar el grupo")
-                return False
-                
         except Exception as e:
-            st.error(f"Error al asignar grupo: {e}")
+            st.error(f"Error al cargar grupos: {e}")
+            return pd.DataFrame()
+    
+    def grupos_asignados(self, proyecto_id: str) -> Set[str]:
+        """Ids de los grupos asignados al proyecto (desde el índice en memoria)."""
+        try:
+            return get_indice_proyecto_grupos().grupos_de(self.supabase, proyecto_id)
+        except Exception as e:
+            st.error(f"Error al cargar grupos del proyecto: {e}")
+            return set()
+    
+    def asignar_grupo_proyecto(self, proyecto_id: str, grupo_id: str) -> bool:
+        """Asigna un grupo a un proyecto"""
+        if not self.can_modify_data():
+            st.error("No tienes permisos para asignar grupos")
             return False
+        
+        resultado = self.asignar_grupos_proyecto(proyecto_id, [grupo_id]).get(grupo_id, "")
+        if resultado == self.ASIGNADO:
+            st.success("Grupo asignado correctamente al proyecto")
+            return True
+        if resultado == self.YA_ASIGNADO:
+            st.warning("El grupo ya está asignado a este proyecto")
+        else:
+            st.error(f"Error al asignar grupo: {resultado}")
+        return False
     
     def desasignar_grupo_proyecto(self, proyecto_id: str, grupo_id: str) -> bool:
         """Desasigna un grupo de un proyecto"""
-        try:
-            if not self.can_modify_data():
-                st.error("No tienes permisos para desasignar grupos")
-                return False
-            
-            result = self.supabase.table("proyecto_grupos").delete().eq("proyecto_id", proyecto_id).eq("grupo_id", grupo_id).execute()
-            
-            if result.data:
-                # Limpiar cache
-                self.get_grupos_proyecto.clear()
-                st.success("Grupo desasignado correctamente")
-                return True
-            else:
-                st.error("Error al desasignar el grupo")
-                return False
-                
-        except Exception as e:
-            st.error(f"Error al desasignar grupo: {e}")
+        if not self.can_modify_data():
+            st.error("No tienes permisos para desasignar grupos")
             return False
+        
+        resultado = self.quitar_grupos_proyecto(proyecto_id, [grupo_id]).get(grupo_id, "")
+        if resultado == self.QUITADO:
+            st.success("Grupo desasignado correctamente")
+            return True
+        st.error("Error al desasignar el grupo" if resultado == self.NO_ASIGNADO
+                 else f"Error al desasignar grupo: {resultado}")
+        return False
     
     # =========================
-    # MÉTRICAS Y DASHBOARD
+    # ASIGNACIONES EN BLOQUE
     # =========================
     
-    def calcular_metricas_dashboard(self, df_proyectos: pd.DataFrame) -> Dict[str, Any]:
-        """Calcula métricas para el dashboard"""
+    LOTE_GRUPOS = 150  # ids por petición (filtro `in` e inserción)
+    
+    # Resultados por grupo
+    ASIGNADO = "asignado"
+    YA_ASIGNADO = "ya_asignado"
+    QUITADO = "quitado"
+    NO_ASIGNADO = "no_asignado"
+    
+    def _insertar_relaciones(self, filas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Upsert que ignora los pares (proyecto_id, grupo_id) ya existentes, así
+        una asignación concurrente no duplica la relación. Si la tabla no tiene
+        la restricción única que exige on_conflict, se inserta sin más (los
+        existentes ya se han descartado con el índice).
+        """
+        tabla = self.supabase.table("proyecto_grupos")
+        try:
+            return tabla.upsert(filas, on_conflict="proyecto_id,grupo_id",
+                                ignore_duplicates=True).execute().data or []
+        except Exception:
+            return self.supabase.table("proyecto_grupos").insert(filas).execute().data or []
+    
+    def asignar_grupos_proyecto(self, proyecto_id: str, grupo_ids: List[str]) -> Dict[str, str]:
+        """Asigna varios grupos a un proyecto. Devuelve {grupo_id: resultado}."""
+        if not self.can_modify_data():
+            return {g: "error: sin permisos" for g in grupo_ids}
+        
+        indice = get_indice_proyecto_grupos()
+        grupo_ids = list(dict.fromkeys(g for g in grupo_ids if g))
         try:
-            if df_proyectos.empty:
-                return {
-                    "total_proyectos": 0,
-                    "proyectos_activos": 0,
-                    "presupuesto_total": 0,
-                    "importe_concedido": 0,
-                    "tasa_exito": 0,
-                    "proximos_vencimientos": 0
-                }
-            
-            total_proyectos = len(df_proyectos)
-            proyectos_activos = len(df_proyectos[df_proyectos['estado_proyecto'] == 'EN_EJECUCION'])
-            
-            # Presupuestos - manejo seguro de valores numéricos
-            def safe_numeric_sum(series):
-                try:
-                    # Convertir a numérico, forzando errores a NaN
-                    numeric_series = pd.to_numeric(series, errors='coerce')
-                    # Llenar NaN con 0 y sumar
-                    return numeric_series.fillna(0).sum()
-                except:
-                    return 0
-            
-            presupuesto_total = safe_numeric_sum(df_proyectos.get('presupuesto_total', pd.Series(dtype=float)))
-            importe_concedido = safe_numeric_sum(df_proyectos.get('importe_concedido', pd.Series(dtype=float)))
-            
-            # Tasa de éxito - manejo seguro
+            ya = indice.grupos_de(self.supabase, proyecto_id)
+        except Exception as e:
+            return {g: f"error: {e}" for g in grupo_ids}
+        
+        resultados = {g: self.YA_ASIGNADO for g in grupo_ids if g in ya}
+        nuevos = [g for g in grupo_ids if g not in ya]
+        ahora = datetime.utcnow().isoformat()
+        
+        for i in range(0, len(nuevos), self.LOTE_GRUPOS):
+            lote = nuevos[i:i + self.LOTE_GRUPOS]
+            filas = [{
+                "id": str(uuid.uuid4()),
+                "proyecto_id": proyecto_id,
+                "grupo_id": g,
+                "fecha_asignacion": ahora,
+                "activo": True
+            } for g in lote]
             try:
-                # Filtrar proyectos que tienen estado de subvención válido
-                con_estado_subvencion = df_proyectos[
-                    df_proyectos['estado_subvencion'].notna() & 
-                    (df_proyectos['estado_subvencion'] != '') &
-                    (df_proyectos['estado_subvencion'] != 'CONVOCADA')
-                ]
-                
-                if len(con_estado_subvencion) > 0:
-                    concedidos = len(con_estado_subvencion[con_estado_subvencion['estado_subvencion'] == 'CONCEDIDA'])
-                    tasa_exito = (concedidos / len(con_estado_subvencion)) * 100
-                else:
-                    tasa_exito = 0
+                insertados = {f["grupo_id"] for f in self._insertar_relaciones(filas)}
+                resultados.update({g: self.ASIGNADO if g in insertados else self.YA_ASIGNADO for g in lote})
             except Exception as e:
-                st.warning(f"Error calculando tasa de éxito: {e}")
-                tasa_exito = 0
-            
-            # Próximos vencimientos - manejo seguro de fechas
+                resultados.update({g: f"error: {e}" for g in lote})
+        
+        indice.registrar(proyecto_id, [g for g, r in resultados.items() if r in (self.ASIGNADO, self.YA_ASIGNADO)])
+        if self.ASIGNADO in resultados.values():
+            self.get_grupos_proyecto.clear()
+        return resultados
+    
+    def quitar_grupos_proyecto(self, proyecto_id: str, grupo_ids: List[str]) -> Dict[str, str]:
+        """Quita varios grupos de un proyecto con un delete por lote. Devuelve {grupo_id: resultado}."""
+        if not self.can_modify_data():
+            return {g: "error: sin permisos" for g in grupo_ids}
+        
+        grupo_ids = list(dict.fromkeys(g for g in grupo_ids if g))
+        resultados: Dict[str, str] = {}
+        for i in range(0, len(grupo_ids), self.LOTE_GRUPOS):
+            lote = grupo_ids[i:i + self.LOTE_GRUPOS]
             try:
-                hoy = datetime.now().date()
-                fecha_limite = hoy + timedelta(days=30)
-                
-                proximos_vencimientos = 0
-                
-                # Campos de fecha a verificar
-                campos_fecha = ['fecha_fin', 'fecha_justificacion', 'fecha_presentacion_informes']
-                
-                for _, proyecto in df_proyectos.iterrows():
-                    for fecha_col in campos_fecha:
-                        fecha_valor = proyecto.get(fecha_col)
-                        
-                        # Manejo seguro de conversión de fechas
-                        try:
-                            if pd.isna(fecha_valor) or fecha_valor is None:
-                                continue
-                                
-                            # Si es string, intentar convertir
-                            if isinstance(fecha_valor, str):
-                                if fecha_valor.strip() == '':
-                                    continue
-                                fecha_dt = pd.to_datetime(fecha_valor, errors='coerce')
-                                if pd.isna(fecha_dt):
-                                    continue
-                                fecha = fecha_dt.date()
-                            # Si ya es datetime o date
-                            elif hasattr(fecha_valor, 'date'):
-                                fecha = fecha_valor.date() if callable(getattr(fecha_valor, 'date', None)) else fecha_valor
-                            # Si es date directamente
-                            elif isinstance(fecha_valor, datetime.date):
-                                fecha = fecha_valor
-                            else:
-                                continue
-                            
-                            # Verificar si está en rango
-                            if hoy <= fecha <= fecha_limite:
-                                proximos_vencimientos += 1
-                                break  # Solo contar una vez por proyecto
-                                
-                        except Exception as fecha_error:
-                            # Si hay cualquier error con una fecha específica, continuamos
-                            continue
-                            
+                borrados = self.supabase.table("proyecto_grupos").delete() \
+                    .eq("proyecto_id", proyecto_id).in_("grupo_id", lote).execute()
+                quitados = {f["grupo_id"] for f in (borrados.data or [])}
+                resultados.update({g: self.QUITADO if g in quitados else self.NO_ASIGNADO for g in lote})
             except Exception as e:
-                st.warning(f"Error calculando vencimientos: {e}")
-                proximos_vencimientos = 0
-            
-            return {
-                "total_proyectos": total_proyectos,
-                "proyectos_activos": proyectos_activos,
-                "presupuesto_total": presupuesto_total,
-                "importe_concedido": importe_concedido,
-                "tasa_exito": tasa_exito,
-                "proximos_vencimientos": proximos_vencimientos
-            }
-            
+                resultados.update({g: f"error: {e}" for g in lote})
+        
+        get_indice_proyecto_grupos().quitar(proyecto_id, [g for g, r in resultados.items() if r == self.QUITADO])
+        if self.QUITADO in resultados.values():
+            self.get_grupos_proyecto.clear()
+        return resultados
+    
+    # =========================
+    # MÉTRICAS Y DASHBOARD
+    # =========================
+    
+    def calcular_metricas_dashboard(self, df_proyectos: pd.DataFrame) -> Dict[str, Any]:
+        """Calcula métricas para el dashboard"""
+        try:
+            return metricas_dashboard(df_proyectos)
         except Exception as e:
             st.error(f"Error al calcular métricas: {e}")
-            # Retornar métricas por defecto en caso de error
-            return {
-                "total_proyectos": 0,
-                "proyectos_activos": 0,
-                "presupuesto_total": 0,
-                "importe_concedido": 0,
-                "tasa_exito": 0,
-                "proximos_vencimientos": 0
-            }
+            return metricas_dashboard(pd.DataFrame())
     
     def filtrar_proyectos(self, df_proyectos: pd.DataFrame, filtros: Dict[str, Any]) -> pd.DataFrame:
         """Aplica filtros a los proyectos"""
@@ -0,0 +1,181 @@
+"""
+Memo de consultas por ejecución de script.
+
+Envuelve el cliente de Supabase para que, dentro de un mismo rerun de
+Streamlit, las lecturas idénticas (misma tabla, mismo select y mismos
+filtros) se sirvan desde memoria en lugar de repetir la petición HTTP.
+Cualquier escritura (insert/update/upsert/delete) vacía el memo para no
+servir datos obsoletos. Al final de cada ejecución se registra cuántas
+consultas se han repetido y cuáles, para poder ir eliminándolas.
+`medir_peticiones` cuenta además las peticiones reales (sin las servidas
+desde el memo) hechas dentro de un bloque, p. ej. al pintar una página.
+
+El cliente envuelto se crea de nuevo en cada rerun (app.py), así que el
+memo nunca vive más allá de una ejecución.
+"""
+
+import copy
+import json
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, List, Tuple
+
+METODOS_ESCRITURA = {"insert", "update", "upsert", "delete"}
+
+
+class QueryMemo:
+    """Almacén de respuestas y estadísticas de una ejecución."""
+
+    def __init__(self):
+        self.respuestas: Dict[str, Any] = {}
+        self.consultas = 0
+        self.duplicadas = 0
+        self.escrituras = 0
+        self.rpcs = 0
+        self.repeticiones: Counter = Counter()
+
+    @property
+    def peticiones(self) -> int:
+        """Peticiones HTTP hechas de verdad (lecturas no memorizadas, escrituras y RPC)."""
+        return self.consultas - self.duplicadas + self.escrituras + self.rpcs
+
+    def limpiar(self):
+        self.respuestas.clear()
+
+    def resumen(self, top: int = 5) -> Dict[str, Any]:
+        return {
+            "consultas": self.consultas,
+            "duplicadas": self.duplicadas,
+            "escrituras": self.escrituras,
+            "top_duplicadas": self.repeticiones.most_common(top),
+        }
+
+
+class _MemoBuilder:
+    """Proxy de un request builder de postgrest que va anotando la cadena de llamadas."""
+
+    def __init__(self, builder, memo: QueryMemo, tabla: str, llamadas: List[Tuple]):
+        self._builder = builder
+        self._memo = memo
+        self._tabla = tabla
+        self._llamadas = llamadas
+
+    def _envolver(self, resultado, llamada: Tuple):
+        if resultado is self._builder:
+            # El builder se modifica en sitio: compartimos la lista de llamadas
+            self._llamadas.append(llamada)
+            return self
+        if hasattr(resultado, "execute"):
+            return _MemoBuilder(resultado, self._memo, self._tabla, self._llamadas + [llamada])
+        return resultado
+
+    def __getattr__(self, nombre):
+        valor = getattr(self._builder, nombre)
+        if not callable(valor):
+            # Propiedades tipo `not_` devuelven el propio builder
+            return self._envolver(valor, (nombre,))
+
+        def metodo(*args, **kwargs):
+            return self._envolver(valor(*args, **kwargs), (nombre, args, kwargs))
+        return metodo
+
+    def _es_lectura(self) -> bool:
+        metodos = {llamada[0] for llamada in self._llamadas}
+        return "select" in metodos and not (metodos & METODOS_ESCRITURA)
+
+    def _huella(self) -> str:
+        return json.dumps([self._tabla, self._llamadas], default=str, sort_keys=True)
+
+    def _descripcion(self) -> str:
+        filtros = [llamada[0] for llamada in self._llamadas if llamada[0] != "select"]
+        return f"{self._tabla}[{','.join(filtros)}]"
+
+    def execute(self):
+        memo = self._memo
+        if not self._es_lectura():
+            memo.escrituras += 1
+            memo.limpiar()
+            return self._builder.execute()
+
+        memo.consultas += 1
+        huella = self._huella()
+        if huella in memo.respuestas:
+            memo.duplicadas += 1
+            memo.repeticiones[self._descripcion()] += 1
+            return copy.deepcopy(memo.respuestas[huella])
+
+        respuesta = self._builder.execute()
+        memo.respuestas[huella] = copy.deepcopy(respuesta)
+        return respuesta
+
+
+class MemoSupabaseClient:
+    """Cliente de Supabase con memo de lecturas para la ejecución actual."""
+
+    def __init__(self, cliente, memo: QueryMemo = None):
+        self.cliente = cliente
+        self.memo = memo or QueryMemo()
+
+    def table(self, nombre: str):
+        return _MemoBuilder(self.cliente.table(nombre), self.memo, nombre, [])
+
+    def from_(self, nombre: str):
+        return self.table(nombre)
+
+    def rpc(self, *args, **kwargs):
+        # Las funciones RPC pueden escribir: no se memorizan y vacían el memo
+        self.memo.limpiar()
+        self.memo.rpcs += 1
+        return self.cliente.rpc(*args, **kwargs)
+
+    def __getattr__(self, nombre):
+        # storage, auth, functions... se delegan tal cual
+        return getattr(self.cliente, nombre)
+
+
+def con_memo(cliente):
+    """Envuelve un cliente de Supabase con un memo nuevo (una vez por rerun)."""
+    if cliente is None:
+        return None
+    if isinstance(cliente, MemoSupabaseClient):
+        cliente = cliente.cliente
+    return MemoSupabaseClient(cliente)
+
+
+def sin_memo(cliente):
+    """Cliente original, para usarlo fuera del rerun (p. ej. en tareas en segundo plano)."""
+    return cliente.cliente if isinstance(cliente, MemoSupabaseClient) else cliente
+
+
+def registrar_estadisticas_memo(cliente, pagina: str = "") -> Dict[str, Any]:
+    """Imprime en el log las consultas duplicadas evitadas en esta ejecución."""
+    if not isinstance(cliente, MemoSupabaseClient):
+        return {}
+    resumen = cliente.memo.resumen()
+    if resumen["duplicadas"]:
+        top = ", ".join(f"{clave} ×{n}" for clave, n in resumen["top_duplicadas"])
+        print(
+            f"[query-memo] página={pagina or 'home'} consultas={resumen['consultas']} "
+            f"duplicadas={resumen['duplicadas']} escrituras={resumen['escrituras']} | {top}"
+        )
+    return resumen
+
+
+@contextmanager
+def medir_peticiones(cliente, etiqueta: str, maximo: int = None):
+    """
+    Cuenta las peticiones hechas dentro del bloque y las deja en el log. El
+    dict devuelto recibe el total al salir; si se pasa `maximo` y se supera,
+    la línea del log lo marca.
+    """
+    medicion = {"peticiones": 0}
+    if not isinstance(cliente, MemoSupabaseClient):
+        yield medicion
+        return
+    inicio = cliente.memo.peticiones
+    try:
+        yield medicion
+    finally:
+        medicion["peticiones"] = cliente.memo.peticiones - inicio
+        exceso = f" (máximo {maximo})" if maximo is not None and medicion["peticiones"] > maximo else ""
+        print(f"[query-memo] {etiqueta} peticiones={medicion['peticiones']}{exceso}")
@@ -0,0 +1,163 @@
+import streamlit as st
+import pandas as pd
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+
+class RgpdPlannerService:
+    """
+    Capa de datos del planner RGPD.
+
+    El tablero (tareas + histórico agrupado por tarea_id) se carga con dos
+    consultas y se guarda en la sesión; los cambios de estado se escriben de
+    una vez y se aplican sobre el tablero en memoria, sin volver a cargarlo.
+    """
+
+    # Función SQL opcional que hace update + histórico en una transacción.
+    # Si PostgREST responde que no existe se deja de llamar en este proceso.
+    RPC_CAMBIAR_ESTADO = "rgpd_cambiar_estado_tarea"
+    _rpc_disponible = True
+
+    @staticmethod
+    def _es_funcion_inexistente(error: Exception) -> bool:
+        texto = str(error)
+        return "PGRST202" in texto or "Could not find the function" in texto
+
+    def __init__(self, supabase, session_state):
+        self.supabase = supabase
+        self.session_state = session_state
+        self.empresa_id = session_state.user.get("empresa_id")
+        self.usuario = session_state.user.get("email")
+        self.clave_tablero = f"rgpd_tablero_{self.empresa_id}"
+
+    # =========================
+    # CARGA DEL TABLERO
+    # =========================
+
+    def get_tablero(self, forzar: bool = False) -> Dict[str, Any]:
+        """Devuelve {"tareas": [...], "historial": {tarea_id: [...]}} cacheado en sesión."""
+        if forzar or self.clave_tablero not in st.session_state:
+            st.session_state[self.clave_tablero] = self._cargar_tablero()
+        return st.session_state[self.clave_tablero]
+
+    def _cargar_tablero(self) -> Dict[str, Any]:
+        tareas = self.supabase.table("rgpd_tareas").select("*").eq(
+            "empresa_id", self.empresa_id
+        ).order("fecha_limite").execute().data or []
+
+        historial = defaultdict(list)
+        ids = [t["id"] for t in tareas]
+        if ids:
+            registros = self.supabase.table("rgpd_tareas_historial").select("*").in_(
+                "tarea_id", ids
+            ).order("fecha_cambio", desc=True).execute().data or []
+            for registro in registros:
+                historial[registro["tarea_id"]].append(registro)
+
+        return {"tareas": tareas, "historial": dict(historial)}
+
+    def get_df_tareas(self) -> pd.DataFrame:
+        return pd.DataFrame(self.get_tablero()["tareas"])
+
+    def get_historial(self, tarea_id: str) -> List[Dict]:
+        return self.get_tablero()["historial"].get(tarea_id, [])
+
+    def limpiar_cache_tablero(self):
+        st.session_state.pop(self.clave_tablero, None)
+
+    # =========================
+    # ESCRITURAS
+    # =========================
+
+    def _registro_historial(self, tarea_id: str, accion: str) -> Dict:
+        return {
+            "tarea_id": tarea_id,
+            "accion": accion,
+            "fecha_cambio": datetime.utcnow().isoformat(),
+            "usuario": self.usuario
+        }
+
+    def _anotar_historial(self, registro: Dict):
+        tablero = self.get_tablero()
+        tablero["historial"].setdefault(registro["tarea_id"], []).insert(0, registro)
+
+    def cambiar_estado(self, tarea: Dict, nuevo_estado: str) -> bool:
+        """
+        Cambia el estado de una tarea y registra el histórico como una única escritura.
+        Usa la función SQL si existe; si no, update + insert revirtiendo el estado
+        si falla el histórico.
+        """
+        registro = self._registro_historial(tarea["id"], f"Cambio de estado a {nuevo_estado}")
+        try:
+            hecho = False
+            if RgpdPlannerService._rpc_disponible:
+                try:
+                    self.supabase.rpc(self.RPC_CAMBIAR_ESTADO, {
+                        "p_tarea_id": tarea["id"],
+                        "p_estado": nuevo_estado,
+                        "p_accion": registro["accion"],
+                        "p_usuario": registro["usuario"]
+                    }).execute()
+                    hecho = True
+                except Exception as e:
+                    if self._es_funcion_inexistente(e):
+                        RgpdPlannerService._rpc_disponible = False
+            if not hecho:
+                self.supabase.table("rgpd_tareas").update({"estado": nuevo_estado}).eq("id", tarea["id"]).execute()
+                try:
+                    self.supabase.table("rgpd_tareas_historial").insert(registro).execute()
+                except Exception:
+                    self.supabase.table("rgpd_tareas").update({"estado": tarea["estado"]}).eq("id", tarea["id"]).execute()
+                    raise
+
+            # Parche local del tablero
+            for t in self.get_tablero()["tareas"]:
+                if t["id"] == tarea["id"]:
+                    t["estado"] = nuevo_estado
+                    break
+            self._anotar_historial(registro)
+            return True
+
+        except Exception as e:
+            st.error(f"❌ Error al cambiar el estado: {e}")
+            return False
+
+    def eliminar_tarea(self, tarea_id: str) -> bool:
+        try:
+            self.supabase.table("rgpd_tareas").delete().eq("id", tarea_id).execute()
+            self.supabase.table("rgpd_tareas_historial").insert(
+                self._registro_historial(tarea_id, "Eliminada")
+            ).execute()
+
+            tablero = self.get_tablero()
+            tablero["tareas"] = [t for t in tablero["tareas"] if t["id"] != tarea_id]
+            tablero["historial"].pop(tarea_id, None)
+            return True
+        except Exception as e:
+            st.error(f"❌ Error al eliminar la tarea: {e}")
+            return False
+
+    def crear_tarea(self, datos: Dict) -> Optional[Dict]:
+        res = self.supabase.table("rgpd_tareas").insert({
+            **datos,
+            "empresa_id": self.empresa_id,
+            "estado": "Pendiente"
+        }).execute()
+        if not res.data:
+            return None
+
+        tarea = res.data[0]
+        registro = self._registro_historial(tarea["id"], "Creada")
+        self.supabase.table("rgpd_tareas_historial").insert(registro).execute()
+
+        tablero = self.get_tablero()
+        tablero["tareas"] = sorted(
+            tablero["tareas"] + [tarea],
+            key=lambda t: (t.get("fecha_limite") is None, t.get("fecha_limite") or "")
+        )
+        self._anotar_historial(registro)
+        return tarea
+
+
+def get_rgpd_planner_service(supabase, session_state) -> RgpdPlannerService:
+    return RgpdPlannerService(supabase, session_state)
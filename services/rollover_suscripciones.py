@@ -0,0 +1,326 @@
+"""
+Cierre mensual del contador de clases de las suscripciones.
+
+`clases_usadas_mes` es un contador que se mueve al reservar y al cancelar.
+Este proceso lo recalcula desde clases_reservas (reservas del mes no
+canceladas) con una única sentencia por empresa:
+
+    UPDATE participantes_suscripciones s
+    SET clases_usadas_mes = (SELECT count(*) FROM clases_reservas r
+                             WHERE r.participante_id = s.participante_id
+                               AND r.estado <> 'CANCELADA'
+                               AND r.fecha_reserva >= :inicio AND r.fecha_reserva < :fin),
+        mes_referencia = :mes, mes_actual = :mes_num, año_actual = :anio
+    WHERE s.empresa_id = :empresa_id AND s.activa
+
+En Supabase se ejecuta como función SQL (RPC_ROLLOVER). Si la función no
+existe, se calcula lo mismo leyendo las reservas del mes de la empresa y
+escribiendo un update por valor distinto del contador. Como el resultado solo
+depende de las reservas, relanzarlo es seguro; además cada empresa queda
+anotada por mes en SQLite local y el modo programado no la repite.
+
+Uso desde un programador local (cron, systemd timer...):
+
+    python -m services.rollover_suscripciones ejecutar [AAAA-MM]
+    python -m services.rollover_suscripciones benchmark [max_suscripciones]
+"""
+
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from services.jobs_service import JOBS_DB_PATH
+
+ROLLOVER_DB_PATH = os.environ.get("ROLLOVER_DB_PATH", JOBS_DB_PATH)
+PAGINA_LECTURA = 1000
+MAX_IDS_FILTRO = 150  # ids por filtro `in` para no exceder la longitud de URL
+
+SQL_ROLLOVER = """
+    UPDATE participantes_suscripciones
+    SET clases_usadas_mes = (
+            SELECT count(*) FROM clases_reservas r
+            WHERE r.participante_id = participantes_suscripciones.participante_id
+              AND r.estado <> 'CANCELADA'
+              AND r.fecha_reserva >= :inicio AND r.fecha_reserva < :fin
+        ),
+        mes_referencia = :mes,
+        mes_actual = :mes_num,
+        año_actual = :anio
+    WHERE empresa_id = :empresa_id AND activa
+"""
+
+
+def limites_mes(mes: str) -> Tuple[str, str]:
+    """'2025-09' -> ('2025-09-01', '2025-10-01')."""
+    anio, num = (int(x) for x in mes.split("-"))
+    inicio = date(anio, num, 1)
+    fin = date(anio + (num == 12), num % 12 + 1, 1)
+    return inicio.isoformat(), fin.isoformat()
+
+
+def mes_en_curso() -> str:
+    hoy = date.today()
+    return f"{hoy.year}-{hoy.month:02d}"
+
+
+def _parametros(empresa_id: str, mes: str) -> Dict[str, Any]:
+    inicio, fin = limites_mes(mes)
+    anio, num = (int(x) for x in mes.split("-"))
+    return {"empresa_id": empresa_id, "mes": mes, "inicio": inicio, "fin": fin,
+            "mes_num": num, "anio": anio}
+
+
+# =========================
+# REGISTRO DE CIERRES
+# =========================
+
+class RegistroRollover:
+    """Empresas ya cerradas por mes (SQLite local, junto a la tabla de tareas)."""
+
+    def __init__(self, path: str = ROLLOVER_DB_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS rollover_suscripciones (
+                    empresa_id TEXT NOT NULL,
+                    mes TEXT NOT NULL,
+                    filas INTEGER,
+                    ejecutado_en TEXT,
+                    PRIMARY KEY (empresa_id, mes)
+                )
+            """)
+
+    def hecho(self, empresa_id: str, mes: str) -> bool:
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT 1 FROM rollover_suscripciones WHERE empresa_id = ? AND mes = ?",
+                (empresa_id, mes)
+            ).fetchone()
+        return fila is not None
+
+    def anotar(self, empresa_id: str, mes: str, filas: int):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO rollover_suscripciones VALUES (?, ?, ?, ?)",
+                (empresa_id, mes, filas, datetime.utcnow().isoformat())
+            )
+
+
+# =========================
+# ROLLOVER
+# =========================
+
+class RolloverSuscripciones:
+    """Recalcula `clases_usadas_mes` por empresa desde clases_reservas."""
+
+    # Función SQL opcional (SQL_ROLLOVER con los parámetros p_*):
+    #   rollover_uso_suscripciones(p_empresa_id uuid, p_mes text, p_inicio date, p_fin date)
+    #   returns integer  -- filas actualizadas
+    #   Índice recomendado: clases_reservas(participante_id, fecha_reserva)
+    RPC_ROLLOVER = "rollover_uso_suscripciones"
+
+    def __init__(self, supabase, registro: Optional[RegistroRollover] = None):
+        self.supabase = supabase
+        self.registro = registro or RegistroRollover()
+        self.peticiones = 0
+
+    def _execute(self, query):
+        self.peticiones += 1
+        return query.execute()
+
+    def empresas(self) -> List[str]:
+        """Empresas con alguna suscripción activa."""
+        ids, desde = set(), 0
+        while True:
+            filas = self._execute(
+                self.supabase.table("participantes_suscripciones").select("empresa_id")
+                .eq("activa", True).order("empresa_id").range(desde, desde + PAGINA_LECTURA - 1)
+            ).data or []
+            ids.update(f["empresa_id"] for f in filas if f.get("empresa_id"))
+            if len(filas) < PAGINA_LECTURA:
+                return sorted(ids)
+            desde += PAGINA_LECTURA
+
+    def ejecutar_empresa(self, empresa_id: str, mes: Optional[str] = None, forzar: bool = False) -> Dict[str, Any]:
+        """
+        Cierra un mes para una empresa. Sin `forzar`, una empresa ya cerrada
+        ese mes se salta (modo programado); con `forzar` se recalcula igual,
+        p. ej. tras cancelaciones masivas.
+        """
+        mes = mes or mes_en_curso()
+        if not forzar and self.registro.hecho(empresa_id, mes):
+            return {"empresa_id": empresa_id, "mes": mes, "omitida": True, "filas": 0}
+
+        p = _parametros(empresa_id, mes)
+        try:
+            res = self._execute(self.supabase.rpc(self.RPC_ROLLOVER, {
+                "p_empresa_id": empresa_id, "p_mes": mes, "p_inicio": p["inicio"], "p_fin": p["fin"]
+            }))
+            filas = int(res.data or 0)
+            metodo = "rpc"
+        except Exception:
+            filas = self._recalcular_por_conjuntos(p)
+            metodo = "conjuntos"
+
+        self.registro.anotar(empresa_id, mes, filas)
+        return {"empresa_id": empresa_id, "mes": mes, "omitida": False, "filas": filas, "metodo": metodo}
+
+    def _leer_paginado(self, construir) -> List[Dict[str, Any]]:
+        filas, desde = [], 0
+        while True:
+            lote = self._execute(construir().range(desde, desde + PAGINA_LECTURA - 1)).data or []
+            filas.extend(lote)
+            if len(lote) < PAGINA_LECTURA:
+                return filas
+            desde += PAGINA_LECTURA
+
+    def _recalcular_por_conjuntos(self, p: Dict[str, Any]) -> int:
+        """Misma semántica que SQL_ROLLOVER sin la función: lecturas paginadas + un update por valor."""
+        suscripciones = pd.DataFrame(self._leer_paginado(
+            lambda: self.supabase.table("participantes_suscripciones").select("id, participante_id")
+            .eq("empresa_id", p["empresa_id"]).eq("activa", True).order("id")
+        ), columns=["id", "participante_id"])
+        if suscripciones.empty:
+            return 0
+
+        reservas = pd.DataFrame(self._leer_paginado(
+            lambda: self.supabase.table("clases_reservas")
+            .select("id, participante_id, participante:participantes!inner(empresa_id)")
+            .eq("participante.empresa_id", p["empresa_id"])
+            .neq("estado", "CANCELADA")
+            .gte("fecha_reserva", p["inicio"]).lt("fecha_reserva", p["fin"]).order("id")
+        ), columns=["id", "participante_id"])
+
+        usadas = reservas.groupby("participante_id").size()
+        suscripciones["usadas"] = suscripciones["participante_id"].map(usadas).fillna(0).astype(int)
+
+        base = {"mes_referencia": p["mes"], "mes_actual": p["mes_num"], "año_actual": p["anio"],
+                "updated_at": datetime.utcnow().isoformat()}
+        for valor, grupo in suscripciones.groupby("usadas"):
+            ids = grupo["id"].tolist()
+            for i in range(0, len(ids), MAX_IDS_FILTRO):
+                self._execute(
+                    self.supabase.table("participantes_suscripciones")
+                    .update({**base, "clases_usadas_mes": int(valor)}).in_("id", ids[i:i + MAX_IDS_FILTRO])
+                )
+        return len(suscripciones)
+
+    def ejecutar(self, mes: Optional[str] = None, forzar: bool = False,
+                 empresas: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Cierre de todas las empresas (o de las indicadas)."""
+        mes = mes or mes_en_curso()
+        informe = {"mes": mes, "empresas": 0, "omitidas": 0, "filas": 0, "errores": []}
+        for empresa_id in (empresas if empresas is not None else self.empresas()):
+            try:
+                r = self.ejecutar_empresa(empresa_id, mes, forzar)
+                informe["empresas"] += 1
+                informe["omitidas"] += int(r["omitida"])
+                informe["filas"] += r["filas"]
+            except Exception as e:
+                informe["errores"].append(f"{empresa_id}: {e}")
+        informe["peticiones"] = self.peticiones
+        return informe
+
+
+# =========================
+# BENCHMARK LOCAL
+# =========================
+
+def _crear_datos_sqlite(n_suscripciones: int, n_empresas: int = 20, reservas_por_suscripcion: int = 6,
+                        mes: str = "2025-09", semilla: int = 42) -> sqlite3.Connection:
+    rnd = random.Random(semilla)
+    inicio, _ = limites_mes(mes)
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE participantes_suscripciones (
+            id TEXT PRIMARY KEY, participante_id TEXT, empresa_id TEXT, activa INTEGER,
+            clases_usadas_mes INTEGER, mes_referencia TEXT, mes_actual INTEGER, año_actual INTEGER
+        );
+        CREATE TABLE clases_reservas (
+            id INTEGER PRIMARY KEY, participante_id TEXT, estado TEXT, fecha_reserva TEXT
+        );
+        CREATE INDEX idx_sus_empresa ON participantes_suscripciones(empresa_id, activa);
+        CREATE INDEX idx_reservas_participante ON clases_reservas(participante_id, fecha_reserva);
+    """)
+    conn.executemany(
+        "INSERT INTO participantes_suscripciones VALUES (?, ?, ?, 1, ?, '2025-08', 8, 2025)",
+        [(f"sus-{i:07d}", f"par-{i:07d}", f"emp-{i % n_empresas:03d}", rnd.randint(0, 12))
+         for i in range(n_suscripciones)]
+    )
+    estados = ["RESERVADA", "ASISTIO", "NO_ASISTIO", "CANCELADA"]
+    conn.executemany(
+        "INSERT INTO clases_reservas (participante_id, estado, fecha_reserva) VALUES (?, ?, ?)",
+        [(f"par-{i:07d}", rnd.choice(estados), f"{inicio[:8]}{rnd.randint(1, 28):02d}T10:00:00")
+         for i in range(n_suscripciones) for _ in range(rnd.randint(0, reservas_por_suscripcion))]
+    )
+    conn.commit()
+    return conn
+
+
+def benchmark_rollover(tamanos: Tuple[int, ...] = (1000, 10000, 100000), n_empresas: int = 20,
+                       mes: str = "2025-09") -> Dict[str, Any]:
+    """
+    Ejecuta SQL_ROLLOVER (una sentencia por empresa) sobre SQLite en memoria
+    para varios tamaños y comprueba el resultado contra un recuento directo.
+    El coste por suscripción debe mantenerse estable (crecimiento lineal).
+    """
+    resultados = []
+    for n in tamanos:
+        conn = _crear_datos_sqlite(n, n_empresas, mes=mes)
+        empresas = [f"emp-{i:03d}" for i in range(n_empresas)]
+
+        t0 = time.perf_counter()
+        with conn:
+            for empresa_id in empresas:
+                conn.execute(SQL_ROLLOVER, _parametros(empresa_id, mes))
+        segundos = time.perf_counter() - t0
+
+        esperado = dict(conn.execute("""
+            SELECT s.id, count(r.id) FROM participantes_suscripciones s
+            LEFT JOIN clases_reservas r ON r.participante_id = s.participante_id AND r.estado <> 'CANCELADA'
+            GROUP BY s.id
+        """).fetchall())
+        obtenido = dict(conn.execute("SELECT id, clases_usadas_mes FROM participantes_suscripciones").fetchall())
+
+        # Idempotencia: una segunda pasada no cambia nada
+        with conn:
+            for empresa_id in empresas:
+                conn.execute(SQL_ROLLOVER, _parametros(empresa_id, mes))
+        repetido = dict(conn.execute("SELECT id, clases_usadas_mes FROM participantes_suscripciones").fetchall())
+
+        resultados.append({
+            "suscripciones": n,
+            "reservas": conn.execute("SELECT count(*) FROM clases_reservas").fetchone()[0],
+            "sentencias": len(empresas),
+            "segundos": round(segundos, 3),
+            "us_por_suscripcion": round(segundos / n * 1e6, 2),
+            "correcto": esperado == obtenido,
+            "idempotente": obtenido == repetido,
+        })
+        conn.close()
+
+    return {"mes": mes, "empresas": n_empresas, "resultados": resultados}
+
+
+if __name__ == "__main__":
+    import sys
+
+    orden = sys.argv[1] if len(sys.argv) > 1 else "benchmark"
+    if orden == "ejecutar":
+        from supabase import create_client
+
+        cliente = create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_SERVICE_ROLE_KEY"])
+        mes = sys.argv[2] if len(sys.argv) > 2 else None
+        print(json.dumps(RolloverSuscripciones(cliente).ejecutar(mes), indent=2))
+    else:
+        maximo = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+        tamanos = tuple(t for t in (1000, 10000, 100000, 1000000) if t <= maximo)
+        print(json.dumps(benchmark_rollover(tamanos), indent=2))
@@ -1,5 +1,6 @@
 from datetime import datetime
 from utils import validar_dni_cif  # Si quieres validar documentos
+from services.plataforma_service import registrar_alta, registrar_baja
 
 def create_user(supabase, *, email, password, nombre, rol, empresa_id=None, grupo_id=None, dni=None):
     """
@@ -50,6 +51,7 @@ def create_user(supabase, *, email, password, nombre, rol, empresa_id=None, grup
         supabase.auth.admin.delete_user(auth_id)
         raise RuntimeError(f"Error al insertar usuario en base de datos: {db_res.error}")
 
+    registrar_alta("usuarios")
     return db_res.data[0]
 
 def update_user(supabase, *, auth_id, email=None, nombre=None, rol=None, empresa_id=None, grupo_id=None, dni=None):
@@ -87,5 +89,6 @@ def delete_user(supabase, *, auth_id):
         raise ValueError("auth_id es obligatorio para eliminar un usuario.")
 
     supabase.table("usuarios").delete().eq("auth_id", auth_id).execute()
+    registrar_baja("usuarios")
     supabase.auth.admin.delete_user(auth_id)
     
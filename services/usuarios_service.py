@@ -0,0 +1,178 @@
+"""
+Directorio de usuarios del sistema (admin, gestor, comercial).
+
+Los usuarios se leen con su empresa en una única select embebida y se
+guardan, junto con la lista de empresas y los conteos por rol y por
+empresa, en una cache única por proceso. Las altas, bajas y cambios que
+pasan por AuthService actualizan directamente el DataFrame y los conteos,
+así que la pantalla de usuarios no vuelve a consultar la tabla en cada
+cambio de filtro ni tras guardar. El TTL solo cubre cambios hechos desde
+fuera de este proceso.
+"""
+
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import pandas as pd
+import streamlit as st
+
+ROLES_SISTEMA = ["admin", "gestor", "comercial"]
+TTL_DIRECTORIO = 300  # segundos
+
+COLUMNAS_DIRECTORIO = """
+    id, auth_id, email, rol, empresa_id, nif, nombre_completo,
+    telefono, nombre, grupo_id, created_at,
+    empresa:empresas!fk_empresa(nombre, cif)
+"""
+
+
+class DirectorioUsuarios:
+    """Usuarios del sistema con empresa, filtros y conteos precalculados."""
+
+    def __init__(self, ttl: float = TTL_DIRECTORIO):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._df: Optional[pd.DataFrame] = None
+        self._empresas: Dict[str, str] = {}
+        self._conteos: Dict[str, Any] = {}
+        self._cargado = 0.0
+
+    # =========================
+    # CARGA
+    # =========================
+
+    def _cargar(self, supabase):
+        filas = supabase.table("usuarios").select(COLUMNAS_DIRECTORIO) \
+            .in_("rol", ROLES_SISTEMA).order("created_at", desc=True).execute().data or []
+        empresas = supabase.table("empresas").select("id, nombre").order("nombre").execute().data or []
+
+        self._empresas = {e["id"]: e["nombre"] for e in empresas}
+        df = pd.DataFrame(filas)
+        if not df.empty:
+            embebida = df.pop("empresa") if "empresa" in df.columns else pd.Series(None, index=df.index)
+            df["empresa_nombre"] = embebida.map(lambda x: x.get("nombre") if isinstance(x, dict) else "")
+            df["empresa_cif"] = embebida.map(lambda x: x.get("cif") if isinstance(x, dict) else "")
+        self._df = self._preparar(df)
+        self._recontar()
+        self._cargado = time.monotonic()
+
+    @staticmethod
+    def _preparar(df: pd.DataFrame) -> pd.DataFrame:
+        """Columnas auxiliares de búsqueda (en minúsculas) calculadas una sola vez."""
+        if df.empty:
+            return df
+        df = df.reset_index(drop=True)
+        df["_texto"] = (df["nombre_completo"].fillna("") + " " + df["email"].fillna("")).str.lower()
+        df["_empresa"] = df["empresa_nombre"].fillna("").str.lower()
+        df["_alta"] = pd.to_datetime(df["created_at"], errors="coerce", utc=True)
+        return df
+
+    def _recontar(self):
+        df = self._df
+        if df is None or df.empty:
+            self._conteos = {"total": 0, "por_rol": Counter(), "por_empresa": Counter(), "nuevos_mes": 0}
+            return
+        ahora = datetime.now()
+        alta = df["_alta"]
+        self._conteos = {
+            "total": len(df),
+            "por_rol": Counter(df["rol"].value_counts().to_dict()),
+            "por_empresa": Counter(df["empresa_id"].dropna().value_counts().to_dict()),
+            "nuevos_mes": int(((alta.dt.month == ahora.month) & (alta.dt.year == ahora.year)).sum()),
+        }
+
+    def _vigente(self) -> bool:
+        return self._df is not None and time.monotonic() - self._cargado < self.ttl
+
+    # =========================
+    # LECTURA
+    # =========================
+
+    def get_usuarios(self, supabase) -> pd.DataFrame:
+        """DataFrame del directorio (no modificar: se comparte entre sesiones)."""
+        with self._lock:
+            if not self._vigente():
+                self._cargar(supabase)
+            return self._df
+
+    def get_empresas_dict(self, supabase) -> Dict[str, str]:
+        """{nombre: id} de todas las empresas, para los selectores."""
+        with self._lock:
+            if not self._vigente():
+                self._cargar(supabase)
+            return {nombre: eid for eid, nombre in self._empresas.items()}
+
+    def get_conteos(self, supabase) -> Dict[str, Any]:
+        """Total, por rol, por empresa y altas del mes en curso."""
+        with self._lock:
+            if not self._vigente():
+                self._cargar(supabase)
+            return {clave: Counter(v) if isinstance(v, Counter) else v for clave, v in self._conteos.items()}
+
+    @staticmethod
+    def filtrar(df: pd.DataFrame, texto: str = "", rol: Optional[str] = None,
+                empresa: str = "") -> pd.DataFrame:
+        """Filtros de la tabla sobre las columnas de búsqueda precalculadas."""
+        if df.empty:
+            return df
+        mascara = pd.Series(True, index=df.index)
+        if texto:
+            mascara &= df["_texto"].str.contains(texto.lower(), regex=False)
+        if rol:
+            mascara &= df["rol"] == rol
+        if empresa:
+            mascara &= df["_empresa"].str.contains(empresa.lower(), regex=False)
+        return df[mascara]
+
+    # =========================
+    # ACTUALIZACIÓN TRAS ESCRITURAS
+    # =========================
+
+    def _enriquecer(self, fila: Dict[str, Any]) -> Dict[str, Any]:
+        fila = {k: v for k, v in fila.items() if not isinstance(v, (dict, list))}
+        fila["empresa_nombre"] = self._empresas.get(fila.get("empresa_id"), "")
+        return fila
+
+    def registrar_alta(self, fila: Dict[str, Any]):
+        with self._lock:
+            if self._df is None or fila.get("rol") not in ROLES_SISTEMA:
+                return
+            nueva = self._preparar(pd.DataFrame([self._enriquecer(fila)]))
+            self._df = pd.concat([nueva, self._df], ignore_index=True)
+            self._recontar()
+
+    def registrar_baja(self, usuario_id: str):
+        with self._lock:
+            if self._df is None or self._df.empty:
+                return
+            self._df = self._df[self._df["id"] != usuario_id].reset_index(drop=True)
+            self._recontar()
+
+    def registrar_cambio(self, usuario_id: str, cambios: Dict[str, Any]):
+        with self._lock:
+            if self._df is None or self._df.empty:
+                return
+            posicion = self._df.index[self._df["id"] == usuario_id]
+            if posicion.empty:
+                return
+            fila = self._df.loc[posicion[0]].to_dict()
+            fila.update(cambios)
+            df = self._df.drop(index=posicion)
+            if fila.get("rol") in ROLES_SISTEMA:
+                nueva = self._preparar(pd.DataFrame([self._enriquecer(fila)]))
+                df = pd.concat([df, nueva], ignore_index=True).sort_values("_alta", ascending=False)
+            self._df = df.reset_index(drop=True)
+            self._recontar()
+
+    def invalidar(self):
+        with self._lock:
+            self._df = None
+
+
+@st.cache_resource
+def get_directorio_usuarios() -> DirectorioUsuarios:
+    """Instancia única por proceso (sobrevive a reruns y sesiones)."""
+    return DirectorioUsuarios()
@@ -0,0 +1,484 @@
+"""
+Validación FUNDAE previa al envío, por lotes de grupos.
+
+generar_informe_validacion_fundae() valida un grupo cada vez (cuatro o más
+consultas por grupo y bucles por participante). Aquí los grupos, sus
+acciones, tutores, participantes y empresas se cargan con unas pocas
+consultas `in` troceadas y las reglas se evalúan como máscaras sobre
+DataFrames. El resultado es un único informe con una fila por incidencia:
+
+    grupo_id | codigo_grupo | ambito | entidad_id | regla | nivel | mensaje
+
+y un resumen por grupo (errores, advertencias, estado VALIDO/ADVERTENCIA/ERROR).
+
+Benchmark local con un cliente en memoria:
+`python -m services.validacion_fundae_service [grupos] [latencia_ms]`.
+"""
+
+import json
+import random
+import string
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from services.documentos_identidad import validar_documentos
+from services.migraciones_service import DestinoSupabase, MAX_IDS_FILTRO
+
+COLUMNAS_INFORME = ["grupo_id", "codigo_grupo", "ambito", "entidad_id", "regla", "nivel", "mensaje"]
+MODALIDADES_FUNDAE = ["PRESENCIAL", "TELEFORMACION", "MIXTA"]
+MAX_PARTICIPANTES_RECOMENDADO = 30  # límite de GruposService.validar_grupo_fundae
+
+PATRON_EMAIL = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
+PATRON_TELEFONO = r"^\d{9,12}$"
+
+SELECT_GRUPOS = """
+    *,
+    accion_formativa:acciones_formativas!fk_grupo_accion(id, codigo_accion, nombre, modalidad, num_horas)
+"""
+SELECT_TUTORES = "grupo_id, tutor:tutores(id, nif, nombre, apellidos, email)"
+SELECT_PARTICIPANTES = "grupo_id, participante:participantes(id, nif, nombre, apellidos, email)"
+SELECT_EMPRESAS = "grupo_id, empresa_id"
+
+# Equivalencias de GruposService.normalizar_modalidad_fundae
+_EQUIVALENCIAS_MODALIDAD = {
+    "presencial": "PRESENCIAL",
+    "mixta": "MIXTA",
+    "teleformación": "TELEFORMACION",
+    "teleformacion": "TELEFORMACION",
+    "online": "TELEFORMACION",
+    "en línea": "TELEFORMACION",
+    "en linea": "TELEFORMACION",
+    "on line": "TELEFORMACION",
+    "on-line": "TELEFORMACION",
+    "aula virtual": "TELEFORMACION",
+}
+
+
+# =========================
+# CARGA POR CONJUNTOS
+# =========================
+
+def _aplanar(df: pd.DataFrame, columna: str, prefijo: str = "") -> pd.DataFrame:
+    """Expande una columna con el objeto embebido de PostgREST en columnas planas."""
+    if df.empty or columna not in df.columns:
+        return df.drop(columns=[columna], errors="ignore")
+    embebidos = pd.DataFrame(
+        [v if isinstance(v, dict) else {} for v in df[columna]], index=df.index
+    ).add_prefix(prefijo)
+    return pd.concat([df.drop(columns=[columna]), embebidos], axis=1)
+
+
+def cargar_datos_lote(supabase, grupo_ids: List[str]) -> Tuple[Dict[str, pd.DataFrame], int]:
+    """
+    Carga grupos (con su acción), tutores, participantes y empresas de
+    `grupo_ids` con consultas `in` de MAX_IDS_FILTRO ids. Devuelve los
+    DataFrames y el número de peticiones realizadas.
+    """
+    destino = DestinoSupabase(supabase)
+    ids = list(dict.fromkeys(str(i) for i in grupo_ids if i))
+    partes = {"grupos": [], "tutores": [], "participantes": [], "empresas": []}
+
+    for inicio in range(0, len(ids), MAX_IDS_FILTRO):
+        trozo = ids[inicio:inicio + MAX_IDS_FILTRO]
+        partes["grupos"].append(destino.leer("grupos", SELECT_GRUPOS, lambda q, t=trozo: q.in_("id", t)))
+        partes["tutores"].append(destino.leer("tutores_grupos", SELECT_TUTORES, lambda q, t=trozo: q.in_("grupo_id", t)))
+        partes["participantes"].append(
+            destino.leer("participantes_grupos", SELECT_PARTICIPANTES, lambda q, t=trozo: q.in_("grupo_id", t))
+        )
+        partes["empresas"].append(destino.leer("empresas_grupos", SELECT_EMPRESAS, lambda q, t=trozo: q.in_("grupo_id", t)))
+
+    def unir(frames):
+        frames = [f for f in frames if not f.empty]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    datos = {
+        "grupos": _aplanar(unir(partes["grupos"]), "accion_formativa", "accion_"),
+        "tutores": _aplanar(unir(partes["tutores"]), "tutor"),
+        "participantes": _aplanar(unir(partes["participantes"]), "participante"),
+        "empresas": unir(partes["empresas"]),
+    }
+    return datos, destino.peticiones
+
+
+# =========================
+# REGLAS VECTORIZADAS
+# =========================
+
+def _columna(df: pd.DataFrame, nombre: str) -> pd.Series:
+    return df[nombre] if nombre in df.columns else pd.Series(None, index=df.index, dtype=object)
+
+
+def _texto(df: pd.DataFrame, nombre: str) -> pd.Series:
+    return _columna(df, nombre).fillna("").astype(str).str.strip()
+
+
+def _vacio(df: pd.DataFrame, nombre: str) -> pd.Series:
+    return _texto(df, nombre).isin(["", "None", "nan", "NaT"])
+
+
+def normalizar_modalidad(modalidades: pd.Series) -> pd.Series:
+    """Versión vectorizada de GruposService.normalizar_modalidad_fundae (sin aula_virtual)."""
+    texto = modalidades.fillna("").astype(str).str.strip()
+    normalizada = texto.str.lower().map(_EQUIVALENCIAS_MODALIDAD)
+    return normalizada.fillna(texto.where(texto.isin(MODALIDADES_FUNDAE), ""))
+
+
+class _Incidencias:
+    """Acumula incidencias como DataFrames y las concatena una sola vez."""
+
+    def __init__(self):
+        self.partes: List[pd.DataFrame] = []
+
+    def agregar(self, df: pd.DataFrame, mascara: pd.Series, ambito: str, regla: str,
+                nivel: str, mensaje, entidad: str = "grupo_id"):
+        mascara = mascara.fillna(False).astype(bool)
+        if not mascara.any():
+            return
+        filas = df.loc[mascara]
+        mensajes = mensaje.loc[mascara] if isinstance(mensaje, pd.Series) else mensaje
+        self.partes.append(pd.DataFrame({
+            "grupo_id": filas["grupo_id"].values,
+            "ambito": ambito,
+            "entidad_id": _columna(filas, entidad).values,
+            "regla": regla,
+            "nivel": nivel,
+            "mensaje": np.asarray(mensajes, dtype=object) if isinstance(mensajes, pd.Series) else mensajes,
+        }))
+
+    def informe(self, codigos: pd.Series) -> pd.DataFrame:
+        if not self.partes:
+            return pd.DataFrame(columns=COLUMNAS_INFORME)
+        informe = pd.concat(self.partes, ignore_index=True)
+        informe["codigo_grupo"] = informe["grupo_id"].map(codigos)
+        return informe[COLUMNAS_INFORME]
+
+
+def _reglas_grupo(grupos: pd.DataFrame, inc: _Incidencias, tipo_validacion: str):
+    obligatorios = [
+        ("codigo_grupo", "Código del grupo"),
+        ("fecha_inicio", "Fecha de inicio"),
+        ("fecha_fin_prevista", "Fecha fin prevista"),
+        ("horario", "Horario"),
+        ("responsable", "Responsable"),
+        ("telefono_contacto", "Teléfono de contacto"),
+        ("empresa_id", "Empresa propietaria"),
+        ("accion_formativa_id", "Acción formativa"),
+    ]
+    for campo, nombre in obligatorios:
+        inc.agregar(grupos, _vacio(grupos, campo), "grupo", f"obligatorio:{campo}", "ERROR",
+                    f"{nombre} es obligatorio")
+
+    inc.agregar(grupos, _vacio(grupos, "localidad") & _vacio(grupos, "localidad_id"), "grupo",
+                "obligatorio:localidad", "ERROR", "Localidad es obligatorio")
+
+    telefono = _texto(grupos, "telefono_contacto").str.replace(r"[\s-]", "", regex=True)
+    inc.agregar(grupos, (telefono != "") & ~telefono.str.match(PATRON_TELEFONO), "grupo",
+                "formato:telefono", "ERROR", "Teléfono debe tener entre 9 y 12 dígitos")
+
+    previstos = pd.to_numeric(_columna(grupos, "n_participantes_previstos"), errors="coerce")
+    inc.agregar(grupos, ~previstos.between(1, 9999), "grupo", "rango:participantes_previstos", "ERROR",
+                "Participantes previstos debe ser un número entre 1 y 9999")
+    inc.agregar(grupos, previstos > MAX_PARTICIPANTES_RECOMENDADO, "grupo", "rango:participantes_previstos",
+                "ADVERTENCIA", f"Más de {MAX_PARTICIPANTES_RECOMENDADO} participantes previstos")
+
+    # Fechas
+    inicio = pd.to_datetime(_columna(grupos, "fecha_inicio"), errors="coerce", utc=True)
+    fin_prevista = pd.to_datetime(_columna(grupos, "fecha_fin_prevista"), errors="coerce", utc=True)
+    fin = pd.to_datetime(_columna(grupos, "fecha_fin"), errors="coerce", utc=True)
+    for campo, serie in (("fecha_inicio", inicio), ("fecha_fin_prevista", fin_prevista), ("fecha_fin", fin)):
+        inc.agregar(grupos, ~_vacio(grupos, campo) & serie.isna(), "grupo", f"formato:{campo}", "ERROR",
+                    f"{campo} no es una fecha válida")
+    inc.agregar(grupos, fin_prevista < inicio, "grupo", "fechas:orden", "ERROR",
+                "La fecha fin prevista es anterior a la de inicio")
+    inc.agregar(grupos, fin < inicio, "grupo", "fechas:orden", "ERROR",
+                "La fecha de finalización es anterior a la de inicio")
+
+    # Horas y modalidad frente a la acción formativa
+    con_accion = ~_vacio(grupos, "accion_id")
+    horas = pd.to_numeric(_columna(grupos, "accion_num_horas"), errors="coerce")
+    inc.agregar(grupos, con_accion & ~(horas > 0), "accion", "horas:accion", "ERROR",
+                "La acción formativa no tiene horas", entidad="accion_id")
+
+    modalidad_grupo = normalizar_modalidad(_columna(grupos, "modalidad"))
+    modalidad_accion = normalizar_modalidad(_columna(grupos, "accion_modalidad"))
+    inc.agregar(grupos, ~_vacio(grupos, "modalidad") & (modalidad_grupo == ""), "grupo", "modalidad:valor",
+                "ERROR", "Modalidad debe ser PRESENCIAL, TELEFORMACION o MIXTA")
+    inc.agregar(grupos, (modalidad_grupo != "") & (modalidad_accion != "") & (modalidad_grupo != modalidad_accion),
+                "grupo", "modalidad:coherencia", "ERROR",
+                "Modalidad del grupo (" + modalidad_grupo + ") distinta de la de la acción (" + modalidad_accion + ")")
+
+    if tipo_validacion == "finalizacion":
+        finalizados = pd.to_numeric(_columna(grupos, "n_participantes_finalizados"), errors="coerce").fillna(0)
+        aptos = pd.to_numeric(_columna(grupos, "n_aptos"), errors="coerce").fillna(0)
+        no_aptos = pd.to_numeric(_columna(grupos, "n_no_aptos"), errors="coerce").fillna(0)
+        inc.agregar(grupos, (finalizados > 0) & (aptos + no_aptos != finalizados), "grupo",
+                    "finalizacion:coherencia", "ERROR",
+                    aptos.astype(int).astype(str) + " aptos + " + no_aptos.astype(int).astype(str)
+                    + " no aptos ≠ " + finalizados.astype(int).astype(str) + " finalizados")
+        inc.agregar(grupos, (aptos < 0) | (no_aptos < 0) | (finalizados < 0), "grupo",
+                    "finalizacion:negativos", "ERROR", "Los números de participantes no pueden ser negativos")
+        inc.agregar(grupos, _vacio(grupos, "fecha_fin"), "grupo", "obligatorio:fecha_fin", "ERROR",
+                    "Falta fecha real de finalización")
+
+
+def _reglas_personas(personas: pd.DataFrame, inc: _Incidencias, ambito: str, etiqueta: str,
+                     campos: List[Tuple[str, str]]):
+    if personas.empty:
+        return
+    nif = _texto(personas, "nif")
+    email = _texto(personas, "email")
+    referencia = etiqueta + " " + nif.where(nif != "", _texto(personas, "id"))
+
+    for campo, nombre in campos:
+        inc.agregar(personas, _vacio(personas, campo), ambito, f"obligatorio:{campo}", "ERROR",
+                    referencia + f": falta {nombre}", entidad="id")
+    inc.agregar(personas, (nif != "") & ~validar_documentos(nif)["valido"], ambito, "formato:nif", "ERROR",
+                referencia + ": NIF inválido", entidad="id")
+    if "email" in dict(campos):
+        inc.agregar(personas, (email != "") & ~email.str.match(PATRON_EMAIL), ambito, "formato:email", "ERROR",
+                    referencia + ": email inválido (" + email + ")", entidad="id")
+
+
+def _reglas_composicion(grupos: pd.DataFrame, datos: Dict[str, pd.DataFrame], inc: _Incidencias):
+    """Participantes, tutores y empresas por grupo (conteos con value_counts)."""
+    def conteo(nombre):
+        df = datos.get(nombre, pd.DataFrame())
+        if df.empty or "grupo_id" not in df.columns:
+            return pd.Series(0, index=grupos.index)
+        return grupos["grupo_id"].map(df["grupo_id"].value_counts()).fillna(0).astype(int)
+
+    participantes = conteo("participantes")
+    previstos = pd.to_numeric(_columna(grupos, "n_participantes_previstos"), errors="coerce")
+
+    inc.agregar(grupos, participantes == 0, "participante", "composicion:participantes", "ERROR",
+                "No hay participantes en el grupo")
+    inc.agregar(grupos, participantes > previstos, "participante", "composicion:participantes", "ADVERTENCIA",
+                participantes.astype(str) + " participantes inscritos y " + previstos.astype("Int64").astype(str)
+                + " previstos")
+    inc.agregar(grupos, conteo("tutores") == 0, "tutor", "composicion:tutores", "ADVERTENCIA",
+                "El grupo no tiene tutores asignados")
+    inc.agregar(grupos, conteo("empresas") == 0, "empresa", "composicion:empresas", "ADVERTENCIA",
+                "El grupo no tiene empresas participantes")
+    return participantes
+
+
+def validar_lote(datos: Dict[str, pd.DataFrame], tipo_validacion: str = "inicio") -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Evalúa todas las reglas sobre los DataFrames de cargar_datos_lote().
+    Devuelve (informe de incidencias, resumen por grupo).
+    """
+    grupos = datos.get("grupos", pd.DataFrame())
+    if grupos.empty:
+        return pd.DataFrame(columns=COLUMNAS_INFORME), pd.DataFrame()
+    grupos = grupos.rename(columns={"id": "grupo_id"})
+
+    inc = _Incidencias()
+    _reglas_grupo(grupos, inc, tipo_validacion)
+    n_participantes = _reglas_composicion(grupos, datos, inc)
+    _reglas_personas(datos.get("participantes", pd.DataFrame()), inc, "participante", "Participante",
+                     [("nif", "NIF/documento"), ("nombre", "nombre"), ("apellidos", "apellidos"), ("email", "email")])
+    _reglas_personas(datos.get("tutores", pd.DataFrame()), inc, "tutor", "Tutor",
+                     [("nif", "NIF/documento"), ("nombre", "nombre"), ("apellidos", "apellidos")])
+
+    codigos = grupos.set_index("grupo_id")["codigo_grupo"] if "codigo_grupo" in grupos.columns \
+        else pd.Series(dtype=object)
+    informe = inc.informe(codigos)
+
+    conteos = pd.crosstab(informe["grupo_id"], informe["nivel"]) if not informe.empty else pd.DataFrame()
+    resumen = pd.DataFrame({
+        "grupo_id": grupos["grupo_id"],
+        "codigo_grupo": _columna(grupos, "codigo_grupo"),
+        "accion": _columna(grupos, "accion_nombre"),
+        "fecha_inicio": _columna(grupos, "fecha_inicio"),
+        "participantes": n_participantes,
+    })
+    for nivel, columna in (("ERROR", "errores"), ("ADVERTENCIA", "advertencias")):
+        serie = conteos[nivel] if nivel in conteos.columns else pd.Series(dtype=int)
+        resumen[columna] = resumen["grupo_id"].map(serie).fillna(0).astype(int)
+    resumen["estado"] = np.select(
+        [resumen["errores"] > 0, resumen["advertencias"] > 0], ["ERROR", "ADVERTENCIA"], default="VALIDO"
+    )
+    return informe, resumen.sort_values(["errores", "advertencias"], ascending=False, ignore_index=True)
+
+
+def validar_grupos_fundae_lote(supabase, grupo_ids: List[str],
+                               tipo_validacion: str = "inicio") -> Dict[str, Any]:
+    """
+    Informe de validación FUNDAE de varios grupos a la vez.
+    Devuelve {"informe", "resumen", "peticiones", "segundos"}.
+    """
+    t0 = time.perf_counter()
+    datos, peticiones = cargar_datos_lote(supabase, grupo_ids)
+    informe, resumen = validar_lote(datos, tipo_validacion)
+    return {
+        "informe": informe,
+        "resumen": resumen,
+        "peticiones": peticiones,
+        "segundos": round(time.perf_counter() - t0, 3),
+    }
+
+
+# =========================
+# BENCHMARK LOCAL
+# =========================
+
+class _Respuesta:
+    def __init__(self, data):
+        self.data = data
+
+
+class _ConsultaMemoria:
+    """Subconjunto de la API de PostgREST (select/eq/in_/range/single) sobre listas en memoria."""
+
+    def __init__(self, cliente, filas: List[Dict[str, Any]]):
+        self.cliente = cliente
+        self.filas = filas
+        self.desde, self.hasta = 0, None
+        self.unico = False
+
+    def select(self, *args, **kwargs):
+        return self
+
+    def eq(self, columna, valor):
+        self.filas = [f for f in self.filas if f.get(columna) == valor]
+        return self
+
+    def in_(self, columna, valores):
+        valores = set(valores)
+        self.filas = [f for f in self.filas if f.get(columna) in valores]
+        return self
+
+    def range(self, desde, hasta):
+        self.desde, self.hasta = desde, hasta + 1
+        return self
+
+    def single(self):
+        self.unico = True
+        return self
+
+    def execute(self):
+        self.cliente.peticiones += 1
+        filas = self.filas[self.desde:self.hasta]
+        return _Respuesta(filas[0] if self.unico and filas else filas)
+
+
+class _ClienteMemoria:
+    def __init__(self, tablas: Dict[str, List[Dict[str, Any]]]):
+        self.tablas = tablas
+        self.peticiones = 0
+
+    def table(self, nombre):
+        return _ConsultaMemoria(self, self.tablas.get(nombre, []))
+
+
+def _persona_aleatoria(rnd: random.Random, i: int, prefijo: str) -> Dict[str, Any]:
+    letras = "TRWAGMYFPDXBNJZSQVHLCKE"
+    numero = rnd.randint(0, 99999999)
+    nif = f"{numero:08d}{letras[numero % 23]}" if rnd.random() > 0.03 else "".join(
+        rnd.choice(string.ascii_uppercase) for _ in range(5)
+    )
+    return {
+        "id": f"{prefijo}-{i:07d}",
+        "nif": nif,
+        "nombre": rnd.choice(["Ana", "Luis", "Marta", "Jorge", None]),
+        "apellidos": "García López",
+        "email": f"{prefijo}{i}@empresa.es" if rnd.random() > 0.02 else "sin-arroba",
+    }
+
+
+def _crear_tablas_benchmark(n_grupos: int, semilla: int = 7) -> Dict[str, List[Dict[str, Any]]]:
+    rnd = random.Random(semilla)
+    modalidades = ["PRESENCIAL", "TELEFORMACION", "MIXTA", "Presencial"]
+    acciones = [
+        {"id": f"accion-{i}", "codigo_accion": str(i), "nombre": f"Acción {i}",
+         "modalidad": rnd.choice(modalidades[:3]), "num_horas": rnd.choice([0, 10, 20, 40])}
+        for i in range(50)
+    ]
+    tablas = {"grupos": [], "tutores_grupos": [], "participantes_grupos": [], "empresas_grupos": []}
+    n_part = n_tut = 0
+    for g in range(n_grupos):
+        accion = rnd.choice(acciones)
+        inicio = pd.Timestamp("2025-01-01") + pd.Timedelta(days=rnd.randint(0, 360))
+        grupo_id = f"grupo-{g:05d}"
+        tablas["grupos"].append({
+            "id": grupo_id, "codigo_grupo": f"{accion['codigo_accion']}-{g}",
+            "fecha_inicio": inicio.date().isoformat(),
+            "fecha_fin_prevista": (inicio + pd.Timedelta(days=rnd.randint(-3, 60))).date().isoformat(),
+            "fecha_fin": None, "horario": "L-V 09:00-14:00", "localidad": "Madrid",
+            "responsable": "Responsable", "telefono_contacto": rnd.choice(["912345678", "91 234", ""]),
+            "n_participantes_previstos": rnd.randint(5, 35), "modalidad": rnd.choice(modalidades),
+            "empresa_id": "empresa-1", "accion_formativa_id": accion["id"],
+            "n_participantes_finalizados": 0, "n_aptos": 0, "n_no_aptos": 0,
+            "accion_formativa": accion,
+        })
+        for _ in range(rnd.randint(0, 25)):
+            tablas["participantes_grupos"].append(
+                {"grupo_id": grupo_id, "participante": _persona_aleatoria(rnd, n_part, "p")}
+            )
+            n_part += 1
+        for _ in range(rnd.randint(0, 2)):
+            tablas["tutores_grupos"].append({"grupo_id": grupo_id, "tutor": _persona_aleatoria(rnd, n_tut, "t")})
+            n_tut += 1
+        tablas["empresas_grupos"].append({"grupo_id": grupo_id, "empresa_id": "empresa-1"})
+    return tablas
+
+
+def _validar_grupo_a_grupo(cliente: _ClienteMemoria, grupo_ids: List[str]) -> int:
+    """Camino anterior: cuatro consultas por grupo y validación en bucles de Python."""
+    from utils import validar_datos_grupo_fundae_completo, validar_participantes_fundae
+
+    con_errores = 0
+    for grupo_id in grupo_ids:
+        grupo = cliente.table("grupos").select("*").eq("id", grupo_id).single().execute().data
+        cliente.table("tutores_grupos").select("*").eq("grupo_id", grupo_id).execute()
+        participantes = cliente.table("participantes_grupos").select("*").eq("grupo_id", grupo_id).execute().data
+        cliente.table("empresas_grupos").select("*").eq("grupo_id", grupo_id).execute()
+
+        _, errores_grupo = validar_datos_grupo_fundae_completo(grupo)
+        _, errores_part = validar_participantes_fundae([p["participante"] for p in participantes])
+        con_errores += bool(errores_grupo or errores_part)
+    return con_errores
+
+
+def benchmark_validacion(n_grupos: int = 500, latencia_ms: float = 0.0) -> Dict[str, Any]:
+    """
+    Compara la validación grupo a grupo con la validación por lotes sobre un
+    cliente en memoria. `latencia_ms` simula el coste de ida y vuelta por petición.
+    """
+    latencia = latencia_ms / 1000.0
+    tablas = _crear_tablas_benchmark(n_grupos)
+    grupo_ids = [g["id"] for g in tablas["grupos"]]
+
+    cliente = _ClienteMemoria(tablas)
+    t0 = time.perf_counter()
+    con_errores_grupo = _validar_grupo_a_grupo(cliente, grupo_ids)
+    t_grupo = time.perf_counter() - t0 + cliente.peticiones * latencia
+    peticiones_grupo = cliente.peticiones
+
+    cliente = _ClienteMemoria(tablas)
+    t0 = time.perf_counter()
+    resultado = validar_grupos_fundae_lote(cliente, grupo_ids)
+    t_lote = time.perf_counter() - t0 + cliente.peticiones * latencia
+    resumen = resultado["resumen"]
+
+    return {
+        "grupos": n_grupos,
+        "participantes": len(tablas["participantes_grupos"]),
+        "grupo_a_grupo": {"segundos": round(t_grupo, 3), "peticiones": peticiones_grupo,
+                          "grupos_con_errores": con_errores_grupo},
+        "lote": {"segundos": round(t_lote, 3), "peticiones": cliente.peticiones,
+                 "incidencias": len(resultado["informe"]),
+                 "estados": resumen["estado"].value_counts().to_dict()},
+        "aceleracion": round(t_grupo / t_lote, 1) if t_lote else None,
+    }
+
+
+if __name__ == "__main__":
+    import sys
+
+    grupos = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    latencia_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    print(json.dumps(benchmark_validacion(grupos, latencia_ms), indent=2, default=str))
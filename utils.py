@@ -1,7 +1,8 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import re
-import base64
+from collections import deque
 from datetime import datetime, date, timedelta
 from io import BytesIO
 from typing import Optional, List, Dict, Any
@@ -10,9 +11,12 @@ from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import cm
 from lxml import etree
 import xml.etree.ElementTree as ET
-import uuid
 import requests
 
+from services.documentos_identidad import validar_documentos
+from services.almacenamiento_service import get_almacenamiento, ruta_desde_url
+from services.plataforma_service import get_plataforma_service
+
 # =========================
 # VALIDACIONES
 # =========================
@@ -1025,72 +1029,173 @@ def generar_informe_validacion_fundae(grupo_id, supabase):
 # EXPORTACIÓN DE DATOS
 # =========================
 
-def export_csv(df: pd.DataFrame, filename: str = "export.csv"):
+EXPORT_CHUNK_SIZE = 5000
+EXPORT_MUESTRA_ANCHOS = 200
+MIME_EXCEL = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _huella_export(df: pd.DataFrame):
+    """Huella barata del DataFrame para saber si un archivo ya preparado sigue vigente."""
+    try:
+        contenido = int(pd.util.hash_pandas_object(df, index=False).sum())
+    except Exception:
+        # Celdas no hasheables (dict/list): nos quedamos con forma y columnas
+        contenido = None
+    return (len(df), tuple(map(str, df.columns)), contenido)
+
+
+def estimar_anchos_columnas(df: pd.DataFrame, muestra: int = EXPORT_MUESTRA_ANCHOS, maximo: int = 60) -> List[int]:
+    """
+    Estima el ancho de cada columna a partir de una muestra de filas
+    en lugar de recorrer la columna completa.
+    """
+    df_muestra = df.head(muestra)
+    anchos = []
+    for col in df.columns:
+        largo = df_muestra[col].astype(str).str.len().max() if not df_muestra.empty else 0
+        largo = 0 if pd.isna(largo) else int(largo)
+        anchos.append(min(max(largo, len(str(col))) + 2, maximo))
+    return anchos
+
+
+def _valor_excel(valor):
+    """Normaliza un valor para XlsxWriter (NaN → vacío, tz-aware → naive, resto → str)."""
+    if valor is None:
+        return None
+    if isinstance(valor, np.datetime64):
+        valor = pd.Timestamp(valor)
+    elif isinstance(valor, np.generic):
+        valor = valor.item()
+    if isinstance(valor, (bool, int, float)):
+        return None if isinstance(valor, float) and pd.isna(valor) else valor
+    if isinstance(valor, (datetime, date)):
+        if valor is pd.NaT:
+            return None
+        if getattr(valor, "tzinfo", None) is not None:
+            return valor.replace(tzinfo=None)
+        return valor
+    if isinstance(valor, str):
+        return valor
+    try:
+        if pd.isna(valor):
+            return None
+    except (TypeError, ValueError):
+        pass
+    return str(valor)
+
+
+def generar_excel_streaming(df: pd.DataFrame, sheet_name: str = "Sheet1",
+                            chunk_size: int = EXPORT_CHUNK_SIZE) -> bytes:
+    """
+    Genera un XLSX escribiendo filas por bloques con XlsxWriter en modo
+    constant_memory (las filas ya escritas se vuelcan a disco y no se retienen).
+    """
+    import xlsxwriter
+
+    output = BytesIO()
+    workbook = xlsxwriter.Workbook(output, {
+        "constant_memory": True,
+        "default_date_format": "dd/mm/yyyy",
+        "strings_to_urls": False,
+    })
+    worksheet = workbook.add_worksheet(sheet_name[:31])
+    formato_cabecera = workbook.add_format({"bold": True, "border": 1})
+
+    # En constant_memory los anchos deben fijarse antes de escribir filas
+    for i, ancho in enumerate(estimar_anchos_columnas(df)):
+        worksheet.set_column(i, i, ancho)
+
+    worksheet.write_row(0, 0, [str(c) for c in df.columns], formato_cabecera)
+
+    fila = 1
+    for inicio in range(0, len(df), chunk_size):
+        bloque = df.iloc[inicio:inicio + chunk_size]
+        for registro in bloque.itertuples(index=False, name=None):
+            worksheet.write_row(fila, 0, [_valor_excel(v) for v in registro])
+            fila += 1
+
+    workbook.close()
+    return output.getvalue()
+
+
+def generar_csv_streaming(df: pd.DataFrame, chunk_size: int = EXPORT_CHUNK_SIZE) -> bytes:
+    """Genera un CSV en UTF-8 serializando el DataFrame por bloques."""
+    output = BytesIO()
+    output.write(df.head(0).to_csv(index=False).encode("utf-8"))
+    for inicio in range(0, len(df), chunk_size):
+        output.write(df.iloc[inicio:inicio + chunk_size].to_csv(index=False, header=False).encode("utf-8"))
+    return output.getvalue()
+
+
+def _boton_descarga_diferida(df: pd.DataFrame, generar, filename: str, mime: str,
+                             label: str, key: Optional[str] = None):
+    """
+    Muestra un botón que genera el archivo solo al pulsarlo y, una vez generado,
+    lo sirve con st.download_button. El archivo se guarda en sesión mientras
+    los datos no cambien, así los reruns no vuelven a generarlo.
+    """
+    key = key or f"export_{filename}_{label}"
+    huella = _huella_export(df)
+    preparado = st.session_state.get(key)
+
+    if not preparado or preparado.get("huella") != huella:
+        if not st.button(label, key=f"{key}_preparar", use_container_width=True):
+            return
+        with st.spinner("⏳ Generando archivo..."):
+            preparado = {"huella": huella, "data": generar(df)}
+        st.session_state[key] = preparado
+
+    st.download_button(
+        f"⬇️ Descargar {filename}",
+        data=preparado["data"],
+        file_name=filename,
+        mime=mime,
+        key=f"{key}_descargar",
+        on_click="ignore",
+        use_container_width=True
+    )
+
+
+def export_csv(df: pd.DataFrame, filename: str = "export.csv", label: str = "📥 Descargar CSV",
+               key: Optional[str] = None):
     """
     Genera un botón para exportar un DataFrame a CSV.
     
     Args:
         df: DataFrame a exportar
         filename: Nombre del archivo a generar
+        label: Texto del botón
+        key: Clave única del widget (por defecto derivada de filename y label)
         
     Returns:
         None
     """
     if df is None or df.empty:
         return
-    
-    # Preparar datos para descarga
-    csv = df.to_csv(index=False)
-    b64 = base64.b64encode(csv.encode()).decode()
-    href = f'<a href="data:file/csv;base64,{b64}" download="{filename}">📥 Descargar CSV</a>'
-    st.markdown(href, unsafe_allow_html=True)
 
-def export_excel(df: pd.DataFrame, filename: str = "export.xlsx", label: str = "📥 Exportar a Excel"):
+    if not filename.lower().endswith(".csv"):
+        filename = f"{filename}.csv"
+
+    _boton_descarga_diferida(df, generar_csv_streaming, filename, "text/csv", label, key)
+
+def export_excel(df: pd.DataFrame, filename: str = "export.xlsx", label: str = "📥 Exportar a Excel",
+                 sheet_name: str = "Sheet1", key: Optional[str] = None):
     """
-    Genera un botón para exportar un DataFrame a Excel con tema personalizado morado.
+    Genera un botón para exportar un DataFrame a Excel.
+    El archivo se escribe por bloques y solo se genera al pulsar el botón.
     """
     if df is None or df.empty:
         st.warning("⚠️ No hay datos para exportar")
         return
 
-    # Crear buffer y guardar Excel
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        df.to_excel(writer, index=False, sheet_name="Sheet1")
-        worksheet = writer.sheets["Sheet1"]
-        for i, col in enumerate(df.columns):
-            max_len = max(df[col].astype(str).str.len().max(), len(str(col))) + 2
-            worksheet.set_column(i, i, max_len)
-
-    excel_data = output.getvalue()
-    
-    # Codificar en base64 para el enlace de descarga
-    import base64
-    b64 = base64.b64encode(excel_data).decode()
-
-    # Botón personalizado con tema morado
-    st.markdown(f"""
-    <a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" 
-       download="{filename}"
-       style="
-           background: linear-gradient(135deg, #667eea, #764ba2);
-           color: white;
-           text-decoration: none;
-           padding: 0.6rem 1.2rem;
-           border-radius: 8px;
-           font-weight: 500;
-           display: inline-block;
-           width: 100%;
-           text-align: center;
-           transition: all 0.3s ease;
-           border: none;
-           cursor: pointer;
-       "
-       onmouseover="this.style.transform='translateY(-2px)'; this.style.boxShadow='0 8px 25px rgba(102, 126, 234, 0.3)'"
-       onmouseout="this.style.transform='translateY(0)'; this.style.boxShadow='none'">
-        {label}
-    </a>
-    """, unsafe_allow_html=True)
+    _boton_descarga_diferida(
+        df,
+        lambda datos: generar_excel_streaming(datos, sheet_name=sheet_name),
+        filename,
+        MIME_EXCEL,
+        label,
+        key
+    )
 
 # =========================
 # SUPABASE STORAGE
@@ -1099,6 +1204,7 @@ def export_excel(df: pd.DataFrame, filename: str = "export.xlsx", label: str = "
 def subir_archivo_supabase(supabase, archivo, empresa_id, bucket="documentos"):
     """
     Sube un archivo a Supabase Storage en una carpeta por empresa.
+    La ruta depende del contenido, así que un archivo idéntico no se vuelve a subir.
     Devuelve la URL pública del archivo o None si falla.
     
     Args:
@@ -1111,25 +1217,20 @@ def subir_archivo_supabase(supabase, archivo, empresa_id, bucket="documentos"):
         str: URL pública del archivo o None si falla
     """
     try:
-        nombre_original = archivo.name
-        extension = nombre_original.split(".")[-1]
-        nombre_unico = f"{uuid.uuid4()}.{extension}"
-        ruta = f"empresa_{empresa_id}/{nombre_unico}"
-
-        res = supabase.storage.from_(bucket).upload(ruta, archivo)
-        if isinstance(res, dict) and res.get("error"):
-            st.error("❌ Error al subir el archivo a Supabase Storage.")
-            return None
-
-        url = supabase.storage.from_(bucket).get_public_url(ruta)
-        return url
+        extension = archivo.name.split(".")[-1] if "." in archivo.name else "bin"
+        resultado = get_almacenamiento(supabase).subir_archivo(
+            bucket, f"empresa_{empresa_id}", archivo.getvalue(), extension, getattr(archivo, "type", None)
+        )
+        return resultado["url"]
     except Exception as e:
         st.error(f"❌ Error al subir archivo: {e}")
         return None
 
 def eliminar_archivo_supabase(supabase, url, bucket="documentos"):
     """
-    Elimina un archivo de Supabase Storage a partir de su URL pública.
+    Libera un archivo de Supabase Storage a partir de su URL pública.
+    Llamar después de borrar el registro: el objeto se elimina en segundo
+    plano solo si ningún otro registro lo sigue usando.
     
     Args:
         supabase: Cliente de Supabase
@@ -1137,20 +1238,14 @@ def eliminar_archivo_supabase(supabase, url, bucket="documentos"):
         bucket: Nombre del bucket (default: "documentos")
         
     Returns:
-        bool: True si se eliminó correctamente, False en caso contrario
+        bool: True si se programó la eliminación, False en caso contrario
     """
     try:
-        base_url = supabase.storage.from_(bucket).get_public_url("")
-        if not url.startswith(base_url):
+        if not ruta_desde_url(url, bucket):
             st.warning("⚠️ La URL no pertenece al bucket especificado.")
             return False
 
-        ruta = url.replace(base_url, "")
-        res = supabase.storage.from_(bucket).remove([ruta])
-        if isinstance(res, dict) and res.get("error"):
-            st.error("❌ Error al eliminar el archivo de Supabase Storage.")
-            return False
-
+        get_almacenamiento(supabase).liberar(bucket, [url])
         return True
     except Exception as e:
         st.error(f"❌ Error al procesar la eliminación del archivo: {e}")
@@ -1431,6 +1526,10 @@ def log_accion(accion: str, usuario_id: str, detalles: dict = None):
     """
     Registra una acción en el log de la aplicación.
     
+    La entrada se encola en el registro persistente (services.log_acciones_service),
+    que la escribe por lotes en segundo plano; además se guardan las últimas
+    1000 en la sesión para mostrarlas.
+    
     Args:
         accion: Nombre de la acción
         usuario_id: ID del usuario que realizó la acción
@@ -1439,23 +1538,23 @@ def log_accion(accion: str, usuario_id: str, detalles: dict = None):
     Returns:
         None
     """
-    if not hasattr(st.session_state, "log_acciones"):
-        st.session_state.log_acciones = []
-        
+    from services.log_acciones_service import get_registro_acciones, nueva_entrada
+
     # Crear entrada de log
-    log_entry = {
-        "timestamp": datetime.now().isoformat(),
-        "accion": accion,
-        "usuario_id": usuario_id,
-        "detalles": detalles or {}
-    }
-    
-    # Añadir al log
-    st.session_state.log_acciones.append(log_entry)
-    
-    # Limitar tamaño del log
-    if len(st.session_state.log_acciones) > 1000:
-        st.session_state.log_acciones = st.session_state.log_acciones[-1000:]
+    log_entry = nueva_entrada(accion, usuario_id, detalles)
+
+    try:
+        get_registro_acciones().registrar(log_entry)
+    except Exception as e:
+        print(f"Error registrando acción {accion}: {e}")
+
+    try:
+        if "log_acciones" not in st.session_state:
+            st.session_state.log_acciones = deque(maxlen=1000)
+        st.session_state.log_acciones.append(log_entry)
+    except Exception:
+        # Fuera de una sesión (tareas en segundo plano) solo queda el registro persistente
+        pass
 
 # =========================
 # SEGURIDAD Y PERMISOS
@@ -1904,10 +2003,8 @@ def get_ajustes_app(supabase, campos=None):
         dict: Diccionario con los ajustes
     """
     try:
-        query = supabase.table("ajustes_app")
-        query = query.select(",".join(campos)) if campos else query.select("*")
-        res = query.eq("id", 1).execute()
-        return res.data[0] if res.data else {}
+        # Cache de proceso con TTL corto: los reruns no consultan la tabla
+        return get_plataforma_service().get_ajustes(supabase, campos)
     except Exception as e:
         st.error(f"❌ Error al cargar ajustes de la app: {e}")
         return {}
@@ -1925,7 +2022,7 @@ def update_ajustes_app(supabase, data_dict):
     """
     try:
         data_dict["updated_at"] = datetime.utcnow().isoformat()
-        supabase.table("ajustes_app").update(data_dict).eq("id", 1).execute()
+        get_plataforma_service().update_ajustes(supabase, data_dict)
     except Exception as e:
         st.error(f"❌ Error al guardar ajustes de la app: {e}")
         
@@ -2284,6 +2381,11 @@ def validar_participantes_fundae(participantes_data):
         errores.append("❌ No hay participantes en el grupo")
         return False, errores
     
+    # Documentos validados de una vez (services.documentos_identidad)
+    nifs_validos = validar_documentos(
+        pd.Series([p.get("nif") or None for p in participantes_data], dtype=object)
+    )["valido"].to_numpy()
+    
     for i, participante in enumerate(participantes_data, 1):
         # Validar campos obligatorios FUNDAE
         if not participante.get("nif"):
@@ -2300,7 +2402,7 @@ def validar_participantes_fundae(participantes_data):
         
         # Validar formato NIF si existe
         nif = participante.get("nif", "")
-        if nif and not validar_dni_cif(nif):
+        if nif and not nifs_validos[i - 1]:
             errores.append(f"❌ Participante {i}: NIF inválido ({nif})")
         
         # Validar email si existe
@@ -2475,39 +2577,19 @@ def preparar_datos_xml_inicio_simple(grupo_id, supabase):
     except Exception as e:
         return None, [f"Error: {str(e)}"]
 
-def actualizar_tipo_documento_tutores(supabase):
+def actualizar_tipo_documento_tutores(supabase, dry_run=False, checkpoints=None, progreso=None):
     """
     Función de migración para calcular tipo_documento basado en el NIF existente.
-    Ejecutar una sola vez para actualizar tutores existentes.
+    Los tipos se calculan de forma vectorizada y se escriben con un UPDATE por
+    tipo y lote (services.migraciones_service). Devuelve True si se actualizó algún tutor.
     """
-    import re
+    from services.migraciones_service import DestinoSupabase, migracion_tipo_documento_tutores
     try:
-        # Obtener todos los tutores
-        tutores = supabase.table("tutores").select("id, nif").execute()
-        
-        actualizados = 0
-        for tutor in tutores.data or []:
-            if not tutor.get("nif"):
-                continue
-                
-            nif = tutor["nif"].upper().strip()
-            tipo_documento = None
-            
-            # Detectar tipo según formato
-            if re.match(r'^[0-9]{8}[A-Z]$', nif):
-                tipo_documento = 10  # NIF
-            elif re.match(r'^[XYZ][0-9]{7}[A-Z]$', nif):
-                tipo_documento = 60  # NIE
-            elif len(nif) >= 6:
-                tipo_documento = 20  # Pasaporte (por defecto para otros)
-            
-            if tipo_documento:
-                supabase.table("tutores").update({
-                    "tipo_documento": tipo_documento
-                }).eq("id", tutor["id"]).execute()
-                actualizados += 1
-                
-        return actualizados > 0
+        informe = migracion_tipo_documento_tutores(DestinoSupabase(supabase)).ejecutar(
+            dry_run=dry_run, checkpoints=checkpoints, progreso=progreso
+        )
+        print(f"Migración tipo_documento tutores: {informe}")
+        return informe["cambios"] > 0 if dry_run else informe["aplicadas"] > 0
         
     except Exception as e:
         print(f"Error en migración de tipos de documento: {e}")
@@ -2572,75 +2654,19 @@ def detectar_tipo_documento_fundae(documento):
     # Si no coincide con ningún patrón, asumir pasaporte
     return 20
 
-def migrar_horarios_existentes(supabase):
+def migrar_horarios_existentes(supabase, dry_run=False, checkpoints=None, progreso=None):
     """
     Función de migración única para convertir horarios de texto a estructurados.
     Ejecutar una sola vez después de crear las nuevas tablas.
+    Parsea todos los horarios a la vez y reemplaza grupos_horarios por lotes.
     """
+    from services.migraciones_service import DestinoSupabase, migracion_horarios_grupos
     try:
-        # Obtener grupos con horarios de texto
-        grupos = supabase.table("grupos").select("""
-            id, horario, 
-            accion_formativa:acciones_formativas(num_horas)
-        """).not_.is_("horario", "null").execute()
-        
-        migrados = 0
-        errores = 0
-        
-        for grupo in grupos.data or []:
-            horario_str = grupo.get("horario")
-            if not horario_str:
-                continue
-                
-            try:
-                # Parsear horario de texto simple
-                horas_accion = 0
-                if grupo.get("accion_formativa"):
-                    horas_accion = grupo["accion_formativa"].get("num_horas", 0)
-                
-                # Parsear horario básico (simplificado para migración)
-                partes = horario_str.split(" | ")
-                m_ini = m_fin = t_ini = t_fin = None
-                dias = ""
-                
-                for parte in partes:
-                    if parte.startswith("Mañana:"):
-                        horas = parte.replace("Mañana: ", "").split(" - ")
-                        if len(horas) == 2:
-                            m_ini, m_fin = horas[0].strip(), horas[1].strip()
-                    elif parte.startswith("Tarde:"):
-                        horas = parte.replace("Tarde: ", "").split(" - ")
-                        if len(horas) == 2:
-                            t_ini, t_fin = horas[0].strip(), horas[1].strip()
-                    elif parte.startswith("Días:"):
-                        dias = parte.replace("Días: ", "").replace("-", "")
-                
-                # Crear registro en grupos_horarios
-                datos_horario = {
-                    "grupo_id": grupo["id"],
-                    "horas_totales": float(horas_accion) if horas_accion else 0.0,
-                    "hora_inicio_tramo1": m_ini,
-                    "hora_fin_tramo1": m_fin,
-                    "hora_inicio_tramo2": t_ini,
-                    "hora_fin_tramo2": t_fin,
-                    "dias": dias
-                }
-                
-                # Eliminar horario anterior si existe
-                supabase.table("grupos_horarios").delete().eq("grupo_id", grupo["id"]).execute()
-                
-                # Insertar nuevo horario
-                result = supabase.table("grupos_horarios").insert(datos_horario).execute()
-                if result.data:
-                    migrados += 1
-                else:
-                    errores += 1
-                    
-            except Exception as e:
-                print(f"Error procesando grupo {grupo['id']}: {e}")
-                errores += 1
-        
-        return migrados, errores
+        informe = migracion_horarios_grupos(DestinoSupabase(supabase)).ejecutar(
+            dry_run=dry_run, checkpoints=checkpoints, progreso=progreso
+        )
+        print(f"Migración horarios: {informe}")
+        return informe["aplicadas"], informe["errores"]
         
     except Exception as e:
         print(f"Error en migración de horarios: {e}")
@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
+from services.calidad_service import get_calidad_service
 
 def render(supabase, session_state):
     st.subheader("🛠️ Acciones Correctivas")
@@ -111,6 +112,7 @@ def render(supabase, session_state):
                                     "estado": nuevo_estado,
                                     "seguimiento": nuevo_seguimiento
                                 }).eq("id", row["id"]).execute()
+                                get_calidad_service(supabase, session_state).limpiar_cache_calidad()
                                 st.success("✅ Cambios guardados.")
                                 st.rerun()
 
@@ -121,6 +123,7 @@ def render(supabase, session_state):
                             eliminar = st.form_submit_button("Eliminar")
                             if eliminar and confirmar:
                                 supabase.table("acciones_correctivas").delete().eq("id", row["id"]).execute()
+                                get_calidad_service(supabase, session_state).limpiar_cache_calidad()
                                 st.success("✅ Eliminada.")
                                 st.rerun()
     else:
@@ -160,6 +163,7 @@ def render(supabase, session_state):
                     if session_state.role == "gestor":
                         data["empresa_id"] = empresa_id
                     supabase.table("acciones_correctivas").insert(data).execute()
+                    get_calidad_service(supabase, session_state).limpiar_cache_calidad()
                     st.success("✅ Acción correctiva registrada.")
                     st.rerun()
           
@@ -1,7 +1,7 @@
 import streamlit as st
 from datetime import datetime
 from utils import get_ajustes_app, update_ajustes_app
-from services.data_service import get_data_service
+from services.plataforma_service import get_plataforma_service
 
 def render(supabase, session_state):
     st.title("⚙️ Configuración del Sistema")
@@ -317,24 +317,8 @@ def render(supabase, session_state):
         st.subheader("📊 Estado del Sistema")
         
         try:
-            data_service = get_data_service(supabase, session_state)
-            
-            # Usar métricas de data_service si está disponible
-            if hasattr(data_service, 'get_metricas_admin'):
-                metricas = data_service.get_metricas_admin()
-            else:
-                # Fallback a consultas directas
-                empresas_res = supabase.table("empresas").select("id", count="exact").execute()
-                usuarios_res = supabase.table("usuarios").select("id", count="exact").execute()
-                grupos_res = supabase.table("grupos").select("id", count="exact").execute()
-                cursos_res = supabase.table("acciones_formativas").select("id", count="exact").execute()
-                
-                metricas = {
-                    "total_empresas": empresas_res.count or 0,
-                    "total_usuarios": usuarios_res.count or 0,
-                    "total_grupos": grupos_res.count or 0,
-                    "total_cursos": cursos_res.count or 0
-                }
+            # Contadores globales desde la cache de proceso (sin consultas en cada rerun)
+            metricas = get_plataforma_service().get_contadores(supabase)
             
             col1, col2, col3, col4 = st.columns(4)
             
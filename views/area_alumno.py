@@ -1,12 +1,14 @@
 import streamlit as st
 import pandas as pd
-import importlib
-import sys
 from datetime import datetime, date, timedelta
 from typing import Dict, List, Optional
 from services.participantes_service import get_participantes_service
-from services.grupos_service import get_grupos_service
 from services.clases_service import get_clases_service
+from services.avatares_service import html_tira_avatares
+from services.alumno_service import AlumnoService, get_alumno_service
+from components.paginacion import paginador_cursor
+
+PAGINA_DIPLOMAS = 10
 
 # =========================
 # CONFIG STREAMLIT
@@ -21,11 +23,7 @@ st.set_page_config(
 # VERIFICACIÓN DE ACCESO CORREGIDA
 # =========================
 def verificar_acceso_alumno(session_state, supabase):
-    """Verifica que el usuario tenga acceso al área de alumnos"""
-    # Si ya viene con rol alumno → OK
-    if session_state.role == "alumno":
-        return True
-
+    """Verifica que el usuario tenga acceso al área de alumnos (una sola vez por login)."""
     # Verificar datos de usuario
     if not hasattr(session_state, 'user') or not session_state.user:
         st.error("🔒 No se encontraron datos de usuario")
@@ -40,14 +38,13 @@ def verificar_acceso_alumno(session_state, supabase):
         return False
 
     try:
-        # CORREGIDO: Usar el servicio para obtener participante_id
-        participantes_service = get_participantes_service(supabase, session_state)
-        participante_id = participantes_service.get_participante_id_from_auth(auth_id)
+        # Perfil de sesión: identidad, grupos, suscripción y diplomas se resuelven
+        # en la primera visita y después se leen de session_state
+        perfil = get_alumno_service(supabase, session_state).get_perfil()
         
-        if participante_id:
+        if perfil:
             session_state.role = "alumno"
-            # Guardar participante_id en session_state para uso posterior
-            session_state.participante_id = participante_id
+            session_state.participante_id = perfil["participante_id"]
             return True
         else:
             st.error("🔒 Acceso restringido al área de alumnos")
@@ -114,28 +111,13 @@ def debug_session_state(session_state):
 # =========================
 # TAB 1: MIS GRUPOS FUNDAE
 # =========================
-def mostrar_mis_grupos_fundae(grupos_service, participantes_service, session_state):
+def mostrar_mis_grupos_fundae(perfil):
     """Muestra los grupos FUNDAE del participante - VERSIÓN MEJORADA."""
     st.header("📚 Mis Grupos FUNDAE")
-    
-    # Obtener participante_id de forma robusta
-    participante_id = None
-    
-    if hasattr(session_state, 'participante_id'):
-        participante_id = session_state.participante_id
-    else:
-        auth_id = session_state.user.get('id')
-        participante_id = participantes_service.get_participante_id_from_auth(auth_id)
-        if participante_id:
-            session_state.participante_id = participante_id
-    
-    if not participante_id:
-        st.error("❌ No se pudo encontrar tu registro como participante")
-        return
 
     try:
-        # Obtener grupos del participante
-        df_grupos = participantes_service.get_grupos_de_participante(participante_id)
+        # Grupos del participante (del perfil de sesión)
+        df_grupos = AlumnoService.grupos_df(perfil)
         
         if df_grupos.empty:
             st.info("🔭 No estás inscrito en ningún grupo FUNDAE")
@@ -213,31 +195,19 @@ def mostrar_mis_grupos_fundae(grupos_service, participantes_service, session_sta
                             st.write(f"**Modalidad:** {modalidad}")
                         
                         if modalidad and modalidad.upper() in ['PRESENCIAL', 'MIXTA']:
-                            # Obtener detalles del grupo para horarios
-                            grupo_id = grupo.get('grupo_id', grupo.get('id'))
+                            horarios_texto = grupo.get('horario')
                             
-                            try:
-                                if hasattr(grupos_service, 'get_grupo_completo'):
-                                    grupo_detalle = grupos_service.get_grupo_completo(grupo_id)
-                                else:
-                                    grupo_res = grupos_service.supabase.table("grupos").select("*").eq("id", grupo_id).execute()
-                                    grupo_detalle = grupo_res.data[0] if grupo_res.data else None
+                            if horarios_texto:
+                                st.markdown("---")
+                                st.markdown("**📅 Horarios**")
                                 
-                                if grupo_detalle and grupo_detalle.get('horarios'):
-                                    st.markdown("---")
-                                    st.markdown("**📅 Horarios**")
-                                    
-                                    horarios_texto = grupo_detalle['horarios']
-                                    
-                                    if isinstance(horarios_texto, str):
-                                        lineas = horarios_texto.strip().split('\n')
-                                        for linea in lineas:
-                                            if linea.strip():
-                                                st.caption(f"• {linea.strip()}")
-                                    else:
-                                        st.caption(horarios_texto)
-                            except Exception:
-                                pass
+                                if isinstance(horarios_texto, str):
+                                    lineas = horarios_texto.strip().split('\n')
+                                    for linea in lineas:
+                                        if linea.strip():
+                                            st.caption(f"• {linea.strip()}")
+                                else:
+                                    st.caption(horarios_texto)
                         
                         lugar_imparticion = grupo.get('lugar_imparticion')
                         if lugar_imparticion:
@@ -281,8 +251,8 @@ def mostrar_mis_grupos_fundae(grupos_service, participantes_service, session_sta
             
                         
                         # Observaciones si existen
-                        if grupo_detalle and grupo_detalle.get('observaciones'):
-                            observaciones = grupo_detalle['observaciones']
+                        observaciones = grupo.get('observaciones')
+                        if isinstance(observaciones, str):
                             if observaciones.strip():
                                 st.markdown("---")
                                 st.markdown("**📝 Observaciones**")
@@ -331,18 +301,15 @@ def mostrar_mis_grupos_fundae(grupos_service, participantes_service, session_sta
 # =========================
 # TAB 2: MIS CLASES RESERVADAS
 # =========================
-def mostrar_mis_clases_reservadas(clases_service, session_state):
+def mostrar_mis_clases_reservadas(clases_service, alumno_service, perfil):
     """Muestra las clases reservadas del participante con avatares de otros alumnos"""
     st.header("🏃‍♀️ Mis Clases Reservadas")
     
-    participante_id = getattr(session_state, 'participante_id', None)
-    if not participante_id:
-        st.error("No se pudo identificar tu registro")
-        return
+    participante_id = perfil["participante_id"]
         
     try:
         # Verificar suscripción primero
-        suscripcion = clases_service.get_suscripcion_participante(participante_id)
+        suscripcion = perfil.get("suscripcion")
         
         if not suscripcion or not suscripcion.get("activa"):
             st.warning("No tienes una suscripción activa de clases")
@@ -379,70 +346,73 @@ def mostrar_mis_clases_reservadas(clases_service, session_state):
                 label_visibility="collapsed"
             )
         
-        # Obtener reservas
-        df_reservas = clases_service.get_reservas_participante(participante_id, fecha_inicio, fecha_fin)
-        
-        if df_reservas.empty:
-            st.info("No tienes clases reservadas en este período")
-            return
+        firma = (participante_id, fecha_inicio, fecha_fin)
         
-        hoy = date.today()
-        reservas_futuras = df_reservas[df_reservas['fecha_clase'] >= hoy]
-        reservas_pasadas = df_reservas[df_reservas['fecha_clase'] < hoy]
+        # Próximas clases (paginadas)
+        st.markdown("#### 🔜 Próximas Clases")
+        reservas_futuras = paginador_cursor(
+            "mis_reservas_futuras", firma,
+            lambda cursor: alumno_service.reservas(participante_id, fecha_inicio, fecha_fin,
+                                                   desplazamiento=cursor or 0),
+            etiqueta="clases"
+        )
         
-        # Próximas clases
-        if not reservas_futuras.empty:
-            st.markdown("#### 🔜 Próximas Clases")
-            for _, row in reservas_futuras.iterrows():
+        if not reservas_futuras:
+            st.info("No tienes clases reservadas en este período")
+        else:
+            # Avatares de todas las clases de la página en una sola consulta
+            avatares_por_clase = clases_service.get_avatares_reservas_rango(
+                tuple(sorted({r["horario_id"] for r in reservas_futuras})),
+                min(r["fecha"] for r in reservas_futuras),
+                max(r["fecha"] for r in reservas_futuras)
+            )
+            for reserva in reservas_futuras:
                 with st.container(border=True):
                     col1, col2, col3 = st.columns([3, 2, 1])
                     
                     with col1:
-                        st.markdown(f"**🏃‍♀️ {row['clase_nombre']}**")
-                        
-                        fecha_display = pd.to_datetime(row['fecha_clase']).strftime('%d/%m/%Y')
-                        st.markdown(f"**📅 {fecha_display}** | **⏰ {row['horario_display']}**")
-                        
-                        # Avatares de otros alumnos - CORREGIDO
-                        try:
-                            fecha_clase_dt = date.fromisoformat(str(row["fecha_clase"]))
-                            avatares = clases_service.get_avatares_reserva(
-                                row["horario_id"], 
-                                fecha_clase_dt
-                            )
-                            
-                            if avatares and len(avatares) > 0:
-                                st.caption(f"👥 {len(avatares)} participantes:")
-                                avatar_html = " ".join([
-                                    f'<img src="{url}" style="width:32px; height:32px; border-radius:50%; margin-right:4px; object-fit:cover; border: 2px solid #ddd;" />'
-                                    for url in avatares[:8]
-                                ])
-                                st.markdown(avatar_html, unsafe_allow_html=True)
+                        st.markdown(f"**🏃‍♀️ {reserva['clase_nombre']}**")
+                        st.markdown(f"**📅 {reserva['fecha_display']}** | **⏰ {reserva['horario_display']}**")
                         
-                        except Exception as e:
-                            pass
+                        # Avatares de otros alumnos (una sola imagen compuesta por clase)
+                        avatares = avatares_por_clase.get((reserva["horario_id"], reserva["fecha"].isoformat()), [])
+                        if avatares:
+                            st.caption(f"👥 {len(avatares)} participantes:")
+                            st.markdown(html_tira_avatares(avatares, maximo=8), unsafe_allow_html=True)
                     
                     with col2:
-                        st.write(f"📊 Estado: {row['estado']}")
+                        st.write(f"📊 Estado: {reserva['estado']}")
                     
                     with col3:
-                        if row["estado"] == "RESERVADA":
-                            if st.button("❌ Cancelar", key=f"cancelar_{row['id']}"):
-                                ok = clases_service.cancelar_reserva(row["id"], participante_id)
+                        if reserva["cancelable"]:
+                            if st.button("❌ Cancelar", key=f"cancelar_{reserva['id']}"):
+                                ok = clases_service.cancelar_reserva(reserva["id"], participante_id)
                                 if ok:
+                                    alumno_service.refrescar("suscripcion")
                                     st.success("Reserva cancelada")
                                     st.rerun()
                                 else:
                                     st.error("No puedes cancelar (menos de 2h antes o error)")
         
-        # Historial
-        if not reservas_pasadas.empty:
-            with st.expander(f"📜 Historial ({len(reservas_pasadas)} clases)"):
-                st.dataframe(
-                    reservas_pasadas[['clase_nombre', 'fecha_clase', 'horario_display', 'estado']],
-                    use_container_width=True,
-                    hide_index=True
+        # Historial (paginado, de la más reciente a la más antigua)
+        if fecha_inicio < date.today():
+            with st.expander("📜 Historial"):
+                reservas_pasadas = paginador_cursor(
+                    "mis_reservas_pasadas", firma,
+                    lambda cursor: alumno_service.reservas(participante_id, fecha_inicio, fecha_fin,
+                                                           pasadas=True, desplazamiento=cursor or 0),
+                    etiqueta="clases"
                 )
+                if reservas_pasadas:
+                    st.dataframe(
+                        pd.DataFrame(reservas_pasadas)[['clase_nombre', 'fecha_display', 'horario_display', 'estado']]
+                        .rename(columns={'clase_nombre': 'Clase', 'fecha_display': 'Fecha',
+                                         'horario_display': 'Horario', 'estado': 'Estado'}),
+                        use_container_width=True,
+                        hide_index=True
+                    )
+                else:
+                    st.info("Sin clases anteriores en este período")
     
     except Exception as e:
         st.error(f"Error cargando tus reservas: {e}")
@@ -451,17 +421,14 @@ def mostrar_mis_clases_reservadas(clases_service, session_state):
 # =========================
 # TAB 3: RESERVAR CLASES
 # =========================   
-def mostrar_reservar_clases(clases_service, session_state):
+def mostrar_reservar_clases(clases_service, alumno_service, perfil):
     """Reservar clases mostrando también los avatares de alumnos que ya reservaron"""
     st.header("📅 Reservar Clases")
     
-    participante_id = getattr(session_state, 'participante_id', None)
-    if not participante_id:
-        st.error("No se pudo identificar tu registro como participante")
-        return
+    participante_id = perfil["participante_id"]
     
     try:
-        suscripcion = clases_service.get_suscripcion_participante(participante_id)
+        suscripcion = perfil.get("suscripcion")
         if not suscripcion or not suscripcion.get("activa"):
             st.warning("No tienes una suscripción activa")
             return
@@ -495,6 +462,13 @@ def mostrar_reservar_clases(clases_service, session_state):
         
         st.markdown("### 📅 Clases Disponibles para Reservar")
         
+        # Avatares de todas las clases del periodo en una sola consulta
+        avatares_por_clase = clases_service.get_avatares_reservas_rango(
+            tuple(sorted({clase["horario_id"] for clase in clases_disponibles_lista})),
+            fecha_inicio_busqueda,
+            fecha_fin_busqueda
+        )
+        
         for clase in clases_disponibles_lista:
             with st.container(border=True):
                 col1, col2, col3 = st.columns([2, 2, 1])
@@ -503,25 +477,14 @@ def mostrar_reservar_clases(clases_service, session_state):
                     st.write(f"**{clase['title']}**")
                     st.caption(f"Categoría: {clase['extendedProps'].get('categoria', 'N/A')}")
                     
-                    # Avatares de quienes ya reservaron - CORREGIDO
+                    # Avatares de quienes ya reservaron (una sola imagen compuesta por clase)
                     try:
-                        fecha_clase_dt = pd.to_datetime(clase['extendedProps']['fecha_clase']).date()
-                        avatares = clases_service.get_avatares_reserva(
-                            clase["horario_id"], 
-                            fecha_clase_dt
-                        )
+                        fecha_clase_iso = pd.to_datetime(clase['extendedProps']['fecha_clase']).date().isoformat()
+                        avatares = avatares_por_clase.get((clase["horario_id"], fecha_clase_iso), [])
                         
                         if avatares and len(avatares) > 0:
                             st.caption(f"👥 {len(avatares)} participantes ya inscritos:")
-                            # Mostrar avatares en línea
-                            avatar_html = " ".join([
-                                f'<img src="{url}" style="width:32px; height:32px; border-radius:50%; margin-right:4px; object-fit:cover; border: 2px solid #ddd;" title="Participante" />'
-                                for url in avatares[:5]  # Máximo 5 avatares
-                            ])
-                            if len(avatares) > 5:
-                                avatar_html += f'<span style="margin-left:8px; color:#666;">+{len(avatares)-5} más</span>'
-                            
-                            st.markdown(avatar_html, unsafe_allow_html=True)
+                            st.markdown(html_tira_avatares(avatares, maximo=5), unsafe_allow_html=True)
                         else:
                             st.caption("👥 Sé el primero en reservar")
                     
@@ -544,6 +507,7 @@ def mostrar_reservar_clases(clases_service, session_state):
                         fecha_clase_obj = pd.to_datetime(fecha_clase).date()
                         success, mensaje = clases_service.crear_reserva(participante_id, clase['horario_id'], fecha_clase_obj)
                         if success:
+                            alumno_service.refrescar("suscripcion")
                             st.success("¡Reserva realizada correctamente!")
                             st.rerun()
                         else:
@@ -555,39 +519,15 @@ def mostrar_reservar_clases(clases_service, session_state):
 # =========================
 # TAB 4: MI PERFIL
 # =========================
-def mostrar_mi_perfil(participantes_service, clases_service, session_state):
+def mostrar_mi_perfil(participantes_service, clases_service, alumno_service, perfil):
     """Mi perfil con gestión de avatar - VERSIÓN ACTUALIZADA"""
     st.header("👤 Mi Perfil")
 
-    # CORREGIDO: Obtener participante_id de forma más robusta
-    participante_id = None
-
-    if hasattr(session_state, "participante_id"):
-        participante_id = session_state.participante_id
-    else:
-        auth_id = session_state.user.get("id")
-        participante_id = participantes_service.get_participante_id_from_auth(auth_id)
-        if participante_id:
-            session_state.participante_id = participante_id
-
-    if not participante_id:
-        st.error("❌ No se pudo encontrar tu registro como participante")
-        return
+    participante_id = perfil["participante_id"]
 
     try:
-        # Obtener datos del participante
-        participante_res = participantes_service.supabase.table("participantes").select(
-            """
-            id, nombre, apellidos, email, telefono, nif, fecha_nacimiento, sexo,
-            empresa:empresas(nombre, tipo_empresa)
-            """
-        ).eq("id", participante_id).execute()
-
-        if not participante_res.data:
-            st.error("❌ No se encontraron tus datos")
-            return
-
-        participante = participante_res.data[0]
+        # Datos del participante (del perfil de sesión)
+        participante = perfil["datos"]
 
         # Layout principal con avatar
         col_avatar, col_info = st.columns([1, 3])
@@ -595,8 +535,8 @@ def mostrar_mi_perfil(participantes_service, clases_service, session_state):
         with col_avatar:
             st.markdown("### 📸 Avatar")
             
-            # Obtener y mostrar avatar
-            avatar_info = participantes_service.get_avatar_participante(participante_id)
+            # Avatar
+            avatar_info = perfil.get("avatar")
             
             if avatar_info:
                 st.image(avatar_info["archivo_url"], width=150, caption="Tu avatar")
@@ -605,6 +545,7 @@ def mostrar_mi_perfil(participantes_service, clases_service, session_state):
                 # Botón eliminar avatar
                 if st.button("🗑️ Eliminar", type="secondary", use_container_width=True, key="eliminar_avatar"):
                     if participantes_service.eliminar_avatar(participante_id):
+                        alumno_service.refrescar("datos")
                         st.success("Avatar eliminado")
                         st.rerun()
                     else:
@@ -632,6 +573,7 @@ def mostrar_mi_perfil(participantes_service, clases_service, session_state):
                     with st.spinner("Subiendo..."):
                         success = participantes_service.subir_avatar(participante_id, uploaded_file)
                         if success:
+                            alumno_service.refrescar("datos")
                             st.success("✅ Avatar actualizado")
                             st.rerun()
                         else:
@@ -660,18 +602,17 @@ def mostrar_mi_perfil(participantes_service, clases_service, session_state):
                     st.markdown(f"**⚥ Sexo:** {participante['sexo']}")
 
                 # Información de empresa
-                if participante.get("empresa"):
-                    st.markdown(f"**🏢 Empresa:** {participante['empresa']['nombre']}")
+                if participante.get("empresa_nombre"):
+                    st.markdown(f"**🏢 Empresa:** {participante['empresa_nombre']}")
 
         # Estadísticas mejoradas
         st.markdown("### 📊 Mis Estadísticas")
 
         # Grupos FUNDAE
-        grupos_participante = participantes_service.get_grupos_de_participante(participante_id)
-        num_grupos = len(grupos_participante) if not grupos_participante.empty else 0
+        num_grupos = len(perfil.get("grupos") or [])
         
         # Suscripción de clases
-        suscripcion_clases = clases_service.get_suscripcion_participante(participante_id)
+        suscripcion_clases = perfil.get("suscripcion")
         
         # Resumen mensual si tiene suscripción
         resumen_clases = {}
@@ -704,17 +645,7 @@ def mostrar_mi_perfil(participantes_service, clases_service, session_state):
         
         with col_stats4:
             # Diplomas obtenidos
-            try:
-                diplomas_res = (
-                    participantes_service.supabase.table("diplomas")
-                    .select("id")
-                    .eq("participante_id", participante_id)
-                    .execute()
-                )
-                num_diplomas = len(diplomas_res.data) if diplomas_res.data else 0
-                st.metric("📜 Diplomas", num_diplomas)
-            except Exception:
-                st.metric("📜 Diplomas", "N/A")
+            st.metric("📜 Diplomas", len(perfil.get("diplomas") or []))
         
         # Información adicional de suscripción si existe
         if suscripcion_clases and suscripcion_clases.get("activa"):
@@ -735,30 +666,15 @@ def mostrar_mi_perfil(participantes_service, clases_service, session_state):
     except Exception as e:
         st.error(f"❌ Error cargando información del perfil: {e}")
 
-def mostrar_mis_diplomas(participantes_service, session_state):
+def mostrar_mis_diplomas(alumno_service, perfil):
     """Muestra los diplomas del participante desde el bucket con filtros"""
     st.header("📜 Mis Diplomas")
     
-    participante_id = getattr(session_state, 'participante_id', None)
-    if not participante_id:
-        st.error("No se pudo identificar tu registro como participante")
+    # Diplomas del perfil de sesión (ya ordenados por fecha de emisión)
+    diplomas = perfil.get("diplomas") or []
+    if not diplomas:
+        st.info("📭 No tienes diplomas disponibles aún")
         return
-    
-    try:
-        diplomas_res = participantes_service.supabase.table("diplomas").select("""
-            id, archivo_nombre, url, fecha_subida,
-            grupo:grupos(codigo_grupo, accion_formativa:acciones_formativas(nombre))
-        """).eq("participante_id", participante_id).order("fecha_subida", desc=True).execute()
-        
-        if not diplomas_res.data:
-            st.info("📭 No tienes diplomas disponibles aún")
-            return
-        
-        diplomas = diplomas_res.data
-
-    except Exception as e:
-        st.error(f"❌ Error cargando diplomas: {e}")
-        return   # 👈 muy importante para no seguir si falla la consulta
 
     # =========================
     # FILTROS AVANZADOS
@@ -773,44 +689,42 @@ def mostrar_mis_diplomas(participantes_service, session_state):
     with col3:
         filtro_curso = st.text_input("📘 Curso contiene")
 
-    # Aplicar filtros
-    if filtro_nombre:
-        diplomas = [d for d in diplomas if filtro_nombre.lower() in d.get("archivo_nombre", "").lower()]
-    if filtro_fecha:
-        diplomas = [d for d in diplomas if d.get("fecha_subida") and pd.to_datetime(d["fecha_subida"]).date() >= filtro_fecha]
-    if filtro_curso:
-        diplomas = [
-            d for d in diplomas 
-            if d.get("grupo") and d["grupo"].get("accion_formativa") and filtro_curso.lower() in d["grupo"]["accion_formativa"]["nombre"].lower()
-        ]
+    diplomas = AlumnoService.filtrar_diplomas(perfil, filtro_nombre, filtro_fecha, filtro_curso)
+    if not diplomas:
+        st.info("No hay diplomas que coincidan con los filtros")
+        return
 
     # =========================
-    # LISTADO DE DIPLOMAS
+    # LISTADO DE DIPLOMAS (paginado; enlaces firmados y cacheados en sesión)
     # =========================
-    for diploma in diplomas:
+    pagina = paginador_cursor(
+        "mis_diplomas", (filtro_nombre, filtro_fecha, filtro_curso, len(diplomas)),
+        lambda cursor: (diplomas[(cursor or 0):(cursor or 0) + PAGINA_DIPLOMAS],
+                        (cursor or 0) + PAGINA_DIPLOMAS if (cursor or 0) + PAGINA_DIPLOMAS < len(diplomas) else None),
+        etiqueta="diplomas"
+    )
+    enlaces = alumno_service.enlaces("diplomas", [d["url"] for d in pagina])
+
+    for diploma in pagina:
         with st.container(border=True):
             col1, col2, col3 = st.columns([2, 2, 1])
             
             with col1:
-                nombre_archivo = diploma.get("archivo_nombre", "Diploma")
-                st.markdown(f"**📜 {nombre_archivo}**")
-                
-                if diploma.get("grupo"):
-                    grupo = diploma["grupo"]
-                    st.caption(f"Grupo: {grupo.get('codigo_grupo','')}")
-                    if grupo.get("accion_formativa"):
-                        st.caption(f"Curso: {grupo['accion_formativa'].get('nombre','')}")
+                st.markdown(f"**📜 {diploma['nombre']}**")
+                if diploma["codigo_grupo"]:
+                    st.caption(f"Grupo: {diploma['codigo_grupo']}")
+                if diploma["curso"]:
+                    st.caption(f"Curso: {diploma['curso']}")
             
             with col2:
-                if diploma.get("fecha_subida"):
-                    fecha = pd.to_datetime(diploma["fecha_subida"]).strftime("%d/%m/%Y")
-                    st.write(f"📅 Emitido: {fecha}")
+                if diploma["fecha_display"]:
+                    st.write(f"📅 Emitido: {diploma['fecha_display']}")
             
             with col3:
-                if diploma.get("url"):
-                    st.link_button("📥 Descargar", diploma["url"], use_container_width=True)
+                if diploma["url"]:
+                    st.link_button("📥 Descargar", enlaces[diploma["url"]], use_container_width=True)
                 else:
-                    st.button("Sin archivo", disabled=True, use_container_width=True)
+                    st.button("Sin archivo", disabled=True, use_container_width=True, key=f"sin_archivo_{diploma['id']}")
 
 
 # =========================
@@ -823,54 +737,13 @@ def render(supabase, session_state):
     if not verificar_acceso_alumno(session_state, supabase):
         return
     
-    # CARGA ROBUSTA DE SERVICIOS - CORREGIDA
+    alumno_service = get_alumno_service(supabase, session_state)
+    perfil = alumno_service.get_perfil()
+    
+    # Servicios usados por las pestañas
     try:
-        # Importaciones al inicio
-        from services.participantes_service import get_participantes_service
-        from services.grupos_service import get_grupos_service
-        from services.clases_service import get_clases_service
-        
-        # Crear servicios
         participantes_service = get_participantes_service(supabase, session_state)
-        grupos_service = get_grupos_service(supabase, session_state)
         clases_service = get_clases_service(supabase, session_state)
-        
-        # Verificar que el servicio crítico tiene los métodos necesarios
-        if not hasattr(participantes_service, 'get_grupos_de_participante'):
-            st.warning("⚠️ Recargando servicios...")
-            
-            # Forzar recarga del módulo
-            import importlib
-            import sys
-            
-            modules_to_reload = [
-                'services.participantes_service',
-                'services.grupos_service', 
-                'services.clases_service'
-            ]
-            
-            for module_name in modules_to_reload:
-                if module_name in sys.modules:
-                    importlib.reload(sys.modules[module_name])
-            
-            # Reimportar después de la recarga
-            from services.participantes_service import get_participantes_service as get_participantes_service_reload
-            from services.grupos_service import get_grupos_service as get_grupos_service_reload
-            from services.clases_service import get_clases_service as get_clases_service_reload
-            
-            # Recrear servicios con nombres únicos
-            participantes_service = get_participantes_service_reload(supabase, session_state)
-            grupos_service = get_grupos_service_reload(supabase, session_state)
-            clases_service = get_clases_service_reload(supabase, session_state)
-            
-            # Verificar nuevamente
-            if not hasattr(participantes_service, 'get_grupos_de_participante'):
-                st.error("❌ Error crítico: No se pudo cargar el servicio de participantes correctamente")
-                st.info("Intenta recargar la página o contacta al administrador")
-                return
-            else:
-                st.success("✅ Servicios recargados correctamente")
-    
     except Exception as e:
         st.error(f"❌ Error cargando servicios: {e}")
         st.info("Intenta recargar la página")
@@ -892,16 +765,16 @@ def render(supabase, session_state):
     ])
     
     with tabs[0]:
-        mostrar_mis_grupos_fundae(grupos_service, participantes_service, session_state)
+        mostrar_mis_grupos_fundae(perfil)
     
     with tabs[1]:
-        mostrar_mis_clases_reservadas(clases_service, session_state)
+        mostrar_mis_clases_reservadas(clases_service, alumno_service, perfil)
     
     with tabs[2]:
-        mostrar_reservar_clases(clases_service, session_state)
+        mostrar_reservar_clases(clases_service, alumno_service, perfil)
     
     with tabs[3]:
-        mostrar_mi_perfil(participantes_service, clases_service, session_state)
+        mostrar_mi_perfil(participantes_service, clases_service, alumno_service, perfil)
 
     with tabs[4]:
-        mostrar_mis_diplomas(participantes_service, session_state)
+        mostrar_mis_diplomas(alumno_service, perfil)
@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
+from services.calidad_service import get_calidad_service
 
 def render(supabase, session_state):
     st.subheader("📋 Auditorías")
@@ -113,6 +114,7 @@ def render(supabase, session_state):
                                     "descripcion": nueva_desc,
                                     "hallazgos": nuevos_hallazgos
                                 }).eq("id", row["id"]).execute()
+                                get_calidad_service(supabase, session_state).limpiar_cache_calidad()
                                 st.success("✅ Cambios guardados.")
                                 st.rerun()
 
@@ -123,6 +125,7 @@ def render(supabase, session_state):
                             eliminar = st.form_submit_button("Eliminar")
                             if eliminar and confirmar:
                                 supabase.table("auditorias").delete().eq("id", row["id"]).execute()
+                                get_calidad_service(supabase, session_state).limpiar_cache_calidad()
                                 st.success("✅ Eliminada.")
                                 st.rerun()
     else:
@@ -165,6 +168,7 @@ def render(supabase, session_state):
                     if session_state.role == "gestor":
                         data["empresa_id"] = empresa_id
                     supabase.table("auditorias").insert(data).execute()
+                    get_calidad_service(supabase, session_state).limpiar_cache_calidad()
                     st.success("✅ Auditoría registrada.")
                     st.rerun()
               
@@ -28,105 +28,35 @@ except ImportError:
     REPORTLAB_AVAILABLE = False
 
 
-def obtener_eventos_unificados(aulas_service, clases_service, fecha_inicio, fecha_fin):
-    """Obtiene TODOS los eventos: reservas de aulas + clases programadas"""
-    
-    eventos = []
-    
-    # 1. Eventos de aulas (reservas manuales)
-    try:
-        aulas_ids = None  # Todas las aulas
-        eventos_aulas = aulas_service.get_eventos_cronograma(
-            fecha_inicio.isoformat() + "T00:00:00Z",
-            fecha_fin.isoformat() + "T23:59:59Z",
-            aulas_ids
-        )
-        eventos.extend(eventos_aulas)
-    except Exception as e:
-        st.error(f"Error cargando reservas de aulas: {e}")
-    
-    # 2. NUEVO: Eventos de clases programadas
-    try:
-        df_horarios = clases_service.get_horarios_con_clase()
-        
-        if not df_horarios.empty:
-            # Generar eventos para cada día del período
-            fecha_actual = fecha_inicio
-            
-            while fecha_actual <= fecha_fin:
-                dia_semana = fecha_actual.weekday()
-                
-                # Filtrar horarios de este día
-                horarios_dia = df_horarios[df_horarios['dia_semana'] == dia_semana]
-                
-                for _, horario in horarios_dia.iterrows():
-                    # Solo si tiene aula asignada
-                    if horario.get('aula_id'):
-                        evento = {
-                            "id": f"clase_{horario['id']}_{fecha_actual.isoformat()}",
-                            "title": f"📚 {horario['clase_nombre']}",
-                            "start": f"{fecha_actual.isoformat()}T{horario['hora_inicio']}",
-                            "end": f"{fecha_actual.isoformat()}T{horario['hora_fin']}",
-                            "backgroundColor": "#8B5CF6",  # Morado para clases
-                            "borderColor": "#8B5CF6",
-                            "textColor": "#ffffff",
-                            "extendedProps": {
-                                "tipo": "CLASE",
-                                "clase_id": horario['clase_id'],
-                                "aula_id": horario.get('aula_id'),
-                                "aula_nombre": "Aula no especificada",  # Placeholder
-                                "capacidad": horario['capacidad_maxima']
-                            }
-                        }
-                        eventos.append(evento)
-                
-                fecha_actual += timedelta(days=1)
-    
-    except Exception as e:
-        st.error(f"Error cargando clases: {e}")
-    
-    return eventos
 # =========================
 # EXPORTACIONES
 # =========================
 
-def exportar_cronograma_excel(eventos: list):
+def exportar_cronograma_excel(timeline: pd.DataFrame):
     """Exporta cronograma a Excel"""
     try:
-        if not eventos:
+        if timeline.empty:
             st.warning("No hay eventos para exportar")
             return
-            
-        datos = []
-        for ev in eventos:
-            props = ev.get("extendedProps", {})
-            try:
-                inicio = pd.to_datetime(ev.get("start", "")).strftime('%d/%m/%Y %H:%M')
-                fin = pd.to_datetime(ev.get("end", "")).strftime('%d/%m/%Y %H:%M')
-            except:
-                inicio = ev.get("start", "")
-                fin = ev.get("end", "")
-                
-            datos.append({
-                "Título": ev.get("title", "").split(": ", 1)[-1] if ": " in ev.get("title", "") else ev.get("title", ""),
-                "Aula": props.get("aula_nombre", ""),
-                "Inicio": inicio,
-                "Fin": fin,
-                "Tipo": props.get("tipo_reserva", ""),
-                "Estado": props.get("estado", ""),
-                "Grupo": props.get("grupo_codigo", "")
-            })
-
-        df_export = pd.DataFrame(datos)
+
+        df_export = pd.DataFrame({
+            "Título": timeline["titulo"],
+            "Aula": timeline["aula_nombre"],
+            "Inicio": timeline["inicio"].dt.strftime('%d/%m/%Y %H:%M'),
+            "Fin": timeline["fin"].dt.strftime('%d/%m/%Y %H:%M'),
+            "Tipo": timeline["tipo_reserva"].fillna(""),
+            "Estado": timeline["estado"].fillna(""),
+            "Grupo": timeline["grupo_codigo"].fillna("")
+        })
         fecha_str = datetime.now().strftime("%Y%m%d_%H%M")
         filename = f"cronograma_aulas_{fecha_str}.xlsx"
         
-        export_excel(df_export, filename=filename, label="📥 Descargar Excel")
+        export_excel(df_export, filename=filename, label="📥 Descargar Excel", key="export_cronograma_aulas")
 
     except Exception as e:
         st.error(f"Error exportando Excel: {e}")
 
-def exportar_cronograma_pdf_semanal(aulas_service, eventos: list, fecha_inicio: date, fecha_fin: date):
+def exportar_cronograma_pdf_semanal(aulas_service, timeline: pd.DataFrame, fecha_inicio: date, fecha_fin: date):
     """Exporta cronograma a PDF con vista semanal unificada (reservas + clases)."""
     if not REPORTLAB_AVAILABLE:
         st.error("reportlab no está instalado. Ejecuta: pip install reportlab")
@@ -195,32 +125,25 @@ def exportar_cronograma_pdf_semanal(aulas_service, eventos: list, fecha_inicio:
         base_row_height = 1.2*cm
         row_heights = [1*cm]
 
+        # Rejilla (aula, día) -> eventos, calculada una vez para toda la tabla
+        rejilla = aulas_service.rejilla_timeline(timeline)
+
         for aula in aulas_list:
             fila = [aula]
             max_eventos_por_fila = 1
 
             for dia in dias:
                 eventos_dia = []
-                for ev in eventos:
-                    try:
-                        ev_inicio = pd.to_datetime(ev.get("start", ""))
-                        ev_fin = pd.to_datetime(ev.get("end", ""))
-                        ev_aula = ev.get("extendedProps", {}).get("aula_nombre", "")
-                        tipo_evento = ev.get("extendedProps", {}).get("tipo", "RESERVA")
-                        
-                        if ev_aula == aula and ev_inicio.date() == dia:
-                            intervalo = f"{ev_inicio.strftime('%H:%M')} - {ev_fin.strftime('%H:%M')}"
-                            titulo = ev.get("title", "").replace("📚 ", "")
-                            
-                            # Usar símbolo visual
-                            prefijo = "●" if tipo_evento == "CLASE" else "■"
-                            estilo = cell_style_clase if tipo_evento == "CLASE" else cell_style_reserva
-                            
-                            eventos_dia.append(
-                                Paragraph(f"{prefijo} {intervalo}<br/>{titulo}", estilo)
-                            )
-                    except:
-                        continue
+                for ev in rejilla.get((aula, dia), []):
+                    intervalo = f"{ev['inicio'].strftime('%H:%M')} - {ev['fin'].strftime('%H:%M')}"
+
+                    # Usar símbolo visual
+                    prefijo = "●" if ev["tipo"] == "CLASE" else "■"
+                    estilo = cell_style_clase if ev["tipo"] == "CLASE" else cell_style_reserva
+
+                    eventos_dia.append(
+                        Paragraph(f"{prefijo} {intervalo}<br/>{ev['titulo']}", estilo)
+                    )
 
                 max_eventos_por_fila = max(max_eventos_por_fila, len(eventos_dia))
                 fila.append(eventos_dia if eventos_dia else "-")
@@ -310,14 +233,14 @@ def exportar_cronograma_pdf_semanal(aulas_service, eventos: list, fecha_inicio:
     except Exception as e:
         st.error(f"Error exportando PDF: {e}")
 
-def exportar_informe_estadisticas_pdf(eventos: list, aulas_info: list, fecha_inicio: date, fecha_fin: date):
+def exportar_informe_estadisticas_pdf(timeline: pd.DataFrame, aulas_info: list, fecha_inicio: date, fecha_fin: date):
     """Exporta informe ejecutivo con estadísticas"""
     if not REPORTLAB_AVAILABLE:
         st.error("reportlab no está instalado")
         return
         
     try:
-        if not eventos or not aulas_info:
+        if timeline.empty or not aulas_info:
             st.warning("No hay datos suficientes")
             return
         
@@ -357,7 +280,7 @@ def exportar_informe_estadisticas_pdf(eventos: list, aulas_info: list, fecha_ini
         elementos.append(Spacer(1, 12))
         
         total_aulas = len(aulas_info)
-        total_eventos = len(eventos)
+        total_eventos = len(timeline)
         dias_periodo = (fecha_fin - fecha_inicio).days + 1
         promedio_eventos_dia = total_eventos / dias_periodo if dias_periodo > 0 else 0
         
@@ -386,14 +309,11 @@ def exportar_informe_estadisticas_pdf(eventos: list, aulas_info: list, fecha_ini
         elementos.append(Paragraph("<b>Ocupación por Aula</b>", styles['Heading2']))
         elementos.append(Spacer(1, 12))
         
-        ocupacion_por_aula = {}
-        for aula in aulas_info:
-            aula_nombre = aula.get("nombre", "Sin nombre")
-            eventos_aula = [
-                ev for ev in eventos 
-                if ev.get("extendedProps", {}).get("aula_nombre") == aula_nombre
-            ]
-            ocupacion_por_aula[aula_nombre] = len(eventos_aula)
+        eventos_por_aula = timeline["aula_nombre"].value_counts()
+        ocupacion_por_aula = {
+            aula.get("nombre", "Sin nombre"): int(eventos_por_aula.get(aula.get("nombre"), 0))
+            for aula in aulas_info
+        }
         
         datos_ocupacion = [["Aula", "Nº Reservas", "% del Total"]]
         for aula_nombre, num_reservas in sorted(ocupacion_por_aula.items(), key=lambda x: x[1], reverse=True):
@@ -1031,28 +951,15 @@ def mostrar_cronograma_simple(aulas_service, session_state):
         st.error(f"Error cargando aulas: {e}")
         return
 
-    # ===== CAMBIO PRINCIPAL AQUÍ =====
     try:
-        # Cargar servicio de clases
-        from services.clases_service import get_clases_service
-        clases_service = get_clases_service(aulas_service.supabase, session_state)
-        
-        # Obtener eventos unificados (aulas + clases)
-        eventos = obtener_eventos_unificados(
-            aulas_service, 
-            clases_service, 
-            fecha_inicio, 
-            fecha_fin
-        )
+        # Timeline unificado (reservas + clases), cacheado por empresa y rango
+        timeline = aulas_service.get_timeline(fecha_inicio, fecha_fin)
         
         # Filtrar por aulas seleccionadas
         if aulas_ids:
-            eventos = [
-                ev for ev in eventos 
-                if ev.get("extendedProps", {}).get("aula_id") in aulas_ids
-            ]
+            timeline = timeline[timeline["aula_id"].isin(aulas_ids)]
         
-        if not eventos:
+        if timeline.empty:
             st.info("No hay eventos en el período seleccionado")
             return
         
@@ -1066,49 +973,38 @@ def mostrar_cronograma_simple(aulas_service, session_state):
         st.markdown("---")
         
         # Mostrar cronograma
-        mostrar_cronograma_alternativo(aulas_service, session_state, fecha_inicio, fecha_fin)
+        mostrar_cronograma_alternativo(aulas_service, session_state, fecha_inicio, fecha_fin, timeline)
         
         st.markdown("---")
         st.markdown("### Exportar")
         col1, col2 = st.columns(2)
         
         with col1:
-            exportar_cronograma_excel(eventos)
+            exportar_cronograma_excel(timeline)
         with col2:
-            exportar_cronograma_pdf_semanal(aulas_service, eventos, fecha_inicio, fecha_fin)
+            exportar_cronograma_pdf_semanal(aulas_service, timeline, fecha_inicio, fecha_fin)
             
     except Exception as e:
         st.error(f"Error obteniendo eventos: {e}")
         st.exception(e)  # Debug
 
-def mostrar_cronograma_alternativo(aulas_service, session_state, fecha_inicio, fecha_fin):
+def mostrar_cronograma_alternativo(aulas_service, session_state, fecha_inicio, fecha_fin, timeline=None):
     """Vista de cronograma tipo tarjetas (TailAdmin-like) - MEJORADA"""
     st.markdown("### Vista de Cronograma")
 
     try:
-        # Cargar clases_service
-        from services.clases_service import get_clases_service
-        clases_service = get_clases_service(aulas_service.supabase, session_state)
+        if timeline is None:
+            timeline = aulas_service.get_timeline(fecha_inicio, fecha_fin)
         
-        # Obtener eventos unificados
-        eventos_unificados = obtener_eventos_unificados(
-            aulas_service, clases_service, fecha_inicio, fecha_fin
-        )
-        
-        if not eventos_unificados:
+        if timeline.empty:
             st.info("No hay eventos en este período")
             return
 
         # Organizar por fecha
-        eventos_por_fecha = {}
-        for evento in eventos_unificados:
-            try:
-                fecha_evento = pd.to_datetime(evento['start']).date()
-                if fecha_evento not in eventos_por_fecha:
-                    eventos_por_fecha[fecha_evento] = []
-                eventos_por_fecha[fecha_evento].append(evento)
-            except:
-                continue
+        eventos_por_fecha = {
+            fecha: grupo.to_dict("records")
+            for fecha, grupo in timeline.sort_values("inicio", kind="stable").groupby("fecha")
+        }
 
         dias_es = {
             "Monday": "Lunes", "Tuesday": "Martes", "Wednesday": "Miércoles",
@@ -1139,10 +1035,10 @@ def mostrar_cronograma_alternativo(aulas_service, session_state, fecha_inicio, f
             for i in range(0, len(eventos_dia), 3):
                 cols = st.columns(3)
                 for j, evento in enumerate(eventos_dia[i:i+3]):
-                    hora_inicio = pd.to_datetime(evento['start']).strftime('%H:%M')
-                    hora_fin = pd.to_datetime(evento['end']).strftime('%H:%M')
-                    titulo = evento.get('title', '').replace('📚 ', '')
-                    tipo = evento.get('extendedProps', {}).get('tipo', 'RESERVA')
+                    hora_inicio = evento['inicio'].strftime('%H:%M')
+                    hora_fin = evento['fin'].strftime('%H:%M')
+                    titulo = evento['titulo']
+                    tipo = evento['tipo']
                     
                     # Color según tipo
                     color_borde = "#8B5CF6" if tipo == "CLASE" else "#3B82F6"
@@ -2,6 +2,7 @@ import streamlit as st
 import pandas as pd
 import re
 from datetime import datetime
+from services.plataforma_service import registrar_alta
 
 def render(supabase, session_state):
     st.markdown("## 🧑‍💼 Comerciales")
@@ -85,6 +86,7 @@ def render(supabase, session_state):
                         }).execute()
                         if usuario_res.data:
                             usuario_id = usuario_res.data[0]["id"]
+                            registrar_alta("usuarios")
 
                     supabase.table("comerciales").insert({
                         "empresa_id": empresa_id_sel,
@@ -1,6 +1,7 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
+from services.crm_service import get_crm_service
+from components.paginacion import paginador_cursor
 
 def render(supabase, session_state):
     st.markdown("## 📬 Comunicaciones CRM")
@@ -14,16 +15,17 @@ def render(supabase, session_state):
         st.warning("🔒 No tienes permisos para acceder a esta sección.")
         st.stop()
 
-    # Filtrar comunicaciones según rol
-    query = supabase.table("crm_comunicaciones").select("*").eq("empresa_id", empresa_id)
-    if rol == "comercial":
-        comercial_id = session_state.user.get("comercial_id")
-        query = query.eq("comercial_id", comercial_id)
+    crm_service = get_crm_service(supabase, session_state)
 
-    comunicaciones = query.execute().data or []
+    # Filtrado por empresa/comercial en la consulta, paginado por fecha
+    df = paginador_cursor(
+        "crm_comunicaciones_paginas",
+        (empresa_id, rol),
+        lambda cursor: crm_service.get_pagina("crm_comunicaciones", cursor=cursor, empresa_id=empresa_id),
+        etiqueta="comunicaciones"
+    )
 
-    if comunicaciones:
-        df = pd.DataFrame(comunicaciones)
+    if not df.empty:
         st.dataframe(df[["tipo", "asunto", "fecha", "notas"]])
     else:
         st.info("No hay comunicaciones registradas.")
@@ -38,20 +40,16 @@ def render(supabase, session_state):
         enviar = st.form_submit_button("Guardar")
 
     if enviar:
-        try:
-            comercial_id = None
-            if rol == "comercial":
-                comercial_id = session_state.user.get("comercial_id")
-            supabase.table("crm_comunicaciones").insert({
-                "empresa_id": empresa_id,
-                "tipo": tipo,
-                "asunto": asunto,
-                "fecha": fecha.isoformat(),
-                "notas": notas,
-                "comercial_id": comercial_id
-            }).execute()
+        comercial_id = None
+        if rol == "comercial":
+            comercial_id = session_state.user.get("comercial_id")
+        if crm_service.crear_comunicacion({
+            "empresa_id": empresa_id,
+            "tipo": tipo,
+            "asunto": asunto,
+            "fecha": fecha.isoformat(),
+            "notas": notas,
+            "comercial_id": comercial_id
+        }):
             st.success("✅ Comunicación registrada.")
             st.rerun()
-        except Exception as e:
-            st.error(f"❌ Error al registrar comunicación: {e}")
-          
@@ -1,6 +1,6 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
+from services.crm_service import get_crm_service
 
 def render(supabase, session_state):
     st.markdown("## 📊 Estadísticas CRM")
@@ -21,56 +21,29 @@ def render(supabase, session_state):
         empresa_sel = st.selectbox("Empresa", list(empresas_dict.keys()))
         empresa_id = empresas_dict[empresa_sel]
 
-    # --- Cargar comerciales ---
-    comerciales_res = supabase.table("comerciales").select("id,nombre").eq("empresa_id", empresa_id).execute()
-    comerciales_dict = {c["id"]: c["nombre"] for c in (comerciales_res.data or [])}
+    # --- Agregado por comercial, estado y mes (una consulta agrupada, filtrada por rol) ---
+    crm_service = get_crm_service(supabase, session_state)
+    resumen = crm_service.get_resumen(empresa_id)
 
-    # --- Cargar oportunidades ganadas ---
-    oportunidades_res = supabase.table("crm_oportunidades").select("*").eq("empresa_id", empresa_id).eq("estado", "Ganada").execute()
-    oportunidades = oportunidades_res.data or []
-
-    if not oportunidades:
+    if resumen[resumen["estado"] == "Ganada"].empty:
         st.info("No hay oportunidades ganadas para mostrar estadísticas.")
         return
 
-    df = pd.DataFrame(oportunidades)
-    df["fecha_cierre_real"] = pd.to_datetime(df["fecha_cierre_real"], errors="coerce")
-
-    # --- Comercial: filtrar solo las suyas ---
-    if rol == "comercial":
-        comercial_id = session_state.user.get("comercial_id")
-        df = df[df["comercial_id"] == comercial_id]
-
     # --- Estadísticas mensuales ---
-    df["mes"] = df["fecha_cierre_real"].dt.to_period("M")
-    mensual = df.groupby(["comercial_id", "mes"]).agg(
-        oportunidades_cerradas=("id", "count"),
-        total_ganado=("importe", "sum")
-    ).reset_index()
-    mensual["comercial"] = mensual["comercial_id"].map(comerciales_dict)
-
+    mensual = crm_service.ganadas_por_periodo(resumen, "mes")
     st.markdown("### 📅 Estadísticas mensuales")
     st.dataframe(mensual[["mes", "comercial", "oportunidades_cerradas", "total_ganado"]])
 
     # --- Estadísticas anuales ---
-    df["año"] = df["fecha_cierre_real"].dt.year
-    anual = df.groupby(["comercial_id", "año"]).agg(
-        oportunidades_cerradas=("id", "count"),
-        total_ganado=("importe", "sum")
-    ).reset_index()
-    anual["comercial"] = anual["comercial_id"].map(comerciales_dict)
-
+    anual = crm_service.ganadas_por_periodo(resumen, "año")
     st.markdown("### 📆 Estadísticas anuales")
     st.dataframe(anual[["año", "comercial", "oportunidades_cerradas", "total_ganado"]])
 
-    # --- Ranking por total ganado ---
-    ranking = df.groupby("comercial_id").agg(
-        oportunidades_cerradas=("id", "count"),
-        total_ganado=("importe", "sum")
-    ).reset_index()
-    ranking["comercial"] = ranking["comercial_id"].map(comerciales_dict)
-    ranking = ranking.sort_values(by="total_ganado", ascending=False)
+    # --- Embudo por estado ---
+    st.markdown("### 🔻 Embudo")
+    st.dataframe(crm_service.embudo(resumen), hide_index=True)
 
+    # --- Ranking por total ganado y conversión ---
+    ranking = crm_service.ranking(resumen).rename(columns={"Ganada": "oportunidades_cerradas"})
     st.markdown("### 🏆 Ranking de comerciales")
-    st.dataframe(ranking[["comercial", "oportunidades_cerradas", "total_ganado"]])
-  
+    st.dataframe(ranking[["comercial", "oportunidades_cerradas", "total_ganado", "tasa_conversion"]])
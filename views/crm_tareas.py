@@ -1,6 +1,7 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
+from services.crm_service import get_crm_service
+from components.paginacion import paginador_cursor
 
 def render(supabase, session_state):
     st.markdown("## 📝 Tareas CRM")
@@ -14,16 +15,17 @@ def render(supabase, session_state):
         st.warning("🔒 No tienes permisos para acceder a esta sección.")
         st.stop()
 
-    # Filtrar tareas según rol
-    query = supabase.table("crm_tareas").select("*").eq("empresa_id", empresa_id)
-    if rol == "comercial":
-        comercial_id = session_state.user.get("comercial_id")
-        query = query.eq("comercial_id", comercial_id)
+    crm_service = get_crm_service(supabase, session_state)
 
-    tareas = query.execute().data or []
+    # Filtrado por empresa/comercial en la consulta, paginado por fecha
+    df = paginador_cursor(
+        "crm_tareas_paginas",
+        (empresa_id, rol),
+        lambda cursor: crm_service.get_pagina("crm_tareas", cursor=cursor, empresa_id=empresa_id),
+        etiqueta="tareas"
+    )
 
-    if tareas:
-        df = pd.DataFrame(tareas)
+    if not df.empty:
         st.dataframe(df[["descripcion", "estado", "fecha_vencimiento", "fecha_creacion"]])
     else:
         st.info("No hay tareas registradas.")
@@ -40,19 +42,15 @@ def render(supabase, session_state):
         if not descripcion:
             st.warning("⚠️ La descripción es obligatoria.")
         else:
-            try:
-                comercial_id = None
-                if rol == "comercial":
-                    comercial_id = session_state.user.get("comercial_id")
-                supabase.table("crm_tareas").insert({
-                    "empresa_id": empresa_id,
-                    "descripcion": descripcion,
-                    "estado": estado,
-                    "fecha_vencimiento": fecha_venc.isoformat(),
-                    "comercial_id": comercial_id
-                }).execute()
+            comercial_id = None
+            if rol == "comercial":
+                comercial_id = session_state.user.get("comercial_id")
+            if crm_service.crear_tarea({
+                "empresa_id": empresa_id,
+                "descripcion": descripcion,
+                "estado": estado,
+                "fecha_vencimiento": fecha_venc.isoformat(),
+                "comercial_id": comercial_id
+            }):
                 st.success("✅ Tarea creada.")
                 st.rerun()
-            except Exception as e:
-                st.error(f"❌ Error al crear tarea: {e}")
-      
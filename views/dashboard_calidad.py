@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
+from services.calidad_service import get_calidad_service
 
 def render(supabase, session_state):
     st.subheader("📊 Dashboard de Calidad ISO 9001")
@@ -28,82 +29,44 @@ def render(supabase, session_state):
         st.warning("🔒 No tienes permisos para acceder a esta sección.")
         st.stop()
 
-    # =========================
-    # Cargar datos
-    # =========================
-    try:
-        if session_state.role == "gestor":
-            df_nc = pd.DataFrame(supabase.table("no_conformidades").select("*").eq("empresa_id", empresa_id).execute().data or [])
-            df_ac = pd.DataFrame(supabase.table("acciones_correctivas").select("*").eq("empresa_id", empresa_id).execute().data or [])
-            df_aud = pd.DataFrame(supabase.table("auditorias").select("*").eq("empresa_id", empresa_id).execute().data or [])
-            df_obj = pd.DataFrame(supabase.table("objetivos_calidad").select("*").eq("empresa_id", empresa_id).execute().data or [])
-            df_seg = pd.DataFrame(supabase.table("seguimiento_objetivos").select("*").eq("empresa_id", empresa_id).execute().data or [])
-        else:
-            df_nc = pd.DataFrame(supabase.table("no_conformidades").select("*").execute().data or [])
-            df_ac = pd.DataFrame(supabase.table("acciones_correctivas").select("*").execute().data or [])
-            df_aud = pd.DataFrame(supabase.table("auditorias").select("*").execute().data or [])
-            df_obj = pd.DataFrame(supabase.table("objetivos_calidad").select("*").execute().data or [])
-            df_seg = pd.DataFrame(supabase.table("seguimiento_objetivos").select("*").execute().data or [])
-    except Exception as e:
-        st.error(f"❌ Error al cargar datos: {e}")
-        return
+    calidad_service = get_calidad_service(supabase, session_state)
+    empresa_filtro = calidad_service.get_empresa_filtro()
 
     # =========================
     # Botón de actualización automática
     # =========================
     if st.button("🔄 Actualizar indicadores automáticos"):
         try:
-            # NC abiertas
-            objetivo_nc = [o for o in df_obj.to_dict("records") if "No Conformidades" in o["nombre"]]
-            if objetivo_nc:
-                valor = len(df_nc[df_nc["estado"] == "Abierta"])
+            # Los indicadores automáticos se calculan sobre el histórico completo
+            datos_totales = calidad_service.get_datos_calidad(empresa_filtro)
+            kpis_totales = datos_totales["kpis"]
+            df_obj_total = datos_totales["obj"]
+
+            def registrar_seguimiento(patron, valor):
+                objetivos = df_obj_total[df_obj_total["nombre"].fillna("").str.contains(patron, regex=False)] if not df_obj_total.empty else df_obj_total
+                if objetivos.empty or valor is None:
+                    return
                 supabase.table("seguimiento_objetivos").insert({
-                    "objetivo_id": objetivo_nc[0]["id"],
+                    "objetivo_id": objetivos.iloc[0]["id"],
                     "valor_real": valor,
-                    "empresa_id": empresa_id if session_state.role == "gestor" else None,
+                    "empresa_id": empresa_filtro,
                     "observaciones": "Actualización automática desde dashboard"
                 }).execute()
 
+            # NC abiertas
+            registrar_seguimiento("No Conformidades", kpis_totales["nc_abiertas"])
+
             # Tiempo medio de resolución NC
-            objetivo_tiempo = [o for o in df_obj.to_dict("records") if "Tiempo medio" in o["nombre"]]
-            if objetivo_tiempo and not df_nc.empty:
-                df_nc_cerradas = df_nc[df_nc["fecha_cierre"].notna() & df_nc["fecha_detectada"].notna()]
-                if not df_nc_cerradas.empty:
-                    df_nc_cerradas["fecha_cierre"] = pd.to_datetime(df_nc_cerradas["fecha_cierre"], errors="coerce")
-                    df_nc_cerradas["fecha_detectada"] = pd.to_datetime(df_nc_cerradas["fecha_detectada"], errors="coerce")
-                    dias = (df_nc_cerradas["fecha_cierre"] - df_nc_cerradas["fecha_detectada"]).dt.days
-                    valor = dias.mean()
-                    supabase.table("seguimiento_objetivos").insert({
-                        "objetivo_id": objetivo_tiempo[0]["id"],
-                        "valor_real": valor,
-                        "empresa_id": empresa_id if session_state.role == "gestor" else None,
-                        "observaciones": "Actualización automática desde dashboard"
-                    }).execute()
+            registrar_seguimiento("Tiempo medio", kpis_totales["tiempo_medio_resolucion"])
 
             # Acciones Correctivas cerradas
-            objetivo_ac = [o for o in df_obj.to_dict("records") if "Acciones Correctivas" in o["nombre"]]
-            if objetivo_ac:
-                valor = len(df_ac[df_ac["estado"] == "Cerrada"])
-                supabase.table("seguimiento_objetivos").insert({
-                    "objetivo_id": objetivo_ac[0]["id"],
-                    "valor_real": valor,
-                    "empresa_id": empresa_id if session_state.role == "gestor" else None,
-                    "observaciones": "Actualización automática desde dashboard"
-                }).execute()
+            registrar_seguimiento("Acciones Correctivas", kpis_totales["ac_cerradas"])
 
             # Cumplimiento plan de auditorías
-            objetivo_aud = [o for o in df_obj.to_dict("records") if "plan de auditorías" in o["nombre"]]
-            if objetivo_aud and not df_aud.empty:
-                total = len(df_aud)
-                cerradas = len(df_aud[df_aud["estado"] == "Cerrada"])
-                valor = (cerradas / total * 100) if total > 0 else 0
-                supabase.table("seguimiento_objetivos").insert({
-                    "objetivo_id": objetivo_aud[0]["id"],
-                    "valor_real": valor,
-                    "empresa_id": empresa_id if session_state.role == "gestor" else None,
-                    "observaciones": "Actualización automática desde dashboard"
-                }).execute()
+            if kpis_totales["auditorias_total"] > 0:
+                registrar_seguimiento("plan de auditorías", kpis_totales["cumplimiento_auditorias"])
 
+            calidad_service.limpiar_cache_calidad()
             st.success("✅ Indicadores automáticos actualizados y guardados en seguimiento.")
             st.experimental_rerun()
         except Exception as e:
@@ -117,24 +80,22 @@ def render(supabase, session_state):
     fecha_inicio = col1.date_input("Desde", datetime(datetime.now().year, 1, 1))
     fecha_fin = col2.date_input("Hasta", datetime.today())
 
-    def filtrar(df, campo):
-        if campo in df.columns:
-            df[campo] = pd.to_datetime(df[campo], errors="coerce")
-            return df[(df[campo] >= pd.to_datetime(fecha_inicio)) & (df[campo] <= pd.to_datetime(fecha_fin))]
-        return df
-
-    df_nc = filtrar(df_nc, "fecha_detectada")
-    df_ac = filtrar(df_ac, "fecha_inicio")
-    df_aud = filtrar(df_aud, "fecha")
+    # =========================
+    # Cargar datos (proyectados, filtrados en servidor y cacheados por empresa/periodo)
+    # =========================
+    datos = calidad_service.get_datos_calidad(empresa_filtro, fecha_inicio, fecha_fin)
+    df_nc, df_ac, df_aud = datos["nc"], datos["ac"], datos["aud"]
+    df_obj, df_seg = datos["obj"], datos["seg"]
+    kpis = datos["kpis"]
 
     # =========================
     # KPIs principales
     # =========================
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("NC Abiertas", len(df_nc[df_nc["estado"] == "Abierta"]) if "estado" in df_nc else 0)
-    col2.metric("NC Cerradas", len(df_nc[df_nc["estado"] == "Cerrada"]) if "estado" in df_nc else 0)
-    col3.metric("AC Cerradas", len(df_ac[df_ac["estado"] == "Cerrada"]) if "estado" in df_ac else 0)
-    col4.metric("Auditorías", len(df_aud))
+    col1.metric("NC Abiertas", kpis["nc_abiertas"])
+    col2.metric("NC Cerradas", kpis["nc_cerradas"])
+    col3.metric("AC Cerradas", kpis["ac_cerradas"])
+    col4.metric("Auditorías", kpis["auditorias_total"])
 
     st.divider()
 
@@ -142,29 +103,13 @@ def render(supabase, session_state):
     # Objetivos de Calidad
     # =========================
     st.markdown("### 🎯 Objetivos de Calidad y Cumplimiento")
-    if not df_obj.empty:
-        for _, obj in df_obj.iterrows():
+    df_objetivos = datos["objetivos"]
+    if not df_objetivos.empty:
+        for obj in df_objetivos.to_dict("records"):
             st.markdown(f"**{obj['nombre']}** — Meta: {obj['meta']} — Responsable: {obj.get('responsable','')}")
-            segs = df_seg[df_seg["objetivo_id"] == obj["id"]]
-            if not segs.empty:
-                ultimo = segs.sort_values("fecha", ascending=False).iloc[0]
-                valor_real = ultimo["valor_real"]
-                meta_num = None
-                try:
-                    meta_num = float(''.join([c for c in obj['meta'] if c.isdigit() or c == '.']))
-                except:
-                    pass
-
-                color = "🟢"
-                if meta_num is not None:
-                    if "%" in obj['meta']:
-                        if valor_real < meta_num:
-                            color = "🔴" if valor_real < meta_num * 0.9 else "🟡"
-                    else:
-                        if valor_real > meta_num:
-                            color = "🔴" if valor_real > meta_num * 1.1 else "🟡"
-
-                st.write(f"{color} Último valor: {valor_real} ({ultimo['fecha']})")
+            if obj["semaforo"] != "⚪":
+                fecha_ultima = obj["ultima_fecha"].date() if pd.notnull(obj["ultima_fecha"]) else ""
+                st.write(f"{obj['semaforo']} Último valor: {obj['ultimo_valor']} ({fecha_ultima})")
             else:
                 st.write("⚪ Sin registros de seguimiento.")
             st.divider()
@@ -174,17 +119,17 @@ def render(supabase, session_state):
     # =========================
     # Gráficos nativos
     # =========================
-    if "estado" in df_nc.columns:
+    if not kpis["nc_por_estado"].empty:
         st.markdown("#### Distribución de No Conformidades por Estado")
-        st.bar_chart(df_nc["estado"].value_counts())
+        st.bar_chart(kpis["nc_por_estado"])
 
-    if "estado" in df_ac.columns:
+    if not kpis["ac_por_estado"].empty:
         st.markdown("#### Distribución de Acciones Correctivas por Estado")
-        st.bar_chart(df_ac["estado"].value_counts())
+        st.bar_chart(kpis["ac_por_estado"])
 
-    if "tipo" in df_aud.columns:
+    if not kpis["aud_por_tipo"].empty:
         st.markdown("#### Auditorías por Tipo")
-        st.bar_chart(df_aud["tipo"].value_counts())
+        st.bar_chart(kpis["aud_por_tipo"])
 
     # =========================
     # Tablas de detalle
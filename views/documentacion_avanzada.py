@@ -97,8 +97,9 @@ def render(supabase, session_state):
                 # Eliminación segura
                 eliminar = st.button(f"🗑️ Eliminar documento", key=f"del_{doc['id']}")
                 if eliminar:
-                    eliminado = eliminar_archivo_supabase(supabase, doc.get("url"), bucket=BUCKET_NAME)
+                    # Primero el registro: el archivo solo se borra si ya nadie lo referencia
                     supabase.table("documentos_avanzados").delete().eq("id", doc["id"]).execute()
+                    eliminado = eliminar_archivo_supabase(supabase, doc.get("url"), bucket=BUCKET_NAME)
                     if eliminado:
                         st.success("✅ Documento y archivo eliminados correctamente.")
                     else:
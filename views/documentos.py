@@ -21,6 +21,7 @@ from utils import (
 )
 from services.data_service import get_data_service
 from services.grupos_service import get_grupos_service
+from services.validacion_fundae_service import validar_grupos_fundae_lote
 
 # =========================
 # CONFIGURACIÓN DE PÁGINA MODERNA
@@ -236,7 +237,8 @@ def render(supabase, session_state):
     
     tipo_documento = st.selectbox(
         "🎯 Selecciona el tipo de documento a generar:",
-        ["Seleccionar...", "XML Acción Formativa", "XML Inicio de Grupo", "XML Finalización de Grupo"],
+        ["Seleccionar...", "XML Acción Formativa", "XML Inicio de Grupo", "XML Finalización de Grupo",
+         "Validación masiva de grupos"],
         key="tipo_documento_fundae",
         help="Documentos con validaciones FUNDAE y jerarquía empresarial"
     )
@@ -252,6 +254,9 @@ def render(supabase, session_state):
         
     elif tipo_documento == "XML Finalización de Grupo":
         procesar_xml_finalizacion_grupo(df_grupos, supabase, session_state, xsd_urls)
+        
+    elif tipo_documento == "Validación masiva de grupos":
+        procesar_validacion_masiva(df_grupos, supabase)
     
     # Footer informativo
     mostrar_footer_informativo()
@@ -966,6 +971,79 @@ def validar_xml_finalizacion_xsd(grupo_data_final, participantes_data, xsd_url):
 # FUNCIONES DE INFORMACIÓN
 # =========================
 
+# =========================
+# VALIDACIÓN MASIVA PREVIA AL ENVÍO
+# =========================
+
+def procesar_validacion_masiva(df_grupos, supabase):
+    """Valida todos los grupos de un periodo con una carga por lotes."""
+    
+    st.markdown("### 🧾 Validación masiva de grupos")
+    st.caption("Revisa todos los grupos de un periodo antes de enviarlos a FUNDAE")
+    
+    if df_grupos.empty:
+        st.warning("⚠️ No hay grupos disponibles")
+        return
+    
+    fechas = pd.to_datetime(df_grupos["fecha_inicio"], errors="coerce", utc=True)
+    anios = sorted(fechas.dt.year.dropna().astype(int).unique().tolist(), reverse=True)
+    if not anios:
+        st.warning("⚠️ Ningún grupo tiene fecha de inicio")
+        return
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        anio = st.selectbox("Año", anios, key="validacion_masiva_anio")
+    with col2:
+        trimestre = st.selectbox("Trimestre", ["Todos", 1, 2, 3, 4], key="validacion_masiva_trimestre")
+    with col3:
+        tipo_validacion = st.radio(
+            "Tipo", ["inicio", "finalizacion"], horizontal=True, key="validacion_masiva_tipo",
+            format_func=lambda t: "Inicio" if t == "inicio" else "Finalización"
+        )
+    
+    mascara = fechas.dt.year == anio
+    if trimestre != "Todos":
+        mascara &= fechas.dt.quarter == trimestre
+    grupo_ids = df_grupos.loc[mascara, "id"].tolist()
+    st.caption(f"{len(grupo_ids)} grupos en el periodo seleccionado")
+    
+    if st.button("🔍 Validar grupos", type="primary", disabled=not grupo_ids):
+        with st.spinner(f"Validando {len(grupo_ids)} grupos..."):
+            try:
+                st.session_state["validacion_masiva_fundae"] = validar_grupos_fundae_lote(
+                    supabase, grupo_ids, tipo_validacion
+                )
+            except Exception as e:
+                st.error(f"❌ Error en la validación masiva: {e}")
+                return
+    
+    resultado = st.session_state.get("validacion_masiva_fundae")
+    if not resultado:
+        return
+    
+    resumen, informe = resultado["resumen"], resultado["informe"]
+    estados = resumen["estado"].value_counts() if not resumen.empty else pd.Series(dtype=int)
+    
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("✅ Válidos", int(estados.get("VALIDO", 0)))
+    col2.metric("⚠️ Con advertencias", int(estados.get("ADVERTENCIA", 0)))
+    col3.metric("❌ Con errores", int(estados.get("ERROR", 0)))
+    col4.metric("⏱️ Tiempo", f"{resultado['segundos']} s", help=f"{resultado['peticiones']} consultas")
+    
+    st.markdown("#### Resumen por grupo")
+    st.dataframe(resumen, use_container_width=True, hide_index=True)
+    
+    st.markdown("#### Incidencias")
+    niveles = st.multiselect(
+        "Nivel", ["ERROR", "ADVERTENCIA"], default=["ERROR", "ADVERTENCIA"], key="validacion_masiva_niveles"
+    )
+    detalle = informe[informe["nivel"].isin(niveles)]
+    st.dataframe(detalle, use_container_width=True, hide_index=True)
+    
+    export_csv(detalle, filename=f"validacion_fundae_{datetime.now():%Y%m%d}.csv",
+               label="📥 Descargar incidencias", key="validacion_masiva_csv")
+
 def mostrar_informacion_tipos_xml():
     """Muestra información sobre los tipos de XML disponibles."""
     
@@ -126,13 +126,11 @@ def exportar_empresas(empresas_service, session_state):
             st.warning("⚠️ No hay empresas para exportar")
             return
 
-        csv = df.to_csv(index=False).encode("utf-8")
-        st.download_button(
-            "📥 Exportar CSV",
-            data=csv,
-            file_name=f"empresas_{datetime.now().strftime('%Y%m%d')}.csv",
-            mime="text/csv",
-            use_container_width=True
+        export_csv(
+            df,
+            filename=f"empresas_{datetime.now().strftime('%Y%m%d')}.csv",
+            label="📥 Exportar CSV",
+            key="export_empresas"
         )
     except Exception as e:
         st.error(f"❌ Error exportando empresas: {e}")
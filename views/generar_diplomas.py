@@ -7,6 +7,7 @@ from typing import Optional, Dict
 from services.participantes_service import get_participantes_service
 from services.grupos_service import get_grupos_service
 from services.empresas_service import get_empresas_service
+from services.almacenamiento_service import get_almacenamiento
 
 # Importar reportlab
 try:
@@ -50,17 +51,13 @@ class FirmasService:
                 st.error("Archivo muy grande. Máximo 2MB")
                 return False
             
-            timestamp = int(datetime.now().timestamp())
-            file_name = f"firma_{timestamp}.png"
-            file_path = f"firmas_diplomas/{empresa_id}/{file_name}"
-            
-            self.supabase.storage.from_("diplomas").upload(
-                file_path,
-                archivo_firma.getvalue(),
-                {"content-type": "image/png"}
+            # Ruta por contenido: la misma imagen no se vuelve a subir
+            almacenamiento = get_almacenamiento(self.supabase)
+            resultado = almacenamiento.subir_archivo(
+                "diplomas", f"firmas_diplomas/{empresa_id}", archivo_firma.getvalue(), "png", "image/png", prefijo="firma"
             )
-            
-            url = self.supabase.storage.from_("diplomas").get_public_url(file_path)
+            url = resultado["url"]
+            file_name = resultado["ruta"].split("/")[-1]
             
             firma_existente = self.get_firma_empresa(empresa_id)
             
@@ -77,6 +74,10 @@ class FirmasService:
                     "archivo_nombre": file_name
                 }).execute()
             
+            # La imagen anterior se borra en segundo plano si ya no la usa nadie
+            if firma_existente and firma_existente.get("archivo_url") != url:
+                almacenamiento.liberar("diplomas", [firma_existente.get("archivo_url")])
+            
             return True
         
         except Exception as e:
@@ -86,9 +87,12 @@ class FirmasService:
     def eliminar_firma(self, empresa_id: str) -> bool:
         """Elimina la firma digital de una empresa."""
         try:
+            firma_existente = self.get_firma_empresa(empresa_id)
             self.supabase.table("empresas_firmas_diplomas").delete().eq(
                 "empresa_id", empresa_id
             ).execute()
+            if firma_existente:
+                get_almacenamiento(self.supabase).liberar("diplomas", [firma_existente.get("archivo_url")])
             return True
         except Exception as e:
             st.error(f"Error eliminando firma: {e}")
@@ -123,18 +127,13 @@ class LogosService:
                 st.error("Archivo muy grande. Máximo 5MB")
                 return False
             
-            timestamp = int(datetime.now().timestamp())
-            file_name = f"logo_{timestamp}.png"
-            file_path = f"logos_diplomas/{empresa_id}/{file_name}"
-            
-            # Subir al bucket
-            self.supabase.storage.from_("diplomas").upload(
-                file_path,
-                archivo_logo.getvalue(),
-                {"content-type": "image/png"}
+            # Ruta por contenido: la misma imagen no se vuelve a subir
+            almacenamiento = get_almacenamiento(self.supabase)
+            resultado = almacenamiento.subir_archivo(
+                "diplomas", f"logos_diplomas/{empresa_id}", archivo_logo.getvalue(), "png", "image/png", prefijo="logo"
             )
-            
-            url = self.supabase.storage.from_("diplomas").get_public_url(file_path)
+            url = resultado["url"]
+            file_name = resultado["ruta"].split("/")[-1]
             
             # Actualizar o insertar en BD
             logo_existente = self.get_logo_empresa(empresa_id)
@@ -152,6 +151,10 @@ class LogosService:
                     "archivo_nombre": file_name
                 }).execute()
             
+            # La imagen anterior se borra en segundo plano si ya no la usa nadie
+            if logo_existente and logo_existente.get("archivo_url") != url:
+                almacenamiento.liberar("diplomas", [logo_existente.get("archivo_url")])
+            
             return True
         
         except Exception as e:
@@ -161,9 +164,12 @@ class LogosService:
     def eliminar_logo(self, empresa_id: str) -> bool:
         """Elimina el logotipo de una empresa."""
         try:
+            logo_existente = self.get_logo_empresa(empresa_id)
             self.supabase.table("empresas_logos_diplomas").delete().eq(
                 "empresa_id", empresa_id
             ).execute()
+            if logo_existente:
+                get_almacenamiento(self.supabase).liberar("diplomas", [logo_existente.get("archivo_url")])
             return True
         except Exception as e:
             st.error(f"Error eliminando logo: {e}")
@@ -1349,28 +1355,23 @@ def render(supabase, session_state):
                         grupo_numero = grupo_completo.get("codigo_grupo", "0").split("_")[-1] if grupo_completo.get("codigo_grupo") else "0"
                         
                         nif = participante.get("nif", "sin_nif").replace(" ", "_")
-                        timestamp = int(datetime.now().timestamp())
-                        file_name = f"diploma_{nif}_{timestamp}.pdf"
-                        
-                        file_path = (
+                        carpeta = (
                             f"diplomas/"
                             f"gestora_{empresa_id_diploma}/"
                             f"ano_{ano_inicio}/"
                             f"accion_{codigo_accion}_{accion_id}/"
-                            f"grupo_{grupo_numero}_{grupo_id_corto}/"
-                            f"{file_name}"
+                            f"grupo_{grupo_numero}_{grupo_id_corto}"
                         )
         
                         # Subir al bucket (solo si no existe)
                         if not diploma_existente.data:
                             try:
-                                supabase.storage.from_("diplomas").upload(
-                                    file_path,
-                                    pdf_buffer.getvalue(),
-                                    {"content-type": "application/pdf"}
+                                resultado = get_almacenamiento(supabase).subir_archivo(
+                                    "diplomas", carpeta, pdf_buffer.getvalue(), "pdf",
+                                    "application/pdf", prefijo=f"diploma_{nif}"
                                 )
-        
-                                url = supabase.storage.from_("diplomas").get_public_url(file_path)
+                                url = resultado["url"]
+                                file_name = resultado["ruta"].split("/")[-1]
         
                                 # Registrar en BD
                                 supabase.table("diplomas").insert({
@@ -3,7 +3,13 @@ import pandas as pd
 import uuid
 from datetime import datetime, date, time
 from services.grupos_service import get_grupos_service
-from utils import validar_dni_cif, export_csv, export_excel
+from services.costes_grupo import get_libro_costes, nombre_mes
+from services.detalle_grupo import MAX_PETICIONES_DETALLE, get_detalle_grupo, invalidar_detalle_grupo
+from services.query_memo import medir_peticiones
+from services.credito_fundae import get_motor_credito
+from utils import export_csv, export_excel
+from services.documentos_identidad import validar_documentos
+from components.paginacion import paginador_cursor
 import re
 import math
 
@@ -386,17 +392,13 @@ def mostrar_formulario_grupo_separado(grupos_service, es_creacion=False, context
         st.error("No hay acciones formativas disponibles. Crea una acción formativa primero.")
         return None
 
-    # Datos iniciales
+    # Datos iniciales (de la ficha del grupo en sesión)
+    detalle = None
     if grupo_seleccionado and not es_creacion:
         try:
-            grupo_fresh = (
-                grupos_service.supabase.table("grupos")
-                .select("*")
-                .eq("id", grupo_seleccionado.get("id"))
-                .execute()
-            )
-            if grupo_fresh.data:
-                datos_grupo = grupo_fresh.data[0]
+            detalle = get_detalle_grupo(grupos_service.supabase, grupo_seleccionado.get("id"))
+            if detalle:
+                datos_grupo = detalle.grupo.copy()
                 estado_actual = determinar_estado_grupo(datos_grupo)
             else:
                 datos_grupo = grupo_seleccionado.copy()
@@ -715,7 +717,9 @@ def mostrar_formulario_grupo_separado(grupos_service, es_creacion=False, context
                     
                     # Cargar localidades de la provincia seleccionada
                     if provincia_sel:
-                        localidades = grupos_service.get_localidades_por_provincia(provincia_id_sel)
+                        localidades = detalle.localidades_de(provincia_id_sel) if detalle else None
+                        if localidades is None:
+                            localidades = grupos_service.get_localidades_por_provincia(provincia_id_sel)
                         loc_opciones = {l["nombre"]: l["id"] for l in localidades}
                         
                         # Obtener localidad actual desde localidad_id
@@ -974,6 +978,7 @@ def mostrar_formulario_grupo_separado(grupos_service, es_creacion=False, context
                         .eq("id", datos_grupo["id"])
                         .execute()
                     )
+                    invalidar_detalle_grupo(datos_grupo["id"])
                     if res.data:
                         st.success("✅ Cambios guardados correctamente")
                         st.session_state.grupo_seleccionado = res.data[0]
@@ -989,14 +994,9 @@ def mostrar_formulario_grupo_separado(grupos_service, es_creacion=False, context
             
         elif recargar and not es_creacion:
             try:
-                grupo_recargado = (
-                    grupos_service.supabase.table("grupos")
-                    .select("*")
-                    .eq("id", datos_grupo["id"])
-                    .execute()
-                )
-                if grupo_recargado.data:
-                    st.session_state.grupo_seleccionado = grupo_recargado.data[0]
+                detalle = get_detalle_grupo(grupos_service.supabase, datos_grupo["id"], refrescar=True)
+                if detalle:
+                    st.session_state.grupo_seleccionado = detalle.grupo.copy()
                 st.rerun()
             except Exception as e:
                 st.error(f"Error al recargar: {e}")
@@ -1008,45 +1008,52 @@ def mostrar_formulario_grupo_separado(grupos_service, es_creacion=False, context
 # =========================
 
 def mostrar_secciones_adicionales(grupos_service, grupo_id):
-    """Muestra las secciones adicionales para grupos ya creados con soporte jerárquico."""
-    
+    """
+    Muestra las secciones adicionales para grupos ya creados con soporte
+    jerárquico. Todas leen de la ficha del grupo (una consulta, en sesión).
+    """
+    grupo_id_limpio = validar_uuid_seguro(grupo_id)
+    if not grupo_id_limpio:
+        st.error("ID de grupo no válido")
+        return
+
+    try:
+        detalle = get_detalle_grupo(grupos_service.supabase, grupo_id_limpio)
+    except Exception as e:
+        st.error(f"Error al cargar el grupo: {e}")
+        return
+    if detalle is None:
+        st.error("❌ No se pudo cargar información del grupo")
+        return
+
     # SECCIÓN 4: TUTORES CON JERARQUÍA
     with st.expander("👨‍🏫 4. Tutores Asignados", expanded=False):
-        mostrar_seccion_tutores_jerarquia(grupos_service, grupo_id)
+        mostrar_seccion_tutores_jerarquia(grupos_service, detalle)
         
     # SECCIÓN 4.b: CENTRO GESTOR
     with st.expander("🏢 4.b Centro Gestor", expanded=False):
-        mostrar_seccion_centro_gestor(grupos_service, grupo_id)
+        mostrar_seccion_centro_gestor(grupos_service, detalle)
         
     # SECCIÓN 5: EMPRESAS PARTICIPANTES CON JERARQUÍA
     with st.expander("🏢 5. Empresas Participantes", expanded=False):
-        mostrar_seccion_empresas_jerarquia(grupos_service, grupo_id)
+        mostrar_seccion_empresas_jerarquia(grupos_service, detalle)
     
     # SECCIÓN 6: PARTICIPANTES CON JERARQUÍA
     with st.expander("👥 6. Participantes del Grupo", expanded=False):
-        mostrar_seccion_participantes_jerarquia(grupos_service, grupo_id)
+        mostrar_seccion_participantes_jerarquia(grupos_service, detalle)
     
     # SECCIÓN 7: COSTES FUNDAE
     with st.expander("💰 7. Costes y Bonificaciones FUNDAE", expanded=False):
-        mostrar_seccion_costes_por_empresa_schema_real(grupos_service, grupo_id)
+        mostrar_seccion_costes_por_empresa_schema_real(grupos_service, grupo_id_limpio)
 
-def mostrar_seccion_tutores_jerarquia(grupos_service, grupo_id):
-    """CORREGIDO: Usando tabla tutores_grupos (N:N)."""
+def mostrar_seccion_tutores_jerarquia(grupos_service, detalle):
+    """Tutores del grupo (tutores_grupos, N:N) desde la ficha del grupo."""
     st.markdown("**Gestión de Tutores con Jerarquía**")
     
-    grupo_id_limpio = validar_uuid_seguro(grupo_id)
-    if not grupo_id_limpio:
-        st.error("ID de grupo no válido")
-        return
+    grupo_id_limpio = detalle.grupo_id
     
     try:
-        # CORRECCIÓN: Usar tabla de relación tutores_grupos
-        tutores_res = grupos_service.supabase.table("tutores_grupos").select("""
-            id, tutor_id, fecha_asignacion,
-            tutor:tutores(id, nombre, apellidos, email, especialidad)
-        """).eq("grupo_id", grupo_id_limpio).execute()
-        
-        df_tutores = pd.DataFrame(tutores_res.data or [])
+        df_tutores = pd.DataFrame(detalle.tutores)
         
         if not df_tutores.empty:
             st.markdown("##### Tutores Asignados")
@@ -1062,13 +1069,12 @@ def mostrar_seccion_tutores_jerarquia(grupos_service, grupo_id):
                             st.caption(f"📧 {tutor.get('email', 'N/A')} | 🎯 {tutor.get('especialidad', 'Sin especialidad')}")
                         with col2:
                             if st.button("Quitar", key=f"quitar_tutor_{row.get('id')}", type="secondary"):
-                                try:
-                                    # CORRECCIÓN: Eliminar de tabla de relación
-                                    grupos_service.supabase.table("tutores_grupos").delete().eq("id", row.get("id")).execute()
+                                resultado = grupos_service.quitar_tutores_de_grupo(grupo_id_limpio, [row.get("tutor_id")])
+                                if grupos_service.QUITADO in resultado.values():
                                     st.success("Tutor eliminado")
                                     st.rerun()
-                                except Exception as e:
-                                    st.error(f"Error: {e}")
+                                else:
+                                    st.error(f"Error: {next(iter(resultado.values()), 'tutor no encontrado')}")
         else:
             st.info("📋 No hay tutores asignados")
         
@@ -1076,9 +1082,8 @@ def mostrar_seccion_tutores_jerarquia(grupos_service, grupo_id):
         st.markdown("##### Añadir Tutores")
         
         try:
-            # CORRECCIÓN: Buscar tutores disponibles (no asignados a este grupo)
-            tutores_grupo = grupos_service.supabase.table("tutores_grupos").select("tutor_id").eq("grupo_id", grupo_id_limpio).execute()
-            tutores_asignados = [t["tutor_id"] for t in (tutores_grupo.data or [])]
+            # Tutores disponibles (no asignados a este grupo)
+            tutores_asignados = detalle.tutor_ids()
             
             # Obtener tutores según jerarquía
             if grupos_service.rol == "admin":
@@ -1090,10 +1095,7 @@ def mostrar_seccion_tutores_jerarquia(grupos_service, grupo_id):
                 # Tutores de su empresa y empresas clientes
                 empresa_id_limpio = validar_uuid_seguro(grupos_service.empresa_id)
                 if empresa_id_limpio:
-                    clientes_res = grupos_service.supabase.table("empresas").select("id").eq("empresa_matriz_id", empresa_id_limpio).execute()
-                    empresas_gestionables = [empresa_id_limpio]
-                    if clientes_res.data:
-                        empresas_gestionables.extend([c["id"] for c in clientes_res.data])
+                    empresas_gestionables = grupos_service.get_empresas_gestionables(empresa_id_limpio)
                     
                     query = grupos_service.supabase.table("tutores").select("""
                         id, nombre, apellidos, email, especialidad, empresa_id,
@@ -1125,22 +1127,10 @@ def mostrar_seccion_tutores_jerarquia(grupos_service, grupo_id):
                     )
                     
                     if tutores_seleccionados and st.button("Asignar Tutores", type="primary"):
-                        exitos = 0
-                        for tutor_nombre in tutores_seleccionados:
-                            tutor_id = opciones_tutores[tutor_nombre]
-                            try:
-                                # CORRECCIÓN: Insertar en tabla de relación N:N
-                                grupos_service.supabase.table("tutores_grupos").insert({
-                                    "grupo_id": grupo_id_limpio,
-                                    "tutor_id": tutor_id,
-                                    "fecha_asignacion": datetime.utcnow().isoformat()
-                                }).execute()
-                                exitos += 1
-                            except Exception as e:
-                                st.error(f"Error al asignar {tutor_nombre}: {e}")
-                        
-                        if exitos > 0:
-                            st.success(f"Se asignaron {exitos} tutores")
+                        nombres = {opciones_tutores[n]: n for n in tutores_seleccionados}
+                        resultados = grupos_service.asignar_tutores_a_grupo(grupo_id_limpio, list(nombres))
+                        if mostrar_resultado_bloque(resultados, nombres, grupos_service.ASIGNADO,
+                                                    "Tutores asignados", "Ya estaban en el grupo"):
                             st.rerun()
                 else:
                     st.info("No hay tutores disponibles")
@@ -1153,23 +1143,30 @@ def mostrar_seccion_tutores_jerarquia(grupos_service, grupo_id):
     except Exception as e:
         st.error(f"Error en sección de tutores: {e}")
         
-def mostrar_seccion_centro_gestor(grupos_service, grupo_id):
+def mostrar_resultado_bloque(resultados, nombres, exito, texto_exito, texto_omitido):
+    """Resume el resultado de una asignación o baja en bloque ({id: resultado})."""
+    hechos = [i for i, r in resultados.items() if r == exito]
+    omitidos = [i for i, r in resultados.items() if r != exito and not r.startswith("error")]
+    errores = [(i, r) for i, r in resultados.items() if r.startswith("error")]
+
+    if hechos:
+        st.success(f"✅ {texto_exito}: {len(hechos)}")
+    if omitidos:
+        st.info(f"ℹ️ {texto_omitido}: {len(omitidos)}")
+    for i, r in errores[:10]:
+        st.error(f"{nombres.get(i, i)}: {r[len('error: '):]}")
+    return len(hechos)
+
+def mostrar_seccion_centro_gestor(grupos_service, detalle):
     """Centro Gestor simplificado usando empresas marcadas."""
     st.markdown("**Centro Gestor (solo Teleformación/Mixta)**")
     
+    grupo_id = detalle.grupo_id
+    
     try:
-        # Verificar modalidad del grupo
-        info_mod = grupos_service.supabase.table("grupos").select(
-            "modalidad"
-        ).eq("id", grupo_id).limit(1).execute()
-        
-        modalidad_norm = "PRESENCIAL"
-        if info_mod.data:
-            modalidad_norm = info_mod.data[0].get("modalidad", "PRESENCIAL")
-        
-        if modalidad_norm in ["TELEFORMACION", "MIXTA"]:
+        if detalle.modalidad in ["TELEFORMACION", "MIXTA"]:
             # Ver centro actual
-            centro_actual = grupos_service.get_centro_gestor_empresa(grupo_id)
+            centro_actual = detalle.centro_gestor
             
             if centro_actual:
                 st.success(f"✅ Centro gestor actual: **{centro_actual['nombre']}**")
@@ -1208,23 +1205,14 @@ def mostrar_seccion_centro_gestor(grupos_service, grupo_id):
     except Exception as e:
         st.error(f"Error en sección Centro Gestor: {e}")
 
-def mostrar_seccion_empresas_jerarquia(grupos_service, grupo_id):
-    """Gestión de empresas participantes usando empresas_grupos."""
+def mostrar_seccion_empresas_jerarquia(grupos_service, detalle):
+    """Gestión de empresas participantes (empresas_grupos) desde la ficha del grupo."""
     st.markdown("**Empresas Participantes con Jerarquía**")
     
-    grupo_id_limpio = validar_uuid_seguro(grupo_id)
-    if not grupo_id_limpio:
-        st.error("ID de grupo no válido")
-        return
+    grupo_id = grupo_id_limpio = detalle.grupo_id
     
     try:
-        # Usar tabla de relación empresas_grupos
-        empresas_res = grupos_service.supabase.table("empresas_grupos").select("""
-            id, empresa_id, fecha_asignacion,
-            empresa:empresas(id, nombre, cif, tipo_empresa)
-        """).eq("grupo_id", grupo_id_limpio).execute()
-        
-        df_empresas = pd.DataFrame(empresas_res.data or [])
+        df_empresas = pd.DataFrame(detalle.empresas)
         
         if not df_empresas.empty:
             st.markdown("##### Empresas Asignadas")
@@ -1243,19 +1231,19 @@ def mostrar_seccion_empresas_jerarquia(grupos_service, grupo_id):
                             st.caption(f"🏢 {tipo} | 📄 {cif} | 📅 {fecha}")
                         with col2:
                             if st.button("Quitar", key=f"quitar_empresa_{row.get('id')}", type="secondary"):
-                                try:
-                                    grupos_service.supabase.table("empresas_grupos").delete().eq("id", row.get("id")).execute()
+                                resultado = grupos_service.quitar_empresas_de_grupo(grupo_id_limpio, [row.get("empresa_id")])
+                                if grupos_service.QUITADO in resultado.values():
                                     st.success("Empresa eliminada")
                                     st.rerun()
-                                except Exception as e:
-                                    st.error(f"Error: {e}")
+                                else:
+                                    st.error(f"Error: {next(iter(resultado.values()), 'empresa no encontrada')}")
         else:
             st.info("📋 No hay empresas asignadas")
         
         # Añadir empresas con jerarquía
         st.markdown("##### Añadir Empresas")
         try:
-            empresas_disponibles = grupos_service.get_empresas_asignables_a_grupo(grupo_id)
+            empresas_disponibles = grupos_service.get_empresas_asignables_a_grupo(grupo_id, detalle=detalle)
             
             if empresas_disponibles:
                 empresas_seleccionadas = st.multiselect(
@@ -1266,17 +1254,10 @@ def mostrar_seccion_empresas_jerarquia(grupos_service, grupo_id):
                 )
                 
                 if empresas_seleccionadas and st.button("Asignar Empresas", type="primary"):
-                    exitos = 0
-                    for empresa_nombre in empresas_seleccionadas:
-                        empresa_id = empresas_disponibles[empresa_nombre]
-                        try:
-                            if grupos_service.create_empresa_grupo(grupo_id, empresa_id):
-                                exitos += 1
-                        except Exception as e:
-                            st.error(f"Error al asignar {empresa_nombre}: {e}")
-                    
-                    if exitos > 0:
-                        st.success(f"✅ Se asignaron {exitos} empresas")
+                    nombres = {empresas_disponibles[n]: n for n in empresas_seleccionadas}
+                    resultados = grupos_service.asignar_empresas_a_grupo(grupo_id_limpio, list(nombres))
+                    if mostrar_resultado_bloque(resultados, nombres, grupos_service.ASIGNADO,
+                                                "Empresas asignadas", "Ya estaban en el grupo"):
                         st.rerun()
             else:
                 st.info("📋 No hay empresas disponibles para asignar")
@@ -1286,23 +1267,14 @@ def mostrar_seccion_empresas_jerarquia(grupos_service, grupo_id):
     except Exception as e:
         st.error(f"Error al cargar sección de empresas: {e}")
 
-def mostrar_seccion_participantes_jerarquia(grupos_service, grupo_id):
-    """CORREGIDO: Usando tabla participantes_grupos (N:N) con validacion de UUIDs."""
+def mostrar_seccion_participantes_jerarquia(grupos_service, detalle):
+    """Participantes del grupo (participantes_grupos, N:N) desde la ficha del grupo."""
     st.markdown("**Participantes del Grupo con Jerarquía**")
     
-    grupo_id_limpio = validar_uuid_seguro(grupo_id)
-    if not grupo_id_limpio:
-        st.error("ID de grupo no válido")
-        return
+    grupo_id = grupo_id_limpio = detalle.grupo_id
     
     try:
-        # CORRECCIÓN: Usar tabla de relación participantes_grupos
-        participantes_res = grupos_service.supabase.table("participantes_grupos").select("""
-            id, participante_id, fecha_asignacion,
-            participante:participantes(id, nif, nombre, apellidos, email, telefono)
-        """).eq("grupo_id", grupo_id_limpio).execute()
-        
-        df_participantes = pd.DataFrame(participantes_res.data or [])
+        df_participantes = pd.DataFrame(detalle.participantes)
         
         if not df_participantes.empty:
             st.markdown("##### Participantes Asignados")
@@ -1314,6 +1286,7 @@ def mostrar_seccion_participantes_jerarquia(grupos_service, grupo_id):
                 if isinstance(participante, dict):
                     participantes_data.append({
                         "relacion_id": row.get("id"),
+                        "participante_id": row.get("participante_id"),
                         "nif": participante.get("nif", ""),
                         "nombre": participante.get("nombre", ""),
                         "apellidos": participante.get("apellidos", ""),
@@ -1337,21 +1310,23 @@ def mostrar_seccion_participantes_jerarquia(grupos_service, grupo_id):
                     }
                 )
                 
-                # Desasignar participantes
+                # Desasignar participantes (un único borrado para toda la selección)
                 with st.expander("❌ Desasignar Participantes"):
-                    for _, row in df_display.iterrows():
-                        col1, col2 = st.columns([3, 1])
-                        with col1:
-                            st.write(f"{row['nif']} - {row['nombre']} {row['apellidos']}")
-                        with col2:
-                            if st.button("Quitar", key=f"quitar_part_{row['relacion_id']}", type="secondary"):
-                                try:
-                                    # CORRECCIÓN: Eliminar de tabla de relación
-                                    grupos_service.supabase.table("participantes_grupos").delete().eq("id", row['relacion_id']).execute()
-                                    st.success("Participante desasignado")
-                                    st.rerun()
-                                except Exception as e:
-                                    st.error(f"Error: {e}")
+                    opciones_quitar = {
+                        f"{row['nif']} - {row['nombre']} {row['apellidos']}": row["participante_id"]
+                        for _, row in df_display.iterrows()
+                    }
+                    a_quitar = st.multiselect(
+                        "Seleccionar participantes a quitar:",
+                        opciones_quitar.keys(),
+                        key=f"participantes_quitar_{grupo_id_limpio}"
+                    )
+                    if a_quitar and st.button("Quitar Seleccionados", type="secondary"):
+                        nombres = {opciones_quitar[n]: n for n in a_quitar}
+                        resultados = grupos_service.quitar_participantes_de_grupo(grupo_id_limpio, list(nombres))
+                        if mostrar_resultado_bloque(resultados, nombres, grupos_service.QUITADO,
+                                                    "Participantes desasignados", "Ya no estaban en el grupo"):
+                            st.rerun()
         else:
             st.info("📋 No hay participantes asignados")
         
@@ -1359,87 +1334,53 @@ def mostrar_seccion_participantes_jerarquia(grupos_service, grupo_id):
         st.markdown("##### Asignar Participantes")
         
         try:
-            # CORRECCIÓN: Buscar participantes disponibles (sin grupo asignado en la relación)
-            participantes_con_grupo = grupos_service.supabase.table("participantes_grupos").select("participante_id").execute()
-            participantes_asignados_raw = [p["participante_id"] for p in (participantes_con_grupo.data or [])]
-            
-            # ✅ VALIDAR UUIDs - Filtrar solo UUIDs válidos
-            participantes_asignados = []
-            for uuid_str in participantes_asignados_raw:
-                uuid_limpio = validar_uuid_seguro(uuid_str)
-                if uuid_limpio:
-                    participantes_asignados.append(uuid_limpio)
-            
-            # Obtener empresas participantes del grupo
-            empresas_grupo = grupos_service.supabase.table("empresas_grupos").select("empresa_id").eq("grupo_id", grupo_id_limpio).execute()
-            empresas_participantes_raw = [e["empresa_id"] for e in (empresas_grupo.data or [])]
-            
-            # ✅ VALIDAR UUIDs - Filtrar solo UUIDs válidos
-            empresas_participantes = []
-            for uuid_str in empresas_participantes_raw:
-                uuid_limpio = validar_uuid_seguro(uuid_str)
-                if uuid_limpio:
-                    empresas_participantes.append(uuid_limpio)
-            
-            if empresas_participantes:
-                # ✅ CONSTRUIR CONSULTA CON UUIDs VALIDADOS
-                query = grupos_service.supabase.table("participantes").select("""
-                    id, nif, nombre, apellidos, email, empresa_id,
-                    empresa:empresas(nombre)
-                """).in_("empresa_id", empresas_participantes)
-                
-                if participantes_asignados:
-                    query = query.not_.in_("id", participantes_asignados)
-                
-                disponibles_res = query.execute()
-                df_disponibles = pd.DataFrame(disponibles_res.data or [])
-                
-                if not df_disponibles.empty:
-                    opciones_participantes = {}
-                    for _, row in df_disponibles.iterrows():
-                        empresa_nombre = row.get("empresa", {}).get("nombre", "Sin empresa") if isinstance(row.get("empresa"), dict) else "Sin empresa"
-                        nombre_completo = f"{row.get('nif', 'Sin NIF')} - {row.get('nombre', '')} {row.get('apellidos', '')} ({empresa_nombre})"
-                        opciones_participantes[nombre_completo] = row["id"]
-                    
-                    participantes_seleccionados = st.multiselect(
-                        "Seleccionar participantes:",
-                        opciones_participantes.keys(),
-                        key=f"participantes_add_{grupo_id_limpio}"
-                    )
-                    
-                    if participantes_seleccionados and st.button("Asignar Seleccionados", type="primary"):
-                        exitos = 0
-                        for participante_nombre in participantes_seleccionados:
-                            participante_id = opciones_participantes[participante_nombre]
-                            try:
-                                # CORRECCIÓN: Insertar en tabla de relación N:N
-                                grupos_service.supabase.table("participantes_grupos").insert({
-                                    "grupo_id": grupo_id_limpio,
-                                    "participante_id": participante_id,
-                                    "fecha_asignacion": datetime.utcnow().isoformat()
-                                }).execute()
-                                exitos += 1
-                            except Exception as e:
-                                st.error(f"Error al asignar {participante_nombre}: {e}")
-                        
-                        if exitos > 0:
-                            st.success(f"Se asignaron {exitos} participantes")
-                            st.rerun()
-                else:
-                    st.info("No hay participantes disponibles")
+            # Candidatos: anti-join resuelto en la base de datos, paginado y con búsqueda
+            busqueda = st.text_input(
+                "🔍 Buscar por NIF, nombre, apellidos o email",
+                key=f"buscar_disponibles_{grupo_id_limpio}"
+            )
+            por_pagina = 50
+
+            def cargar_disponibles(cursor):
+                desplazamiento = cursor or 0
+                df, hay_mas = grupos_service.buscar_participantes_disponibles(
+                    grupo_id_limpio, busqueda, limite=por_pagina, desplazamiento=desplazamiento
+                )
+                return df, (desplazamiento + por_pagina) if hay_mas else None
+
+            df_disponibles = paginador_cursor(
+                f"disponibles_{grupo_id_limpio}",
+                busqueda,
+                cargar_disponibles,
+                etiqueta="participantes disponibles"
+            )
+
+            if not df_disponibles.empty:
+                opciones_participantes = {}
+                for _, row in df_disponibles.iterrows():
+                    empresa_nombre = row.get("empresa_nombre") or "Sin empresa"
+                    nombre_completo = f"{row.get('nif') or 'Sin NIF'} - {row.get('nombre', '')} {row.get('apellidos', '')} ({empresa_nombre})"
+                    opciones_participantes[nombre_completo] = row["id"]
+
+                participantes_seleccionados = st.multiselect(
+                    "Seleccionar participantes:",
+                    opciones_participantes.keys(),
+                    key=f"participantes_add_{grupo_id_limpio}"
+                )
+
+                if participantes_seleccionados and st.button("Asignar Seleccionados", type="primary"):
+                    nombres = {opciones_participantes[n]: n for n in participantes_seleccionados}
+                    resultados = grupos_service.asignar_participantes_a_grupo(grupo_id_limpio, list(nombres))
+                    if mostrar_resultado_bloque(resultados, nombres, grupos_service.ASIGNADO,
+                                                "Participantes asignados", "Ya estaban en el grupo"):
+                        st.rerun()
+            elif busqueda:
+                st.info("Ningún participante disponible coincide con la búsqueda")
             else:
-                st.warning("Primero asigna empresas participantes al grupo")
-                
+                st.info("No hay participantes disponibles en las empresas del grupo")
+
         except Exception as e:
-            # ✅ DEBUGGING MEJORADO
             st.error(f"Error cargando participantes disponibles: {e}")
-            
-            # Solo para debugging - quitar después de solucionar
-            with st.expander("🔧 Debug Info", expanded=False):
-                st.write("Empresas participantes raw:", empresas_participantes_raw if 'empresas_participantes_raw' in locals() else "No disponible")
-                st.write("Empresas válidas:", empresas_participantes if 'empresas_participantes' in locals() else "No disponible") 
-                st.write("Participantes asignados raw:", participantes_asignados_raw if 'participantes_asignados_raw' in locals() else "No disponible")
-                st.write("Participantes válidos:", participantes_asignados if 'participantes_asignados' in locals() else "No disponible")
         
         # Importación masiva desde Excel
         st.divider()
@@ -1480,25 +1421,24 @@ def mostrar_seccion_participantes_jerarquia(grupos_service, grupo_id):
                         
                         if st.button("🔄 Procesar Archivo", type="primary"):
                             try:
-                                nifs = [str(d).strip() for d in df_import[col_nif] if pd.notna(d)]
-                                nifs_validos = [d for d in nifs if validar_dni_cif(d)]
+                                nifs = df_import[col_nif].dropna().astype(str).str.strip()
+                                nifs_validos = nifs[validar_documentos(nifs)["valido"]].tolist()
                                 
-                                df_disp_masivo = grupos_service.get_participantes_disponibles_jerarquia(grupo_id)
-                                disponibles = {p["nif"]: p["id"] for _, p in df_disp_masivo.iterrows()}
+                                # Solo se consultan los NIF del archivo, no todo el censo
+                                disponibles = grupos_service.resolver_nifs_disponibles(grupo_id, nifs_validos)
                                 
+                                errores = [f"NIF {nif} no encontrado o ya asignado"
+                                           for nif in nifs_validos if nif.upper() not in disponibles]
+                                nif_por_id = {pid: nif for nif, pid in disponibles.items()}
+                                resultados = grupos_service.asignar_participantes_a_grupo(grupo_id, list(nif_por_id))
                                 asignados = 0
-                                errores = []
-                                
-                                for nif in nifs_validos:
-                                    participante_id = disponibles.get(nif)
-                                    if participante_id:
-                                        try:
-                                            if grupos_service.asignar_participante_a_grupo(participante_id, grupo_id):
-                                                asignados += 1
-                                        except Exception as e:
-                                            errores.append(f"NIF {nif}: {str(e)}")
+                                for pid, resultado in resultados.items():
+                                    if resultado == grupos_service.ASIGNADO:
+                                        asignados += 1
+                                    elif resultado == grupos_service.YA_ASIGNADO:
+                                        errores.append(f"NIF {nif_por_id[pid]} ya asignado")
                                     else:
-                                        errores.append(f"NIF {nif} no encontrado o ya asignado")
+                                        errores.append(f"NIF {nif_por_id[pid]}: {resultado[len('error: '):]}")
                                 
                                 if asignados > 0:
                                     st.success(f"✅ Se asignaron {asignados} participantes")
@@ -1520,98 +1460,64 @@ def mostrar_seccion_participantes_jerarquia(grupos_service, grupo_id):
 
 def mostrar_seccion_costes_por_empresa_schema_real(grupos_service, grupo_id):
     """
-    CORREGIDO: Usando las tablas del schema real con validaciones robustas.
+    Costes y bonificaciones de cada empresa participante, leídos del libro de
+    costes del grupo (una consulta para todas las empresas).
     """
     st.markdown("### 💰 Costes y Bonificaciones por Empresa")
     st.caption("Cada empresa participante gestiona sus propios costes y bonificaciones de forma independiente")
     
     try:
-        # Obtener empresas participantes del grupo (VALIDACIÓN ROBUSTA)
-        empresas_grupo_res = grupos_service.supabase.table("empresas_grupos").select("""
-            id, empresa_id, fecha_asignacion,
-            empresa:empresas(id, nombre, cif, tipo_empresa)
-        """).eq("grupo_id", grupo_id).execute()
-        
-        if not empresas_grupo_res.data:
-            st.warning("⚠️ No hay empresas participantes. Añade empresas primero en la sección anterior.")
-            return
-        
-        # FILTRAR empresas válidas (con datos no None)
-        empresas_validas = []
-        for empresa_grupo in empresas_grupo_res.data:
-            if (empresa_grupo and 
-                isinstance(empresa_grupo, dict) and 
-                empresa_grupo.get("empresa") and 
-                isinstance(empresa_grupo.get("empresa"), dict)):
-                empresas_validas.append(empresa_grupo)
-        
-        if not empresas_validas:
-            st.error("❌ No se encontraron empresas con datos válidos")
-            return
-        
-        # Obtener datos del grupo para cálculos FUNDAE
-        grupo_info = grupos_service.supabase.table("grupos").select("""
-            modalidad, n_participantes_previstos,
-            accion_formativa:acciones_formativas(num_horas)
-        """).eq("id", grupo_id).execute()
+        libro = get_libro_costes(grupos_service.supabase, grupo_id)
         
-        if not grupo_info.data:
+        if libro is None:
             st.error("❌ No se pudo cargar información del grupo")
             return
-            
-        datos_grupo = grupo_info.data[0] or {}
-        modalidad = datos_grupo.get("modalidad", "PRESENCIAL")
-        participantes = datos_grupo.get("n_participantes_previstos", 1) or 1
-        
-        # VALIDACIÓN ROBUSTA de accion_formativa
-        accion_formativa = datos_grupo.get("accion_formativa")
-        if accion_formativa and isinstance(accion_formativa, dict):
-            horas = accion_formativa.get("num_horas", 0) or 0
-        else:
-            horas = 0
         
-        # Calcular límite FUNDAE con valores por defecto seguros
-        try:
-            limite_boni_base, tarifa_max = grupos_service.calcular_limite_fundae(modalidad, horas, participantes)
-        except Exception as e:
-            st.warning(f"⚠️ Error al calcular límites FUNDAE: {e}")
-            limite_boni_base, tarifa_max = 0.0, 13.0
+        if libro.empresas.empty:
+            st.warning("⚠️ No hay empresas participantes. Añade empresas primero en la sección anterior.")
+            return
         
         # Métricas generales del grupo
         with st.container(border=True):
             col1, col2, col3, col4 = st.columns(4)
             with col1:
-                st.metric("🎯 Modalidad", modalidad)
+                st.metric("🎯 Modalidad", libro.modalidad)
             with col2:
-                st.metric("👥 Participantes", participantes)
+                st.metric("👥 Participantes", libro.participantes)
             with col3:
-                st.metric("⏱️ Horas", horas)
+                st.metric("⏱️ Horas", f"{libro.horas:g}")
             with col4:
-                st.metric("💰 Tarifa Max", f"{tarifa_max:.2f} €/h")
+                st.metric("💰 Tarifa Max", f"{libro.tarifa_max:.2f} €/h")
         
-        # PESTAÑAS PARA CADA EMPRESA
-        empresa_nombres = []
-        empresa_data_map = {}
+        # Resumen de todas las empresas con sus comprobaciones de límite
+        resumen = libro.resumen()
+        if len(libro.empresas) > 1:
+            tabla = libro.empresas[["nombre", "total_costes", "limite", "bonificado", "disponible"]].rename(columns={
+                "nombre": "Empresa", "total_costes": "Costes (€)", "limite": "Límite (€)",
+                "bonificado": "Bonificado (€)", "disponible": "Disponible (€)"
+            })
+            tabla["Avisos"] = (
+                libro.empresas["supera_indirectos"].map({True: "Indirectos > 30% ", False: ""})
+                + libro.empresas["supera_tarifa"].map({True: "Tarifa > máx. ", False: ""})
+                + libro.empresas["supera_limite"].map({True: "Bonificado > límite ", False: ""})
+                + libro.empresas["supera_costes"].map({True: "Bonificado > costes", False: ""})
+            ).str.strip()
+            st.dataframe(tabla, use_container_width=True, hide_index=True)
+        if resumen["con_avisos"]:
+            st.warning(f"⚠️ {resumen['con_avisos']} empresa(s) con costes o bonificaciones fuera de límites")
         
-        for empresa_grupo in empresas_validas:
-            empresa_data = empresa_grupo.get("empresa", {})
-            tipo_icon = {"GESTORA": "🏛️", "CLIENTE_GESTOR": "🏢", "CLIENTE_SAAS": "💼"}.get(
-                empresa_data.get("tipo_empresa", ""), "🏢"
-            )
-            nombre_empresa = empresa_data.get("nombre", "Sin nombre")
-            nombre_tab = f"{tipo_icon} {nombre_empresa[:20]}..."
-            empresa_nombres.append(nombre_tab)
-            empresa_data_map[nombre_tab] = empresa_grupo
+        # PESTAÑAS PARA CADA EMPRESA
+        iconos = {"GESTORA": "🏛️", "CLIENTE_GESTOR": "🏢", "CLIENTE_SAAS": "💼"}
+        empresa_grupo_ids = libro.empresas["empresa_grupo_id"].tolist()
+        nombres_tab = (libro.empresas["tipo_empresa"].map(iconos).fillna("🏢") + " "
+                       + libro.empresas["nombre"].str.slice(0, 20) + "...").tolist()
         
-        # Crear tabs dinámicas
-        if len(empresa_nombres) == 1:
-            procesar_empresa_individual_schema_real(grupos_service, empresa_data_map[empresa_nombres[0]], tarifa_max, horas, participantes, modalidad)
+        if len(empresa_grupo_ids) == 1:
+            procesar_empresa_individual_schema_real(grupos_service, libro, empresa_grupo_ids[0])
         else:
-            tabs_empresas = st.tabs(empresa_nombres)
-            for i, tab in enumerate(tabs_empresas):
+            for tab, empresa_grupo_id in zip(st.tabs(nombres_tab), empresa_grupo_ids):
                 with tab:
-                    empresa_data = empresa_data_map[empresa_nombres[i]]
-                    procesar_empresa_individual_schema_real(grupos_service, empresa_data, tarifa_max, horas, participantes, modalidad)
+                    procesar_empresa_individual_schema_real(grupos_service, libro, empresa_grupo_id)
         
     except Exception as e:
         st.error(f"❌ Error en sección de costes por empresa: {e}")
@@ -1623,71 +1529,39 @@ def mostrar_seccion_costes_por_empresa_schema_real(grupos_service, grupo_id):
             st.code(traceback.format_exc())
 
 
-def procesar_empresa_individual_schema_real(grupos_service, empresa_grupo_data, tarifa_max, horas, participantes, modalidad):
+def procesar_empresa_individual_schema_real(grupos_service, libro, empresa_grupo_id):
     """
-    CORREGIDO: Procesamiento individual usando campos exactos del schema.
+    Costes y bonificaciones de una empresa del grupo. Los guardados se aplican
+    sobre el libro de costes, que no se vuelve a consultar.
     """
-    # VALIDACIONES INICIALES ROBUSTAS
-    if not empresa_grupo_data or not isinstance(empresa_grupo_data, dict):
+    empresa = libro.empresa(empresa_grupo_id)
+    if not empresa:
         st.error("❌ Datos de empresa-grupo no válidos")
         return
-        
-    empresa_grupo_id = empresa_grupo_data.get("id")
-    if not empresa_grupo_id:
-        st.error("❌ ID de empresa-grupo no encontrado")
-        return
-
-    empresa_data = empresa_grupo_data.get("empresa", {})
-    if not isinstance(empresa_data, dict):
-        st.error("❌ Datos de empresa no válidos")
-        return
-        
-    empresa_nombre = empresa_data.get("nombre", "Sin nombre")
-    empresa_tipo = empresa_data.get("tipo_empresa", "N/D")
-    empresa_cif = empresa_data.get("cif", "N/A")
+    
+    horas, participantes, tarifa_max = libro.horas, libro.participantes, libro.tarifa_max
 
     # Header
-    st.markdown(f"#### 🏢 {empresa_nombre}")
-    st.caption(f"Tipo: {empresa_tipo} | CIF: {empresa_cif}")
+    st.markdown(f"#### 🏢 {empresa['nombre']}")
+    st.caption(f"Tipo: {empresa['tipo_empresa']} | CIF: {empresa['cif']}")
 
     # === COSTES DE ESTA EMPRESA (tabla empresa_grupo_costes) ===
     st.markdown("##### 💳 Costes de Formación")
 
-    try:
-        # USAR CAMPOS EXACTOS DEL SCHEMA
-        costes_empresa_res = grupos_service.supabase.table("empresa_grupo_costes").select("*").eq("empresa_grupo_id", empresa_grupo_id).execute()
-        costes_actuales = (costes_empresa_res.data[0] if costes_empresa_res.data else None) or {}
-    except Exception as e:
-        st.warning(f"⚠️ Error al cargar costes: {e}")
-        costes_actuales = {}
-
-    # DEFINIR VARIABLES FUERA DEL FORMULARIO PARA ACCESO GLOBAL
-    costes_directos_inicial = float(costes_actuales.get("costes_directos", 0) or 0)
-    costes_indirectos_inicial = float(costes_actuales.get("costes_indirectos", 0) or 0)
-    costes_organizacion_inicial = float(costes_actuales.get("costes_organizacion", 0) or 0)
-    costes_salariales_inicial = float(costes_actuales.get("costes_salariales", 0) or 0)
-    cofinanciacion_privada_inicial = float(costes_actuales.get("cofinanciacion_privada", 0) or 0)
-    tarifa_hora_inicial = float(costes_actuales.get("tarifa_hora", tarifa_max) or tarifa_max)
-    
-    # CALCULAR TOTALES INICIALES
-    total_costes_empresa = costes_directos_inicial + costes_indirectos_inicial + costes_organizacion_inicial + costes_salariales_inicial
-    limite_calculado_empresa = tarifa_hora_inicial * horas * participantes
-
     with st.form(f"costes_empresa_{empresa_grupo_id}", clear_on_submit=False):
         col1, col2 = st.columns(2)
 
         with col1:
-            # USAR NOMBRES EXACTOS DEL SCHEMA
             costes_directos = st.number_input(
                 "💼 Costes Directos (€)",
-                value=costes_directos_inicial,
+                value=empresa["costes_directos"],
                 min_value=0.0,
                 key=f"directos_emp_{empresa_grupo_id}"
             )
 
             costes_indirectos = st.number_input(
                 "📋 Costes Indirectos (€)",
-                value=costes_indirectos_inicial,
+                value=empresa["costes_indirectos"],
                 min_value=0.0,
                 help="Máximo 30% de costes directos",
                 key=f"indirectos_emp_{empresa_grupo_id}"
@@ -1695,7 +1569,7 @@ def procesar_empresa_individual_schema_real(grupos_service, empresa_grupo_data,
 
             costes_organizacion = st.number_input(
                 "🏢 Costes Organización (€)",
-                value=costes_organizacion_inicial,
+                value=empresa["costes_organizacion"],
                 min_value=0.0,
                 key=f"organizacion_emp_{empresa_grupo_id}"
             )
@@ -1703,28 +1577,37 @@ def procesar_empresa_individual_schema_real(grupos_service, empresa_grupo_data,
         with col2:
             costes_salariales = st.number_input(
                 "👥 Costes Salariales (€)",
-                value=costes_salariales_inicial,
+                value=empresa["costes_salariales"],
                 min_value=0.0,
                 key=f"salariales_emp_{empresa_grupo_id}"
             )
 
             cofinanciacion_privada = st.number_input(
                 "🏦 Cofinanciación Privada (€)",
-                value=cofinanciacion_privada_inicial,
+                value=empresa["cofinanciacion_privada"],
                 min_value=0.0,
                 key=f"cofinanciacion_emp_{empresa_grupo_id}"
             )
 
             tarifa_hora = st.number_input(
                 "⏰ Tarifa por Hora (€)",
-                value=tarifa_hora_inicial,
+                value=min(empresa["tarifa_hora"], tarifa_max),
                 min_value=0.0,
                 max_value=tarifa_max,
                 help=f"Máximo FUNDAE: {tarifa_max} €/h",
                 key=f"tarifa_emp_{empresa_grupo_id}"
             )
 
-        # RECALCULAR TOTALES CON VALORES DEL FORMULARIO
+        valores = {
+            "costes_directos": costes_directos,
+            "costes_indirectos": costes_indirectos,
+            "costes_organizacion": costes_organizacion,
+            "costes_salariales": costes_salariales,
+            "cofinanciacion_privada": cofinanciacion_privada,
+            "tarifa_hora": tarifa_hora,
+        }
+
+        # Totales con los valores del formulario
         total_costes_formulario = costes_directos + costes_indirectos + costes_organizacion + costes_salariales
         limite_calculado_formulario = tarifa_hora * horas * participantes
 
@@ -1739,15 +1622,7 @@ def procesar_empresa_individual_schema_real(grupos_service, empresa_grupo_data,
             st.metric("📊 Diferencia", f"{diferencia:,.2f} €")
 
         # Validaciones
-        errores_empresa = []
-        if costes_directos > 0:
-            pct_indirectos = (costes_indirectos / costes_directos) * 100
-            if pct_indirectos > 30:
-                errores_empresa.append(f"Costes indirectos ({pct_indirectos:.1f}%) superan el 30% permitido")
-
-        if tarifa_hora > tarifa_max:
-            errores_empresa.append(f"Tarifa/hora ({tarifa_hora:.2f}€) supera el máximo ({tarifa_max:.2f}€)")
-
+        errores_empresa = libro.errores_costes(valores)
         if errores_empresa:
             st.error("❌ Errores encontrados:")
             for err in errores_empresa:
@@ -1756,112 +1631,55 @@ def procesar_empresa_individual_schema_real(grupos_service, empresa_grupo_data,
         submit_costes = st.form_submit_button("💾 Guardar Costes", type="primary", disabled=bool(errores_empresa))
 
         if submit_costes and not errores_empresa:
-            # USAR CAMPOS EXACTOS DEL SCHEMA
-            datos_costes_empresa = {
-                "empresa_grupo_id": empresa_grupo_id,
-                "costes_directos": costes_directos,
-                "costes_indirectos": costes_indirectos,
-                "costes_organizacion": costes_organizacion,
-                "costes_salariales": costes_salariales,
-                "cofinanciacion_privada": cofinanciacion_privada,
-                "tarifa_hora": tarifa_hora,
-                "modalidad": modalidad,  # Campo según schema
-                "total_costes_formacion": total_costes_formulario,
-                "limite_maximo_bonificacion": limite_calculado_formulario,
-                "observaciones": None,  # Campo según schema
-                "updated_at": "now()"
-            }
-            
-            try:
-                if costes_actuales and costes_actuales.get("id"):
-                    # ACTUALIZAR EXISTENTE
-                    res = grupos_service.supabase.table("empresa_grupo_costes").update(datos_costes_empresa).eq("empresa_grupo_id", empresa_grupo_id).execute()
-                else:
-                    # CREAR NUEVO - incluir created_at
-                    datos_costes_empresa["created_at"] = "now()"
-                    res = grupos_service.supabase.table("empresa_grupo_costes").insert(datos_costes_empresa).execute()
-
-                if res.data:
-                    st.success(f"✅ Costes de {empresa_nombre} guardados correctamente")
-                    # ACTUALIZAR VARIABLES GLOBALES
-                    total_costes_empresa = total_costes_formulario
-                    limite_calculado_empresa = limite_calculado_formulario
-                    st.rerun()
-                else:
-                    st.error("❌ Error al guardar costes - sin datos devueltos")
-            except Exception as e:
-                st.error(f"❌ Error al guardar costes: {e}")
+            resultado = libro.guardar_costes(grupos_service.supabase, {empresa_grupo_id: valores})
+            if resultado.get(empresa_grupo_id) == "guardado":
+                st.success(f"✅ Costes de {empresa['nombre']} guardados correctamente")
+                st.rerun()
+            else:
+                st.error(f"❌ Error al guardar costes: {resultado.get(empresa_grupo_id)}")
 
     # === BONIFICACIONES MENSUALES (FUERA DEL FORMULARIO) ===
     st.divider()
     st.markdown("##### 📅 Bonificaciones Mensuales")
 
-    try:
-        # USAR CAMPOS EXACTOS DEL SCHEMA: mes es INTEGER, no VARCHAR
-        bonificaciones_empresa_res = grupos_service.supabase.table("empresa_grupo_bonificaciones").select("*").eq("empresa_grupo_id", empresa_grupo_id).order("mes").execute()
-        df_bonif_empresa = pd.DataFrame(bonificaciones_empresa_res.data or [])
-    except Exception as e:
-        st.warning(f"⚠️ Error al cargar bonificaciones: {e}")
-        df_bonif_empresa = pd.DataFrame()
-
-    # Cálculos seguros de bonificaciones
-    try:
-        if not df_bonif_empresa.empty:
-            df_bonif_empresa["importe"] = pd.to_numeric(df_bonif_empresa["importe"], errors="coerce").fillna(0.0)
-            df_bonif_empresa["mes"] = pd.to_numeric(df_bonif_empresa["mes"], errors="coerce").fillna(1).astype(int)
-            total_bonificado_empresa = df_bonif_empresa["importe"].sum()
-        else:
-            total_bonificado_empresa = 0.0
-    except Exception as e:
-        st.warning(f"⚠️ Error al procesar bonificaciones: {e}")
-        total_bonificado_empresa = 0.0
-
-    disponible_empresa = total_costes_empresa - total_bonificado_empresa
+    df_bonif_empresa = libro.bonificaciones_de(empresa_grupo_id)
+    disponible_empresa = empresa["disponible"]
 
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("💰 Costes Empresa", f"{total_costes_empresa:,.2f} €")
+        st.metric("💰 Costes Empresa", f"{empresa['total_costes']:,.2f} €")
     with col2:
-        st.metric("📊 Ya Bonificado", f"{total_bonificado_empresa:,.2f} €")
+        st.metric("📊 Ya Bonificado", f"{empresa['bonificado']:,.2f} €")
     with col3:
         st.metric("💡 Disponible", f"{disponible_empresa:,.2f} €")
 
-    # Mostrar bonificaciones existentes (FUERA DE CUALQUIER FORMULARIO)
+    if empresa["supera_limite"]:
+        st.warning(f"⚠️ Lo bonificado supera el límite calculado ({empresa['limite']:,.2f} €)")
+
+    # Bonificaciones existentes
     if not df_bonif_empresa.empty:
         st.markdown("###### 📋 Bonificaciones Registradas")
-        for _, bonif in df_bonif_empresa.iterrows():
-            with st.container(border=True):
-                col1, col2, col3, col4 = st.columns([2, 2, 3, 1])
-                with col1:
-                    mes_val = bonif.get("mes", 1)
-                    try:
-                        mes_num = int(mes_val) if mes_val else 1
-                        mes_nombre = ["", "Enero","Febrero","Marzo","Abril","Mayo","Junio","Julio",
-                                      "Agosto","Septiembre","Octubre","Noviembre","Diciembre"][mes_num]
-                    except (IndexError, ValueError, TypeError):
-                        mes_nombre = "N/D"
-                    st.write(f"📅 {mes_nombre}")
-                    
-                with col2:
-                    importe_val = bonif.get("importe", 0)
-                    try:
-                        importe_num = float(importe_val) if importe_val is not None else 0.0
-                    except (ValueError, TypeError):
-                        importe_num = 0.0
-                    st.write(f"💰 {importe_num:.2f} €")
-                    
-                with col3:
-                    observaciones = bonif.get("observaciones") or ""
-                    st.caption(f"📝 {str(observaciones)[:30]}...")
-                    
-                with col4:
-                    bonif_id = bonif.get("id")
-                    if bonif_id and st.button("❌", key=f"del_bonif_emp_{bonif_id}", help="Eliminar bonificación"):
-                        try:
-                            grupos_service.supabase.table("empresa_grupo_bonificaciones").delete().eq("id", bonif_id).execute()
-                            st.rerun()
-                        except Exception as e:
-                            st.error(f"Error al eliminar: {e}")
+        tabla_bonif = pd.DataFrame({
+            "📅 Mes": df_bonif_empresa["mes_nombre"],
+            "💰 Importe (€)": df_bonif_empresa["importe"].round(2),
+            "📝 Observaciones": df_bonif_empresa["observaciones"].fillna(""),
+        })
+        st.dataframe(tabla_bonif, use_container_width=True, hide_index=True)
+        
+        opciones_bonif = dict(zip(
+            df_bonif_empresa["mes_nombre"] + " - " + df_bonif_empresa["importe"].map("{:.2f} €".format),
+            df_bonif_empresa["id"]
+        ))
+        a_eliminar = st.multiselect(
+            "Bonificaciones a eliminar",
+            options=list(opciones_bonif.keys()),
+            key=f"del_bonif_emp_{empresa_grupo_id}"
+        )
+        if a_eliminar and st.button("❌ Eliminar seleccionadas", key=f"btn_del_bonif_emp_{empresa_grupo_id}"):
+            borradas = libro.eliminar_bonificaciones(grupos_service.supabase, [opciones_bonif[b] for b in a_eliminar])
+            if borradas:
+                st.success(f"✅ {borradas} bonificación(es) eliminada(s)")
+                st.rerun()
 
     # Añadir nueva bonificación (CON SU PROPIO FORMULARIO INDEPENDIENTE)
     with st.expander("➕ Añadir Bonificación Mensual"):
@@ -1869,18 +1687,16 @@ def procesar_empresa_individual_schema_real(grupos_service, empresa_grupo_data,
             col1, col2 = st.columns(2)
 
             with col1:
-                # Meses disponibles (que no estén ya usados) - USAR INTEGER
-                meses_usados = df_bonif_empresa["mes"].tolist() if not df_bonif_empresa.empty else []
-                meses_disponibles = [m for m in range(1, 13) if m not in meses_usados]
+                meses_disponibles = libro.meses_libres(empresa_grupo_id)
                 
                 if not meses_disponibles:
                     st.warning("⚠️ Ya hay bonificaciones para todos los meses")
-                    mes_bonif = 1
+                    mes_bonif = None
                 else:
                     mes_bonif = st.selectbox(
                         "📅 Mes",
                         options=meses_disponibles,
-                        format_func=lambda x: f"{x:02d} - {['Enero','Febrero','Marzo','Abril','Mayo','Junio','Julio','Agosto','Septiembre','Octubre','Noviembre','Diciembre'][x-1]}",
+                        format_func=lambda x: f"{x:02d} - {nombre_mes(x)}",
                         key=f"mes_nueva_bonif_emp_{empresa_grupo_id}"
                     )
                 
@@ -1900,31 +1716,18 @@ def procesar_empresa_individual_schema_real(grupos_service, empresa_grupo_data,
                     key=f"obs_nueva_bonif_emp_{empresa_grupo_id}"
                 )
 
-            # USAR st.form_submit_button EN LUGAR DE st.button
-            if st.form_submit_button("➕ Añadir Bonificación", type="primary"):
-                if importe_bonif <= 0:
-                    st.error("❌ El importe debe ser mayor que 0")
-                elif importe_bonif > disponible_empresa:
-                    st.error(f"❌ El importe ({importe_bonif:.2f} €) supera lo disponible ({disponible_empresa:.2f} €)")
-                else:
-                    # USAR CAMPOS EXACTOS DEL SCHEMA
-                    datos_bonif = {
-                        "empresa_grupo_id": empresa_grupo_id,
-                        "mes": mes_bonif,  # INTEGER según schema
-                        "importe": importe_bonif,
-                        "observaciones": observaciones_bonif or None,
-                        "created_at": "now()",
-                        "updated_at": "now()"
-                    }
-                    try:
-                        res = grupos_service.supabase.table("empresa_grupo_bonificaciones").insert(datos_bonif).execute()
-                        if res.data:
-                            st.success("✅ Bonificación añadida correctamente")
-                            st.rerun()
-                        else:
-                            st.error("❌ Error al añadir bonificación - sin datos devueltos")
-                    except Exception as e:
-                        st.error(f"❌ Error al añadir bonificación: {e}")
+            if st.form_submit_button("➕ Añadir Bonificación", type="primary") and mes_bonif:
+                guardadas, errores = libro.guardar_bonificaciones(grupos_service.supabase, [{
+                    "empresa_grupo_id": empresa_grupo_id,
+                    "mes": mes_bonif,
+                    "importe": importe_bonif,
+                    "observaciones": observaciones_bonif or None,
+                }])
+                for error in errores:
+                    st.error(f"❌ {error}")
+                if guardadas:
+                    st.success("✅ Bonificación añadida correctamente")
+                    st.rerun()
 
 # =========================
 # 2. IMPLEMENTAR FILTROS AVANZADOS STREAMLIT 1.49
@@ -2175,7 +1978,7 @@ def render(supabase, session_state):
     grupos_service = get_grupos_service(supabase, session_state)
     
     # Crear tabs principales siguiendo el patrón de participantes
-    tabs = st.tabs(["📋 Listado", "➕ Crear"])
+    tabs = st.tabs(["📋 Listado", "➕ Crear", "💳 Crédito FUNDAE"])
     
     # ========================= 
     # TAB 1: LISTADO (Estilo consistente)
@@ -2234,7 +2037,9 @@ def render(supabase, session_state):
 
             # Mostrar formulario de edición si hay selección
             if seleccionado is not None:
-                with st.container(border=True):
+                etiqueta = f"grupo={(st.session_state.get('grupo_seleccionado') or {}).get('id')}"
+                with st.container(border=True), \
+                        medir_peticiones(grupos_service.supabase, etiqueta, MAX_PETICIONES_DETALLE):
                     grupo_id = mostrar_formulario_grupo_separado(
                         grupos_service, es_creacion=False, context="_editar"
                     )
@@ -2253,6 +2058,85 @@ def render(supabase, session_state):
             mostrar_formulario_grupo_separado(
                 grupos_service, es_creacion=True, context="_crear"
             )
+
+    # =========================
+    # TAB 3: CONSUMO DE CRÉDITO POR EMPRESA
+    # =========================
+    with tabs[2]:
+        mostrar_consumo_credito(grupos_service)
+
+def mostrar_consumo_credito(grupos_service):
+    """Costes y bonificaciones de cada empresa sumando todos sus grupos del ejercicio."""
+    st.markdown("### 💳 Consumo de Crédito FUNDAE por Empresa")
+    st.caption("Costes, límite y bonificado de todos los grupos del ejercicio (año de inicio del grupo)")
+    
+    año_actual = datetime.now().year
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        año = st.selectbox("Ejercicio", list(range(año_actual, año_actual - 6, -1)), key="credito_año")
+    with col2:
+        buscar = st.text_input("🔍 Buscar empresa", key="credito_buscar")
+    
+    motor = get_motor_credito()
+    gestor_id = grupos_service.empresa_id if grupos_service.rol == "gestor" else None
+    try:
+        df_empresas = motor.por_empresa(grupos_service.supabase, año, gestor_id)
+        df_alertas = motor.alertas(grupos_service.supabase, año, gestor_id)
+    except Exception as e:
+        st.error(f"❌ Error al calcular el consumo de crédito: {e}")
+        return
+    
+    if df_empresas.empty:
+        st.info(f"📋 No hay empresas con grupos iniciados en {año}.")
+        return
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("🏢 Empresas", len(df_empresas))
+    with col2:
+        st.metric("💰 Límite", f"{df_empresas['limite'].sum():,.2f} €")
+    with col3:
+        st.metric("📊 Bonificado", f"{df_empresas['bonificado'].sum():,.2f} €")
+    with col4:
+        st.metric("🚨 Alertas", len(df_alertas))
+    
+    if not df_alertas.empty:
+        etiquetas = {"excedido": "🔴 Límite superado", "sin_costes": "🟠 Bonificado sin costes",
+                     "aviso": "🟡 Cerca del límite"}
+        with st.expander(f"🚨 Empresas con alertas ({len(df_alertas)})", expanded=True):
+            st.dataframe(pd.DataFrame({
+                "Alerta": df_alertas["nivel"].map(etiquetas),
+                "Empresa": df_alertas["empresa_nombre"],
+                "Límite (€)": df_alertas["limite"].round(2),
+                "Bonificado (€)": df_alertas["bonificado"].round(2),
+                "Consumo (%)": df_alertas["pct_consumo"],
+                "Grupos excedidos": df_alertas["grupos_excedidos"],
+            }), use_container_width=True, hide_index=True)
+    
+    if buscar:
+        texto = buscar.lower()
+        df_empresas = df_empresas[
+            df_empresas["empresa_nombre"].str.lower().str.contains(texto, regex=False)
+            | df_empresas["empresa_cif"].str.lower().str.contains(texto, regex=False)
+        ]
+    
+    st.dataframe(df_empresas.rename(columns={
+        "empresa_nombre": "Empresa", "empresa_cif": "CIF", "grupos": "Grupos", "costes": "Costes (€)",
+        "limite": "Límite (€)", "bonificado": "Bonificado (€)", "disponible": "Disponible (€)",
+        "pct_consumo": "Consumo (%)", "grupos_excedidos": "Grupos excedidos"
+    }).drop(columns="empresa_id"), use_container_width=True, hide_index=True)
+    
+    with st.expander("📅 Bonificado por mes"):
+        por_mes = motor.por_mes(grupos_service.supabase, año, gestor_id)
+        if por_mes.empty:
+            st.info("No hay bonificaciones registradas en el ejercicio.")
+        else:
+            por_mes.columns = [nombre_mes(m)[:3] for m in por_mes.columns]
+            st.dataframe(por_mes.round(2), use_container_width=True)
+    
+    if st.button("🔄 Recalcular", key="credito_recalcular"):
+        motor.invalidar([año])
+        st.rerun()
         
 def mostrar_tabla_grupos_consistente(df_grupos, session_state, grupos_service):
     """Tabla de grupos usando las métricas y funcionalidad existente."""
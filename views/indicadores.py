@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
+from services.calidad_service import get_calidad_service
 
 def render(supabase, session_state):
     st.subheader("📈 Indicadores de Calidad ISO 9001")
@@ -28,24 +29,6 @@ def render(supabase, session_state):
         st.warning("🔒 No tienes permisos para acceder a esta sección.")
         st.stop()
 
-    # =========================
-    # Cargar datos
-    # =========================
-    try:
-        if session_state.role == "gestor":
-            df_nc = pd.DataFrame(supabase.table("no_conformidades").select("*").eq("empresa_id", empresa_id).execute().data or [])
-            df_ac = pd.DataFrame(supabase.table("acciones_correctivas").select("*").eq("empresa_id", empresa_id).execute().data or [])
-            df_aud = pd.DataFrame(supabase.table("auditorias").select("*").eq("empresa_id", empresa_id).execute().data or [])
-        else:
-            df_nc = pd.DataFrame(supabase.table("no_conformidades").select("*").execute().data or [])
-            df_ac = pd.DataFrame(supabase.table("acciones_correctivas").select("*").execute().data or [])
-            df_aud = pd.DataFrame(supabase.table("auditorias").select("*").execute().data or [])
-    except Exception as e:
-        st.error(f"❌ Error al cargar datos: {e}")
-        df_nc = pd.DataFrame()
-        df_ac = pd.DataFrame()
-        df_aud = pd.DataFrame()
-
     # =========================
     # Filtro por fecha
     # =========================
@@ -54,38 +37,31 @@ def render(supabase, session_state):
     fecha_inicio = col1.date_input("Desde", datetime(datetime.now().year, 1, 1))
     fecha_fin = col2.date_input("Hasta", datetime.today())
 
-    def filtrar_por_fecha(df, campo_fecha):
-        if campo_fecha in df.columns:
-            df[campo_fecha] = pd.to_datetime(df[campo_fecha], errors="coerce")
-            return df[(df[campo_fecha] >= pd.to_datetime(fecha_inicio)) & (df[campo_fecha] <= pd.to_datetime(fecha_fin))]
-        return df
-
-    df_nc = filtrar_por_fecha(df_nc, "fecha_detectada")
-    df_ac = filtrar_por_fecha(df_ac, "fecha_inicio")
-    df_aud = filtrar_por_fecha(df_aud, "fecha")
+    # =========================
+    # Cargar datos (proyectados, filtrados en servidor y cacheados por empresa/periodo)
+    # =========================
+    calidad_service = get_calidad_service(supabase, session_state)
+    datos = calidad_service.get_datos_calidad(calidad_service.get_empresa_filtro(), fecha_inicio, fecha_fin)
+    df_nc, df_ac, df_aud = datos["nc"], datos["ac"], datos["aud"]
+    kpis = datos["kpis"]
 
     # =========================
     # KPIs
     # =========================
     st.markdown("### 📊 KPIs de Calidad")
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("NC Abiertas", len(df_nc[df_nc["estado"] == "Abierta"]) if "estado" in df_nc.columns else 0)
-    col2.metric("NC Cerradas", len(df_nc[df_nc["estado"] == "Cerrada"]) if "estado" in df_nc.columns else 0)
-    col3.metric("AC Cerradas", len(df_ac[df_ac["estado"] == "Cerrada"]) if "estado" in df_ac.columns else 0)
-    col4.metric("Auditorías Realizadas", len(df_aud))
+    col1.metric("NC Abiertas", kpis["nc_abiertas"])
+    col2.metric("NC Cerradas", kpis["nc_cerradas"])
+    col3.metric("AC Cerradas", kpis["ac_cerradas"])
+    col4.metric("Auditorías Realizadas", kpis["auditorias_total"])
 
     # =========================
     # Tiempo medio de resolución de NC
     # =========================
-    if "fecha_detectada" in df_nc.columns and "fecha_cierre" in df_nc.columns:
-        df_nc["fecha_detectada"] = pd.to_datetime(df_nc["fecha_detectada"], errors="coerce")
-        df_nc["fecha_cierre"] = pd.to_datetime(df_nc["fecha_cierre"], errors="coerce")
-        df_nc["dias_resolucion"] = (df_nc["fecha_cierre"] - df_nc["fecha_detectada"]).dt.days
-        tiempo_medio = df_nc["dias_resolucion"].mean(skipna=True)
-        if pd.notnull(tiempo_medio):
-            st.metric("⏱️ Tiempo medio de resolución (días)", round(tiempo_medio, 1))
-        else:
-            st.metric("⏱️ Tiempo medio de resolución (días)", "N/D")
+    if kpis["tiempo_medio_resolucion"] is not None:
+        st.metric("⏱️ Tiempo medio de resolución (días)", round(kpis["tiempo_medio_resolucion"], 1))
+    else:
+        st.metric("⏱️ Tiempo medio de resolución (días)", "N/D")
 
     # =========================
     # Tablas de detalle
@@ -1,6 +1,6 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime
+from services.calidad_service import get_calidad_service
 from utils import generar_pdf  # Asegúrate de tener esta función en utils.py
 
 def render(supabase, session_state):
@@ -34,36 +34,24 @@ def render(supabase, session_state):
     fecha_inicio = col1.date_input("Desde", datetime(datetime.now().year, 1, 1))
     fecha_fin = col2.date_input("Hasta", datetime.today())
 
-    def filtrar(df, campo):
-        if campo in df.columns:
-            df[campo] = pd.to_datetime(df[campo], errors="coerce")
-            return df[(df[campo] >= pd.to_datetime(fecha_inicio)) & (df[campo] <= pd.to_datetime(fecha_fin))]
-        return df
-
     # =========================
-    # Cargar y filtrar datos
+    # Cargar datos (proyectados, filtrados en servidor y cacheados por empresa/periodo)
     # =========================
-    def cargar(tabla):
-        query = supabase.table(tabla).select("*")
-        if empresa_id:
-            query = query.eq("empresa_id", empresa_id)
-        return pd.DataFrame(query.execute().data or [])
-
-    df_nc = filtrar(cargar("no_conformidades"), "fecha_detectada")
-    df_ac = filtrar(cargar("acciones_correctivas"), "fecha_inicio")
-    df_aud = filtrar(cargar("auditorias"), "fecha")
-    df_obj = cargar("objetivos_calidad")
-    df_seg = cargar("seguimiento_objetivos")
+    calidad_service = get_calidad_service(supabase, session_state)
+    datos = calidad_service.get_datos_calidad(empresa_id, fecha_inicio, fecha_fin)
+    df_nc, df_ac, df_aud = datos["nc"], datos["ac"], datos["aud"]
+    df_obj, df_seg = datos["obj"], datos["seg"]
+    kpis = datos["kpis"]
 
     # =========================
     # KPIs
     # =========================
     st.markdown("### 📊 Resumen de Indicadores")
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("NC Abiertas", len(df_nc[df_nc["estado"] == "Abierta"]) if "estado" in df_nc else 0)
-    col2.metric("NC Cerradas", len(df_nc[df_nc["estado"] == "Cerrada"]) if "estado" in df_nc else 0)
-    col3.metric("AC Cerradas", len(df_ac[df_ac["estado"] == "Cerrada"]) if "estado" in df_ac else 0)
-    col4.metric("Auditorías", len(df_aud))
+    col1.metric("NC Abiertas", kpis["nc_abiertas"])
+    col2.metric("NC Cerradas", kpis["nc_cerradas"])
+    col3.metric("AC Cerradas", kpis["ac_cerradas"])
+    col4.metric("Auditorías", kpis["auditorias_total"])
 
     # =========================
     # Tablas de detalle
@@ -90,16 +78,15 @@ def render(supabase, session_state):
         Periodo: {fecha_inicio.strftime('%d/%m/%Y')} - {fecha_fin.strftime('%d/%m/%Y')}
 
         Indicadores:
-        - No Conformidades Abiertas: {len(df_nc[df_nc["estado"] == "Abierta"]) if "estado" in df_nc else 0}
-        - No Conformidades Cerradas: {len(df_nc[df_nc["estado"] == "Cerrada"]) if "estado" in df_nc else 0}
-        - Acciones Correctivas Cerradas: {len(df_ac[df_ac["estado"] == "Cerrada"]) if "estado" in df_ac else 0}
-        - Auditorías Realizadas: {len(df_aud)}
+        - No Conformidades Abiertas: {kpis["nc_abiertas"]}
+        - No Conformidades Cerradas: {kpis["nc_cerradas"]}
+        - Acciones Correctivas Cerradas: {kpis["ac_cerradas"]}
+        - Auditorías Realizadas: {kpis["auditorias_total"]}
 
         Objetivos de Calidad:
         """
-        for _, obj in df_obj.iterrows():
-            segs = df_seg[df_seg["objetivo_id"] == obj["id"]]
-            valor = segs.sort_values("fecha", ascending=False)["valor_real"].iloc[0] if not segs.empty else "Sin seguimiento"
+        for obj in datos["objetivos"].to_dict("records"):
+            valor = obj["ultimo_valor"] if obj["semaforo"] != "⚪" else "Sin seguimiento"
             contenido += f"\n- {obj['nombre']} → Meta: {obj['meta']} → Último valor: {valor}"
 
         pdf_buffer = generar_pdf(f"informe_auditoria_{empresa_nombre}.pdf", contenido=contenido)
@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
+from services.calidad_service import get_calidad_service
 
 def render(supabase, session_state):
     st.subheader("🚨 No Conformidades (ISO 9001)")
@@ -117,6 +118,7 @@ def render(supabase, session_state):
                                         "estado": nuevo_estado,
                                         "acciones": nuevas_acciones
                                     }).eq("id", row["id"]).execute()
+                                    get_calidad_service(supabase, session_state).limpiar_cache_calidad()
                                     st.success("✅ Cambios guardados.")
                                     st.rerun()
 
@@ -127,6 +129,7 @@ def render(supabase, session_state):
                             eliminar = st.form_submit_button("Eliminar")
                             if eliminar and confirmar:
                                 supabase.table("no_conformidades").delete().eq("id", row["id"]).execute()
+                                get_calidad_service(supabase, session_state).limpiar_cache_calidad()
                                 st.success("✅ Eliminada.")
                                 st.rerun()
     else:
@@ -159,5 +162,6 @@ def render(supabase, session_state):
                     if session_state.role == "gestor":
                         data["empresa_id"] = session_state.user.get("empresa_id")
                     supabase.table("no_conformidades").insert(data).execute()
+                    get_calidad_service(supabase, session_state).limpiar_cache_calidad()
                     st.success("✅ No conformidad registrada.")
                     st.rerun()
@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime
+from services.calidad_service import get_calidad_service
 
 def render(supabase, session_state):
     st.subheader("🎯 Objetivos de Calidad (ISO 9001)")
@@ -91,6 +92,7 @@ def render(supabase, session_state):
                             if session_state.role == "gestor":
                                 seguimiento_data["empresa_id"] = empresa_id
                             supabase.table("seguimiento_objetivos").insert(seguimiento_data).execute()
+                            get_calidad_service(supabase, session_state).limpiar_cache_calidad()
                             st.success("✅ Avance registrado.")
                             st.rerun()
 
@@ -127,6 +129,7 @@ def render(supabase, session_state):
                     if session_state.role == "gestor":
                         objetivo_data["empresa_id"] = empresa_id
                     supabase.table("objetivos_calidad").insert(objetivo_data).execute()
+                    get_calidad_service(supabase, session_state).limpiar_cache_calidad()
                     st.success("✅ Objetivo añadido.")
                     st.rerun()
       
@@ -5,6 +5,8 @@ import plotly.graph_objects as go
 import plotly.express as px
 from components.tailadmin_dashboard import TailAdminDashboard
 from components.tailadmin_forms import TailAdminForms
+from components.panel_jobs import lanzar_job, panel_job
+from services.almacenamiento_service import REFERENCIAS_STORAGE
 
 def render(supabase, session_state):
     """Panel de Administración rediseñado con TailAdmin"""
@@ -526,6 +528,25 @@ def mostrar_estadisticas_globales(supabase, datos_globales, dashboard):
         with col:
             colores = ['#3B82F6', '#10B981', '#F59E0B', '#8B5CF6']
             dashboard.metric_card_secondary(modulo, str(count), "✓", colores[i])
+    
+    # === MANTENIMIENTO DE ALMACENAMIENTO ===
+    st.markdown("<br>", unsafe_allow_html=True)
+    dashboard.section_header("Archivos huérfanos", "Objetos de Storage que ya no referencia ningún registro", "🧹")
+    
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        buckets = st.multiselect("Buckets", list(REFERENCIAS_STORAGE), default=list(REFERENCIAS_STORAGE))
+        dry_run = st.checkbox("Solo contar (no borrar)", value=True)
+    with col2:
+        if st.button(
+            "🧹 Limpiar huérfanos",
+            use_container_width=True,
+            disabled=not buckets or bool(st.session_state.get("job_huerfanos_storage"))
+        ):
+            lanzar_job("limpiar_huerfanos_storage", {"buckets": buckets, "dry_run": dry_run},
+                       supabase, st.session_state, "job_huerfanos_storage")
+    
+    panel_job("job_huerfanos_storage", supabase, st.session_state, titulo="Limpieza de archivos huérfanos")
 
 
 # =====================================================
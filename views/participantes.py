@@ -11,6 +11,9 @@ from services.empresas_service import get_empresas_service
 from services.grupos_service import get_grupos_service
 from services.auth_service import get_auth_service
 from services.clases_service import get_clases_service
+from components.panel_jobs import lanzar_job, panel_job
+from components.paginacion import paginador_cursor
+from services.almacenamiento_service import get_almacenamiento
 
 # =========================
 # CONFIG STREAMLIT
@@ -1071,50 +1074,7 @@ def mostrar_lista_suscripciones(clases_service, participantes_service, session_s
     st.markdown("#### 📋 Lista de Suscripciones Activas")
     
     try:
-        # Obtener participantes con suscripciones
-        df_participantes = participantes_service.get_participantes_completos()
-        
-        if session_state.role == "gestor":
-            empresa_id = session_state.user.get("empresa_id")
-            df_participantes = df_participantes[df_participantes["empresa_id"] == empresa_id]
-        
-        if df_participantes.empty:
-            st.info("📋 No hay participantes disponibles")
-            return
-        
-        # Obtener datos de suscripciones para cada participante
-        participantes_con_suscripcion = []
-        
-        for _, participante in df_participantes.iterrows():
-            suscripcion = clases_service.get_suscripcion_participante(participante["id"])
-            
-            estado = "❌ Inactiva"
-            clases_mensuales = 0
-            clases_usadas = 0
-            disponibles = 0
-            
-            if suscripcion:
-                if suscripcion.get("activa"):
-                    estado = "✅ Activa"
-                    clases_mensuales = suscripcion.get("clases_mensuales", 0)
-                    clases_usadas = suscripcion.get("clases_usadas_mes", 0)
-                    disponibles = clases_mensuales - clases_usadas
-            
-            participantes_con_suscripcion.append({
-                "id": participante["id"],
-                "nombre": f"{participante['nombre']} {participante.get('apellidos', '')}",
-                "email": participante["email"],
-                "empresa_nombre": participante.get("empresa_nombre", ""),
-                "suscripcion_activa": suscripcion.get("activa", False) if suscripcion else False,
-                "estado": estado,
-                "clases_mensuales": clases_mensuales,
-                "clases_usadas": clases_usadas,
-                "disponibles": disponibles
-            })
-        
-        df_suscripciones = pd.DataFrame(participantes_con_suscripcion)
-        
-        # Filtros
+        # Filtros (se aplican en la consulta)
         col1, col2, col3 = st.columns(3)
         
         with col1:
@@ -1136,27 +1096,30 @@ def mostrar_lista_suscripciones(clases_service, participantes_service, session_s
                 key="filtro_suscripciones_empresa"
             )
         
-        # Aplicar filtros
-        df_filtrado = df_suscripciones.copy()
-        
-        if filtro_nombre:
-            df_filtrado = df_filtrado[
-                df_filtrado["nombre"].str.contains(filtro_nombre, case=False, na=False) |
-                df_filtrado["email"].str.contains(filtro_nombre, case=False, na=False)
-            ]
-        
-        if filtro_estado == "Activas":
-            df_filtrado = df_filtrado[df_filtrado["suscripcion_activa"] == True]
-        elif filtro_estado == "Inactivas":
-            df_filtrado = df_filtrado[df_filtrado["suscripcion_activa"] == False]
-        
-        if filtro_empresa:
-            df_filtrado = df_filtrado[
-                df_filtrado["empresa_nombre"].str.contains(filtro_empresa, case=False, na=False)
-            ]
+        # Roster paginado: participante + suscripción + uso del mes en una sola consulta
+        por_pagina = 50
+        totales = {}
+
+        def cargar_pagina(cursor):
+            desplazamiento = cursor or 0
+            df, total = clases_service.get_roster_suscripciones(
+                filtro_estado, filtro_nombre, filtro_empresa,
+                limite=por_pagina, desplazamiento=desplazamiento
+            )
+            totales["total"] = total
+            siguiente = desplazamiento + por_pagina
+            return df, siguiente if siguiente < total else None
+
+        df_filtrado = paginador_cursor(
+            "roster_suscripciones",
+            (filtro_nombre, filtro_estado, filtro_empresa),
+            cargar_pagina,
+            etiqueta="participantes"
+        )
         
         # Mostrar tabla
         if not df_filtrado.empty:
+            st.caption(f"{totales.get('total', 0)} participantes coinciden con los filtros")
             st.dataframe(
                 df_filtrado[["nombre", "email", "empresa_nombre", "estado", "clases_mensuales", "clases_usadas", "disponibles"]],
                 use_container_width=True,
@@ -1172,9 +1135,47 @@ def mostrar_lista_suscripciones(clases_service, participantes_service, session_s
                 }
             )
             
-            # Resumen
-            activas = len(df_filtrado[df_filtrado["suscripcion_activa"] == True])
-            inactivas = len(df_filtrado[df_filtrado["suscripcion_activa"] == False])
+            # Acciones en bloque sobre la página
+            with st.expander("⚙️ Acciones en bloque"):
+                opciones = {f"{row['nombre']} ({row['email']})": row for _, row in df_filtrado.iterrows()}
+                seleccion = st.multiselect(
+                    "Participantes",
+                    list(opciones.keys()),
+                    key="roster_seleccion"
+                )
+                clases_bloque = st.number_input(
+                    "🎯 Clases mensuales", min_value=1, max_value=50, value=8, key="roster_clases"
+                )
+                col_act, col_upd, col_des = st.columns(3)
+                filas = [opciones[n] for n in seleccion]
+                resultados = None
+                with col_act:
+                    if st.button("🚀 Activar", disabled=not filas, use_container_width=True):
+                        resultados = clases_service.activar_suscripciones_masivo(
+                            [{"id": f["id"], "empresa_id": f["empresa_id"]} for f in filas], int(clases_bloque)
+                        )
+                with col_upd:
+                    if st.button("💾 Actualizar clases", disabled=not filas, use_container_width=True):
+                        resultados = clases_service.actualizar_suscripciones_masivo(
+                            [f["id"] for f in filas], int(clases_bloque)
+                        )
+                with col_des:
+                    if st.button("❌ Desactivar", disabled=not filas, use_container_width=True):
+                        resultados = clases_service.desactivar_suscripciones_masivo([f["id"] for f in filas])
+                if resultados is not None:
+                    errores = [r for r in resultados.values() if r.startswith("error")]
+                    omitidos = [r for r in resultados.values() if r == "sin_suscripcion"]
+                    if errores:
+                        st.error(f"❌ {len(errores)} errores: {errores[0]}")
+                    if omitidos:
+                        st.info(f"ℹ️ {len(omitidos)} sin suscripción activa")
+                    if len(errores) + len(omitidos) < len(resultados):
+                        st.rerun()
+            
+            # Resumen (sobre todo el ámbito, no solo la página)
+            df_roster = clases_service.get_roster()
+            activas = int(df_roster["suscripcion_activa"].sum())
+            inactivas = len(df_roster) - activas
             
             col1, col2, col3 = st.columns(3)
             with col1:
@@ -1182,7 +1183,7 @@ def mostrar_lista_suscripciones(clases_service, participantes_service, session_s
             with col2:
                 st.metric("❌ Inactivas", inactivas)
             with col3:
-                total_clases_usadas = df_filtrado[df_filtrado["suscripcion_activa"] == True]["clases_usadas"].sum()
+                total_clases_usadas = int(df_roster["clases_usadas"].sum())
                 st.metric("🏃‍♀️ Total Usadas", total_clases_usadas)
         
         else:
@@ -1196,33 +1197,14 @@ def mostrar_activacion_masiva_suscripciones(clases_service, participantes_servic
     st.markdown("#### 🎯 Activación Masiva de Suscripciones")
     
     try:
-        # Obtener participantes sin suscripción activa
-        df_participantes = participantes_service.get_participantes_completos()
-        
-        if session_state.role == "gestor":
-            empresa_id = session_state.user.get("empresa_id")
-            df_participantes = df_participantes[df_participantes["empresa_id"] == empresa_id]
+        # Participantes sin suscripción activa (anti-join resuelto en la consulta)
+        df_sin_suscripcion = clases_service.get_roster("Inactivas")
         
-        # Filtrar solo los que no tienen suscripción activa
-        participantes_sin_suscripcion = []
-        
-        for _, participante in df_participantes.iterrows():
-            suscripcion = clases_service.get_suscripcion_participante(participante["id"])
-            
-            if not suscripcion or not suscripcion.get("activa"):
-                participantes_sin_suscripcion.append({
-                    "id": participante["id"],
-                    "nombre": f"{participante['nombre']} {participante.get('apellidos', '')}",
-                    "email": participante["email"],
-                    "empresa_id": participante["empresa_id"],
-                    "empresa_nombre": participante.get("empresa_nombre", "")
-                })
-        
-        if not participantes_sin_suscripcion:
+        if df_sin_suscripcion.empty:
             st.success("🎉 Todos los participantes ya tienen suscripción activa")
             return
         
-        st.info(f"📋 {len(participantes_sin_suscripcion)} participantes sin suscripción activa")
+        st.info(f"📋 {len(df_sin_suscripcion)} participantes sin suscripción activa")
         
         # Configuración masiva
         col1, col2 = st.columns(2)
@@ -1238,49 +1220,33 @@ def mostrar_activacion_masiva_suscripciones(clases_service, participantes_servic
         
         with col2:
             if st.button(
-                f"🚀 Activar para {len(participantes_sin_suscripcion)} participantes",
+                f"🚀 Activar para {len(df_sin_suscripcion)} participantes",
                 type="primary",
-                use_container_width=True
+                use_container_width=True,
+                disabled=bool(st.session_state.get("job_activacion_suscripciones"))
             ):
-                with st.spinner("Activando suscripciones..."):
-                    exitos = 0
-                    errores = 0
-                    
-                    progress_bar = st.progress(0)
-                    
-                    for i, participante in enumerate(participantes_sin_suscripcion):
-                        try:
-                            success = clases_service.activar_suscripcion(
-                                participante["id"],
-                                participante["empresa_id"],
-                                clases_mensuales_masivo
-                            )
-                            
-                            if success:
-                                exitos += 1
-                            else:
-                                errores += 1
-                        
-                        except Exception as e:
-                            errores += 1
-                        
-                        # Actualizar barra de progreso
-                        progress_bar.progress((i + 1) / len(participantes_sin_suscripcion))
-                    
-                    if exitos > 0:
-                        st.success(f"✅ {exitos} suscripciones activadas correctamente")
-                    
-                    if errores > 0:
-                        st.warning(f"⚠️ {errores} errores durante la activación")
-                    
-                    if exitos > 0:
-                        st.rerun()
+                # Se ejecuta en segundo plano: sobrevive a reruns y desconexiones
+                lanzar_job(
+                    "activacion_masiva_suscripciones",
+                    {
+                        "participantes": df_sin_suscripcion[["id", "empresa_id", "nombre"]].to_dict("records"),
+                        "clases_mensuales": int(clases_mensuales_masivo)
+                    },
+                    clases_service.supabase,
+                    session_state,
+                    "job_activacion_suscripciones"
+                )
+        
+        panel_job(
+            "job_activacion_suscripciones",
+            clases_service.supabase,
+            session_state,
+            titulo="Activación masiva de suscripciones"
+        )
         
         # Lista de participantes sin suscripción
         st.markdown("#### 📋 Participantes Sin Suscripción")
         
-        df_sin_suscripcion = pd.DataFrame(participantes_sin_suscripcion)
-        
         st.dataframe(
             df_sin_suscripcion[["nombre", "email", "empresa_nombre"]],
             use_container_width=True,
@@ -1321,6 +1287,47 @@ def mostrar_reportes_suscripciones(clases_service, session_state):
             st.error("❌ La fecha de inicio debe ser anterior a la fecha de fin")
             return
         
+        # Consumo del mes en curso por empresa (mismo roster que la lista)
+        df_consumo = clases_service.resumen_mensual_suscripciones(clases_service.get_roster())
+        if not df_consumo.empty:
+            st.markdown(f"##### 🗓️ Consumo de {datetime.now().strftime('%m/%Y')} por Empresa")
+            st.dataframe(
+                df_consumo,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "empresa_nombre": "🏢 Empresa",
+                    "participantes": "👥 Participantes",
+                    "suscripciones_activas": "✅ Suscripciones",
+                    "clases_asignadas": "🎯 Asignadas",
+                    "clases_usadas": "🏃‍♀️ Usadas",
+                    "clases_restantes": "⚡ Restantes",
+                    "uso_pct": st.column_config.ProgressColumn("📊 Uso", min_value=0, max_value=100)
+                }
+            )
+        
+        # Recalcular contadores del mes desde las reservas (una sentencia por empresa)
+        if session_state.role == "admin":
+            with st.expander("🔁 Recalcular contadores del mes"):
+                st.caption("Recalcula las clases usadas de todas las suscripciones activas a partir de las reservas no canceladas del mes.")
+                if st.button(
+                    "🔁 Recalcular ahora",
+                    disabled=bool(st.session_state.get("job_rollover_suscripciones"))
+                ):
+                    lanzar_job(
+                        "rollover_suscripciones",
+                        {"forzar": True},
+                        clases_service.supabase,
+                        session_state,
+                        "job_rollover_suscripciones"
+                    )
+                panel_job(
+                    "job_rollover_suscripciones",
+                    clases_service.supabase,
+                    session_state,
+                    titulo="Recálculo de contadores mensuales"
+                )
+        
         # Obtener datos de ocupación
         df_ocupacion = clases_service.get_ocupacion_detallada(fecha_inicio, fecha_fin)
         
@@ -1435,12 +1442,11 @@ def exportar_participantes(participantes_service, session_state, df_filtrado=Non
                 empresa_id = session_state.user.get("empresa_id")
                 df_export = df_export[df_export["empresa_id"] == empresa_id]
 
-        st.download_button(
-            "📥 Exportar participantes a CSV",
-            data=df_export.to_csv(index=False).encode("utf-8"),
-            file_name=f"participantes_{datetime.today().strftime('%Y%m%d')}.csv",
-            mime="text/csv",
-            use_container_width=True
+        export_csv(
+            df_export,
+            filename=f"participantes_{datetime.today().strftime('%Y%m%d')}.csv",
+            label="📥 Exportar participantes a CSV",
+            key="export_participantes"
         )
 
     except Exception as e:
@@ -1486,55 +1492,42 @@ def importar_participantes(auth_service, empresas_service, session_state):
         st.success(f"✅ {len(df)} filas cargadas desde {uploaded.name}")
         st.dataframe(df.head(10), use_container_width=True)
 
-        if st.button("🚀 Importar participantes", type="primary", use_container_width=True):
-            errores, creados = [], 0
+        if st.button(
+            "🚀 Importar participantes",
+            type="primary",
+            use_container_width=True,
+            disabled=bool(st.session_state.get("job_importar_participantes"))
+        ):
+            filas, passwords = [], {}
             for idx, fila in df.iterrows():
-                try:
-                    if not fila.get("nombre") or not fila.get("apellidos") or not fila.get("email"):
-                        raise ValueError("Nombre, apellidos y email son obligatorios")
-
-                    if "@" not in fila["email"]:
-                        raise ValueError(f"Email inválido: {fila['email']}")
-
-                    if session_state.role == "gestor":
-                        empresa_id = session_state.user.get("empresa_id")
-                    else:
-                        empresa_id = fila.get("empresa_id") or None
-
-                    grupo_id = fila.get("grupo_id") or None
-                    password = fila.get("password") or None
+                if session_state.role == "gestor":
+                    empresa_id = session_state.user.get("empresa_id")
+                else:
+                    empresa_id = fila.get("empresa_id") or None
 
-                    datos = {
+                if fila.get("password"):
+                    passwords[idx + 1] = fila.get("password")
+                filas.append({
+                    "fila": idx + 1,
+                    "datos": {
                         "nombre": fila.get("nombre"),
                         "apellidos": fila.get("apellidos"),
                         "nif": fila.get("nif") or fila.get("documento"),
                         "email": fila.get("email"),
                         "telefono": fila.get("telefono"),
                         "empresa_id": empresa_id,
-                        "grupo_id": grupo_id,
+                        "grupo_id": fila.get("grupo_id") or None,
                     }
+                })
 
-                    ok, participante_id = auth_service.crear_usuario_con_auth(
-                        datos, 
-                        tabla="participantes", 
-                        password=password
-                    )
-                    
-                    if ok:
-                        creados += 1
-                    else:
-                        raise ValueError("Error al crear participante con AuthService")
-
-                except Exception as ex:
-                    errores.append(f"Fila {idx+1}: {ex}")
+            # La importación se ejecuta en segundo plano y se puede reanudar.
+            # Las contraseñas no se guardan con la tarea: solo viven en memoria
+            lanzar_job("importar_participantes", {"filas": filas}, auth_service.supabase,
+                       session_state, "job_importar_participantes",
+                       secretos={"passwords": passwords})
 
-            if errores:
-                st.error("⚠️ Errores durante la importación:")
-                for e in errores:
-                    st.text(e)
-            if creados:
-                st.success(f"✅ {creados} participantes importados correctamente")
-                st.rerun()
+        panel_job("job_importar_participantes", auth_service.supabase, session_state,
+                  titulo="Importación de participantes")
 
     except Exception as e:
         st.error(f"❌ Error importando participantes: {e}")
@@ -1764,6 +1757,7 @@ def mostrar_gestion_diplomas_participantes(supabase, session_state, participante
                                             .eq("id", diploma_data["id"])\
                                             .eq("grupo_id", participante["grupo_id"])\
                                             .execute()
+                                        get_almacenamiento(supabase).liberar("diplomas", [diploma_data.get("url")])
                                         st.success("✅ Diploma eliminado.")
                                         del st.session_state[confirmar_key]
                                         st.rerun()
@@ -1817,27 +1811,21 @@ def mostrar_gestion_diplomas_participantes(supabase, session_state, participante
                                                 grupo_numero = grupo_info.get("codigo_grupo", "0").split("_")[-1] if grupo_info.get("codigo_grupo") else "0"
                                                 
                                                 nif = p_info.get("nif", "sin_nif").replace(" ", "_")
-                                                timestamp = int(datetime.now().timestamp())
-                                                
-                                                file_name = f"diploma_{nif}_{timestamp}.pdf"
-                                                file_path = (
+                                                carpeta = (
                                                     f"diplomas/"
                                                     f"gestora_{empresa_id}/"
                                                     f"ano_{ano_inicio}/"
                                                     f"accion_{codigo_accion}_{accion_id}/"
-                                                    f"grupo_{grupo_numero}_{grupo_id_corto}/"
-                                                    f"{file_name}"
+                                                    f"grupo_{grupo_numero}_{grupo_id_corto}"
                                                 )
                                                 
-                                                # Subir al storage
-                                                supabase.storage.from_("diplomas").upload(
-                                                    file_path,
-                                                    diploma_file.getvalue(),
-                                                    {"content-type": "application/pdf"}
+                                                # Subir al storage (un PDF idéntico ya subido se reutiliza)
+                                                resultado = get_almacenamiento(supabase).subir_archivo(
+                                                    "diplomas", carpeta, diploma_file.getvalue(), "pdf",
+                                                    "application/pdf", prefijo=f"diploma_{nif}"
                                                 )
-                                                
-                                                # Obtener URL
-                                                url = supabase.storage.from_("diplomas").get_public_url(file_path)
+                                                url = resultado["url"]
+                                                file_name = resultado["ruta"].split("/")[-1]
                                                 
                                                 # Insertar en BD
                                                 insert_result = supabase.table("diplomas").insert({
@@ -2,8 +2,10 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.figure_factory as ff
-from datetime import datetime, timedelta
+from datetime import datetime
 from services.proyectos_service import get_proyectos_service
+from services.proyectos_analitica import barras_gantt, presupuesto_por_año, vencimientos
+from utils import export_csv, export_excel
 
 try:
     from streamlit_option_menu import option_menu
@@ -228,21 +230,13 @@ def mostrar_dashboard(proyectos_service):
     
     with col_right:
         st.markdown("#### 💸 Evolución de Presupuestos")
-        if not df_proyectos.empty and 'year_proyecto' in df_proyectos.columns:
+        if not df_proyectos.empty:
             try:
-                # Crear columna year_proyecto si no existe
-                if 'year_proyecto' not in df_proyectos.columns:
-                    # Intentar extraer año de fecha_inicio
-                    try:
-                        df_proyectos['year_proyecto'] = pd.to_datetime(df_proyectos['fecha_inicio'], errors='coerce').dt.year
-                    except:
-                        df_proyectos['year_proyecto'] = datetime.now().year
+                presupuesto_anual = presupuesto_por_año(df_proyectos)
                 
-                presupuesto_por_año = df_proyectos.groupby('year_proyecto')['presupuesto_total'].sum().reset_index()
-                
-                if not presupuesto_por_año.empty:
+                if not presupuesto_anual.empty:
                     fig_presupuesto = px.bar(
-                        presupuesto_por_año, 
+                        presupuesto_anual, 
                         x='year_proyecto', 
                         y='presupuesto_total',
                         title="Presupuesto por Año",
@@ -692,23 +686,9 @@ def mostrar_vista_gantt(proyectos_service):
         return
     
     # Preparar datos para el gráfico Gantt
-    gantt_data = []
+    barras = barras_gantt(df_gantt)
     
-    for _, proyecto in df_gantt.iterrows():
-        # Usar fecha_inicio y fecha_fin, con fallbacks
-        fecha_start = proyecto.get('fecha_inicio') or proyecto.get('fecha_ejecucion')
-        fecha_end = proyecto.get('fecha_fin') or proyecto.get('fecha_justificacion')
-        
-        if fecha_start and fecha_end:
-            gantt_data.append({
-                'Task': proyecto['nombre'][:30] + ('...' if len(proyecto['nombre']) > 30 else ''),
-                'Start': fecha_start,
-                'Finish': fecha_end,
-                'Resource': proyecto['estado_proyecto'],
-                'Description': f"Tipo: {proyecto['tipo_proyecto']} | Empresa: {proyecto.get('empresa_nombre', 'N/A')}"
-            })
-    
-    if not gantt_data:
+    if barras.empty:
         st.warning("No hay proyectos con fechas válidas para mostrar en el timeline")
         return
     
@@ -723,7 +703,7 @@ def mostrar_vista_gantt(proyectos_service):
         }
         
         fig = ff.create_gantt(
-            gantt_data,
+            barras.to_dict("records"),
             colors=colors,
             index_col='Resource',
             show_colorbar=True,
@@ -745,18 +725,14 @@ def mostrar_vista_gantt(proyectos_service):
         col_info1, col_info2, col_info3 = st.columns(3)
         
         with col_info1:
-            st.metric("Proyectos en Timeline", len(gantt_data))
+            st.metric("Proyectos en Timeline", len(barras))
         
         with col_info2:
-            if gantt_data:
-                fecha_min = min([item['Start'] for item in gantt_data])
-                fecha_max = max([item['Finish'] for item in gantt_data])
-                duracion = (fecha_max - fecha_min).days
-                st.metric("Duración Total", f"{duracion} días")
+            duracion = (barras['Finish'].max() - barras['Start'].min()).days
+            st.metric("Duración Total", f"{duracion} días")
         
         with col_info3:
-            proyectos_activos_gantt = len([item for item in gantt_data if item['Resource'] == 'EN_EJECUCION'])
-            st.metric("En Ejecución", proyectos_activos_gantt)
+            st.metric("En Ejecución", int((barras['Resource'] == 'EN_EJECUCION').sum()))
         
     except Exception as e:
         st.error(f"Error al crear el gráfico Gantt: {e}")
@@ -775,8 +751,8 @@ def gestionar_grupos_proyecto(proyectos_service):
         st.info("📝 No hay proyectos registrados")
         return
     
-    proyecto_options = {f"{row['nombre']} ({row['estado_proyecto']})": row['id'] 
-                       for _, row in df_proyectos.iterrows()}
+    etiquetas_proyecto = df_proyectos['nombre'].astype(str) + " (" + df_proyectos['estado_proyecto'].astype(str) + ")"
+    proyecto_options = dict(zip(etiquetas_proyecto, df_proyectos['id']))
     
     proyecto_seleccionado = st.selectbox("Seleccionar Proyecto", [""] + list(proyecto_options.keys()))
     
@@ -799,77 +775,46 @@ def gestionar_grupos_proyecto(proyectos_service):
     
     st.divider()
     
-    # Cargar grupos con información de acción formativa
-    try:
-        if proyectos_service.session_state.role == "gestor":
-            grupos_res = proyectos_service.supabase.table("grupos").select("""
-                id, codigo_grupo, estado, localidad, fecha_inicio, fecha_fin_prevista,
-                accion_formativa:acciones_formativas(nombre, modalidad, num_horas)
-            """).eq("empresa_id", proyectos_service.session_state.user.get("empresa_id")).execute()
-        else:
-            grupos_res = proyectos_service.supabase.table("grupos").select("""
-                id, codigo_grupo, estado, localidad, fecha_inicio, fecha_fin_prevista,
-                accion_formativa:acciones_formativas(nombre, modalidad, num_horas)
-            """).execute()
-            
-        grupos_disponibles = grupos_res.data or []
-        
-    except Exception as e:
-        st.error(f"Error al cargar grupos: {e}")
-        grupos_disponibles = []
+    # Grupos con información de acción formativa (cacheados) y asignaciones (índice en memoria)
+    df_grupos = proyectos_service.get_grupos_asignables(
+        proyectos_service.user_role, proyectos_service.user_empresa_id
+    )
     
-    if not grupos_disponibles:
+    if df_grupos.empty:
         st.info("No hay grupos disponibles")
         return
     
-    # Grupos actualmente asignados al proyecto
-    try:
-        grupos_proyecto_res = proyectos_service.supabase.table("proyecto_grupos")\
-            .select("grupo_id, created_at")\
-            .eq("proyecto_id", proyecto_id)\
-            .execute()
-        
-        grupos_asignados_ids = [pg["grupo_id"] for pg in (grupos_proyecto_res.data or [])]
-        
-    except Exception as e:
-        st.error(f"Error al cargar grupos del proyecto: {e}")
-        grupos_asignados_ids = []
+    grupos_asignados_ids = proyectos_service.grupos_asignados(proyecto_id)
+    asignado = df_grupos['id'].isin(grupos_asignados_ids)
     
     # Mostrar grupos asignados
     st.markdown("#### 📋 Grupos Asignados")
     if grupos_asignados_ids:
-        grupos_asignados = [g for g in grupos_disponibles if g["id"] in grupos_asignados_ids]
+        grupos_asignados = df_grupos[asignado]
         
-        if grupos_asignados:
-            for grupo in grupos_asignados:
-                # Información de acción formativa
-                accion_info = grupo.get('accion_formativa', {})
-                accion_nombre = accion_info.get('nombre', 'Sin acción') if accion_info else 'Sin acción'
-                modalidad = accion_info.get('modalidad', 'No definida') if accion_info else 'No definida'
-                
-                with st.expander(f"📚 {grupo['codigo_grupo']} - {accion_nombre}", expanded=False):
+        if not grupos_asignados.empty:
+            for grupo in grupos_asignados.to_dict("records"):
+                with st.expander(f"📚 {grupo['codigo_grupo']} - {grupo['accion_nombre']}", expanded=False):
                     col1, col2, col3 = st.columns([2, 2, 1])
                     
                     with col1:
-                        st.write(f"**Acción:** {accion_nombre}")
-                        st.write(f"**Modalidad:** {modalidad}")
+                        st.write(f"**Acción:** {grupo['accion_nombre']}")
+                        st.write(f"**Modalidad:** {grupo['modalidad'] or 'No definida'}")
                     
                     with col2:
-                        st.write(f"**Estado:** {grupo.get('estado', 'No definido').capitalize()}")
-                        st.write(f"**Localidad:** {grupo.get('localidad', 'No definida')}")
+                        st.write(f"**Estado:** {grupo['estado'].capitalize()}")
+                        st.write(f"**Localidad:** {grupo['localidad']}")
                     
                     with col3:
-                        if st.button("🗑️ Quitar", key=f"remove_grupo_{grupo['id']}", help="Quitar grupo del proyecto"):
-                            try:
-                                proyectos_service.supabase.table("proyecto_grupos")\
-                                    .delete()\
-                                    .eq("proyecto_id", proyecto_id)\
-                                    .eq("grupo_id", grupo['id'])\
-                                    .execute()
+                        if proyectos_service.can_modify_data() and st.button(
+                            "🗑️ Quitar", key=f"remove_grupo_{grupo['id']}", help="Quitar grupo del proyecto"
+                        ):
+                            resultado = proyectos_service.quitar_grupos_proyecto(proyecto_id, [grupo['id']])
+                            if resultado.get(grupo['id']) == proyectos_service.QUITADO:
                                 st.success(f"✅ Grupo {grupo['codigo_grupo']} eliminado del proyecto")
                                 st.rerun()
-                            except Exception as e:
-                                st.error(f"❌ Error al quitar grupo: {e}")
+                            else:
+                                st.error(f"❌ Error al quitar grupo: {resultado.get(grupo['id'])}")
         else:
             st.info("Los grupos asignados no se encuentran disponibles")
     else:
@@ -880,81 +825,44 @@ def gestionar_grupos_proyecto(proyectos_service):
         st.markdown("#### ➕ Asignar Nuevos Grupos")
         
         # Filtrar grupos no asignados
-        grupos_no_asignados = [g for g in grupos_disponibles if g["id"] not in grupos_asignados_ids]
+        grupos_no_asignados = df_grupos[~asignado]
         
-        if not grupos_no_asignados:
+        if grupos_no_asignados.empty:
             st.info("Todos los grupos disponibles ya están asignados a este proyecto.")
             return
         
-        # Selector mejorado con nombres de acción formativa
+        # Selector con nombres de acción formativa
         with st.form("form_asignar_grupo", clear_on_submit=True):
-            grupo_options = []
-            grupo_mapping = {}
+            grupo_mapping = dict(zip(grupos_no_asignados['etiqueta'], grupos_no_asignados['id']))
             
-            for g in grupos_no_asignados:
-                # Extraer información de acción formativa
-                accion_info = g.get('accion_formativa', {})
-                accion_nombre = accion_info.get('nombre', 'Sin acción') if accion_info else 'Sin acción'
-                modalidad = accion_info.get('modalidad', '') if accion_info else ''
-                num_horas = accion_info.get('num_horas', '') if accion_info else ''
-                estado = g.get('estado', 'abierto').capitalize()
-                
-                # Formato: "GRUP001 - Excel Avanzado (PRESENCIAL) [Abierto] - 40h"
-                display_text = f"{g['codigo_grupo']} - {accion_nombre}"
-                
-                if modalidad:
-                    display_text += f" ({modalidad})"
-                
-                display_text += f" [{estado}]"
-                
-                if num_horas:
-                    display_text += f" - {num_horas}h"
-                
-                grupo_options.append(display_text)
-                grupo_mapping[display_text] = g
+            grupos_seleccionados = st.multiselect(
+                "Seleccionar grupos para asignar",
+                options=list(grupo_mapping.keys()),
+                help="Formato: Código - Acción Formativa (Modalidad) [Estado] - Horas"
+            )
+            
+            asignar_clicked = st.form_submit_button("✅ Asignar Grupos al Proyecto", type="primary")
             
-            if grupo_options:
-                grupo_seleccionado = st.selectbox(
-                    "Seleccionar grupo para asignar",
-                    options=[""] + grupo_options,
-                    help="Formato: Código - Acción Formativa (Modalidad) [Estado] - Horas"
+            if asignar_clicked and grupos_seleccionados:
+                resultados = proyectos_service.asignar_grupos_proyecto(
+                    proyecto_id, [grupo_mapping[g] for g in grupos_seleccionados]
                 )
+                etiquetas = {grupo_mapping[g]: g for g in grupos_seleccionados}
+                asignados = [etiquetas[g] for g, r in resultados.items() if r == proyectos_service.ASIGNADO]
+                ya = [etiquetas[g] for g, r in resultados.items() if r == proyectos_service.YA_ASIGNADO]
+                errores = [f"{etiquetas[g]}: {r}" for g, r in resultados.items() if r.startswith("error")]
                 
-                asignar_clicked = st.form_submit_button("✅ Asignar Grupo al Proyecto", type="primary")
-                
-                if asignar_clicked and grupo_seleccionado:
-                    try:
-                        grupo_data = grupo_mapping[grupo_seleccionado]
-                        
-                        # Verificar que no esté ya asignado
-                        existe = proyectos_service.supabase.table("proyecto_grupos")\
-                            .select("id")\
-                            .eq("proyecto_id", proyecto_id)\
-                            .eq("grupo_id", grupo_data['id'])\
-                            .execute()
-                        
-                        if existe.data:
-                            st.warning("⚠️ Este grupo ya está asignado al proyecto.")
-                        else:
-                            # Asignar grupo al proyecto
-                            proyectos_service.supabase.table("proyecto_grupos").insert({
-                                "proyecto_id": proyecto_id,
-                                "grupo_id": grupo_data['id'],
-                                "fecha_asignacion": datetime.utcnow().isoformat(),
-                                "activo": True
-                            }).execute()
-                            
-                            accion_nombre = grupo_data.get('accion_formativa', {}).get('nombre', grupo_data['codigo_grupo'])
-                            st.success(f"✅ Grupo '{grupo_data['codigo_grupo']} - {accion_nombre}' asignado correctamente")
-                            st.rerun()
-                            
-                    except Exception as e:
-                        st.error(f"❌ Error al asignar grupo: {e}")
-                
-                elif asignar_clicked:
-                    st.warning("⚠️ Selecciona un grupo para asignar")
-            else:
-                st.info("No hay grupos disponibles para mostrar")
+                if ya:
+                    st.warning(f"⚠️ Ya estaban asignados: {', '.join(ya)}")
+                for error in errores:
+                    st.error(f"❌ Error al asignar {error}")
+                if asignados:
+                    st.success(f"✅ {len(asignados)} grupo(s) asignado(s) correctamente")
+                    if not errores:
+                        st.rerun()
+            
+            elif asignar_clicked:
+                st.warning("⚠️ Selecciona al menos un grupo para asignar")
     else:
         st.info("No tienes permisos para modificar asignaciones de grupos")
 
@@ -1123,79 +1031,22 @@ def mostrar_opciones_exportacion(df_proyectos):
     todas_columnas = df_proyectos.columns.tolist()
     columnas_export = st.multiselect("Columnas a Exportar", todas_columnas, default=todas_columnas[:10])
     
-    if st.button("Descargar"):
-        if not columnas_export:
-            st.error("Selecciona al menos una columna")
-            return
-        
-        df_export = df_proyectos[columnas_export]
-        
-        if formato_export == "CSV":
-            csv = df_export.to_csv(index=False)
-            st.download_button(
-                label="📥 Descargar CSV",
-                data=csv,
-                file_name=f"proyectos_{datetime.now().strftime('%Y%m%d')}.csv",
-                mime="text/csv"
-            )
-        else:  # Excel
-            from io import BytesIO
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df_export.to_excel(writer, index=False, sheet_name='Proyectos')
-            
-            st.download_button(
-                label="📥 Descargar Excel",
-                data=output.getvalue(),
-                file_name=f"proyectos_{datetime.now().strftime('%Y%m%d')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+    if not columnas_export:
+        st.info("Selecciona al menos una columna")
+        return
+
+    df_export = df_proyectos[columnas_export]
+    filename = f"proyectos_{datetime.now().strftime('%Y%m%d')}"
+
+    if formato_export == "CSV":
+        export_csv(df_export, filename=f"{filename}.csv", label="📥 Descargar CSV", key="export_proyectos_csv")
+    else:  # Excel
+        export_excel(df_export, filename=f"{filename}.xlsx", label="📥 Descargar Excel",
+                     sheet_name="Proyectos", key="export_proyectos_excel")
 
 def obtener_proyectos_urgentes(df_proyectos):
-    """Obtiene proyectos con fechas próximas a vencer - VERSIÓN ULTRA CORREGIDA"""
-    
-    if df_proyectos.empty:
-        return pd.DataFrame()
-    
+    """Obtiene proyectos con fechas próximas a vencer (próximos 30 días)"""
     try:
-        hoy = datetime.now().date()
-        fecha_limite = hoy + timedelta(days=30)
-        
-        proyectos_urgentes = []
-        
-        for _, proyecto in df_proyectos.iterrows():
-            campos_fecha = ['fecha_fin', 'fecha_justificacion', 'fecha_presentacion_informes']
-            
-            for fecha_col in campos_fecha:
-                fecha_valor = proyecto.get(fecha_col)
-                
-                # Usar la función safe_date_value corregida
-                fecha_convertida = safe_date_value(fecha_valor)
-                
-                # Si logramos convertir la fecha y está en rango
-                if fecha_convertida and hoy <= fecha_convertida <= fecha_limite:
-                    dias_restantes = (fecha_convertida - hoy).days
-                    
-                    proyectos_urgentes.append({
-                        'nombre': proyecto.get('nombre', 'Sin nombre'),
-                        'estado_proyecto': proyecto.get('estado_proyecto', 'N/A'),
-                        'fecha_fin': safe_date_value(proyecto.get('fecha_fin')),
-                        'fecha_justificacion': safe_date_value(proyecto.get('fecha_justificacion')),
-                        'dias_restantes': dias_restantes,
-                        'tipo_vencimiento': fecha_col.replace('fecha_', '').replace('_', ' ').title(),
-                        'fecha_urgente': fecha_convertida
-                    })
-                    break  # Solo agregar una vez por proyecto
-        
-        # Convertir a DataFrame
-        df_result = pd.DataFrame(proyectos_urgentes)
-        
-        # Ordenar por días restantes si hay datos
-        if not df_result.empty and 'dias_restantes' in df_result.columns:
-            df_result = df_result.sort_values('dias_restantes')
-        
-        return df_result
-        
-    except Exception as e:
-        # Si hay cualquier error, retornar DataFrame vacío
+        return vencimientos(df_proyectos)
+    except Exception:
         return pd.DataFrame()
@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 from datetime import datetime, date
+from services.rgpd_planner_service import get_rgpd_planner_service
 
 def render(supabase, session_state):
     st.markdown("## 🗂️ Planner RGPD")
@@ -19,10 +20,11 @@ def render(supabase, session_state):
         "Completada": "🟢"
     }
 
-    # Cargar tareas
+    planner = get_rgpd_planner_service(supabase, session_state)
+
+    # Cargar tareas e histórico (dos consultas, cacheado en sesión)
     try:
-        tareas = supabase.table("rgpd_tareas").select("*").eq("empresa_id", empresa_id).order("fecha_limite").execute().data or []
-        df_tareas = pd.DataFrame(tareas)
+        df_tareas = planner.get_df_tareas()
     except Exception as e:
         st.error(f"⚠️ No se pudieron cargar las tareas: {e}")
         df_tareas = pd.DataFrame()
@@ -48,6 +50,10 @@ def render(supabase, session_state):
     st.divider()
 
     # Mostrar tablero Kanban
+    if st.button("🔄 Recargar tablero", key="rgpd_planner_recargar"):
+        planner.limpiar_cache_tablero()
+        st.rerun()
+
     cols = st.columns(len(estados))
     for col, (estado, icono) in zip(cols, estados.items()):
         col.subheader(f"{icono} {estado}")
@@ -61,38 +67,23 @@ def render(supabase, session_state):
                     st.write(f"**Fecha límite:** {tarea.get('fecha_limite','')}")
                     
                     # Histórico de cambios
-                    try:
-                        historial = supabase.table("rgpd_tareas_historial").select("*").eq("tarea_id", tarea["id"]).order("fecha_cambio", desc=True).execute().data or []
-                        if historial:
-                            st.markdown("**Histórico de cambios:**")
-                            for h in historial:
-                                st.write(f"- {h['fecha_cambio']}: {h['accion']} por {h.get('usuario','')}")
-                    except:
-                        pass
+                    historial = planner.get_historial(tarea["id"])
+                    if historial:
+                        st.markdown("**Histórico de cambios:**")
+                        for h in historial:
+                            st.write(f"- {h['fecha_cambio']}: {h['accion']} por {h.get('usuario','')}")
 
                     # Botones para cambiar estado
                     for nuevo_estado in estados.keys():
                         if nuevo_estado != estado:
                             if st.button(f"Mover a {nuevo_estado}", key=f"{tarea['id']}_{nuevo_estado}"):
-                                supabase.table("rgpd_tareas").update({"estado": nuevo_estado}).eq("id", tarea["id"]).execute()
-                                supabase.table("rgpd_tareas_historial").insert({
-                                    "tarea_id": tarea["id"],
-                                    "accion": f"Cambio de estado a {nuevo_estado}",
-                                    "fecha_cambio": datetime.utcnow().isoformat(),
-                                    "usuario": session_state.user.get("email")
-                                }).execute()
-                                st.experimental_rerun()
+                                if planner.cambiar_estado(tarea.to_dict(), nuevo_estado):
+                                    st.rerun()
 
                     # Botón para eliminar
                     if st.button("🗑️ Eliminar tarea", key=f"del_{tarea['id']}"):
-                        supabase.table("rgpd_tareas").delete().eq("id", tarea["id"]).execute()
-                        supabase.table("rgpd_tareas_historial").insert({
-                            "tarea_id": tarea["id"],
-                            "accion": "Eliminada",
-                            "fecha_cambio": datetime.utcnow().isoformat(),
-                            "usuario": session_state.user.get("email")
-                        }).execute()
-                        st.experimental_rerun()
+                        if planner.eliminar_tarea(tarea["id"]):
+                            st.rerun()
 
     st.divider()
     st.markdown("### ➕ Nueva tarea")
@@ -109,24 +100,15 @@ def render(supabase, session_state):
             st.warning("⚠️ El título es obligatorio.")
         else:
             try:
-                res = supabase.table("rgpd_tareas").insert({
-                    "empresa_id": empresa_id,
+                planner.crear_tarea({
                     "titulo": titulo,
                     "descripcion": descripcion,
                     "tipo": tipo,
                     "responsable": responsable,
-                    "fecha_limite": fecha_limite.isoformat(),
-                    "estado": "Pendiente"
-                }).execute()
-                if res.data:
-                    supabase.table("rgpd_tareas_historial").insert({
-                        "tarea_id": res.data[0]["id"],
-                        "accion": "Creada",
-                        "fecha_cambio": datetime.utcnow().isoformat(),
-                        "usuario": session_state.user.get("email")
-                    }).execute()
+                    "fecha_limite": fecha_limite.isoformat()
+                })
                 st.success("✅ Tarea creada correctamente.")
-                st.experimental_rerun()
+                st.rerun()
             except Exception as e:
                 st.error(f"❌ Error al crear la tarea: {e}")
                         
@@ -2,8 +2,9 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 import uuid
-from utils import export_csv, validar_dni_cif
+from utils import export_csv, validar_dni_cif, log_accion
 from services.data_service import get_data_service
+from services.almacenamiento_service import get_almacenamiento
 
 # =========================
 # FUNCIONES DE CACHE OPTIMIZADO
@@ -260,6 +261,7 @@ def render(supabase, session_state):
             # Usar data_service para actualizar
             success = data_service.update_tutor(tutor_id, datos_limpios)
             if success:
+                log_accion("tutor_actualizado", session_state.user.get("id"), {"tutor_id": tutor_id})
                 st.success("✅ Tutor actualizado correctamente.")
                 return True
             else:
@@ -317,6 +319,7 @@ def render(supabase, session_state):
             # Usar data_service para crear
             success = data_service.create_tutor(datos_limpios)
             if success:
+                log_accion("tutor_creado", session_state.user.get("id"), {"nif": datos_limpios.get("nif")})
                 st.success("✅ Tutor creado correctamente.")
                 return True
             else:
@@ -689,8 +692,7 @@ def render(supabase, session_state):
             col1, col2 = st.columns(2)
             
             with col1:
-                if st.button("📥 Exportar Tutores CSV", use_container_width=True):
-                    export_csv(df_filtrado, "tutores_export")
+                export_csv(df_filtrado, "tutores_export.csv", label="📥 Exportar Tutores CSV", key="export_tutores")
                     
             with col2:
                 st.markdown("**Resumen de tutores filtrados:**")
@@ -795,30 +797,22 @@ def subir_cv_tutor(supabase, data_service, tutor, cv_file):
                 st.error(f"❌ Error al leer el archivo: {e}")
                 return False
             
-            # Generar path estructurado
+            # Ruta por contenido: un CV idéntico ya subido no se vuelve a enviar
             empresa_id_tutor = tutor.get("empresa_id")
             file_extension = cv_file.name.split(".")[-1] if "." in cv_file.name else "pdf"
-            timestamp = int(datetime.now().timestamp())
-            filename = f"empresa_{empresa_id_tutor}/tutores/cv_{tutor['id']}_{timestamp}.{file_extension}"
+            almacenamiento = get_almacenamiento(supabase)
             
             # Subir a bucket de Supabase
             try:
-                upload_res = supabase.storage.from_("curriculums").upload(
-                    filename, 
-                    file_bytes, 
-                    file_options={
-                        "content-type": cv_file.type,
-                        "cache-control": "3600",
-                        "upsert": "true"
-                    }
+                resultado = almacenamiento.subir_archivo(
+                    "curriculums",
+                    f"empresa_{empresa_id_tutor}/tutores",
+                    file_bytes,
+                    file_extension,
+                    cv_file.type,
+                    prefijo="cv"
                 )
-                
-                # Verificar si la subida fue exitosa
-                if hasattr(upload_res, 'error') and upload_res.error:
-                    raise Exception(f"Error de subida: {upload_res.error}")
-                
-                # Obtener URL pública
-                public_url = supabase.storage.from_("curriculums").get_public_url(filename)
+                public_url = resultado["url"]
                 if not public_url:
                     raise Exception("No se pudo generar URL pública")
                 
@@ -826,6 +820,9 @@ def subir_cv_tutor(supabase, data_service, tutor, cv_file):
                 success = data_service.update_tutor(tutor["id"], {"cv_url": public_url})
                 
                 if success:
+                    # El CV anterior se borra en segundo plano si ya no lo usa nadie
+                    if tutor.get("cv_url") and tutor["cv_url"] != public_url:
+                        almacenamiento.liberar("curriculums", [tutor["cv_url"]])
                     st.success("✅ CV subido correctamente!")
                     st.balloons()
                     st.markdown(f"🔗 [Ver CV subido]({public_url})")
@@ -855,23 +852,16 @@ def eliminar_cv_tutor(supabase, data_service, tutor_id):
     try:
         confirmar_key = f"confirm_delete_cv_{tutor_id}"
         if st.session_state.get(confirmar_key, False):
-            # Eliminar archivo del storage también
-            try:
-                tutor_actual = supabase.table("tutores").select("cv_url").eq("id", tutor_id).execute()
-                if tutor_actual.data and tutor_actual.data[0].get("cv_url"):
-                    cv_url = tutor_actual.data[0]["cv_url"]
-                    if "curriculums/" in cv_url:
-                        file_path = cv_url.split("curriculums/")[-1].split("?")[0]
-                        try:
-                            supabase.storage.from_("curriculums").remove([file_path])
-                        except Exception:
-                            pass
-            except Exception:
-                pass
+            tutor_actual = supabase.table("tutores").select("cv_url").eq("id", tutor_id).execute()
+            cv_url = tutor_actual.data[0].get("cv_url") if tutor_actual.data else None
             
             # Eliminar referencia de la base de datos
             success = data_service.update_tutor(tutor_id, {"cv_url": None})
             
+            # El archivo se borra en segundo plano si ningún otro tutor lo comparte
+            if success and cv_url:
+                get_almacenamiento(supabase).liberar("curriculums", [cv_url])
+            
             if success:
                 st.success("✅ CV eliminado.")
                 st.session_state[confirmar_key] = False
@@ -4,8 +4,8 @@ import re
 from datetime import datetime, date
 from io import BytesIO
 from utils import validar_dni_cif, validar_email, get_ajustes_app
-from services.data_service import get_data_service
 from services.auth_service import get_auth_service
+from services.usuarios_service import DirectorioUsuarios, get_directorio_usuarios
 
 EMAIL_REGEX = r"^[^@]+@[^@]+\.[^@]+$"
 
@@ -74,41 +74,17 @@ def validar_datos_usuario(datos: dict, empresas_dict: dict, es_creacion: bool =
 # =========================
 # MÉTRICAS CON GRÁFICOS
 # =========================
-def mostrar_metricas_usuarios(df_usuarios):
-    """Muestra métricas con gráficos como en participantes.py."""
+def mostrar_metricas_usuarios(conteos, empresas_dict):
+    """Muestra métricas con gráficos como en participantes.py (conteos precalculados del directorio)."""
     try:
-        # Filtrar solo usuarios del sistema (no alumnos)
-        df_sistema = df_usuarios[df_usuarios["rol"].isin(["admin", "gestor", "comercial"])]
-        
-        if df_sistema.empty:
-            metricas = {"total": 0, "admin": 0, "gestor": 0, "comercial": 0, "nuevos_mes": 0}
-        else:
-            total = len(df_sistema)
-            admin = len(df_sistema[df_sistema["rol"] == "admin"])
-            gestor = len(df_sistema[df_sistema["rol"] == "gestor"])
-            comercial = len(df_sistema[df_sistema["rol"] == "comercial"])
-            
-            # Usuarios nuevos este mes
-            nuevos_mes = 0
-            if "created_at" in df_sistema.columns:
-                try:
-                    df_sistema['created_at_dt'] = pd.to_datetime(df_sistema["created_at"], errors="coerce")
-                    mes_actual = datetime.now().month
-                    año_actual = datetime.now().year
-                    nuevos_mes = len(df_sistema[
-                        (df_sistema['created_at_dt'].dt.month == mes_actual) & 
-                        (df_sistema['created_at_dt'].dt.year == año_actual)
-                    ])
-                except:
-                    nuevos_mes = 0
-            
-            metricas = {
-                "total": total,
-                "admin": admin,
-                "gestor": gestor,
-                "comercial": comercial,
-                "nuevos_mes": nuevos_mes
-            }
+        por_rol = conteos["por_rol"]
+        metricas = {
+            "total": conteos["total"],
+            "admin": por_rol.get("admin", 0),
+            "gestor": por_rol.get("gestor", 0),
+            "comercial": por_rol.get("comercial", 0),
+            "nuevos_mes": conteos["nuevos_mes"]
+        }
 
         # Mostrar métricas
         col1, col2, col3, col4, col5 = st.columns(5)
@@ -150,6 +126,14 @@ def mostrar_metricas_usuarios(df_usuarios):
                                      title="Usuarios por periodo")
                 st.plotly_chart(fig_temporal, use_container_width=True)
 
+            if conteos["por_empresa"]:
+                st.markdown("#### 🏢 Usuarios por Empresa")
+                nombres = {eid: nombre for nombre, eid in empresas_dict.items()}
+                st.dataframe(pd.DataFrame([
+                    {"Empresa": nombres.get(eid, eid), "Usuarios": n}
+                    for eid, n in conteos["por_empresa"].most_common()
+                ]), use_container_width=True, hide_index=True)
+
     except Exception as e:
         st.error(f"❌ Error calculando métricas: {e}")
         # Mostrar métricas vacías
@@ -180,18 +164,13 @@ def mostrar_tabla_usuarios(df_usuarios, session_state, columnas_mostrar, titulo_
     with col3:
         filtro_empresa = st.text_input("🏢 Empresa contiene", key="filtro_tabla_empresa")
 
-    # Aplicar filtros
-    df_filtered = df_usuarios.copy()
-
-    if filtro_nombre:
-        df_filtered = df_filtered[
-            df_filtered["nombre_completo"].str.contains(filtro_nombre, case=False, na=False) |
-            df_filtered["email"].str.contains(filtro_nombre, case=False, na=False)
-        ]
-    if filtro_rol != "Todos":
-        df_filtered = df_filtered[df_filtered["rol"] == filtro_rol]
-    if filtro_empresa and "empresa_nombre" in df_filtered.columns:
-        df_filtered = df_filtered[df_filtered["empresa_nombre"].str.contains(filtro_empresa, case=False, na=False)]
+    # Aplicar filtros (columnas de búsqueda precalculadas en el directorio)
+    df_filtered = DirectorioUsuarios.filtrar(
+        df_usuarios,
+        texto=filtro_nombre,
+        rol=None if filtro_rol == "Todos" else filtro_rol,
+        empresa=filtro_empresa
+    )
 
     # ✅ Filtrar columnas dinámicas
     columnas_existentes = [col for col in columnas_mostrar if col in df_filtered.columns]
@@ -218,7 +197,7 @@ def mostrar_tabla_usuarios(df_usuarios, session_state, columnas_mostrar, titulo_
 # =========================
 # FORMULARIO INTEGRADO CORREGIDO
 # =========================
-def mostrar_formulario_usuario(usuario_data, data_service, auth_service, empresas_dict, es_creacion=False):
+def mostrar_formulario_usuario(usuario_data, auth_service, empresas_dict, es_creacion=False):
     """Formulario simplificado: crear sin empresa, editar con empresa."""
     
     if es_creacion:
@@ -362,9 +341,6 @@ def mostrar_formulario_usuario(usuario_data, data_service, auth_service, empresa
                             st.info("💡 Ve a la pestaña 'Listado' para asignarle una empresa")
                         st.balloons()
                         
-                        # Limpiar cache
-                        if hasattr(data_service, 'get_usuarios') and hasattr(data_service.get_usuarios, 'clear'):
-                            data_service.get_usuarios.clear()
                         st.rerun()
                     else:
                         st.error("❌ Error al crear usuario")
@@ -394,8 +370,6 @@ def mostrar_formulario_usuario(usuario_data, data_service, auth_service, empresa
                     
                     if ok:
                         st.success("✅ Usuario actualizado correctamente")
-                        if hasattr(data_service, 'get_usuarios') and hasattr(data_service.get_usuarios, 'clear'):
-                            data_service.get_usuarios.clear()
                         st.rerun()
                     else:
                         st.error("❌ Error al actualizar usuario")
@@ -421,8 +395,6 @@ def mostrar_formulario_usuario(usuario_data, data_service, auth_service, empresa
                         if ok:
                             st.success("✅ Usuario eliminado correctamente")
                             del st.session_state["confirmar_eliminar_usuario"]
-                            if hasattr(data_service, 'get_usuarios') and hasattr(data_service.get_usuarios, 'clear'):
-                                data_service.get_usuarios.clear()
                             st.rerun()
                     except Exception as e:
                         st.error(f"❌ Error eliminando usuario: {e}")
@@ -441,14 +413,13 @@ def render(supabase, session_state):
         st.warning("🔒 Solo los administradores pueden acceder a esta sección.")
         return
 
-    data_service = get_data_service(supabase, session_state)
     auth_service = get_auth_service(supabase, session_state)
+    directorio = get_directorio_usuarios()
 
     try:
-        df_usuarios = data_service.get_usuarios(include_empresa=True)
-
-        empresas_res = supabase.table("empresas").select("id,nombre").execute()
-        empresas_dict = {e["nombre"]: e["id"] for e in empresas_res.data or []}
+        # Cache de proceso: usuarios con su empresa en una sola select embebida
+        df_usuarios = directorio.get_usuarios(supabase)
+        empresas_dict = directorio.get_empresas_dict(supabase)
 
     except Exception as e:
         st.error(f"❌ Error al cargar datos: {e}")
@@ -478,7 +449,7 @@ def render(supabase, session_state):
             ]
 
         # Filtrar solo las columnas que existen en df
-        columnas_mostrar = [col for col in columnas_mostrar if col in df_usuarios.columns]
+        columnas_mostrar = [col for col in columnas_mostrar if col in df_usuarios.columns and not col.startswith("_")]
 
         # ✅ Asegurar que 'nombre_completo' siempre esté presente y primero
         if "nombre_completo" not in columnas_mostrar and "nombre_completo" in df_usuarios.columns:
@@ -492,7 +463,7 @@ def render(supabase, session_state):
         if session_state.role == "admin":
             st.subheader("⚙️ Configuración de columnas visibles")
 
-            columnas_disponibles = df_usuarios.columns.tolist()
+            columnas_disponibles = [c for c in df_usuarios.columns if not c.startswith("_")]
             columnas_opciones = [c for c in columnas_disponibles if c != "nombre_completo"]
 
             columnas_seleccionadas = st.multiselect(
@@ -517,16 +488,14 @@ def render(supabase, session_state):
         # Mostrar tabla con columnas dinámicas
         # =========================
         try:
-            df_filtered = df_usuarios[df_usuarios["rol"].isin(["admin", "gestor", "comercial"])].copy()
-
-            seleccionado, df_paged = mostrar_tabla_usuarios(
-                df_filtered, session_state, columnas_mostrar
+            seleccionado, df_filtered = mostrar_tabla_usuarios(
+                df_usuarios, session_state, columnas_mostrar
             )
 
             st.divider()
 
             with st.expander("📥 Exportar Usuarios"):
-                exportar_usuarios(df_filtered)
+                exportar_usuarios(df_filtered[[c for c in df_filtered.columns if not c.startswith("_")]])
 
             with st.expander("ℹ️ Ayuda sobre Usuarios"):
                 st.markdown("""
@@ -539,17 +508,17 @@ def render(supabase, session_state):
 
             if seleccionado is not None:
                 with st.container(border=True):
-                    mostrar_formulario_usuario(seleccionado, data_service, auth_service, empresas_dict, es_creacion=False)
+                    mostrar_formulario_usuario(seleccionado, auth_service, empresas_dict, es_creacion=False)
 
         except Exception as e:
             st.error(f"❌ Error cargando usuarios: {e}")
 
     with tabs[1]:
         with st.container(border=True):
-            mostrar_formulario_usuario({}, data_service, auth_service, empresas_dict, es_creacion=True)
+            mostrar_formulario_usuario({}, auth_service, empresas_dict, es_creacion=True)
 
     with tabs[2]:
-        mostrar_metricas_usuarios(df_usuarios)
+        mostrar_metricas_usuarios(directorio.get_conteos(supabase), empresas_dict)
 
     st.divider()
     st.caption("💡 Gestiona usuarios administrativos del sistema desde esta interfaz centralizada.")